@@ -75,6 +75,8 @@ class ApiAppConfig(AppConfig):
              'roles': ['Administrador', 'Gerente', 'Supervisor', ]},
             {'nombre': 'api_contactos_campana',
              'roles': ['Agente', ]},
+            {'nombre': 'api_buscar_contactos_campana',
+             'roles': ['Agente', ]},
             {'nombre': 'api_click2call',
              'roles': ['Agente', ]},
             {'nombre': 'api_agent_asterisk_login',
@@ -163,6 +165,8 @@ class ApiAppConfig(AppConfig):
              'version': '1.11.6'},
         'api_contactos_campana':
             {'descripcion': _('Contactos de una campaña'), 'version': '1.7.0'},
+        'api_buscar_contactos_campana':
+            {'descripcion': _('Búsqueda de contactos de una campaña'), 'version': '1.14.0'},
         'api_click2call':
             {'descripcion': _('Ejecuta un click 2 call'), 'version': '1.7.0'},
         'api_agent_asterisk_login':
@@ -20,14 +20,15 @@ from __future__ import unicode_literals
 
 import json
 
+from django.db import transaction
 from django.utils.translation import ugettext as _
 
 from ominicontacto_app.services.base_de_datos_contactos import \
-    CreacionBaseDatosServiceIdExternoError, PredictorMetadataService
+    CreacionBaseDatosServiceIdExternoError, InsercionContactosEnLotes, PredictorMetadataService
 from ominicontacto_app.parser import ParserCsv
 from ominicontacto_app.errors import OmlArchivoImportacionInvalidoError, \
     OmlError, OmlParserCsvImportacionError, OmlParserMaxRowError, OmlParserRepeatedColumnsError
-from ominicontacto_app.models import BaseDatosContacto, Contacto
+from ominicontacto_app.models import BaseDatosContacto
 
 from api_app.utils.contactos.base_datos_contacto_archivo_parser \
     import BaseDatosContactoArchivoCSVParser
@@ -89,48 +90,44 @@ class BaseDatosContactoService(object):
 
         ids_externos = base_datos_contacto.contactos.values_list('id_externo', flat=True)
         ids_externos = set(ids_externos)
-        ids_nuevos_contactos = []
+        insercion = InsercionContactosEnLotes(base_datos_contacto)
         try:
-            estructura_archivo = self.legacy_parser.get_estructura_archivo(base_datos_contacto)
-            posicion_primer_telefono = estructura_archivo[0].index(campos_telefonicos[0])
-            cantidad_contactos = 0
-            if base_datos_contacto.cantidad_contactos:
-                cantidad_contactos = base_datos_contacto.cantidad_contactos
-            numero_fila = 0
-            for lista_dato in estructura_archivo[1:]:
-                numero_fila += 1
-                telefono, datos, id_externo = self._obtener_telefono_y_datos(
-                    lista_dato, posicion_primer_telefono, columna_id_externo)
-                cantidad_contactos += 1
-                if id_externo is not None and id_externo != '':
-                    # El id_externo no puede estar repetido
-                    if id_externo in ids_externos:
-                        base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
-                        raise CreacionBaseDatosServiceIdExternoError(numero_fila,
-                                                                     columna_id_externo,
-                                                                     lista_dato,
-                                                                     id_externo)
-                    else:
-                        ids_externos.add(id_externo)
-
-                contacto = Contacto.objects.create(
-                    telefono=telefono,
-                    datos=datos,
-                    bd_contacto=base_datos_contacto,
-                    id_externo=id_externo
-                )
-                ids_nuevos_contactos.append(contacto.id)
+            # Si falla la importación se descartan todos los contactos insertados
+            with transaction.atomic():
+                filas = self.legacy_parser.iterar_estructura_archivo(base_datos_contacto)
+                encabezado = next(filas)
+                posicion_primer_telefono = encabezado.index(campos_telefonicos[0])
+                cantidad_contactos = 0
+                if base_datos_contacto.cantidad_contactos:
+                    cantidad_contactos = base_datos_contacto.cantidad_contactos
+                numero_fila = 0
+                for lista_dato in filas:
+                    numero_fila += 1
+                    telefono, datos, id_externo = self._obtener_telefono_y_datos(
+                        lista_dato, posicion_primer_telefono, columna_id_externo)
+                    cantidad_contactos += 1
+                    if id_externo is not None and id_externo != '':
+                        # El id_externo no puede estar repetido
+                        if id_externo in ids_externos:
+                            raise CreacionBaseDatosServiceIdExternoError(numero_fila,
+                                                                         columna_id_externo,
+                                                                         lista_dato,
+                                                                         id_externo)
+                        else:
+                            ids_externos.add(id_externo)
+
+                    insercion.agregar(telefono, datos, id_externo)
+                insercion.volcar()
         except CreacionBaseDatosServiceIdExternoError as e:
             raise e
 
         except OmlParserMaxRowError:
-            base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
             raise OmlError(_("Archivo excede máximo de filas permitidas"))
 
         except OmlParserCsvImportacionError:
-            base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
             raise OmlError(_("Error al parsear el archivo csv"))
 
+        insercion.loguear_rendimiento()
         base_datos_contacto.cantidad_contactos = cantidad_contactos
 
         base_datos_contacto.save()
@@ -209,12 +209,15 @@ class APITest(OMLBaseTest):
     def set_redis_mock_return_values(self, redis_mock_class, keys, values):
 
         redis_fake_dict = dict(zip(keys, values))
-        redis_mock_class.return_value.keys.return_value = keys
+        pipeline = redis_mock_class.return_value.pipeline.return_value
+        self.keys_consultadas_pipeline = []
 
         def hgetall_fake(key):
-            return redis_fake_dict[key]
+            return dict(redis_fake_dict.get(key, {}))
 
         redis_mock_class.return_value.hgetall = hgetall_fake
+        pipeline.hgetall = self.keys_consultadas_pipeline.append
+        pipeline.execute = lambda: [hgetall_fake(key) for key in self.keys_consultadas_pipeline]
 
         return redis_mock_class
 
@@ -302,6 +305,8 @@ class APITest(OMLBaseTest):
         ag_value = response_json[0]
         self.assertEqual(len(response_json), 1)
         self.assertEqual(ag_value['id'], ag1_pk)
+        # Sólo se consultan los agentes del supervisor
+        self.assertEqual(self.keys_consultadas_pipeline, [key1])
 
     @patch('ominicontacto_app.services.asterisk.supervisor_activity.redis.Redis')
     def test_servicio_agentes_activos_no_muestra_entradas_con_menos_campos(
@@ -364,6 +369,38 @@ class APITest(OMLBaseTest):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['recordsTotal'], cantidad)
 
+    def test_api_vista_contactos_campanas_pagina_contactos_no_calificados(self):
+        bd_contacto = self.campana_activa.bd_contacto
+        for i in range(3):
+            ContactoFactory(bd_contacto=bd_contacto)
+        no_calificados = list(bd_contacto.contactos.exclude(pk=self.contacto.pk).order_by('pk'))
+        token_agente = Token.objects.get(user=self.agente_profile.user).key
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_agente)
+        url = reverse('api_contactos_campana', args=(self.campana_activa.pk,))
+        response = client.get(url, {'search[value]': '', 'start': 1, 'length': 1, 'draw': 1},
+                              format='json')
+        self.assertEqual(response.data['recordsFiltered'], len(no_calificados))
+        self.assertEqual(response.data['data'],
+                         [[no_calificados[1].pk, no_calificados[1].telefono, '']])
+
+    def test_api_buscar_contactos_campana_prioriza_telefono_normalizado(self):
+        bd_contacto = self.campana_activa.bd_contacto
+        por_datos = ContactoFactory(bd_contacto=bd_contacto, telefono='1100000000',
+                                    datos='["Juan", "Jos\\u00e9", "351-555-1234"]')
+        por_telefono = ContactoFactory(bd_contacto=bd_contacto, telefono='(351) 555-1234')
+        token_agente = Token.objects.get(user=self.agente_profile.user).key
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_agente)
+        url = reverse('api_buscar_contactos_campana', args=(self.campana_activa.pk,))
+        response = client.get(url, {'search': '3515551234'}, format='json')
+        self.assertTrue(response.data['complete'])
+        self.assertEqual([contacto['id'] for contacto in response.data['contacts']],
+                         [por_telefono.pk])
+        response = client.get(url, {'search': 'josé'}, format='json')
+        self.assertEqual([contacto['id'] for contacto in response.data['contacts']],
+                         [por_datos.pk])
+
     def test_api_vista_contactos_campanas_no_es_accessible_usando_token_no_agente(self):
         token_agente = Token.objects.get(user=self.supervisor_admin.user).key
         client = APIClient()
@@ -170,3 +170,22 @@ class RolesYPermisosAPITest(OMLBaseTest):
         self.assertEqual(response.json()['status'], 'ERROR')
         self.assertEqual(response.json()['message'], _('Id de Rol incorrecto'))
         self.assertTrue(Group.objects.filter(name=User.SUPERVISOR).exists())
+
+    def test_permisos_cacheados_no_consultan_la_base_de_datos(self):
+        self.assertTrue(self.administrador.tiene_permiso_oml('api_new_role'))
+        administrador = User.objects.get(pk=self.administrador.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(administrador.tiene_permiso_oml('api_new_role'))
+            self.assertTrue(administrador.tiene_permiso_oml('url_no_restringida'))
+
+    def test_asignar_permisos_a_rol_invalida_permisos_cacheados(self):
+        rol = Group.objects.create(name='Rol_1')
+        usuario = self.crear_user_supervisor()
+        usuario.groups.set([rol])
+        self.assertFalse(usuario.tiene_permiso_oml('api_new_role'))
+        url = reverse('api_update_role_permissions')
+        permiso = PermisoOML.objects.get(codename='api_new_role')
+        post_data = json.dumps({'role_id': rol.id, 'permissions': [permiso.id]})
+        self.client.post(url, post_data, format='json', content_type='application/json')
+        usuario = User.objects.get(pk=usuario.pk)
+        self.assertTrue(usuario.tiene_permiso_oml('api_new_role'))
@@ -36,7 +36,8 @@ from api_app.views.supervisor import (
 from api_app.views.agente import (
     ObtenerCredencialesSIPAgenteView,
     OpcionesCalificacionViewSet, ApiCalificacionClienteView, ApiCalificacionClienteCreateView,
-    API_ObtenerContactosCampanaView, Click2CallView, AgentLogoutView,
+    API_ObtenerContactosCampanaView, API_BuscarContactosCampanaView, Click2CallView,
+    AgentLogoutView,
     AgentLoginAsterisk, AgentLogoutAsterisk, AgentPauseAsterisk, AgentUnpauseAsterisk,
     SetEstadoRevisionAuditoria, ApiStatusCalificacionLlamada, ApiEventoHold
 )
@@ -142,6 +143,8 @@ urlpatterns = [
     # ###########     AGENTE      ############ #
     url(r'^api/v1/campaign/(?P<pk_campana>\d+)/contacts/$',
         API_ObtenerContactosCampanaView.as_view(), name='api_contactos_campana'),
+    url(r'^api/v1/campaign/(?P<pk_campana>\d+)/contacts/search/$',
+        API_BuscarContactosCampanaView.as_view(), name='api_buscar_contactos_campana'),
     url(r'api/v1/makeCall/$',
         Click2CallView.as_view(),
         name='api_click2call'),
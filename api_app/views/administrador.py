@@ -38,7 +38,7 @@ from api_app.serializers import AgenteProfileSerializer
 from api_app.views.permissions import TienePermisoOML
 from api_app.services.base_datos_contacto_service import BaseDatosContactoService
 from ominicontacto_app.models import AgenteProfile, User
-from ominicontacto_app.permisos import PermisoOML
+from ominicontacto_app.permisos import PermisoOML, cache_permisos_oml
 from ominicontacto_app.errors import OmlArchivoImportacionInvalidoError, OmlError, \
     OmlParserRepeatedColumnsError
 from django.utils.encoding import smart_text
@@ -84,6 +84,7 @@ class CrearRolView(APIView):
         else:
             rol = Group(name=nombre)
             rol.save()
+            cache_permisos_oml.invalidar()
             return Response(data={
                 'status': 'OK',
                 'role': {
@@ -124,6 +125,7 @@ class ActualizarPermisosDeRolView(APIView):
                                   'message': _('Lista de permisos incorrecta')})
 
         rol.permissions.set(permisos_en_base)
+        cache_permisos_oml.invalidar()
         return Response(data={'status': 'OK'})
 
 
@@ -149,6 +151,7 @@ class EliminarRolView(APIView):
             return Response(data={'status': 'ERROR',
                                   'message': _('No se puede borrar un rol asignado a usuarios.')})
         rol.delete()
+        cache_permisos_oml.invalidar()
         return Response(data={'status': 'OK'})
 
 
@@ -19,6 +19,9 @@
 
 from __future__ import unicode_literals
 
+import redis
+
+from django.conf import settings
 from django.utils.translation import ugettext as _
 from django.contrib.auth import logout
 from django.http import Http404
@@ -26,6 +29,7 @@ from django.shortcuts import get_object_or_404, redirect
 from django.views.generic import View
 from django.utils import timezone
 
+from redis.exceptions import RedisError
 from rest_framework import viewsets
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.renderers import JSONRenderer
@@ -42,6 +46,7 @@ from ominicontacto_app.models import (
     Campana, SistemaExterno, CalificacionCliente, Contacto, AuditoriaCalificacion)
 from reportes_app.models import LlamadaLog
 from ominicontacto_app.services.asterisk.agent_activity import AgentActivityAmiManager
+from ominicontacto_app.services.busqueda_contactos import BuscadorDeContactos
 from ominicontacto_app.services.click2call import Click2CallOriginator
 
 from ominicontacto_app.services.kamailio_service import KamailioService
@@ -139,32 +144,50 @@ class API_ObtenerContactosCampanaView(APIView):
     permission_classes = (TienePermisoOML, )
     authentication_classes = (SessionAuthentication, ExpiringTokenAuthentication)
 
+    CLAVE_TOTAL_CONTACTOS = 'OML:CONTACTS_TOTAL:{0}'
+    DURACION_TOTAL_CONTACTOS = 300
+
     def _procesar_api(self, request, campana):
         search = request.GET['search[value]']
-        contactos_calificados_ids = list(campana.obtener_calificaciones().values_list(
-            'contacto__pk', flat=True))
         if search != '':
             contactos = Contacto.objects.contactos_by_filtro_bd_contacto(
                 campana.bd_contacto, filtro=search)
-            contactos = contactos.exclude(pk__in=contactos_calificados_ids)
         else:
-            contactos = campana.bd_contacto.contactos.exclude(pk__in=contactos_calificados_ids)
+            contactos = campana.bd_contacto.contactos.all()
 
-        return contactos
+        return campana.obtener_contactos_no_calificados(contactos)
+
+    def _obtener_total_contactos(self, bd_contacto):
+        """ Devuelve la cantidad de contactos de la base, cacheada unos minutos en Redis ya que
+            sólo se muestra como referencia """
+        clave = self.CLAVE_TOTAL_CONTACTOS.format(bd_contacto.pk)
+        try:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME, port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+            total_contactos = redis_connection.get(clave)
+            if total_contactos is None:
+                total_contactos = bd_contacto.contactos.count()
+                redis_connection.set(clave, total_contactos, ex=self.DURACION_TOTAL_CONTACTOS)
+            return int(total_contactos)
+        except RedisError:
+            return bd_contacto.contactos.count()
 
     def _procesar_contactos_salida(self, request, campana, contactos_filtrados):
-        total_contactos = campana.bd_contacto.contactos.count()
+        total_contactos = self._obtener_total_contactos(campana.bd_contacto)
         total_contactos_filtrados = contactos_filtrados.count()
         start = int(request.GET['start'])
         length = int(request.GET['length'])
         draw = int(request.GET['draw'])
-        data = [[pk, telefono, ''] for pk, telefono
-                in contactos_filtrados.values_list('pk', 'telefono')]
+        # La página se obtiene con LIMIT/OFFSET, sin traer el resto de los contactos
+        pagina = contactos_filtrados.order_by('pk').values_list('pk', 'telefono')[
+            start:start + length]
+        data = [[pk, telefono, ''] for pk, telefono in pagina]
         result_dict = {
             'draw': draw,
             'recordsTotal': total_contactos,
             'recordsFiltered': total_contactos_filtrados,
-            'data': data[start:start + length],
+            'data': data,
         }
         return result_dict
 
@@ -176,6 +199,30 @@ class API_ObtenerContactosCampanaView(APIView):
         return Response(result_dict)
 
 
+class API_BuscarContactosCampanaView(APIView):
+    """ Busca contactos de la base de datos de la campaña por teléfono o por sus datos,
+        ordenados por relevancia """
+    permission_classes = (TienePermisoOML, )
+    authentication_classes = (SessionAuthentication, ExpiringTokenAuthentication)
+    renderer_classes = (JSONRenderer, )
+
+    def get(self, request, *args, **kwargs):
+        campana = get_object_or_404(Campana, pk=kwargs.get('pk_campana'))
+        texto = request.GET.get('search', '')
+        if not texto.strip():
+            return Response(data={
+                'status': 'ERROR',
+                'message': _('Debe indicar el texto a buscar'),
+            })
+        contactos, completa = BuscadorDeContactos(campana.bd_contacto).buscar(texto)
+        return Response(data={
+            'status': 'OK',
+            'complete': completa,
+            'contacts': [{'id': contacto.pk, 'phone': contacto.telefono,
+                          'data': contacto.obtener_datos()} for contacto in contactos],
+        })
+
+
 class Click2CallView(APIView):
     """
         Vista para ejecutar un click2call desde un sistema externo
@@ -19,8 +19,6 @@
 
 from __future__ import unicode_literals
 
-import os
-
 from django.conf import settings
 from django_sendfile import sendfile
 from django.utils.translation import ugettext as _
@@ -30,9 +28,7 @@ from rest_framework.views import APIView
 from api_app.views.permissions import TienePermisoOML
 from api_app.authentication import ExpiringTokenAuthentication
 from rest_framework.response import Response
-import threading
-from ominicontacto_app.services.grabaciones.generacion_zip_grabaciones \
-    import GeneracionZipGrabaciones
+from ominicontacto_app.services.trabajos_segundo_plano import ColaDeTrabajos
 import json
 
 
@@ -54,12 +50,6 @@ class ObtenerArchivosGrabacionView(APIView):
     authentication_classes = (SessionAuthentication, ExpiringTokenAuthentication, )
     http_method_names = ['post']
 
-    def _generar_zip(self, listado_archivos, username, key_task):
-
-        zip_path = os.path.join(settings.SENDFILE_ROOT, 'zip')
-        zip_grabaciones = GeneracionZipGrabaciones(listado_archivos, zip_path, key_task, username)
-        zip_grabaciones.genera_zip()
-
     def post(self, request):
         params = request.POST
         supervisor_id = request.user.id
@@ -68,10 +58,8 @@ class ObtenerArchivosGrabacionView(APIView):
 
         key_task = 'OML:STATUS_DOWNLOAD:RECORDINGS:{0}:{1}'.format(supervisor_id, TASK_ID)
 
-        thread_zip = threading.Thread(
-            target=self._generar_zip, args=[listado_archivos, request.user.username, key_task])
-        thread_zip.setDaemon(True)
-        thread_zip.start()
+        ColaDeTrabajos().encolar('zip_grabaciones', key_task, listado_archivos=listado_archivos,
+                                 username=request.user.username)
 
         return Response(data={
             'status': 'OK',
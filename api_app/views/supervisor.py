@@ -21,9 +21,7 @@ from __future__ import unicode_literals
 
 import logging as _logging
 
-import datetime
 import json
-import threading
 
 import redis
 
@@ -47,11 +45,10 @@ from api_app.serializers import (CampanaSerializer, )
 from ominicontacto_app.models import (
     Campana, CalificacionCliente, AgenteProfile, AgendaContacto, AgenteEnContacto)
 from ominicontacto_app.services.asterisk.supervisor_activity import SupervisorActivityAmiManager
+from ominicontacto_app.services.trabajos_segundo_plano import ColaDeTrabajos
 from reportes_app.reportes.reporte_llamadas_supervision import (
     ReporteDeLLamadasEntrantesDeSupervision, )
 from reportes_app.reportes.reporte_llamadas import ReporteTipoDeLlamadasDeCampana
-from reportes_app.reportes.reporte_llamados_contactados_csv import (
-    ExportacionCampanaCSV, ReporteCalificadosCSV, ReporteContactadosCSV, ReporteNoAtendidosCSV)
 from reportes_app.reportes.reporte_llamadas_salientes import ReporteLlamadasSalienteFamily
 from ominicontacto_app.utiles import datetime_hora_minima_dia, convert_fecha_datetime
 
@@ -100,10 +97,11 @@ class AgentesStatusAPIView(APIView):
         online = []
         agentes_parseados = SupervisorActivityAmiManager()
         agentes_dict = self._obtener_ids_agentes_propios(request)
-        for data_agente in agentes_parseados.obtener_agentes_activos():
+        # Sólo se consultan en Redis los agentes del supervisor
+        for data_agente in agentes_parseados.obtener_agentes_activos(agentes_dict.keys()):
             id_agente = int(data_agente.get('id', -1))
             status_agente = data_agente.get('status', '')
-            if status_agente != 'OFFLINE' and str(id_agente) in agentes_dict:
+            if status_agente != 'OFFLINE':
                 agente_dict = agentes_dict.get(str(id_agente), '')
                 grupo_activo = agente_dict.get('grupo', '')
                 campanas_activas = agente_dict.get('campana', [])
@@ -335,6 +333,13 @@ class CalificacionesDeCampanaView(View):
 
 
 class ExportarCSVMixin:
+    permission_classes = (TienePermisoOML, )
+    renderer_classes = (JSONRenderer, )
+    http_method_names = ['post', ]
+
+    tipo_reporte = None
+    descripcion_tipo = None
+    prefijo_key_task = None
 
     def loguear_inicio_exportacion(
             self, tipo, campana_id, supervisor_nombre, fecha_hasta, fecha_desde):
@@ -344,19 +349,8 @@ class ExportarCSVMixin:
             "Date filter: from {0} to {1}".format(fecha_hasta, fecha_desde)
         logger.info(cadena_inicio_exportacion_info)
 
-
-class ExportarCSVContactados(ExportarCSVMixin, APIView):
-    permission_classes = (TienePermisoOML, )
-    renderer_classes = (JSONRenderer, )
-    http_method_names = ['post', ]
-
-    def generar_csv_contactados(self, key_task, campana, desde, hasta):
-
-        reporte_contactados_csv = ReporteContactadosCSV(
-            campana, key_task, desde, hasta)
-        datos_contactados = reporte_contactados_csv.datos
-        service_csv = ExportacionCampanaCSV()
-        service_csv.exportar_reportes_csv(campana, datos_contactados=datos_contactados)
+    def get_mensaje_en_proceso(self):
+        raise NotImplementedError()
 
     def post(self, request):
         campana_id = request.data.get('campana_id')
@@ -365,125 +359,52 @@ class ExportarCSVContactados(ExportarCSVMixin, APIView):
         hasta = request.data.get('hasta')
         fecha_desde = convert_fecha_datetime(desde)
         fecha_hasta = convert_fecha_datetime(hasta)
-        fecha_desde = datetime.datetime.combine(fecha_desde, datetime.time.min)
-        fecha_hasta = datetime.datetime.combine(fecha_hasta, datetime.time.max)
         campana = Campana.objects.get(pk=campana_id)
 
-        # generar id para la operacion de acuerdo a (timestamp, campana, supervisor)
-        # obtener de request
-
-        key_task = 'OML:STATUS_CSV_REPORT:CONTACTED:{0}:{1}'.format(campana_id, task_id)
+        key_task = '{0}:{1}:{2}'.format(self.prefijo_key_task, campana.pk, task_id)
         # chequear si el supervisor esta asignado a la campaña
-        # chequear si la campaña existe
 
-        thread_exportacion = threading.Thread(
-            target=self.generar_csv_contactados, args=[key_task, campana, fecha_desde, fecha_hasta])
-        thread_exportacion.setDaemon(True)
-        thread_exportacion.start()
+        # El reporte se genera en el pool de trabajos en segundo plano
+        ColaDeTrabajos().encolar(
+            'exportar_csv_campana', key_task, tipo_reporte=self.tipo_reporte,
+            campana_id=campana.pk, desde=desde, hasta=hasta)
 
         self.loguear_inicio_exportacion(
-            'contactados', campana_id, request.user.username, fecha_hasta.strftime("%m/%d/%Y"),
-            fecha_desde.strftime("%m/%d/%Y"))
+            self.descripcion_tipo, campana_id, request.user.username,
+            fecha_hasta.strftime("%m/%d/%Y"), fecha_desde.strftime("%m/%d/%Y"))
 
         return Response(data={
             'status': 'OK',
-            'msg': _('Exportación de contactados a .csv en proceso'),
+            'msg': self.get_mensaje_en_proceso(),
             'id': task_id,
         })
 
 
-class ExportarCSVCalificados(ExportarCSVMixin, APIView):
-    permission_classes = (TienePermisoOML, )
-    renderer_classes = (JSONRenderer, )
-    http_method_names = ['post', ]
-
-    def generar_csv_calificados(self, key_task, campana, desde, hasta):
-
-        reporte_calificados_csv = ReporteCalificadosCSV(
-            campana, key_task, desde, hasta)
-        datos_calificados = reporte_calificados_csv.datos
-        service_csv = ExportacionCampanaCSV()
-        service_csv.exportar_reportes_csv(campana, datos_calificados=datos_calificados)
-
-    def post(self, request):
-        campana_id = request.data.get('campana_id')
-        task_id = request.data.get('task_id')
-        desde = request.data.get('desde')
-        hasta = request.data.get('hasta')
-        fecha_desde = convert_fecha_datetime(desde)
-        fecha_hasta = convert_fecha_datetime(hasta)
-        fecha_desde = datetime.datetime.combine(fecha_desde, datetime.time.min)
-        fecha_hasta = datetime.datetime.combine(fecha_hasta, datetime.time.max)
-        campana = Campana.objects.get(pk=campana_id)
-        # generar id para la operacion de acuerdo a (timestamp, campana, supervisor)
-        # obtener de request
-
-        key_task = 'OML:STATUS_CSV_REPORT:DISPOSITIONED:{0}:{1}'.format(campana_id, task_id)
+class ExportarCSVContactados(ExportarCSVMixin, APIView):
+    tipo_reporte = 'contactados'
+    descripcion_tipo = 'contactados'
+    prefijo_key_task = 'OML:STATUS_CSV_REPORT:CONTACTED'
 
-        # chequear si el supervisor esta asignado a la campaña
-        # chequear si la campaña existe
+    def get_mensaje_en_proceso(self):
+        return _('Exportación de contactados a .csv en proceso')
 
-        thread_exportacion = threading.Thread(
-            target=self.generar_csv_calificados, args=[key_task, campana, fecha_desde, fecha_hasta])
-        thread_exportacion.setDaemon(True)
-        thread_exportacion.start()
 
-        self.loguear_inicio_exportacion(
-            'calificados', campana_id, request.user.username, fecha_hasta.strftime("%m/%d/%Y"),
-            fecha_desde.strftime("%m/%d/%Y"))
+class ExportarCSVCalificados(ExportarCSVMixin, APIView):
+    tipo_reporte = 'calificados'
+    descripcion_tipo = 'calificados'
+    prefijo_key_task = 'OML:STATUS_CSV_REPORT:DISPOSITIONED'
 
-        return Response(data={
-            'status': 'OK',
-            'msg': _('Exportación de calificados a .csv en proceso'),
-            'id': task_id,
-        })
+    def get_mensaje_en_proceso(self):
+        return _('Exportación de calificados a .csv en proceso')
 
 
 class ExportarCSVNoAtendidos(ExportarCSVMixin, APIView):
-    permission_classes = (TienePermisoOML, )
-    renderer_classes = (JSONRenderer, )
-    http_method_names = ['post', ]
-
-    def generar_csv_no_atendidos(self, key_task, campana, desde, hasta):
+    tipo_reporte = 'no_atendidos'
+    descripcion_tipo = 'no atendidos'
+    prefijo_key_task = 'OML:STATUS_CSV_REPORT:NOT_ATTENDED'
 
-        reporte_no_atendidos_csv = ReporteNoAtendidosCSV(
-            campana, key_task, desde, hasta)
-        datos_no_atendidos = reporte_no_atendidos_csv.datos
-        service_csv = ExportacionCampanaCSV()
-        service_csv.exportar_reportes_csv(campana, datos_no_atendidos=datos_no_atendidos)
-
-    def post(self, request):
-        campana_id = request.data.get('campana_id')
-        task_id = request.data.get('task_id')
-        desde = request.data.get('desde')
-        hasta = request.data.get('hasta')
-        fecha_desde = convert_fecha_datetime(desde)
-        fecha_hasta = convert_fecha_datetime(hasta)
-        fecha_desde = datetime.datetime.combine(fecha_desde, datetime.time.min)
-        fecha_hasta = datetime.datetime.combine(fecha_hasta, datetime.time.max)
-        campana = Campana.objects.get(pk=campana_id)
-        # generar id para la operacion de acuerdo a (timestamp, campana, supervisor)
-        # obtener de request
-
-        key_task = 'OML:STATUS_CSV_REPORT:NOT_ATTENDED:{0}:{1}'.format(campana_id, task_id)
-
-        # chequear si el supervisor esta asignado a la campaña
-        # chequear si la campaña existe
-
-        thread_exportacion = threading.Thread(
-            target=self.generar_csv_no_atendidos,
-            args=[key_task, campana, fecha_desde, fecha_hasta])
-        thread_exportacion.setDaemon(True)
-        thread_exportacion.start()
-        self.loguear_inicio_exportacion(
-            'no atendidos', campana_id, request.user.username, fecha_hasta.strftime("%m/%d/%Y"),
-            fecha_desde.strftime("%m/%d/%Y"))
-
-        return Response(data={
-            'status': 'OK',
-            'msg': _('Exportación de no atendidos a .csv en proceso'),
-            'id': task_id,
-        })
+    def get_mensaje_en_proceso(self):
+        return _('Exportación de no atendidos a .csv en proceso')
 
 
 class ContactosAsignadosCampanaPreviewView(APIView):
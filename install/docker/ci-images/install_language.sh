@@ -1,2 +1,3 @@
 #!/bin/bash
 PGUSER=$POSTGRES_USER psql -d template1 -c "CREATE EXTENSION plperl"
+PGUSER=$POSTGRES_USER psql -d template1 -c "CREATE EXTENSION IF NOT EXISTS pg_trgm"
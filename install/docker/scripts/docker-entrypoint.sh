@@ -34,10 +34,12 @@ if [ "$1" = "" ]; then
   cat > /var/spool/cron/crontabs/omnileads << EOF
 SHELL=/bin/bash
 0 1 * * * ${INSTALL_PREFIX}bin/conversor.sh 1 0  >> ${INSTALL_PREFIX}log/conversor.log
+10 * * * * source /etc/profile.d/omnileads_envars.sh; $COMMAND consolidar_resumen_diario_llamadas
 EOF
   fi
   printenv > /etc/profile.d/omnileads_envars.sh
 
+  psql -U $PGUSER -h $PGHOST -d $PGDATABASE -c "CREATE EXTENSION IF NOT EXISTS pg_trgm;" 2>&1
   $COMMAND migrate --noinput
   $COMMAND createsuperuser --noinput --username=admin --email=admin@example.com || true
   $COMMAND populate_history
@@ -59,6 +61,7 @@ EOF
   chown -R $OMNIAPP_USER. ${INSTALL_PREFIX} /var/spool/cron/crontabs/omnileads
   Init
 else
+  psql -U $PGUSER -h $PGHOST -d $PGDATABASE -c "CREATE EXTENSION IF NOT EXISTS pg_trgm;" 2>&1
   $COMMAND migrate --noinput
   $COMMAND compilemessages
   echo 'yes' | $COMMAND collectstatic
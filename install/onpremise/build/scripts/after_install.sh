@@ -12,6 +12,8 @@ if [ -f /etc/profile.d/omnileads_envars.sh ]; then
   rm -rf ${STATIC_PATH}/CACHE/manifest.json
   echo "Execute reinstall_addons.sh script"
   ${INSTALL_PREFIX}/bin/reinstall_addons.sh
+  echo "Create pg_trgm extension"
+  psql -c "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
   echo " Execute django commands"
   sudo -u omnileads bash -c "$MANAGE_SCRIPT migrate --noinput"
   echo "Create admin superuser"
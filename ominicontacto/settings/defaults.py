@@ -196,6 +196,25 @@ OL_NRO_TELEFONO_LARGO_MAX = 15
 OL_MAX_CANTIDAD_CONTACTOS = 60000
 """Límite de contactos que pueden ser importados a la base de datos."""
 
+OL_TAMANO_LOTE_IMPORTACION_CONTACTOS = 5000
+"""Cantidad de contactos que se insertan por lote al importar una base de datos."""
+
+OL_TAMANO_LOTE_REPORTES_CSV = 2000
+"""Cantidad de logs de llamadas que se leen por lote al generar los reportes CSV de campaña."""
+
+OL_DESPACHADOR_PREVIEW_REDIS = False
+"""Entregar los contactos de campañas preview desde Redis (ver
+ominicontacto_app.services.redis.despachador_preview). Requiere que el comando
+persistir_entregas_preview esté en ejecución."""
+
+OL_AMI_POOL_CONEXIONES = 4
+"""Cantidad máxima de conexiones AMI ociosas que cada proceso mantiene abiertas para
+reutilizarlas entre requests (ver ominicontacto_app.services.asterisk.asterisk_ami)."""
+
+OL_AMI_TIMEOUT_RESPUESTA = 10
+"""Segundos que una conexión AMI espera la respuesta de Asterisk a una acción antes de
+considerarla fallida y descartar la conexión."""
+
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 OML_DUMP_HTTP_AMI_RESPONSES = False
@@ -293,6 +312,15 @@ Ejemplo: `.wav` (con el . incluido):  el archivo `<OUTPUT_FILE>`
 tendra la extension `.wav`
 """
 
+OML_AUDIO_CONVERSOR_PROCESOS = 4
+"""Cantidad máxima de conversiones de audio (procesos de `TMPL_OML_AUDIO_CONVERSOR`) que cada
+proceso ejecuta en paralelo (ver ominicontacto_app.services.audio_conversor)."""
+
+OML_AUDIO_CACHE_CONVERSIONES = None
+"""Directorio donde se guardan los audios ya convertidos, indexados por el contenido del
+archivo original y el comando de conversión. Si es None se usa `cache_audios_asterisk`
+dentro de MEDIA_ROOT."""
+
 OML_AUDIO_PATH_ASTERISK = None
 """Directory donde se guardan los audios de asterisk en el server de asterisk
 
@@ -337,6 +365,22 @@ Ejemplo:
 OML_WOMBAT_TIMEOUT es el tiempo de timeout de la request hacia Wombat API
 """
 
+OML_WOMBAT_TIMEOUT_CONEXION = 5
+"""Segundos de espera para establecer la conexión con la API de Wombat."""
+
+OML_WOMBAT_REINTENTOS = 2
+"""Reintentos ante errores de conexión con la API de Wombat (los requests ya enviados no se
+reintentan)."""
+
+OML_WOMBAT_CONEXIONES = 10
+"""Cantidad máxima de conexiones keep-alive hacia Wombat que cada proceso mantiene abiertas
+(ver ominicontacto_app.services.wombat_service)."""
+
+OML_WOMBAT_INTERVALO_SNAPSHOT = 5
+"""Segundos durante los que se reutiliza la respuesta de los endpoints 'live' de Wombat
+(corridas, llamadas en curso y estadísticas) antes de volver a descargarla
+(ver ominicontacto_app.services.wombat_snapshot)."""
+
 CALIFICACION_REAGENDA = None
 
 # configuración de Django Rest Framework
@@ -19,6 +19,7 @@
 from __future__ import unicode_literals
 
 import logging
+import time
 
 from django.core.management.base import BaseCommand
 from django.utils.translation import ugettext as _
@@ -45,11 +46,13 @@ class Command(BaseCommand):
         Los contactos liberados podrán ser asignados a nuevos agentes para la finalización de
         su gestión
         """
+        inicio = time.monotonic()
         liberados = AgenteEnContacto.liberar_contactos_por_tiempo()
+        duracion = time.monotonic() - inicio
 
         logger.info(
-            _("Actualizando {0} asignaciones de contactos a agentes en campañas preview".format(
-                liberados)))
+            _("Actualizando {0} asignaciones de contactos a agentes en campañas preview "
+              "en {1:.3f} segundos".format(liberados, duracion)))
 
     def handle(self, *args, **options):
         try:
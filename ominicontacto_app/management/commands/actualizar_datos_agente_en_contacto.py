@@ -76,6 +76,7 @@ class Command(BaseCommand):
                 modificados += 1
             else:
                 creados += 1
+        AgenteEnContacto.invalidar_despachador(campana.id)
 
         msg = _('Actualizando {0}  y creando {1} AgentesEnContacto para la campana con id:'
                 ' {2}').format(modificados, creados, campaign_id)
@@ -24,7 +24,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import Group
 from ominicontacto_app.errors import OmlError
 from ominicontacto_app.models import User
-from ominicontacto_app.permisos import PermisoOML, DESCRIPCIONES
+from ominicontacto_app.permisos import PermisoOML, DESCRIPCIONES, cache_permisos_oml
 
 
 class Command(BaseCommand):
@@ -53,6 +53,7 @@ class Command(BaseCommand):
         # Se persisten así al final los permisos para cada grupo para que sea más rápido que
         # persistir los grupos de cada permiso por cada permiso gestionado.
         gestor_de_permisos.persistir_permisos()
+        cache_permisos_oml.invalidar()
 
         # TODO: Discutir
         # Borrar permisos viejos que ya no están en nombres_de_permisos.
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max, Min
+
+from ominicontacto_app.models import AgenteEnContacto, Contacto
+
+
+class Command(BaseCommand):
+    """
+    Completa las columnas JSONB Contacto.datos_por_campo y
+    AgenteEnContacto.datos_contacto_por_campo de las filas anteriores a los triggers que las
+    mantienen. Reescribe la columna de texto por rangos de id, en transacciones cortas, para
+    que los triggers recalculen la columna JSONB sin bloquear la tabla.
+    """
+
+    help = 'Completa los datos de contactos por nombre de columna (JSONB) en lotes'
+
+    TAMANO_LOTE = 5000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=self.TAMANO_LOTE,
+                            help='Cantidad de ids a procesar por transacción')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos de espera entre lotes')
+        parser.add_argument('--base', type=int,
+                            help='Recalcula todos los contactos de la base indicada (por ejemplo '
+                                 'si cambiaron los nombres de sus columnas)')
+
+    def handle(self, *args, **options):
+        self.lote = options['lote']
+        self.pausa = options['pausa']
+        if options['base'] is not None:
+            self._completar(Contacto.objects.filter(bd_contacto_id=options['base']), 'datos')
+            return
+        self._completar(Contacto.objects.filter(datos_por_campo__isnull=True), 'datos')
+        self._completar(AgenteEnContacto.objects.filter(
+            datos_contacto_por_campo__isnull=True), 'datos_contacto')
+
+    def _completar(self, queryset, campo):
+        nombre_modelo = queryset.model.__name__
+        rango = queryset.aggregate(Min('id'), Max('id'))
+        if rango['id__min'] is None:
+            return
+        ultimo_id = rango['id__max']
+        actualizados = 0
+        desde = rango['id__min'] - 1
+        while desde < ultimo_id:
+            hasta = desde + self.lote
+            # El trigger recalcula la columna JSONB cuando se escribe la columna de texto
+            actualizados += queryset.filter(id__gt=desde, id__lte=hasta).update(
+                **{campo: F(campo)})
+            self.stdout.write('{0}: {1} filas actualizadas (id <= {2})'.format(
+                nombre_modelo, actualizados, hasta))
+            desde = hasta
+            if self.pausa:
+                time.sleep(self.pausa)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.translation import ugettext as _
+
+from ominicontacto_app.services.trabajos_segundo_plano import (
+    ColaDeTrabajos, TrabajadorSegundoPlano)
+
+logger = logging.getLogger(__name__)
+
+
+def _ejecutar_trabajador():
+    trabajador = TrabajadorSegundoPlano()
+
+    def detener(signum, frame):
+        trabajador.detenido = True
+
+    signal.signal(signal.SIGTERM, detener)
+    trabajador.ejecutar()
+
+
+class Command(BaseCommand):
+    """
+    Inicia el pool de procesos que ejecuta los trabajos en segundo plano (exportaciones
+    de reportes CSV, generación de zips de grabaciones). Se ejecuta como daemon
+    adjunto al master de uwsgi, por lo que sobrevive al reciclado de sus workers.
+    """
+
+    help = 'Ejecuta los trabajos encolados en segundo plano'
+
+    INTERVALO_SUPERVISION = 5
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=2,
+                            help='Cantidad de procesos trabajadores')
+
+    def _iniciar_proceso(self):
+        proceso = multiprocessing.Process(target=_ejecutar_trabajador)
+        proceso.start()
+        return proceso
+
+    def handle(self, *args, **options):
+        self.detenido = False
+
+        def detener(signum, frame):
+            self.detenido = True
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        # Los procesos hijos deben abrir sus propias conexiones a la base de datos
+        connections.close_all()
+        cola = ColaDeTrabajos()
+        procesos = [self._iniciar_proceso() for i in range(options['procesos'])]
+        logger.info(_('Iniciados {0} procesos de trabajos en segundo plano'.format(
+            len(procesos))))
+
+        while not self.detenido:
+            recuperados = cola.recuperar_trabajos_abandonados()
+            if recuperados:
+                logger.warning(_('Se reencolaron {0} trabajos abandonados'.format(recuperados)))
+            for i, proceso in enumerate(procesos):
+                if not proceso.is_alive():
+                    logger.warning(_('Reiniciando proceso de trabajos {0}'.format(proceso.pid)))
+                    procesos[i] = self._iniciar_proceso()
+            time.sleep(self.INTERVALO_SUPERVISION)
+
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.join()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import logging
+import signal
+import time
+
+from asterisk.manager import Manager, ManagerException
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext as _
+from redis.exceptions import RedisError
+
+from ominicontacto_app.services.asterisk.estado_colas import (
+    EstadoColasAsterisk, parsear_eventos_ami, formatear_evento_ami)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Mantiene en Redis las llamadas en espera de cada cola y los agentes Unavailable a partir
+    de los eventos AMI de Asterisk (ver ominicontacto_app.services.asterisk.estado_colas).
+    Se ejecuta como daemon adjunto al master de uwsgi.
+    Con --reproducir aplica los eventos de un archivo grabado con --grabar, sin conectarse a
+    Asterisk.
+    """
+
+    help = 'Mantiene en Redis el estado de las colas de Asterisk a partir de eventos AMI'
+
+    INTERVALO_VIGENCIA = 30
+    INTERVALO_RESINCRONIZACION = 600
+    ESPERA_ERROR = 5
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grabar', help=_('Archivo donde agregar los eventos recibidos'))
+        parser.add_argument('--reproducir', help=_('Archivo de eventos a aplicar'))
+
+    def handle(self, *args, **options):
+        estado = EstadoColasAsterisk()
+        if options['reproducir']:
+            with open(options['reproducir']) as archivo:
+                eventos = parsear_eventos_ami(archivo.read())
+            aplicados = sum(1 for headers in eventos if estado.procesar_evento(headers))
+            self.stdout.write(_('Eventos aplicados: {0} de {1}').format(aplicados, len(eventos)))
+            return
+
+        self.detenido = False
+
+        def detener(signum, frame):
+            self.detenido = True
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        self.grabacion = open(options['grabar'], 'a') if options['grabar'] else None
+        try:
+            while not self.detenido:
+                try:
+                    self._escuchar(estado)
+                except (ManagerException, RedisError) as e:
+                    logger.error(_('Error al escuchar los eventos de colas: {0}'.format(e)))
+                if not self.detenido:
+                    time.sleep(self.ESPERA_ERROR)
+        finally:
+            if self.grabacion is not None:
+                self.grabacion.close()
+
+    def _escuchar(self, estado):
+        manager = Manager()
+        try:
+            manager.connect(str(settings.ASTERISK_HOSTNAME))
+            manager.login(settings.ASTERISK['AMI_USERNAME'], settings.ASTERISK['AMI_PASSWORD'])
+            # Los eventos de colas son de la clase 'agent'
+            manager.send_action({'Action': 'Events', 'EventMask': 'agent'})
+            manager.register_event('*', lambda evento, manager: self._procesar(estado, evento))
+            ultima_resincronizacion = ultima_vigencia = 0
+            while not self.detenido and manager.connected():
+                if time.monotonic() - ultima_resincronizacion >= self.INTERVALO_RESINCRONIZACION:
+                    respuesta = manager.send_action({'Action': 'QueueStatus'})
+                    estado.reemplazar(parsear_eventos_ami(respuesta.data))
+                    ultima_resincronizacion = ultima_vigencia = time.monotonic()
+                elif time.monotonic() - ultima_vigencia >= self.INTERVALO_VIGENCIA:
+                    estado.marcar_vigente()
+                    ultima_vigencia = time.monotonic()
+                time.sleep(1)
+        finally:
+            manager.close()
+            # Mientras no se reciban eventos los lectores consultan a Asterisk
+            estado.marcar_no_vigente()
+
+    def _procesar(self, estado, evento):
+        # Corre en el thread de eventos del Manager: un error no debe cortarlo
+        try:
+            estado.procesar_evento(evento.headers)
+        except RedisError as e:
+            logger.error(_('Error al procesar el evento {0}: {1}'.format(evento.name, e)))
+        if self.grabacion is not None:
+            self.grabacion.write(formatear_evento_ami(evento.headers))
+            self.grabacion.flush()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import logging
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils.translation import ugettext as _
+from redis.exceptions import RedisError
+
+from ominicontacto_app.models import AgenteEnContacto
+from ominicontacto_app.services.redis.despachador_preview import DespachadorContactosPreview
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Aplica en la base de datos las entregas y liberaciones de contactos de campañas preview
+    realizadas por el despachador de Redis (OL_DESPACHADOR_PREVIEW_REDIS). Se ejecuta como
+    daemon adjunto al master de uwsgi. Debe existir un único proceso, ya que los cambios
+    se aplican en el orden en que fueron encolados.
+    """
+
+    help = 'Persiste las entregas de contactos preview realizadas desde Redis'
+
+    TAMANO_LOTE = 500
+    ESPERA_ERROR = 5
+
+    def handle(self, *args, **options):
+        self.detenido = False
+
+        def detener(signum, frame):
+            self.detenido = True
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        despachador = DespachadorContactosPreview()
+        while not self.detenido:
+            try:
+                self._persistir_lote(despachador)
+            except (RedisError, InterfaceError, OperationalError) as e:
+                logger.error(_('Error al persistir las entregas de contactos preview: {0}'.format(
+                    e)))
+                time.sleep(self.ESPERA_ERROR)
+
+    def _persistir_lote(self, despachador):
+        pendientes = despachador.obtener_pendientes(self.TAMANO_LOTE)
+        if not pendientes:
+            return
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                AgenteEnContacto.persistir_entregas(pendientes)
+        except (InterfaceError, OperationalError):
+            raise
+        except Exception:
+            # Se aplican de a uno para aislar los cambios que no pueden persistirse
+            for pendiente in pendientes:
+                self._persistir_pendiente(despachador, pendiente)
+        else:
+            despachador.descartar_pendientes(len(pendientes))
+
+    def _persistir_pendiente(self, despachador, pendiente):
+        try:
+            with transaction.atomic():
+                AgenteEnContacto.persistir_entregas([pendiente])
+        except (InterfaceError, OperationalError):
+            raise
+        except Exception as e:
+            logger.exception(_('No se pudo persistir la entrega de contacto preview {0}: {1}'
+                               .format(pendiente, e)))
+            despachador.mover_pendiente_a_fallidos()
+        else:
+            despachador.descartar_pendientes(1)
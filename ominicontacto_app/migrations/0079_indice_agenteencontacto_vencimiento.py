@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ominicontacto_app', '0078_adiciona_acceso_grabaciones_agente_grupo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agenteencontacto',
+            index=models.Index(fields=['campana_id', 'estado', 'modificado'],
+                               name='ominicontac_campana_65afb2_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.7 on 2026-10-18 16:02
+
+import json
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def calcular_desactivados(apps, schema_editor):
+    Campana = apps.get_model('ominicontacto_app', 'Campana')
+    AgenteEnContacto = apps.get_model('ominicontacto_app', 'AgenteEnContacto')
+    campanas = Campana.objects.exclude(campo_desactivacion__isnull=True).exclude(
+        campo_desactivacion='').values_list('id', 'campo_desactivacion')
+    for campana_id, campo_desactivacion in campanas:
+        # "campo": "FALSE" o "campo": "0", sin llaves
+        desactivacion_booleana = json.dumps({campo_desactivacion: "FALSE"})[1:-1]
+        desactivacion_numerica = json.dumps({campo_desactivacion: "0"})[1:-1]
+        AgenteEnContacto.objects.filter(campana_id=campana_id).filter(
+            Q(datos_contacto__contains=desactivacion_booleana) |
+            Q(datos_contacto__contains=desactivacion_numerica)).update(desactivado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ominicontacto_app', '0079_indice_agenteencontacto_vencimiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agenteencontacto',
+            name='desactivado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='agenteencontacto',
+            index=models.Index(fields=['campana_id', 'desactivado', 'estado', 'orden'],
+                               name='ominicontac_campana_d70a1f_idx'),
+        ),
+        migrations.RunPython(calcular_desactivados, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.7 on 2026-10-18 18:40
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción.
+    # La extensión pg_trgm la crean los scripts de instalación.
+    atomic = False
+
+    dependencies = [
+        ('ominicontacto_app', '0080_agenteencontacto_desactivado'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS contacto_telefono_trgm "
+                    "ON ominicontacto_app_contacto USING gin (telefono gin_trgm_ops)",
+                    reverse_sql="DROP INDEX IF EXISTS contacto_telefono_trgm",
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='contacto',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['telefono'], name='contacto_telefono_trgm',
+                        opclasses=['gin_trgm_ops']),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.7 on 2026-10-18 19:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('ominicontacto_app', '0081_contacto_indices_trigramas'),
+    ]
+
+    operations = [
+        # Búsquedas con datos__icontains (UPPER(datos) LIKE UPPER('%...%'))
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS contacto_datos_upper_trgm "
+            "ON ominicontacto_app_contacto USING gin (UPPER(datos) gin_trgm_ops)",
+            reverse_sql="DROP INDEX IF EXISTS contacto_datos_upper_trgm",
+        ),
+        # Identificación por caller id (ver ContactoManager.contactos_by_telefono_normalizado)
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS contacto_telefono_normalizado "
+            "ON ominicontacto_app_contacto "
+            "(bd_contacto_id, REGEXP_REPLACE(telefono, '[^0-9]', '', 'g'))",
+            reverse_sql="DROP INDEX IF EXISTS contacto_telefono_normalizado",
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.7 on 2026-10-18 20:10
+
+import os
+
+import django.contrib.postgres.fields.jsonb
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+def crear_triggers(apps, schema_editor):
+    sql_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'sql', 'plpgsql', 'datos_por_campo.sql')
+    with open(sql_file_path, 'r', encoding='utf-8') as sql_file:
+        schema_editor.execute(sql_file.read())
+
+
+def borrar_triggers(apps, schema_editor):
+    schema_editor.execute(
+        'DROP TRIGGER IF EXISTS contacto_datos_por_campo ON ominicontacto_app_contacto;'
+        'DROP FUNCTION IF EXISTS contacto_datos_por_campo();'
+        'DROP TRIGGER IF EXISTS agenteencontacto_datos_por_campo '
+        'ON ominicontacto_app_agenteencontacto;'
+        'DROP FUNCTION IF EXISTS agenteencontacto_datos_por_campo();')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ominicontacto_app', '0082_contacto_indices_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contacto',
+            name='datos_por_campo',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='agenteencontacto',
+            name='datos_contacto_por_campo',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contacto',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['datos_por_campo'], name='contacto_datos_campo_gin',
+                opclasses=['jsonb_path_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='agenteencontacto',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['datos_contacto_por_campo'], name='aec_datos_campo_gin',
+                opclasses=['jsonb_path_ops']),
+        ),
+        # Las filas existentes se completan con el comando completar_datos_por_campo
+        migrations.RunPython(crear_triggers, reverse_code=borrar_triggers),
+    ]
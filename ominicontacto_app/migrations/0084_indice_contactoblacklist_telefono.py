@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ominicontacto_app', '0083_datos_por_campo_jsonb'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactoblacklist',
+            index=models.Index(fields=['black_list', 'telefono'],
+                               name='ominicontac_black_l_d297e2_idx'),
+        ),
+    ]
@@ -24,25 +24,33 @@ import logging
 import os
 import random
 import re
+import threading
 import uuid
 
 
 from ast import literal_eval
+from collections import OrderedDict
+from datetime import datetime
+from types import MappingProxyType
 
-from django.contrib.auth.models import AbstractUser, _user_has_perm
+from redis.exceptions import RedisError
+
+from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.sessions.models import Session
 from django.db import (models,
-                       # connection
+                       connection,
                        )
 
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count, Sum, Case, When, Value, Func
 from django.db.utils import DatabaseError
 from django.conf import settings
 from django.core.exceptions import ValidationError, SuspiciousOperation, ObjectDoesNotExist
 from django.core.validators import RegexValidator
 from django.forms.models import model_to_dict
 from django.utils.translation import ugettext_lazy as _
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import now, timedelta, utc
 
 from django_extensions.db.models import TimeStampedModel
 
@@ -52,7 +60,8 @@ from simple_history.utils import update_change_reason
 from ominicontacto_app.utiles import (
     ValidadorDeNombreDeCampoExtra, fecha_local, datetime_hora_maxima_dia,
     datetime_hora_minima_dia, remplace_espacio_por_guion, dividir_lista)
-from ominicontacto_app.permisos import PermisoOML
+from ominicontacto_app.permisos import PermisoOML, cache_permisos_oml
+from ominicontacto_app.services.redis.despachador_preview import DespachadorContactosPreview
 PermisoOML
 
 logger = logging.getLogger(__name__)
@@ -154,9 +163,10 @@ class User(AbstractUser):
         return False
 
     def tiene_permiso_oml(self, nombre_permiso):
-        if PermisoOML.objects.filter(codename=nombre_permiso).exists():
-            full_name = 'permiso_oml.{0}'.format(nombre_permiso)
-            return _user_has_perm(self, full_name, None)
+        if nombre_permiso in cache_permisos_oml.obtener_nombres_restringidos():
+            if not hasattr(self, '_permisos_oml'):
+                self._permisos_oml = cache_permisos_oml.obtener_permisos(self)
+            return nombre_permiso in self._permisos_oml
         # Si no existe el permiso la vista no esta restringida
         return True
 
@@ -1118,6 +1128,7 @@ class Campana(models.Model):
         if self.type == Campana.TYPE_PREVIEW:
             # eliminamos todos las entradas de AgenteEnContacto relativas a la campaña
             AgenteEnContacto.objects.filter(campana_id=self.pk).delete()
+            AgenteEnContacto.invalidar_despachador(self.pk)
         # assert self.estado == Campana.ESTADO_ACTIVA
         self.estado = Campana.ESTADO_BORRADA
         self.save()
@@ -1164,13 +1175,28 @@ class Campana(models.Model):
         self.estado = Campana.ESTADO_TEMPLATE_BORRADO
         self.save()
 
+    def actualizar_campo_desactivacion(self, campo_desactivacion):
+        """
+        Actualiza el campo de desactivación de la campaña preview y recalcula cuáles de sus
+        contactos están desactivados
+        """
+        if self.campo_desactivacion == campo_desactivacion:
+            return
+        self.campo_desactivacion = campo_desactivacion
+        self.save()
+        AgenteEnContacto.objects.actualizar_desactivacion(self)
+        AgenteEnContacto.invalidar_despachador(self.pk)
+
     def _crear_agente_en_contacto(self, contacto, agente_id, campos_contacto, estado, orden):
         datos_contacto = literal_eval(contacto.datos)
         datos_contacto = dict(zip(campos_contacto, datos_contacto))
         datos_contacto_json = json.dumps(datos_contacto)
+        desactivado = AgenteEnContacto.calcular_desactivado(
+            datos_contacto_json, self.campo_desactivacion)
         agente_en_contacto = AgenteEnContacto(
             agente_id=agente_id, contacto_id=contacto.pk, datos_contacto=datos_contacto_json,
-            telefono_contacto=contacto.telefono, campana_id=self.pk, estado=estado, orden=orden)
+            telefono_contacto=contacto.telefono, campana_id=self.pk, estado=estado, orden=orden,
+            desactivado=desactivado)
         return agente_en_contacto
 
     def establecer_valores_iniciales_agente_contacto(
@@ -1222,6 +1248,7 @@ class Campana(models.Model):
 
         # insertamos las instancias en la BD
         AgenteEnContacto.objects.bulk_create(agente_en_contacto_list)
+        AgenteEnContacto.invalidar_despachador(self.pk)
 
     def gestionar_finalizacion_relacion_agente_contacto(self, contacto_pk):
         """
@@ -1253,23 +1280,26 @@ class Campana(models.Model):
             estado=AgenteEnContacto.ESTADO_FINALIZADO).count()
         if n_contactos_campana == n_contactos_atendidos:
             contactos_campana.delete()
+            AgenteEnContacto.invalidar_despachador(self.pk)
             self.finalizar()
 
     def adicionar_agente_en_contacto(self, contacto, agente_id, es_originario=True):
         """Crea una nueva entrada para relacionar un agentes y un contacto
         nuevo a una campaña preview
         """
-        metadata = self.bd_contacto.get_metadata()
+        metadata = self.bd_contacto.get_metadata_compartida()
         campos_contacto = metadata.nombres_de_columnas_de_datos
         datos_contacto = literal_eval(contacto.datos)
         datos_contacto = dict(zip(campos_contacto, datos_contacto))
         datos_contacto_json = json.dumps(datos_contacto)
         orden = AgenteEnContacto.ultimo_id() + 1
-        AgenteEnContacto.objects.create(
+        agente_en_contacto = AgenteEnContacto.objects.create(
             agente_id=agente_id, contacto_id=contacto.pk, datos_contacto=datos_contacto_json,
             telefono_contacto=contacto.telefono, campana_id=self.pk,
             estado=AgenteEnContacto.ESTADO_INICIAL,
             es_originario=es_originario, orden=orden)
+        AgenteEnContacto._ejecutar_en_despachador(
+            'agregar', self.pk, agente_en_contacto.pk, contacto.pk, orden, agente_id)
 
     def get_queue_id_name(self):
         """ Devuelve un nombre único para identificar la queue en Asterisk/Wombat """
@@ -1298,12 +1328,20 @@ class Campana(models.Model):
             opcion_calificacion__campana_id=self.id,
             opcion_calificacion__tipo=OpcionCalificacion.AGENDA)
 
-    def obtener_contactos_no_calificados(self):
-        """Devuelve los contactos que no han sido calificados en la campaña"""
-        contactos_calificados_ids = list(self.obtener_calificaciones().values_list(
-            'contacto__pk', flat=True))
-        contactos = self.bd_contacto.contactos.exclude(pk__in=contactos_calificados_ids)
-        return contactos
+    def obtener_contactos_no_calificados(self, contactos=None):
+        """Devuelve los contactos (por defecto los de la base de la campaña) que no han sido
+        calificados en la campaña"""
+        if contactos is None:
+            contactos = self.bd_contacto.contactos.all()
+        # NOT EXISTS correlacionado, que PostgreSQL resuelve como anti-join
+        no_calificado = """
+        NOT EXISTS (SELECT 1 FROM {0} calificacion
+                    INNER JOIN {1} opcion ON opcion.id = calificacion.opcion_calificacion_id
+                    WHERE opcion.campana_id = %s AND calificacion.contacto_id = {2}.id)
+        """.format(connection.ops.quote_name(CalificacionCliente._meta.db_table),
+                   connection.ops.quote_name(OpcionCalificacion._meta.db_table),
+                   connection.ops.quote_name(Contacto._meta.db_table))
+        return contactos.extra(where=[no_calificado], params=[self.id])
 
     def update_basedatoscontactos(self, bd_nueva):
         """ Actualizar con nueva base datos de contacto"""
@@ -2105,7 +2143,7 @@ class MetadataBaseDatosContactoDTO(object):
 class MetadataBaseDatosContacto(MetadataBaseDatosContactoDTO):
     """Encapsula acceso a metadatos de BaseDatosContacto"""
 
-    def __init__(self, bd):
+    def __init__(self, bd, solo_lectura=False):
         super(MetadataBaseDatosContacto, self).__init__()
         self.bd = bd
         if bd.metadata is not None and bd.metadata != '':
@@ -2115,6 +2153,9 @@ class MetadataBaseDatosContacto(MetadataBaseDatosContactoDTO):
                 logger.exception(_("Error: {0} detectada al desserializar "
                                    "metadata de la bd {1}".format(e, bd.id)))
                 raise
+        if solo_lectura:
+            # Los setters fallan con TypeError: la instancia puede estar compartida
+            self._metadata = MappingProxyType(self._metadata)
 
     # -----
 
@@ -2134,6 +2175,44 @@ class MetadataBaseDatosContacto(MetadataBaseDatosContactoDTO):
             raise
 
 
+class CacheMetadataBaseDatosContacto(object):
+    """
+    Cache del proceso con la metadata de solo lectura de las bases de datos de contactos,
+    por id de la base y hash del texto de la metadata. Así los contactos de una misma base
+    comparten un único objeto aunque cada uno tenga su propia instancia de la base (por
+    ejemplo al cargarlos con select_related('bd_contacto')).
+    """
+
+    TAMANO_MAXIMO = 128
+
+    def __init__(self):
+        self._metadatas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, bd):
+        texto = bd.metadata or ''
+        clave = (bd.pk, hash(texto))
+        with self._lock:
+            cacheada = self._metadatas.get(clave)
+            if cacheada is not None and cacheada[0] == texto:
+                self._metadatas.move_to_end(clave)
+                return cacheada[1]
+        metadata = MetadataBaseDatosContacto(bd, solo_lectura=True)
+        with self._lock:
+            self._metadatas[clave] = (texto, metadata)
+            while len(self._metadatas) > self.TAMANO_MAXIMO:
+                self._metadatas.popitem(last=False)
+        return metadata
+
+    def invalidar(self, bd_id):
+        with self._lock:
+            for clave in [clave for clave in self._metadatas if clave[0] == bd_id]:
+                del self._metadatas[clave]
+
+
+cache_metadata_bd_contacto = CacheMetadataBaseDatosContacto()
+
+
 class BaseDatosContacto(models.Model):
     objects = BaseDatosContactoManager()
 
@@ -2195,9 +2274,22 @@ class BaseDatosContacto(models.Model):
         return "{0}: ({1} contactos)".format(self.nombre,
                                              self.cantidad_contactos)
 
+    def save(self, *args, **kwargs):
+        super(BaseDatosContacto, self).save(*args, **kwargs)
+        cache_metadata_bd_contacto.invalidar(self.pk)
+
     def get_metadata(self):
         return MetadataBaseDatosContacto(self)
 
+    def get_metadata_compartida(self):
+        """ Devuelve la metadata de solo lectura compartida por todas las instancias de la base
+            (ver CacheMetadataBaseDatosContacto). Para modificarla usar get_metadata() """
+        texto, metadata = getattr(self, '_metadata_compartida', (None, None))
+        if metadata is None or texto is not self.metadata:
+            metadata = cache_metadata_bd_contacto.obtener(self)
+            self._metadata_compartida = (self.metadata, metadata)
+        return metadata
+
     def define(self):
         """
         Este método se encara de llevar a cabo la definición del
@@ -2321,18 +2413,43 @@ class BaseDatosContacto(models.Model):
         """
         Este metodo se encarga de realizar la generación de contactos
         a partir de una lista de contactos.
+        La copia se hace con un único INSERT ... SELECT en la base de datos.
         Parametros:
-        - lista_contactos: lista de contactos.
+        - lista_contactos: queryset o lista de contactos.
         """
+        if isinstance(lista_contactos, models.QuerySet):
+            contactos = lista_contactos
+        else:
+            contactos = Contacto.objects.filter(pk__in=[c.pk for c in lista_contactos])
+        select, params = contactos.order_by().values_list(
+            'telefono', 'datos', 'id_externo').query.sql_with_params()
+        sql = """
+        INSERT INTO {0}
+            (telefono, datos, id_externo, bd_contacto_id, es_originario)
+        SELECT origen.telefono, origen.datos, origen.id_externo, %s, %s
+        FROM ({1}) origen
+        """.format(connection.ops.quote_name(Contacto._meta.db_table), select)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (self.pk, True) + tuple(params))
+            self.cantidad_contactos = cursor.rowcount
 
-        for contacto in lista_contactos:
-            Contacto.objects.create(
-                telefono=contacto.telefono,
-                datos=contacto.datos,
-                bd_contacto=self,
-                id_externo=contacto.id_externo,
-            )
-        self.cantidad_contactos = len(lista_contactos)
+
+def normalizar_telefono(telefono):
+    """ Deja sólo los dígitos del teléfono, para comparar números con distinto formato """
+    return re.sub(r'[^0-9]', '', telefono or '')
+
+
+def normalizar_texto_busqueda(texto):
+    """ Devuelve el texto como aparece dentro de Contacto.datos (JSON con los caracteres no
+        ASCII escapados) """
+    return json.dumps(texto)[1:-1]
+
+
+class TelefonoNormalizado(Func):
+    """ Misma expresión que la del índice contacto_telefono_normalizado """
+    function = 'REGEXP_REPLACE'
+    template = "%(function)s(%(expressions)s, '[^0-9]', '', 'g')"
+    output_field = models.CharField()
 
 
 class ContactoManager(models.Manager):
@@ -2347,12 +2464,28 @@ class ContactoManager(models.Manager):
     def contactos_by_filtro_bd_contacto(self, bd_contacto, filtro):
         """ Busqueda en todos los campos relevantes """
         try:
-            contactos = self.filter(Q(telefono__contains=filtro) | Q(datos__contains=filtro))
+            # datos__icontains compara UPPER(datos), que tiene índice de trigramas
+            contactos = self.filter(Q(telefono__contains=filtro) |
+                                    Q(datos__icontains=normalizar_texto_busqueda(filtro)))
             return contactos.filter(bd_contacto=bd_contacto)
         except Contacto.DoesNotExist:
             raise (SuspiciousOperation("No se encontro contactos con este "
                                        "filtro"))
 
+    def contactos_by_campo(self, bd_contacto, campo, valor):
+        """ Contactos de la base con el valor indicado en una de sus columnas de datos
+            (usa el índice contacto_datos_campo_gin) """
+        return self.filter(bd_contacto=bd_contacto, datos_por_campo__contains={campo: valor})
+
+    def contactos_by_telefono_normalizado(self, bd_contacto, telefono):
+        """ Contactos de la base cuyo teléfono tiene los mismos dígitos que el indicado,
+            para identificar llamadas por caller id """
+        telefono = normalizar_telefono(telefono)
+        if not telefono:
+            return self.none()
+        return self.annotate(telefono_normalizado=TelefonoNormalizado('telefono')).filter(
+            bd_contacto=bd_contacto, telefono_normalizado=telefono)
+
     # def obtener_contacto_editar(self, id_cliente):
     #     """Devuelve el contacto pasado por ID, siempre que dicha
     #     pedido pueda ser editar
@@ -2405,32 +2538,61 @@ class Contacto(models.Model):
     )
     id_externo = models.CharField(max_length=128, null=True)
     es_originario = models.BooleanField(default=True)
+    # 'datos' por nombre de columna. Lo completa el trigger contacto_datos_por_campo
+    # (sql/plpgsql/datos_por_campo.sql); es NULL si 'datos' no pudo interpretarse o si el
+    # contacto es anterior al trigger y todavía no se ejecutó completar_datos_por_campo.
+    datos_por_campo = JSONField(null=True)
+
+    class Meta:
+        # Indice de trigramas (pg_trgm) para las búsquedas con LIKE '%...%'. Los índices sobre
+        # UPPER(datos) y sobre el teléfono normalizado se crean en la migración 0082.
+        indexes = [
+            GinIndex(fields=['telefono'], name='contacto_telefono_trgm',
+                     opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['datos_por_campo'], name='contacto_datos_campo_gin',
+                     opclasses=['jsonb_path_ops']),
+        ]
 
     def obtener_datos(self):
         """ Devuelve un diccionario con todos los datos, incluido el telefono """
         if not hasattr(self, 'datos_contacto'):
-            bd_metadata = self.bd_contacto.get_metadata()
+            bd_metadata = self.bd_contacto.get_metadata_compartida()
             columnas = bd_metadata.nombres_de_columnas
-            datos = self.lista_de_datos_completa()
-
-            self.datos_contacto = dict(zip(columnas, datos))
+            if self.datos_por_campo is not None:
+                datos = dict(self.datos_por_campo)
+                datos[bd_metadata.nombre_campo_telefono] = self.telefono
+                if bd_metadata.nombre_campo_id_externo is not None:
+                    datos[bd_metadata.nombre_campo_id_externo] = self.id_externo
+                self.datos_contacto = {columna: datos.get(columna) for columna in columnas}
+            else:
+                datos = self.lista_de_datos_completa()
+                self.datos_contacto = dict(zip(columnas, datos))
         return self.datos_contacto
 
     def _sincronizar_agente_en_contacto(self):
         # obtenemos los campos de la BD del contacto
-        metadata = self.bd_contacto.get_metadata()
+        metadata = self.bd_contacto.get_metadata_compartida()
         campos_contacto = metadata.nombres_de_columnas_de_datos
 
         # y los hacemos en estructura json para AgenteEnContacto
         datos_contacto = literal_eval(self.datos)
         datos_contacto = dict(zip(campos_contacto, datos_contacto))
         datos_contacto_json = json.dumps(datos_contacto)
-        AgenteEnContacto.objects.filter(contacto_id=self.pk).update(
-            telefono_contacto=self.telefono, datos_contacto=datos_contacto_json)
+        agentes_en_contacto = AgenteEnContacto.objects.filter(contacto_id=self.pk)
+        campos_desactivacion = Campana.objects.filter(
+            pk__in=agentes_en_contacto.values('campana_id')).values_list(
+                'pk', 'campo_desactivacion')
+        for campana_id, campo_desactivacion in campos_desactivacion:
+            agentes_en_contacto.filter(campana_id=campana_id).update(
+                telefono_contacto=self.telefono, datos_contacto=datos_contacto_json,
+                desactivado=AgenteEnContacto.calcular_desactivado(
+                    datos_contacto_json, campo_desactivacion))
 
     def save(self, *args, **kwargs):
         if self.pk is not None:
             self._sincronizar_agente_en_contacto()
+        # Lo recalcula el trigger a partir de 'datos', que pudo haber cambiado
+        self.datos_por_campo = None
         super(Contacto, self).save()
 
     def lista_de_datos(self):
@@ -2439,7 +2601,7 @@ class Contacto(models.Model):
     def lista_de_datos_completa(self):
         """ Devuelve un diccionario con todos los datos, incluido el telefono """
         if not hasattr(self, 'lista_datos_contacto'):
-            bd_metadata = self.bd_contacto.get_metadata()
+            bd_metadata = self.bd_contacto.get_metadata_compartida()
             datos = self.lista_de_datos()
             pos_primer_telefono = bd_metadata.columnas_con_telefono[0]
             if bd_metadata.columna_id_externo is not None:
@@ -2953,6 +3115,11 @@ class ContactoBlacklist(models.Model):
         Blacklist, related_name='contactosblacklist', blank=True, null=True,
         on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['black_list', 'telefono']),
+        ]
+
     def __str__(self):
         return "Telefono no llame {0}  ".format(self.telefono)
 
@@ -3213,22 +3380,57 @@ class AgenteEnContactoManager(models.Manager):
 
     def esta_asignado_o_entregado_a_agente(self, contacto_id, campana_id, agente_id):
         # Devuelve si el agente tiene ese contacto asignado o entregado
-        return self.contacto_asignado(agente_id, campana_id).filter(
-            contacto_id=contacto_id).exists()
+        if self.contacto_asignado(agente_id, campana_id).filter(
+                contacto_id=contacto_id).exists():
+            return True
+        # La entrega puede no haber sido persistida todavía por el despachador
+        entrega = AgenteEnContacto.obtener_entrega_despachador(campana_id, agente_id)
+        return entrega is not None and entrega[1] == int(contacto_id)
+
+    def liberar_vencidos(self, campana_id, duracion_asignacion):
+        """
+        Vuelve a estado INICIAL los contactos de la campaña entregados hace más de
+        'tiempo_desconexion' minutos o asignados hace más de 'duracion_asignacion' minutos.
+        Devuelve (id, contacto_id, orden, agente_id anterior) de cada contacto liberado.
+        """
+        sql = """
+        UPDATE ominicontacto_app_agenteencontacto aec
+            SET agente_id = -1, estado = %(inicial)s
+            FROM ominicontacto_app_agenteencontacto anterior, ominicontacto_app_campana campana
+            WHERE anterior.id = aec.id AND campana.id = aec.campana_id AND
+                  aec.campana_id = %(campana_id)s AND (
+                  (aec.estado = %(entregado)s AND
+                   aec.modificado <= now() - campana.tiempo_desconexion * interval '1 minute') OR
+                  (aec.estado = %(asignado)s AND
+                   aec.modificado <= now() - %(duracion_asignacion)s * interval '1 minute'))
+            RETURNING aec.id, aec.contacto_id, aec.orden, anterior.agente_id
+        """
+        params = {'campana_id': campana_id,
+                  'duracion_asignacion': duracion_asignacion,
+                  'inicial': AgenteEnContacto.ESTADO_INICIAL,
+                  'entregado': AgenteEnContacto.ESTADO_ENTREGADO,
+                  'asignado': AgenteEnContacto.ESTADO_ASIGNADO}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
 
     def activos(self, campana_id):
         # Devuelve los que estan activos de acuerdo al campo de desactivacion definido en la
         # campaña
-        campana = Campana.objects.get(pk=campana_id)
-        campo_desactivacion = campana.campo_desactivacion
-        desactivacion_booleana = {campo_desactivacion: "FALSE"}
-        desactivacion_numerica = {campo_desactivacion: "0"}
-        # deberiamos tener algo como "desactivado: FALSE" o  "desactivado: 0", sin llaves
-        desactivacion_booleana_str = json.dumps(desactivacion_booleana)[1:-1]
-        desactivacion_numerica_str = json.dumps(desactivacion_numerica)[1:-1]
-        return self.filter(campana_id=campana_id).exclude(
-            Q(datos_contacto__contains=desactivacion_booleana_str) |
-            Q(datos_contacto__contains=desactivacion_numerica_str))
+        return self.filter(campana_id=campana_id, desactivado=False)
+
+    def actualizar_desactivacion(self, campana):
+        # Recalcula el campo 'desactivado' de los contactos de la campaña de acuerdo a su
+        # campo de desactivacion
+        agentes_en_contacto = self.filter(campana_id=campana.pk)
+        if not campana.campo_desactivacion:
+            return agentes_en_contacto.update(desactivado=False)
+        desactivacion_booleana_str, desactivacion_numerica_str = \
+            AgenteEnContacto.valores_desactivacion(campana.campo_desactivacion)
+        return agentes_en_contacto.update(desactivado=Case(
+            When(Q(datos_contacto__contains=desactivacion_booleana_str) |
+                 Q(datos_contacto__contains=desactivacion_numerica_str), then=Value(True)),
+            default=Value(False), output_field=models.BooleanField()))
 
 
 class AgenteEnContacto(models.Model):
@@ -3260,28 +3462,163 @@ class AgenteEnContacto(models.Model):
     modificado = models.DateTimeField(auto_now=True, null=True)
     es_originario = models.BooleanField(default=True)
     orden = models.IntegerField(default=1)
+    # Indica si el contacto fue desactivado de acuerdo al campo de desactivacion de la campaña
+    desactivado = models.BooleanField(default=False)
+    # 'datos_contacto' como JSONB, completado por el trigger agenteencontacto_datos_por_campo
+    datos_contacto_por_campo = JSONField(null=True)
 
     class Meta:
         ordering = ['orden']
+        indexes = [
+            models.Index(fields=['campana_id', 'estado', 'modificado']),
+            models.Index(fields=['campana_id', 'desactivado', 'estado', 'orden']),
+            GinIndex(fields=['datos_contacto_por_campo'], name='aec_datos_campo_gin',
+                     opclasses=['jsonb_path_ops']),
+        ]
 
     def __str__(self):
         return "Agente de id={0} relacionado con contacto de id={1} con el estado {2}".format(
             self.agente_id, self.contacto_id, self.estado)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(AgenteEnContacto, cls).from_db(db, field_names, values)
+        instance._datos_contacto_cargados = instance.__dict__.get('datos_contacto')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Si cambiaron los datos del contacto se recalcula si está desactivado
+        if self.datos_contacto != getattr(self, '_datos_contacto_cargados', None):
+            campo_desactivacion = Campana.objects.filter(pk=self.campana_id).values_list(
+                'campo_desactivacion', flat=True).first()
+            self.desactivado = self.calcular_desactivado(
+                self.datos_contacto, campo_desactivacion)
+            self._datos_contacto_cargados = self.datos_contacto
+        super(AgenteEnContacto, self).save(*args, **kwargs)
+
+    @classmethod
+    def valores_desactivacion(cls, campo_desactivacion):
+        # Devuelve los textos que indican en datos_contacto que el contacto está desactivado
+        desactivacion_booleana = {campo_desactivacion: "FALSE"}
+        desactivacion_numerica = {campo_desactivacion: "0"}
+        # deberiamos tener algo como "desactivado: FALSE" o  "desactivado: 0", sin llaves
+        desactivacion_booleana_str = json.dumps(desactivacion_booleana)[1:-1]
+        desactivacion_numerica_str = json.dumps(desactivacion_numerica)[1:-1]
+        return desactivacion_booleana_str, desactivacion_numerica_str
+
+    @classmethod
+    def calcular_desactivado(cls, datos_contacto_json, campo_desactivacion):
+        if not campo_desactivacion:
+            return False
+        return any(valor in datos_contacto_json
+                   for valor in cls.valores_desactivacion(campo_desactivacion))
+
     @classmethod
     def asignar_contacto(cls, contacto_id, campana_id, agente):
+        entrega = cls.obtener_entrega_despachador(campana_id, agente.id)
         try:
             agente_en_contacto = cls.objects.get(agente_id=agente.id, campana_id=campana_id,
                                                  contacto_id=contacto_id,
                                                  estado__in=[AgenteEnContacto.ESTADO_ENTREGADO,
                                                              AgenteEnContacto.ESTADO_ASIGNADO])
         except AgenteEnContacto.DoesNotExist:
-            return False  # No se pudo asignar
+            # Puede estar entregado por el despachador pero aún no persistido
+            if entrega is None or entrega[1] != int(contacto_id):
+                return False  # No se pudo asignar
+            agente_en_contacto = cls.objects.filter(pk=entrega[0]).exclude(
+                estado=AgenteEnContacto.ESTADO_FINALIZADO).first()
+            if agente_en_contacto is None:
+                return False
 
         agente_en_contacto.estado = AgenteEnContacto.ESTADO_ASIGNADO
+        agente_en_contacto.agente_id = agente.id
         agente_en_contacto.save()
+        if entrega is not None:
+            # Una vez asignado deja de ser administrado por el despachador
+            cls._ejecutar_en_despachador(
+                'quitar_entrega', campana_id, agente.id, agente_en_contacto.pk)
         return True
 
+    @classmethod
+    def _ejecutar_en_despachador(cls, metodo, *args):
+        # Ejecuta un método del despachador de contactos preview si está habilitado.
+        # Ante un error de Redis devuelve None para que se utilice la base de datos.
+        if not DespachadorContactosPreview.habilitado():
+            return None
+        try:
+            return getattr(DespachadorContactosPreview(), metodo)(*args)
+        except RedisError as e:
+            logger.warning(_("Error en el despachador de contactos preview: {0}".format(e)))
+            return None
+
+    @classmethod
+    def obtener_entrega_despachador(cls, campana_id, agente_id):
+        return cls._ejecutar_en_despachador('obtener_entrega', campana_id, agente_id)
+
+    @classmethod
+    def invalidar_despachador(cls, campana_id):
+        """
+        Descarta los contactos disponibles de la campaña cargados en el despachador, que
+        serán recargados desde la base de datos. Se debe invocar luego de modificaciones
+        masivas de AgenteEnContacto.
+        """
+        cls._ejecutar_en_despachador('invalidar', campana_id)
+
+    @classmethod
+    def _obtener_contactos_despachador(cls, campana_id):
+        def obtener_contactos():
+            contactos = cls.objects.filter(campana_id=campana_id)
+            campos = ('id', 'contacto_id', 'agente_id', 'orden')
+            disponibles = cls.objects.activos(campana_id).filter(
+                estado=AgenteEnContacto.ESTADO_INICIAL).order_by().values_list(*campos)
+            entregados = contactos.filter(
+                estado=AgenteEnContacto.ESTADO_ENTREGADO).order_by().values_list(*campos)
+            return contactos.count(), disponibles.iterator(), entregados
+        return obtener_contactos
+
+    @classmethod
+    def _entregar_contacto_despachador(cls, agente, campana_id):
+        """
+        Entrega un contacto desde el despachador de contactos preview, sin bloquear filas
+        en la base de datos. La entrega se persiste luego de forma asíncrona.
+        """
+        despachador = DespachadorContactosPreview()
+        cargas = 0
+        while True:
+            resultado, entregado = despachador.entregar(campana_id, agente.id)
+            if resultado == despachador.NO_CARGADA:
+                cargas += 1
+                if cargas > 2 or not despachador.cargar(
+                        campana_id, cls._obtener_contactos_despachador(campana_id)):
+                    # Otro proceso está cargando los contactos de la campaña
+                    return {'result': 'Error',
+                            'code': 'error-concurrencia',
+                            'data': 'Contacto siendo accedido por más de un agente'}
+                continue
+            if resultado == despachador.SIN_CONTACTOS:
+                return {'result': 'Error',
+                        'code': 'error-no-contactos',
+                        'data': 'No hay contactos para asignar en esta campaña'}
+
+            agente_en_contacto_id, __ = entregado
+            agente_en_contacto = cls.objects.filter(pk=agente_en_contacto_id).first()
+            # Los contactos finalizados o desactivados desde la carga se descartan
+            if agente_en_contacto is None or \
+                    agente_en_contacto.estado in (AgenteEnContacto.ESTADO_FINALIZADO,
+                                                  AgenteEnContacto.ESTADO_ASIGNADO) or \
+                    agente_en_contacto.desactivado:
+                despachador.quitar_entrega(campana_id, agente.id, agente_en_contacto_id)
+                continue
+
+            despachador.confirmar_entrega(agente_en_contacto_id, agente.id)
+            agente_en_contacto.estado = AgenteEnContacto.ESTADO_ENTREGADO
+            agente_en_contacto.agente_id = agente.id
+            data = model_to_dict(agente_en_contacto)
+            data['datos_contacto'] = literal_eval(data['datos_contacto'])
+            data['result'] = 'OK'
+            data['code'] = 'contacto-entregado'
+            return data
+
     @classmethod
     def entregar_contacto(cls, agente, campana_id):
         # Si ya tiene un contacto ASIGNADO solo puede llamar a ese.
@@ -3297,7 +3634,14 @@ class AgenteEnContacto(models.Model):
             return data
 
         # Si no tiene un contacto asignado, asignarle otro
-
+        if DespachadorContactosPreview.habilitado():
+            try:
+                data = cls._entregar_contacto_despachador(agente, campana_id)
+            except RedisError as e:
+                logger.warning(_("Error en el despachador de contactos preview: {0}".format(e)))
+                data = None
+            if data is not None:
+                return data
         # Si el agente tiene algún contacto entregado previamente se libera para
         # que pueda ser entregado a otros agentes de la campaña
         __, orden = cls.liberar_contacto(agente.id, campana_id)
@@ -3348,50 +3692,65 @@ class AgenteEnContacto(models.Model):
 
     @classmethod
     def liberar_contacto(cls, agente_id, campana_id):
+        # El contacto entregado por el despachador puede no estar persistido todavía
+        orden = cls._ejecutar_en_despachador('liberar', campana_id, agente_id)
         qs_agente_en_contacto = cls.objects.contacto_asignado(agente_id, campana_id)
         if qs_agente_en_contacto.exists():
             agente_en_contacto = qs_agente_en_contacto.first()
             agente_en_contacto.estado = AgenteEnContacto.ESTADO_INICIAL
             agente_en_contacto.agente_id = -1
             agente_en_contacto.save()
+            cls._ejecutar_en_despachador(
+                'devolver', campana_id, agente_en_contacto.pk, agente_en_contacto.contacto_id,
+                agente_en_contacto.orden, agente_id)
             return True, agente_en_contacto.orden
+        if orden is not None:
+            return True, orden
         return False, -1
 
     @classmethod
     def liberar_contactos_por_tiempo(cls):
-
-        # obtenemos las campañas preview activas y almacenamos en un dict su
-        # tiempo de reserva
-        campanas_preview_dict = {}
+        """
+        Libera los contactos entregados o asignados de las campañas preview activas cuyo
+        tiempo de reserva venció, con un UPDATE por campaña.
+        """
         campanas_preview_activas = Campana.objects.obtener_campanas_preview().filter(
-            estado=Campana.ESTADO_ACTIVA)
-
-        tiempo_actual = now()
-        for campana_preview in campanas_preview_activas:
-            campanas_preview_dict[campana_preview.pk] = campana_preview.tiempo_desconexion
-
-        agente_en_contacto_ids = []
-        for agente_en_contacto in AgenteEnContacto.objects.filter(
-                estado__in=[AgenteEnContacto.ESTADO_ENTREGADO, AgenteEnContacto.ESTADO_ASIGNADO]):
-            campana_id = agente_en_contacto.campana_id
-            tiempo_de_reserva = campanas_preview_dict[campana_id]
-            delta_tiempo_desconexion = timedelta(minutes=tiempo_de_reserva)
-            hora_limite_reserva = tiempo_actual - delta_tiempo_desconexion
-            ultima_modificacion = agente_en_contacto.modificado
-            delta_tiempo_asignacion = timedelta(
-                minutes=settings.DURACION_ASIGNACION_CONTACTO_PREVIEW)
-            hora_limite_asignacion = tiempo_actual - delta_tiempo_asignacion
-            if ultima_modificacion <= hora_limite_reserva and \
-               agente_en_contacto.estado == AgenteEnContacto.ESTADO_ENTREGADO:
-                agente_en_contacto_ids.append(agente_en_contacto.pk)
-            elif (ultima_modificacion <= hora_limite_asignacion and
-                  agente_en_contacto.estado == AgenteEnContacto.ESTADO_ASIGNADO):
-                agente_en_contacto_ids.append(agente_en_contacto.pk)
-
-        liberados = AgenteEnContacto.objects.filter(pk__in=agente_en_contacto_ids).update(
-            agente_id=-1, estado=AgenteEnContacto.ESTADO_INICIAL)
+            estado=Campana.ESTADO_ACTIVA).values_list('pk', flat=True)
+
+        liberados = 0
+        for campana_id in campanas_preview_activas:
+            agentes_en_contacto_liberados = cls.objects.liberar_vencidos(
+                campana_id, settings.DURACION_ASIGNACION_CONTACTO_PREVIEW)
+            liberados += len(agentes_en_contacto_liberados)
+
+            # Los contactos liberados vuelven a estar disponibles en el despachador
+            for agente_en_contacto_id, contacto_id, orden, agente_id in \
+                    agentes_en_contacto_liberados:
+                cls._ejecutar_en_despachador(
+                    'devolver', campana_id, agente_en_contacto_id, contacto_id, orden, agente_id)
         return liberados
 
+    @classmethod
+    def persistir_entregas(cls, pendientes):
+        """
+        Aplica en la base de datos los cambios de estado realizados por el despachador de
+        contactos preview. Las actualizaciones son condicionales para no pisar cambios
+        posteriores (asignaciones, finalizaciones o liberaciones por tiempo).
+        """
+        for pendiente in pendientes:
+            modificado = datetime.fromtimestamp(pendiente['modificado'], utc)
+            if pendiente['accion'] == DespachadorContactosPreview.ACCION_ENTREGAR:
+                cls.objects.filter(
+                    pk=pendiente['id'], estado=AgenteEnContacto.ESTADO_INICIAL).update(
+                        estado=AgenteEnContacto.ESTADO_ENTREGADO,
+                        agente_id=pendiente['agente_id'], modificado=modificado)
+            else:
+                cls.objects.filter(
+                    pk=pendiente['id'], estado=AgenteEnContacto.ESTADO_ENTREGADO,
+                    agente_id=pendiente['agente_id']).update(
+                        estado=AgenteEnContacto.ESTADO_INICIAL, agente_id=-1,
+                        modificado=modificado)
+
     @classmethod
     def ultimo_id(cls):
         ultimo = AgenteEnContacto.objects.last()
@@ -231,6 +231,35 @@ class ParserCsv(object):
         """
         return self._get_contenido_de_archivo(base_datos_contactos)
 
+    def iterar_estructura_archivo(self, base_datos_contactos):
+        """
+        Versión streaming de get_estructura_archivo(): devuelve un generador
+        que entrega primero los nombres de columnas saneados y luego cada fila
+        no vacía del archivo, sin cargar el archivo completo en memoria.
+        Las validaciones son las mismas, pero la de cantidad mínima de filas
+        se lanza recién al terminar de recorrer el archivo.
+        """
+        file_obj = base_datos_contactos.archivo_importacion.file
+        file_obj_str = codecs.iterdecode(file_obj, 'utf-8', errors='ignore')
+        workbook = csv.reader(file_obj_str, skipinitialspace=True)
+
+        i = -1
+        encabezado_leido = False
+        for i, row in enumerate(workbook):
+            if not row:
+                continue
+            if not encabezado_leido:
+                encabezado_leido = True
+                yield self._sanear_nombres_de_columnas(row)
+            else:
+                yield row
+
+        if i < 2:
+            logger.warn(_("El archivo CSV seleccionado posee menos de 2 "
+                          "filas."))
+            raise OmlParserMinRowError(_("El archivo CSV posee menos de "
+                                         "2 filas"))
+
     def _get_contenido_de_archivo(self, base_datos_contactos, previsualizacion=False):
         """
         Lee un archivo CSV y devuelve contenidos de
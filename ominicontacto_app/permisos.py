@@ -17,12 +17,22 @@
 # along with this program.  If not, see http://www.gnu.org/licenses/.
 #
 
+import json
+import logging
+
 from collections import ChainMap
+
+import redis
+from redis.exceptions import RedisError
+
 from django.apps import apps
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import Permission
 from django.db import models
 
+logger = logging.getLogger(__name__)
+
 
 class PermisoOMLManager(models.Manager):
     def get_queryset(self):
@@ -81,3 +91,78 @@ def cargar_descripciones_y_versiones():
 
 
 DESCRIPCIONES, VERSIONES = cargar_descripciones_y_versiones()
+
+
+class CachePermisosOML(object):
+    """
+    Resuelve los PermisoOML sin consultar la base de datos en cada request:
+    - Los nombres de las vistas restringidas (codenames de PermisoOML) se cargan una vez por
+      proceso. Sólo cambian al correr el comando actualizar_permisos.
+    - Los PermisoOML de cada usuario se guardan en Redis, compartidos por todos los procesos.
+      Se deben invalidar al modificar los permisos de un rol o el rol de un usuario.
+    Si Redis no está disponible los permisos del usuario se consultan en la base de datos.
+    """
+
+    CLAVE_PERMISOS_USUARIO = 'OML:PERMISOS_OML_USUARIO:{0}'
+    DURACION = 3600
+
+    def __init__(self, redis_connection=None):
+        self._redis_connection = redis_connection
+        self._nombres_restringidos = None
+
+    @property
+    def redis_connection(self):
+        if self._redis_connection is None:
+            self._redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        return self._redis_connection
+
+    def obtener_nombres_restringidos(self):
+        if self._nombres_restringidos is None:
+            self._nombres_restringidos = frozenset(
+                PermisoOML.objects.values_list('codename', flat=True))
+        return self._nombres_restringidos
+
+    def obtener_permisos(self, user):
+        """ Devuelve los codenames de los PermisoOML que tiene el usuario """
+        clave = self.CLAVE_PERMISOS_USUARIO.format(user.id)
+        try:
+            permisos = self.redis_connection.get(clave)
+        except RedisError as e:
+            logger.warning('No se pudieron obtener los permisos cacheados: {0}'.format(e))
+            return self._cargar_permisos(user)
+        if permisos is not None:
+            return frozenset(json.loads(permisos))
+        permisos = self._cargar_permisos(user)
+        try:
+            self.redis_connection.set(clave, json.dumps(sorted(permisos)), ex=self.DURACION)
+        except RedisError as e:
+            logger.warning('No se pudieron cachear los permisos: {0}'.format(e))
+        return permisos
+
+    def _cargar_permisos(self, user):
+        prefijo = PermisoOML._meta.app_label + '.'
+        return frozenset(permiso[len(prefijo):] for permiso in user.get_all_permissions()
+                         if permiso.startswith(prefijo))
+
+    def invalidar_usuario(self, user_id):
+        try:
+            self.redis_connection.delete(self.CLAVE_PERMISOS_USUARIO.format(user_id))
+        except RedisError as e:
+            logger.warning('No se pudieron invalidar los permisos cacheados: {0}'.format(e))
+
+    def invalidar(self):
+        """ Invalida los permisos de todos los usuarios y los nombres restringidos del proceso """
+        self._nombres_restringidos = None
+        try:
+            claves = list(self.redis_connection.scan_iter(
+                match=self.CLAVE_PERMISOS_USUARIO.format('*'), count=1000))
+            if claves:
+                self.redis_connection.delete(*claves)
+        except RedisError as e:
+            logger.warning('No se pudieron invalidar los permisos cacheados: {0}'.format(e))
+
+
+cache_permisos_oml = CachePermisosOML()
@@ -19,6 +19,10 @@
 from __future__ import unicode_literals
 
 import logging as _logging
+import os
+import queue
+import socket
+import threading
 
 from asterisk.manager import Manager, ManagerSocketException, ManagerAuthException, ManagerException
 
@@ -27,23 +31,151 @@ from ominicontacto_app.errors import OmlError
 
 logger = _logging.getLogger(__name__)
 
+FIN_DE_LINEA = '\r\n'
+
+
+class ColaDeRespuestasAMI(queue.Queue):
+    """ Cola de respuestas del Manager que no espera indefinidamente: si Asterisk no responde
+        a tiempo levanta ManagerException """
+
+    def __init__(self, timeout):
+        super(ColaDeRespuestasAMI, self).__init__()
+        self.timeout = timeout
+
+    def get(self, block=True, timeout=None):
+        if block and timeout is None:
+            timeout = self.timeout
+        try:
+            return super(ColaDeRespuestasAMI, self).get(block, timeout)
+        except queue.Empty:
+            raise ManagerException('Sin respuesta de Asterisk en {0} segundos'.format(timeout))
+
+
+class ManagerAMI(Manager):
+    """Manager de pyst2 que además permite enviar varias acciones en una sola escritura
+    y deja de esperar una respuesta luego de OL_AMI_TIMEOUT_RESPUESTA segundos
+    """
+
+    def __init__(self, timeout_respuesta=None):
+        super(ManagerAMI, self).__init__()
+        if timeout_respuesta is None:
+            timeout_respuesta = settings.OL_AMI_TIMEOUT_RESPUESTA
+        self._response_queue = ColaDeRespuestasAMI(timeout_respuesta)
+
+    def send_actions(self, acciones):
+        """ Escribe todas las acciones juntas en el socket y devuelve sus respuestas en el mismo
+            orden, correlacionadas por ActionID """
+        if not self.connected():
+            raise ManagerException('Not connected')
+        action_ids = []
+        comandos = []
+        for accion in acciones:
+            accion = dict(accion)
+            if 'ActionID' not in accion:
+                accion['ActionID'] = '%s-%08x' % (self.hostname, self.next_seq())
+            action_ids.append(accion['ActionID'])
+            lineas = []
+            for clave, valor in accion.items():
+                valores = valor if isinstance(valor, list) else [valor]
+                lineas.extend('%s: %s' % (clave, item) for item in valores)
+            comandos.append(FIN_DE_LINEA.join(lineas + [FIN_DE_LINEA]))
+        try:
+            self._sock.write(''.join(comandos).encode('utf8', 'ignore'))
+            self._sock.flush()
+        except socket.error as e:
+            raise ManagerSocketException(e.errno, e.strerror)
+
+        respuestas = {}
+        for __ in action_ids:
+            self._reswaiting.insert(0, 1)
+            respuesta = self._response_queue.get()
+            self._reswaiting.pop(0)
+            if not respuesta:
+                raise ManagerSocketException(0, 'Connection Terminated')
+            respuestas[respuesta.get_header('ActionID', None)] = respuesta
+        sin_respuesta = [action_id for action_id in action_ids if action_id not in respuestas]
+        if sin_respuesta:
+            raise ManagerException('Acciones sin respuesta: {0}'.format(', '.join(sin_respuesta)))
+        return [respuestas[action_id] for action_id in action_ids]
+
+
+class PoolConexionesAMI(object):
+    """
+    Conexiones AMI ya autenticadas para reutilizar entre requests. Cada conexión es usada por
+    un solo thread a la vez: se toma con obtener() y se devuelve con devolver(). Si no hay
+    conexiones libres se abre una nueva, y al devolverlas se conservan hasta 'tamano'.
+    """
+
+    _pool = None
+    _pid = None
+    _lock = threading.Lock()
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self._libres = queue.LifoQueue()
+
+    @classmethod
+    def del_proceso(cls):
+        """ Devuelve el pool del proceso actual (los sockets no se comparten entre procesos
+            hijos de uWSGI) """
+        with cls._lock:
+            if cls._pool is None or cls._pid != os.getpid():
+                cls._pool = cls(settings.OL_AMI_POOL_CONEXIONES)
+                cls._pid = os.getpid()
+            return cls._pool
+
+    def obtener(self):
+        while True:
+            try:
+                manager = self._libres.get_nowait()
+            except queue.Empty:
+                return self._conectar()
+            if manager.connected():
+                return manager
+            # Se cortó mientras estaba libre (ej: reinicio de Asterisk)
+            self._cerrar(manager)
+
+    def devolver(self, manager, descartar=False):
+        if descartar or not manager.connected() or self._libres.qsize() >= self.tamano:
+            self._cerrar(manager)
+        else:
+            self._libres.put(manager)
+
+    def _conectar(self):
+        manager = ManagerAMI()
+        try:
+            manager.connect(str(settings.ASTERISK_HOSTNAME))
+            manager.login(settings.ASTERISK['AMI_USERNAME'], settings.ASTERISK['AMI_PASSWORD'])
+            # Las conexiones del pool sólo envían acciones, no necesitan recibir eventos
+            manager.send_action({'Action': 'Events', 'EventMask': 'off'})
+        except ManagerException:
+            self._cerrar(manager)
+            raise
+        return manager
+
+    def _cerrar(self, manager):
+        try:
+            manager.close()
+        except (ManagerException, socket.error) as e:
+            logger.warning("Error closing the manager: {0}".format(e))
+
 
 class AMIManagerConnector(object):
-    """Establece la conexión AMI utilizando la librería pyst2, para manipular asterisk
+    """Establece la conexión AMI utilizando la librería pyst2, para manipular asterisk.
+    Las conexiones se toman del pool del proceso y se devuelven al desconectar.
     """
 
     def __init__(self):
-        self.manager = Manager()
+        self.manager = None
         self.disconnected = False
+        self._descartar_conexion = False
 
     def connect(self):
         error = False
-        ami_manager_user = settings.ASTERISK['AMI_USERNAME']
-        ami_manager_pass = settings.ASTERISK['AMI_PASSWORD']
-        ami_manager_host = str(settings.ASTERISK_HOSTNAME)
         try:
-            self.manager.connect(ami_manager_host)
-            self.manager.login(ami_manager_user, ami_manager_pass)
+            self.manager = PoolConexionesAMI.del_proceso().obtener()
+            self.disconnected = False
+            self._descartar_conexion = False
         except ManagerSocketException as e:
             logger.exception("Error connecting to the manager: {0}".format(e))
             error = True
@@ -56,16 +188,18 @@ class AMIManagerConnector(object):
         return error
 
     def disconnect(self):
-        # Atención: El Manager solo permite una sola conexión
-        self.manager.close()
+        # La conexión vuelve al pool, salvo que haya fallado
+        if self.manager is not None:
+            PoolConexionesAMI.del_proceso().devolver(
+                self.manager, descartar=self._descartar_conexion)
+            self.manager = None
         self.disconnected = True
 
     # TODO: Refactorizar esta clase. Nombres mas descriptivos.
-    #       Permitir ejecutar varios comandos con la misma sesion.
     def _ami_manager(self, action, content):
         if self.disconnected:
             raise OmlError(message='La conexión del Asterisk Manager ya ha sido cerrada')
-        if not self.manager.connected():
+        if self.manager is None or not self.manager.connected():
             raise OmlError(message='El Asterisk Manager no ha sido conectado')
 
         error = False
@@ -81,43 +215,63 @@ class AMIManagerConnector(object):
         except ManagerException as e:
             logger.exception("Error {0}".format(e))
             error = True
+        if error:
+            # Tras cualquier error la conexión puede tener respuestas pendientes de otras
+            # acciones: no vuelve al pool para que otro request no las lea como propias
+            self._descartar_conexion = True
         return data_returned, error
 
-    def _ami_action(self, action, content):
-        if action == 'command':
-            data_returned = self.manager.command(content).data
-        elif action == 'QueueAdd':
+    def _acciones_de_cola(self, action, content):
+        """ Devuelve las acciones QueueAdd/QueueRemove/QueuePause de todas las colas del agente
+            seguidas del QueueLog correspondiente, para enviarlas juntas """
+        acciones = []
+        if action == 'QueueAdd':
             event_queuelog = 'ADDMEMBER'
             for i in range(len(content[2])):
-                dict = {
+                acciones.append({
                     'Action': action,
                     'Queue': content[2][i],
                     'Interface': content[4],
                     'Penalty': content[3][i],
                     'Paused': 0,
                     'MemberName': content[1]
-                }
-                data_returned = self.manager.send_action(dict)
+                })
         elif action == 'QueueRemove':
             event_queuelog = 'REMOVEMEMBER'
             for i in range(len(content[2])):
-                dict = {
+                acciones.append({
                     'Action': action,
                     'Queue': content[2][i],
                     'Interface': content[4],
-                }
-                data_returned = self.manager.send_action(dict)
+                })
         elif action == 'QueuePause':
             if content[6] == 'true':
                 event_queuelog = 'PAUSEALL'
             elif content[6] == 'false':
                 event_queuelog = 'UNPAUSEALL'
-            dict = {
+            acciones.append({
                 'Action': action,
                 'Interface': content[4],
                 'Paused': content[6],
-            }
-            data_returned = self.manager.send_action(dict)
+            })
+        queue_log = {
+            'Action': 'QueueLog',
+            'Queue': 'ALL',
+            'Event': event_queuelog,
+            'Uniqueid': 'MANAGER',
+            'Interface': content[0]
+        }
+        if action == 'QueuePause':
+            queue_log['Message'] = content[5]
+        acciones.append(queue_log)
+        return acciones
+
+    def _ami_action(self, action, content):
+        if action == 'command':
+            data_returned = self.manager.command(content).data
+        elif action in ('QueueAdd', 'QueueRemove', 'QueuePause'):
+            # Todas las acciones del agente en una sola escritura; se devuelve la del QueueLog
+            data_returned = self.manager.send_actions(self._acciones_de_cola(action, content))[-1]
         elif action == 'dbput':
             family = content[0]
             key = content[1]
@@ -134,17 +288,6 @@ class AMIManagerConnector(object):
                 priority=1,
                 timeout='25000',
                 variables=content[3])
-        if action == 'QueueAdd' or action == 'QueueRemove' or action == 'QueuePause':
-            dict = {
-                'Action': 'QueueLog',
-                'Queue': 'ALL',
-                'Event': event_queuelog,
-                'Uniqueid': 'MANAGER',
-                'Interface': content[0]
-            }
-            if action == 'QueuePause':
-                dict['Message'] = content[5]
-            data_returned = self.manager.send_action(dict)
         return data_returned
 
 
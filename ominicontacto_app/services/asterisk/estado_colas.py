@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Estado de las colas de Asterisk mantenido en Redis a partir de eventos AMI.
+
+El comando ``escuchar_eventos_colas`` recibe los eventos QueueCallerJoin/QueueCallerLeave y
+QueueMember* y actualiza por cada campaña un set con los Uniqueid de las llamadas en espera,
+y un set con los ids de los agentes cuyo dispositivo está Unavailable. Al conectarse (y cada
+tanto, por si se perdió algún evento) reemplaza ese estado con el de un QueueStatus.
+Mientras el comando esté conectado mantiene vigente una clave con expiración; si la clave no
+existe los lectores deben volver a consultar a Asterisk directamente.
+"""
+
+from __future__ import unicode_literals
+
+import redis
+from django.conf import settings
+from redis.exceptions import RedisError
+
+import logging as _logging
+
+logger = _logging.getLogger(__name__)
+
+
+def parsear_eventos_ami(texto):
+    """ Devuelve los headers de cada evento de un texto en formato AMI (bloques de líneas
+        'Clave: valor' separados por una línea vacía), como los datos de una respuesta a
+        QueueStatus o un archivo grabado con escuchar_eventos_colas --grabar """
+    eventos = []
+    headers = {}
+    for linea in texto.splitlines() + ['']:
+        clave, separador, valor = linea.partition(':')
+        if separador:
+            headers[clave.strip()] = valor.strip()
+        elif not linea.strip():
+            if 'Event' in headers:
+                eventos.append(headers)
+            headers = {}
+    return eventos
+
+
+def formatear_evento_ami(headers):
+    """ Devuelve el evento en formato AMI, para grabarlo y poder reproducirlo luego """
+    return ''.join('{0}: {1}\r\n'.format(clave, valor) for clave, valor in headers.items()) + \
+        '\r\n'
+
+
+class EstadoColasAsterisk(object):
+
+    CLAVE_LLAMADAS_EN_ESPERA = 'OML:QUEUE_CALLERS:{0}'
+    CLAVE_AGENTES_NO_DISPONIBLES = 'OML:QUEUE_MEMBERS_UNAVAILABLE'
+    CLAVE_VIGENCIA = 'OML:QUEUE_STATE_ALIVE'
+    VIGENCIA = 120
+
+    # AST_DEVICE_UNAVAILABLE, que 'queue show' muestra como "(Unavailable)"
+    DISPOSITIVO_NO_DISPONIBLE = '5'
+
+    def __init__(self, redis_connection=None):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+
+    def _obtener_id(self, nombre):
+        """ Devuelve el id de la campaña (colas '<id>_<nombre>') o del agente (miembros
+            '<id>_<nombre>') """
+        try:
+            return int(nombre.split('_')[0])
+        except (AttributeError, ValueError):
+            return None
+
+    def _obtener_miembro(self, headers):
+        # En el QueueStatus el nombre del miembro viene en 'Name', en los eventos en 'MemberName'
+        return self._obtener_id(headers.get('MemberName', headers.get('Name')))
+
+    # Lectura
+
+    def esta_vigente(self):
+        """ Indica si el estado está siendo mantenido por el comando escuchar_eventos_colas """
+        try:
+            return bool(self.redis_connection.exists(self.CLAVE_VIGENCIA))
+        except RedisError as e:
+            logger.warning("Error al consultar el estado de las colas: {0}".format(e))
+            return False
+
+    def obtener_llamadas_en_espera(self, campanas_ids):
+        """ Devuelve la cantidad de llamadas en espera de las campañas que tengan alguna """
+        campanas_ids = list(campanas_ids)
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        for campana_id in campanas_ids:
+            pipeline.scard(self.CLAVE_LLAMADAS_EN_ESPERA.format(campana_id))
+        return {campana_id: cantidad
+                for campana_id, cantidad in zip(campanas_ids, pipeline.execute()) if cantidad}
+
+    def obtener_agentes_no_disponibles(self):
+        return set(int(agente_id) for agente_id in
+                   self.redis_connection.smembers(self.CLAVE_AGENTES_NO_DISPONIBLES))
+
+    # Escritura
+
+    def marcar_vigente(self):
+        self.redis_connection.set(self.CLAVE_VIGENCIA, 1, ex=self.VIGENCIA)
+
+    def marcar_no_vigente(self):
+        self.redis_connection.delete(self.CLAVE_VIGENCIA)
+
+    def procesar_evento(self, headers):
+        """ Aplica un evento AMI. Devuelve False si el evento no modifica el estado """
+        evento = headers.get('Event')
+        if evento in ('QueueCallerJoin', 'QueueCallerLeave'):
+            campana_id = self._obtener_id(headers.get('Queue'))
+            if campana_id is None or not headers.get('Uniqueid'):
+                return False
+            clave = self.CLAVE_LLAMADAS_EN_ESPERA.format(campana_id)
+            if evento == 'QueueCallerJoin':
+                self.redis_connection.sadd(clave, headers['Uniqueid'])
+            else:
+                self.redis_connection.srem(clave, headers['Uniqueid'])
+        elif evento in ('QueueMemberStatus', 'QueueMemberAdded', 'QueueMemberRemoved'):
+            agente_id = self._obtener_miembro(headers)
+            if agente_id is None:
+                return False
+            if evento != 'QueueMemberRemoved' and \
+                    headers.get('Status') == self.DISPOSITIVO_NO_DISPONIBLE:
+                self.redis_connection.sadd(self.CLAVE_AGENTES_NO_DISPONIBLES, agente_id)
+            else:
+                self.redis_connection.srem(self.CLAVE_AGENTES_NO_DISPONIBLES, agente_id)
+        else:
+            return False
+        return True
+
+    def reemplazar(self, eventos_queue_status):
+        """ Reemplaza todo el estado por el de los eventos QueueEntry y QueueMember de una
+            respuesta a QueueStatus """
+        llamadas_en_espera = {}
+        agentes_no_disponibles = set()
+        for headers in eventos_queue_status:
+            if headers['Event'] == 'QueueEntry':
+                campana_id = self._obtener_id(headers.get('Queue'))
+                if campana_id is not None and headers.get('Uniqueid'):
+                    clave = self.CLAVE_LLAMADAS_EN_ESPERA.format(campana_id)
+                    llamadas_en_espera.setdefault(clave, set()).add(headers['Uniqueid'])
+            elif headers['Event'] == 'QueueMember':
+                agente_id = self._obtener_miembro(headers)
+                if agente_id is not None and \
+                        headers.get('Status') == self.DISPOSITIVO_NO_DISPONIBLE:
+                    agentes_no_disponibles.add(agente_id)
+
+        claves_actuales = list(self.redis_connection.scan_iter(
+            match=self.CLAVE_LLAMADAS_EN_ESPERA.format('*'), count=1000))
+        pipeline = self.redis_connection.pipeline()
+        for clave in set(claves_actuales) - set(llamadas_en_espera):
+            pipeline.delete(clave)
+        for clave, uniqueids in llamadas_en_espera.items():
+            pipeline.delete(clave)
+            pipeline.sadd(clave, *uniqueids)
+        pipeline.delete(self.CLAVE_AGENTES_NO_DISPONIBLES)
+        if agentes_no_disponibles:
+            pipeline.sadd(self.CLAVE_AGENTES_NO_DISPONIBLES, *agentes_no_disponibles)
+        pipeline.set(self.CLAVE_VIGENCIA, 1, ex=self.VIGENCIA)
+        pipeline.execute()
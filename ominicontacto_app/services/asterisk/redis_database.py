@@ -21,12 +21,17 @@ from __future__ import unicode_literals
 
 import json
 import sys
+import time
+
+from uuid import uuid4
 
 from django.conf import settings
+from django.db import connection
 from django.utils.translation import ugettext as _
 
 from ominicontacto_app.models import (
-    AgenteProfile, Pausa, Campana, Blacklist, ConfiguracionDeAgentesDeCampana)
+    AgenteProfile, Pausa, Campana, Blacklist, ConfiguracionDeAgentesDeCampana,
+    ContactoBlacklist)
 from ominicontacto_app.utiles import convert_audio_asterisk_path_astdb
 from configuracion_telefonia_app.models import (
     RutaSaliente, IVR, DestinoEntrante, ValidacionFechaHora, GrupoHorario, IdentificadorCliente,
@@ -120,10 +125,67 @@ class AbstractRedisFamily(object):
     def get_nombre_families(self):
         raise (NotImplementedError())
 
+    def _obtener_families_esperadas(self):
+        """ Devuelve el contenido que debe tener cada family: {nombre_family: variables} """
+        return {self._get_nombre_family(family_member): self._create_dict(family_member)
+                for family_member in self._obtener_todos()}
+
+    def _obtener_families_actuales(self):
+        """ Devuelve el contenido actual en Redis de cada family, leido en un solo pipeline.
+            Las claves que no son hashes quedan con valor None para que sean reescritas """
+        redis_connection = self.get_redis_connection()
+        nombres = list(redis_connection.scan_iter(self.get_nombre_families() + ':*', count=1000))
+        pipeline = redis_connection.pipeline(transaction=False)
+        for nombre in nombres:
+            pipeline.hgetall(nombre)
+        contenidos = pipeline.execute(raise_on_error=False)
+        return {nombre: (None if isinstance(contenido, Exception) else contenido)
+                for nombre, contenido in zip(nombres, contenidos)}
+
+    def _normalizar_variables(self, variables):
+        # Redis devuelve todos los valores como strings
+        return {str(clave): str(valor) for clave, valor in variables.items()}
+
+    def _agregar_operaciones_regeneracion(self, pipeline, families_esperadas):
+        """ Permite agregar operaciones propias de la family a la transacción de
+            regeneración """
+        pass
+
     def regenerar_families(self):
-        """regenera la family"""
-        self._delete_tree_family()
-        self._create_families()
+        """regenera la family escribiendo sólo las families que cambiaron y eliminando las que
+        sobran, todo en una única transacción para que los lectores nunca las vean vacías"""
+        inicio = time.monotonic()
+        families_esperadas = {
+            nombre: self._normalizar_variables(variables)
+            for nombre, variables in self._obtener_families_esperadas().items()}
+        families_actuales = self._obtener_families_actuales()
+        pipeline = self.get_redis_connection().pipeline(transaction=True)
+        escritas = 0
+        for nombre, variables in families_esperadas.items():
+            actuales = families_actuales.get(nombre)
+            if actuales == variables or (actuales is None and not variables
+                                         and nombre not in families_actuales):
+                continue
+            pipeline.delete(nombre)
+            if variables:
+                pipeline.hset(nombre, mapping=variables)
+            escritas += 1
+        eliminadas = [nombre for nombre in families_actuales if nombre not in families_esperadas]
+        if eliminadas:
+            pipeline.delete(*eliminadas)
+        self._agregar_operaciones_regeneracion(pipeline, families_esperadas)
+        try:
+            pipeline.execute()
+        except RedisError as e:
+            raise e
+        except ConnectionError as e:
+            logger.exception(e)
+            sys.exit(1)
+        logger.info(_("Regeneración de {0}: {1} families escritas, {2} eliminadas, "
+                      "{3} sin cambios en {4:.3f}s".format(
+                          self.get_nombre_families(), escritas, len(eliminadas),
+                          len(families_esperadas) - escritas, time.monotonic() - inicio)))
+        return escritas, len(eliminadas)
 
     def regenerar_family(self, family_member):
         """regenera una family"""
@@ -132,6 +194,12 @@ class AbstractRedisFamily(object):
 
 
 class AbstractRedisChanelPublisher(AbstractRedisFamily):
+
+    def regenerar_families(self):
+        """regenera la family"""
+        self._delete_tree_family()
+        self._create_families()
+
     def _create_family(self, family_member):
         redis_connection = self.get_redis_connection()
         family = self._get_nombre_family(family_member)
@@ -249,6 +317,9 @@ class CampanaFamily(AbstractRedisFamily):
 
 class AgenteFamily(AbstractRedisFamily):
 
+    # Set con los ids de los agentes que tienen family, para no tener que recorrer las claves
+    CLAVE_INDICE = 'OML:AGENT_IDS'
+
     def _create_dict(self, agente, status='', timestamp=''):
         dict_agente = {
             'NAME': agente.user.get_full_name(),
@@ -273,14 +344,49 @@ class AgenteFamily(AbstractRedisFamily):
         family = self._get_nombre_family(family_member)
         variables = self._create_dict(family_member, status=status, timestamp=timestamp)
         try:
-            redis_crea_family = redis_connection.hset(family, mapping=variables)
-            return redis_crea_family
+            pipeline = redis_connection.pipeline()
+            pipeline.hset(family, mapping=variables)
+            pipeline.sadd(self.CLAVE_INDICE, family_member.id)
+            return pipeline.execute()[0]
+        except RedisError as e:
+            raise e
+        except ConnectionError as e:
+            logger.exception(e)
+            sys.exit(1)
+
+    def delete_family(self, agente):
+        redis_connection = self.get_redis_connection()
+        try:
+            pipeline = redis_connection.pipeline()
+            pipeline.delete(self._get_nombre_family(agente))
+            pipeline.srem(self.CLAVE_INDICE, agente.id)
+            pipeline.execute()
         except RedisError as e:
             raise e
         except ConnectionError as e:
             logger.exception(e)
             sys.exit(1)
 
+    def _agregar_operaciones_regeneracion(self, pipeline, families_esperadas):
+        prefijo = self.get_nombre_families() + ':'
+        pipeline.delete(self.CLAVE_INDICE)
+        if families_esperadas:
+            pipeline.sadd(self.CLAVE_INDICE,
+                          *[nombre[len(prefijo):] for nombre in families_esperadas])
+
+    def obtener_ids_agentes(self):
+        """ Devuelve los ids de los agentes con family. Si el índice todavía no existe
+            (families creadas por una versión anterior) lo reconstruye a partir de las claves """
+        redis_connection = self.get_redis_connection()
+        ids_agentes = redis_connection.smembers(self.CLAVE_INDICE)
+        if not ids_agentes and not redis_connection.exists(self.CLAVE_INDICE):
+            prefijo = self.get_nombre_families() + ':'
+            ids_agentes = set(key[len(prefijo):]
+                              for key in redis_connection.scan_iter(prefijo + '*', count=1000))
+            if ids_agentes:
+                redis_connection.sadd(self.CLAVE_INDICE, *ids_agentes)
+        return ids_agentes
+
     def regenerar_family(self, agente, preservar_status=False):
         """Regenera una family de Agente y preserva su status actual en Asterisk"""
         agente_status = ''
@@ -655,21 +761,91 @@ class DestinoPersonalizadoFamily(AbstractRedisFamily):
 
 
 class BlacklistFamily(object):
+    """
+    Mantiene en el set OML:BLACKLIST los teléfonos de la blacklist vigente.
+    La regeneración arma el set en una clave temporal, de a lotes para no bloquear a Redis,
+    y la reemplaza con un RENAME atómico: el dialplan nunca ve la blacklist vacía.
+    """
+
     BLACKLIST_KEY = 'OML:BLACKLIST'
+    TAMANO_LOTE = 10000
+    MAXIMO_DIFERENCIAS = 10000
 
-    def regenerar_families(self, blacklist=None):
+    def _conectar(self):
         self.redis_connection = redis.Redis(
             host=settings.REDIS_HOSTNAME,
             port=settings.CONSTANCE_REDIS_CONNECTION['port'],
             decode_responses=True)
-        self.redis_connection.delete(self.BLACKLIST_KEY)
 
+    def regenerar_families(self, blacklist=None):
+        self._conectar()
         if blacklist is None:
             blacklist = Blacklist.objects.first()
             if blacklist is None:
+                self.redis_connection.delete(self.BLACKLIST_KEY)
                 return
         telefonos = blacklist.contactosblacklist.values_list('telefono', flat=True)
-        self.redis_connection.sadd(self.BLACKLIST_KEY, *telefonos)
+        self._reemplazar(telefonos.iterator(chunk_size=self.TAMANO_LOTE))
+
+    def actualizar_families(self, blacklist, blacklist_anterior):
+        """ Reemplaza en Redis la blacklist anterior por la nueva. Si difieren en pocos
+            teléfonos sólo se agregan y quitan esos, si no se regenera el set completo """
+        if blacklist_anterior is None:
+            return self.regenerar_families(blacklist)
+        self._conectar()
+        # Si el set no refleja la blacklist anterior (ej: se reinició Redis) no sirve la diferencia
+        if self.redis_connection.scard(self.BLACKLIST_KEY) != \
+                blacklist_anterior.contactosblacklist.values('telefono').distinct().count():
+            return self.regenerar_families(blacklist)
+        agregados = self._obtener_telefonos_ausentes(blacklist, blacklist_anterior)
+        quitados = self._obtener_telefonos_ausentes(blacklist_anterior, blacklist)
+        if len(agregados) + len(quitados) > self.MAXIMO_DIFERENCIAS:
+            return self.regenerar_families(blacklist)
+        pipeline = self.redis_connection.pipeline()
+        for lote in self._dividir_en_lotes(agregados):
+            pipeline.sadd(self.BLACKLIST_KEY, *lote)
+        for lote in self._dividir_en_lotes(quitados):
+            pipeline.srem(self.BLACKLIST_KEY, *lote)
+        pipeline.execute()
+
+    def _obtener_telefonos_ausentes(self, blacklist, otra_blacklist):
+        """ Teléfonos de la blacklist que no están en la otra (hasta MAXIMO_DIFERENCIAS + 1).
+            Se usa NOT EXISTS para que PostgreSQL lo planifique como anti-join sobre el
+            índice (black_list_id, telefono): NOT IN sobre una subconsulta que no entra en
+            work_mem no puede hashearse y se vuelve cuadrático en listas grandes """
+        tabla = connection.ops.quote_name(ContactoBlacklist._meta.db_table)
+        no_en_otra = """
+        NOT EXISTS (SELECT 1 FROM {0} otra
+                    WHERE otra.black_list_id = %s AND otra.telefono = {0}.telefono)
+        """.format(tabla)
+        return list(blacklist.contactosblacklist.extra(
+            where=[no_en_otra], params=[otra_blacklist.pk]).values_list(
+                'telefono', flat=True).distinct()[:self.MAXIMO_DIFERENCIAS + 1])
+
+    def _reemplazar(self, telefonos):
+        clave_temporal = '{0}:TMP:{1}'.format(self.BLACKLIST_KEY, uuid4().hex)
+        try:
+            cargada = False
+            for lote in self._dividir_en_lotes(telefonos):
+                self.redis_connection.sadd(clave_temporal, *lote)
+                cargada = True
+            if cargada:
+                self.redis_connection.rename(clave_temporal, self.BLACKLIST_KEY)
+            else:
+                self.redis_connection.delete(self.BLACKLIST_KEY)
+        except Exception:
+            self.redis_connection.delete(clave_temporal)
+            raise
+
+    def _dividir_en_lotes(self, telefonos):
+        lote = []
+        for telefono in telefonos:
+            lote.append(telefono)
+            if len(lote) == self.TAMANO_LOTE:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
 
 
 class RegenerarAsteriskFamilysOML(object):
@@ -22,10 +22,11 @@ Servicio de regenarción de archivos de asterisk y reload del mismo
 """
 
 from __future__ import unicode_literals
-from configuracion_telefonia_app.models import MusicaDeEspera, Playlist
+from configuracion_telefonia_app.models import Playlist
 from configuracion_telefonia_app.regeneracion_configuracion_telefonia import (
     SincronizadorDeConfiguracionTelefonicaEnAsterisk)
 from ominicontacto_app.services.asterisk.redis_database import RegenerarAsteriskFamilysOML
+from ominicontacto_app.services.audio_conversor import ConversorDeAudioService
 from ominicontacto_app.services.redis.redis_streams import RedisStreams
 
 import getpass
@@ -294,13 +295,15 @@ class RegeneracionAsteriskService(object):
             crontab.write_to_user(user=getpass.getuser())
 
     def _reenviar_archivos_playlist_asterisk(self):
-        playlists = Playlist.objects.all()
+        # Las conversiones ya hechas con el mismo conversor se toman de la cache
+        conversor = ConversorDeAudioService()
+        playlists = Playlist.objects.prefetch_related('musicas')
         for playlist in playlists:
-            musica_espera_list = MusicaDeEspera.objects.filter(playlist=playlist.pk)
-            print(list(musica_espera_list))
-            for musica in musica_espera_list:
-                audio_file_asterisk = AudioConfigFile(musica)
-                audio_file_asterisk.copy_asterisk()
+            conversor.convertir_audios_de_playlist(playlist)
+            for musica in playlist.musicas.all():
+                if musica.audio_asterisk.name:
+                    audio_file_asterisk = AudioConfigFile(musica)
+                    audio_file_asterisk.copy_asterisk()
 
     def _reenviar_paquetes_idioma(self):
         ASTERISK_SOUNDS_URL = 'https://downloads.asterisk.org/pub/telephony/sounds/'
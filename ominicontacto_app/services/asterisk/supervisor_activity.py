@@ -28,6 +28,8 @@ from django.utils.translation import ugettext as _
 
 from ominicontacto_app.services.asterisk.asterisk_ami import AMIManagerConnector
 from ominicontacto_app.services.asterisk.agent_activity import AgentActivityAmiManager
+from ominicontacto_app.services.asterisk.estado_colas import EstadoColasAsterisk
+from ominicontacto_app.services.asterisk.redis_database import AgenteFamily
 from ominicontacto_app.models import AgenteProfile
 
 LONGITUD_MINIMA_HEADERS = 4
@@ -49,19 +51,24 @@ class SupervisorActivityAmiManager(object):
         self.manager.disconnect()
         return data_returned
 
-    def obtener_agentes_activos(self):
-        agentes_activos = []
+    def obtener_agentes_activos(self, agentes_ids=None):
+        """ Devuelve el estado de los agentes con sesión. Si se indican los ids de agentes
+            sólo se consultan esos agentes """
         redis_connection = redis.Redis(
             host=settings.REDIS_HOSTNAME, port=settings.CONSTANCE_REDIS_CONNECTION['port'],
             decode_responses=True)
-        # TODO: cambiar a usar el metodo 'scan' que es mas eficiente con datos muy grandes
-        # y realiza una especie de paginación
-        keys_agentes = redis_connection.keys('OML:AGENT*')
+        agente_family = AgenteFamily()
+        agente_family.redis_connection = redis_connection
+        if agentes_ids is None:
+            agentes_ids = agente_family.obtener_ids_agentes()
+        agentes_ids = list(agentes_ids)
+        # Una sola ida y vuelta a Redis para todos los agentes
+        pipeline = redis_connection.pipeline(transaction=False)
+        for id_agente in agentes_ids:
+            pipeline.hgetall('{0}:{1}'.format(agente_family.get_nombre_families(), id_agente))
         agentes_activos = []
-        for key in keys_agentes:
-            agente_info = redis_connection.hgetall(key)
+        for id_agente, agente_info in zip(agentes_ids, pipeline.execute()):
             status = agente_info.get('STATUS', '')
-            id_agente = key.split(':')[-1]
             if status != '' and len(agente_info) >= LONGITUD_MINIMA_HEADERS:
                 agente_info['nombre'] = agente_info['NAME']
                 agente_info['status'] = status
@@ -100,6 +107,19 @@ class SupervisorActivityAmiManager(object):
 
     def escribir_estado_agentes_unavailable(self):
         """ Busca en el queue de Asterisk si hay agentes Unavailable para reportarlo en Redis"""
+        estado_colas = EstadoColasAsterisk()
+        if estado_colas.esta_vigente():
+            # Estado mantenido por el comando escuchar_eventos_colas
+            agentes_profiles = list(AgenteProfile.objects.filter(
+                id__in=estado_colas.obtener_agentes_no_disponibles()))
+        else:
+            agentes_profiles = self._obtener_agentes_unavailable_queue_show()
+
+        if agentes_profiles:
+            for agente_profile in agentes_profiles:
+                self.agent_activity.set_agent_as_unavailable(agente_profile)
+
+    def _obtener_agentes_unavailable_queue_show(self):
         self.manager.connect()
         user_activity_list, error = self.manager._ami_manager('command', 'queue show')
         self.manager.disconnect()
@@ -112,7 +132,4 @@ class SupervisorActivityAmiManager(object):
                 agente_profile = AgenteProfile.objects.get(id=agente_id)
                 if agente_profile not in agentes_profiles:
                     agentes_profiles.append(agente_profile)
-
-        if agentes_profiles:
-            for agente_profile in agentes_profiles:
-                self.agent_activity.set_agent_as_unavailable(agente_profile)
+        return agentes_profiles
@@ -23,20 +23,96 @@ Conversión de archivos de audio para Asterisk.
 
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import os
+import shutil
 import subprocess
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.utils.translation import ugettext as _
 from ominicontacto_app.errors import OmlAudioConversionError
 from ominicontacto_app.models import ArchivoDeAudio
+from ominicontacto_app.services.redis.progreso import PublicadorDeProgreso
 from configuracion_telefonia_app.models import MusicaDeEspera
 import logging as _logging
 
 logger = _logging.getLogger(__name__)
 
+_pool_conversion_audio = None
+_pid_pool_conversion_audio = None
+_lock_pool_conversion_audio = threading.Lock()
+
+
+def obtener_pool_conversion_audio():
+    """ Devuelve el pool del proceso que ejecuta las conversiones de audio. Acota la cantidad
+        de conversores corriendo a la vez (OML_AUDIO_CONVERSOR_PROCESOS). Se crea uno por
+        proceso para no compartir threads con los procesos forkeados por uwsgi. """
+    global _pool_conversion_audio, _pid_pool_conversion_audio
+    pid = os.getpid()
+    with _lock_pool_conversion_audio:
+        if _pool_conversion_audio is None or _pid_pool_conversion_audio != pid:
+            _pool_conversion_audio = ThreadPoolExecutor(
+                max_workers=settings.OML_AUDIO_CONVERSOR_PROCESOS)
+            _pid_pool_conversion_audio = pid
+        return _pool_conversion_audio
+
+
+class CacheConversionesDeAudio(object):
+    """
+    Guarda los audios convertidos en un directorio, con el hash del contenido del archivo
+    original y del comando de conversión como nombre. Así un mismo audio subido varias veces,
+    o reenviado al regenerar la configuración, no se vuelve a convertir mientras no cambie
+    `TMPL_OML_AUDIO_CONVERSOR`.
+    """
+
+    DIRECTORIO = 'cache_audios_asterisk'
+    TAMANO_BLOQUE = 1024 * 1024
+
+    def __init__(self, directorio=None):
+        if directorio is None:
+            directorio = settings.OML_AUDIO_CACHE_CONVERSIONES
+        if directorio is None:
+            directorio = os.path.join(settings.MEDIA_ROOT, self.DIRECTORIO)
+        self.directorio = directorio
+
+    def obtener_clave(self, input_file_abs):
+        hash_audio = hashlib.sha256()
+        hash_audio.update(json.dumps([settings.TMPL_OML_AUDIO_CONVERSOR,
+                                      settings.TMPL_OML_AUDIO_CONVERSOR_EXTENSION]).encode())
+        with open(input_file_abs, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(self.TAMANO_BLOQUE), b''):
+                hash_audio.update(bloque)
+        return hash_audio.hexdigest()
+
+    def _path(self, clave):
+        return os.path.join(self.directorio, clave)
+
+    def copiar(self, clave, destino):
+        """ Copia el audio convertido guardado con la clave a destino.
+            Devuelve False si no estaba guardado """
+        try:
+            shutil.copyfile(self._path(clave), destino)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def guardar(self, clave, origen):
+        os.makedirs(self.directorio, exist_ok=True)
+        # Se copia a un temporal y se renombra para que nunca se lea un archivo a medio copiar
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, prefix='.tmp-')
+        os.close(descriptor)
+        try:
+            shutil.copyfile(origen, temporal)
+            os.replace(temporal, self._path(clave))
+        except Exception:
+            os.remove(temporal)
+            raise
+
 
 class ConversorDeAudioService(object):
     """Servicio que realiza la conversion de archivos de audio
@@ -52,6 +128,9 @@ class ConversorDeAudioService(object):
     2. {1} para el sufijo del nombre del archivo (ej: '.wav')
     """
 
+    def __init__(self, cache=None):
+        self.cache = CacheConversionesDeAudio() if cache is None else cache
+
     def _crear_directorios(self, directorio, mode=0o755):
         """Crea directorio (recursivamente) si no existen. Es el equivalente
         de `mkdir -p`.
@@ -94,7 +173,8 @@ class ConversorDeAudioService(object):
         return False
 
     def _convertir_audio(self, input_file_abs, output_filename_abs):
-        """Convierte archivo de audio.
+        """Convierte archivo de audio. Si el mismo audio ya fue convertido con el
+        mismo conversor se copia la conversión guardada en la cache.
 
         :param input_file_abs: path absoluto a archivo de entrada (.wav)
         :type input_file_abs: str
@@ -119,6 +199,31 @@ class ConversorDeAudioService(object):
                 output_filename_abs)))
             raise OmlAudioConversionError(_("El archivo de salida no es un path absoluto"))
 
+        # Se convierte a un temporal (con la misma extension, que puede usar el conversor para
+        # determinar el formato) y se renombra: si falla queda el audio convertido anterior
+        directorio_salida, nombre_salida = os.path.split(output_filename_abs)
+        descriptor, temporal = tempfile.mkstemp(
+            dir=directorio_salida, prefix='.tmp-', suffix=os.path.splitext(nombre_salida)[1])
+        os.close(descriptor)
+        try:
+            clave = self.cache.obtener_clave(input_file_abs)
+            if self.cache.copiar(clave, temporal):
+                logger.info(_("Se reutiliza la conversion de audio de {0}".format(
+                    input_file_abs)))
+            else:
+                self._ejecutar_conversor(input_file_abs, temporal)
+                self.cache.guardar(clave, temporal)
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, output_filename_abs)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _ejecutar_conversor(self, input_file_abs, output_filename_abs):
+        """Ejecuta `TMPL_OML_AUDIO_CONVERSOR`.
+
+        :raises: OmlAudioConversionError: si el conversor termina con error
+        """
         stdout_file = tempfile.TemporaryFile()
         stderr_file = tempfile.TemporaryFile()
 
@@ -176,7 +281,23 @@ class ConversorDeAudioService(object):
         :type archivo_de_audio: ominicontacto_app.models.ArchivoDeAudio
         :raises: OmlAudioConversionError
         """
+        wav_full_path, abs_output_filename, filename = self._preparar_conversion(
+            archivo_de_audio)
+
+        # convierte archivo
+        obtener_pool_conversion_audio().submit(
+            self._convertir_audio, wav_full_path, abs_output_filename).result()
+
+        # guarda ref. a archivo convertido
+        archivo_de_audio.audio_asterisk = filename
+        archivo_de_audio.save()
 
+    def _preparar_conversion(self, archivo_de_audio):
+        """Crea el directorio y archivo de salida de la conversión.
+
+        :returns: path absoluto al audio original, path absoluto al archivo de
+                  salida y nombre del archivo de salida relativo a MEDIA_ROOT
+        """
         assert isinstance(archivo_de_audio, ArchivoDeAudio) or \
             isinstance(archivo_de_audio, MusicaDeEspera)
 
@@ -203,10 +324,59 @@ class ConversorDeAudioService(object):
 
         assert os.path.exists(abs_output_filename)
 
-        # convierte archivo
-        self._convertir_audio(wav_full_path, abs_output_filename)
+        return (wav_full_path, abs_output_filename,
+                os.path.join(archivo_de_audio.DIR_AUDIO_PREDEFINIDO, filename))
 
-        # guarda ref. a archivo convertido
-        archivo_de_audio.audio_asterisk = os.path.join(
-            archivo_de_audio.DIR_AUDIO_PREDEFINIDO, filename)
-        archivo_de_audio.save()
+    def convertir_audios(self, conversiones, progreso=None):
+        """Convierte en paralelo (en el pool del proceso) varios archivos de audio.
+
+        :param conversiones: pares (path absoluto de entrada, path absoluto de salida)
+        :param progreso: PublicadorDeProgreso a avanzar por cada archivo procesado
+        :returns: diccionario con el OmlAudioConversionError de cada archivo de salida
+                  que no se pudo convertir
+        """
+        if progreso is not None:
+            progreso.iniciar()
+        pool = obtener_pool_conversion_audio()
+        futuros = {pool.submit(self._convertir_audio, entrada, salida): salida
+                   for entrada, salida in conversiones}
+        errores = {}
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except OmlAudioConversionError as e:
+                errores[futuros[futuro]] = e
+            if progreso is not None:
+                progreso.avanzar()
+        return errores
+
+    def convertir_audios_de_playlist(self, playlist, key_task=None):
+        """Convierte en paralelo los audios originales de todas las músicas de espera de
+        la playlist y actualiza las instancias de MusicaDeEspera convertidas.
+        Las músicas sin audio original en disco se ignoran.
+
+        :param key_task: canal de Redis donde publicar el porcentaje de avance
+        :returns: lista de MusicaDeEspera que no se pudieron convertir
+        """
+        audios = {}
+        for musica in playlist.musicas.all():
+            if musica.audio_original and \
+                    os.path.exists(default_storage.path(musica.audio_original.name)):
+                audios[musica] = self._preparar_conversion(musica)
+
+        progreso = None
+        if key_task is not None:
+            progreso = PublicadorDeProgreso(key_task, len(audios))
+        errores = self.convertir_audios(
+            [(entrada, salida) for entrada, salida, __ in audios.values()], progreso)
+
+        fallidas = []
+        for musica, (__, salida, filename) in audios.items():
+            if salida in errores:
+                logger.warning(_("No se pudo convertir la musica de espera {0}: {1}".format(
+                    musica.descripcion, errores[salida])))
+                fallidas.append(musica)
+            elif musica.audio_asterisk.name != filename:
+                musica.audio_asterisk = filename
+                musica.save()
+        return fallidas
@@ -23,11 +23,15 @@ Servicio encargado de validar y crear las bases de datos.
 
 from __future__ import unicode_literals
 
+import io
 import json
 import logging
 import os
 import re
+import time
 
+from django.conf import settings
+from django.db import connection, transaction
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext as _
 
@@ -43,6 +47,81 @@ from ominicontacto_app.utiles import elimina_tildes
 logger = logging.getLogger(__name__)
 
 
+class InsercionContactosEnLotes(object):
+    """
+    Inserta contactos de una BaseDatosContacto en lotes de tamaño fijo.
+    En PostgreSQL cada lote se envía con COPY ... FROM STDIN, en otros motores
+    se utiliza bulk_create.
+    """
+
+    def __init__(self, base_datos_contacto, tamano_lote=None):
+        self.base_datos_contacto = base_datos_contacto
+        if tamano_lote is None:
+            tamano_lote = settings.OL_TAMANO_LOTE_IMPORTACION_CONTACTOS
+        self.tamano_lote = tamano_lote
+        self.usar_copy = connection.vendor == 'postgresql'
+        self.lote = []
+        self.cantidad_insertados = 0
+        self.inicio = time.time()
+
+    def agregar(self, telefono, datos, id_externo):
+        self.lote.append((telefono, datos, id_externo))
+        if len(self.lote) >= self.tamano_lote:
+            self.volcar()
+
+    def volcar(self):
+        """ Inserta en la base de datos los contactos pendientes del lote actual """
+        if not self.lote:
+            return
+        if self.usar_copy:
+            self._volcar_con_copy()
+        else:
+            self._volcar_con_bulk_create()
+        self.cantidad_insertados += len(self.lote)
+        self.lote = []
+
+    def _valor_copy(self, valor):
+        if valor is None:
+            return '\\N'
+        return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace(
+            '\n', '\\n').replace('\r', '\\r')
+
+    def _volcar_con_copy(self):
+        opts = Contacto._meta
+        columnas = [opts.get_field(nombre).column
+                    for nombre in ('telefono', 'datos', 'bd_contacto', 'id_externo',
+                                   'es_originario')]
+        buffer = io.StringIO()
+        for telefono, datos, id_externo in self.lote:
+            valores = [telefono, datos, self.base_datos_contacto.pk, id_externo, 't']
+            buffer.write('\t'.join(self._valor_copy(valor) for valor in valores))
+            buffer.write('\n')
+        buffer.seek(0)
+        sql = 'COPY {0} ({1}) FROM STDIN'.format(
+            connection.ops.quote_name(opts.db_table),
+            ', '.join(connection.ops.quote_name(columna) for columna in columnas))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    def _volcar_con_bulk_create(self):
+        Contacto.objects.bulk_create([
+            Contacto(telefono=telefono, datos=datos, bd_contacto=self.base_datos_contacto,
+                     id_externo=id_externo)
+            for telefono, datos, id_externo in self.lote])
+
+    @property
+    def contactos_por_segundo(self):
+        duracion = time.time() - self.inicio
+        if duracion <= 0:
+            return float(self.cantidad_insertados)
+        return self.cantidad_insertados / duracion
+
+    def loguear_rendimiento(self):
+        logger.info(_("Importados {0} contactos en la base {1} ({2:.0f} contactos por "
+                      "segundo)".format(self.cantidad_insertados, self.base_datos_contacto.pk,
+                                        self.contactos_por_segundo)))
+
+
 class CreacionBaseDatosService(object):
 
     # TODO: Antes de crear la base de datos debería validar un poco la estructura
@@ -118,18 +197,19 @@ class CreacionBaseDatosService(object):
 
         ids_externos = base_datos_contacto.contactos.values_list('id_externo', flat=True)
         ids_externos = set(ids_externos)
-        ids_nuevos_contactos = []
+        insercion = InsercionContactosEnLotes(base_datos_contacto)
 
-        try:
-            estructura_archivo = parser.get_estructura_archivo(base_datos_contacto)
-            posicion_primer_telefono = estructura_archivo[0].index(
-                str(campos_telefonicos[0]))
+        # Si falla la importación se descartan todos los contactos insertados
+        with transaction.atomic():
+            filas = parser.iterar_estructura_archivo(base_datos_contacto)
+            encabezado = next(filas)
+            posicion_primer_telefono = encabezado.index(str(campos_telefonicos[0]))
             cantidad_contactos = 0
 
             if base_datos_contacto.cantidad_contactos:
                 cantidad_contactos = base_datos_contacto.cantidad_contactos
             numero_fila = 0
-            for lista_dato in estructura_archivo[1:]:
+            for lista_dato in filas:
                 numero_fila += 1
                 telefono, datos, id_externo = self.obtener_telefono_y_datos(
                     lista_dato, posicion_primer_telefono, columna_id_externo)
@@ -138,7 +218,6 @@ class CreacionBaseDatosService(object):
                 if id_externo is not None and id_externo != '':
                     # El id_externo no puede estar repetido
                     if id_externo in ids_externos:
-                        base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
                         raise(CreacionBaseDatosServiceIdExternoError(numero_fila,
                                                                      columna_id_externo,
                                                                      lista_dato,
@@ -146,22 +225,10 @@ class CreacionBaseDatosService(object):
                     else:
                         ids_externos.add(id_externo)
 
-                contacto = Contacto.objects.create(
-                    telefono=telefono,
-                    datos=datos,
-                    bd_contacto=base_datos_contacto,
-                    id_externo=id_externo
-                )
-                ids_nuevos_contactos.append(contacto.id)
-
-        except OmlParserMaxRowError:
-            base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
-            raise
-
-        except OmlParserCsvImportacionError:
-            base_datos_contacto.contactos.filter(id__in=ids_nuevos_contactos).delete()
-            raise
+                insercion.agregar(telefono, datos, id_externo)
+            insercion.volcar()
 
+        insercion.loguear_rendimiento()
         base_datos_contacto.cantidad_contactos = cantidad_contactos
         base_datos_contacto.save()
 
@@ -632,22 +699,3 @@ class PredictorMetadataService(object):
 
         logger.debug("columnas_con_telefonos: %s", columnas_con_telefonos)
         return columnas_con_telefonos
-
-
-class BaseDatosService(object):
-    """Servicio de base de datos usado para eliminar contactos duplicados
-       se podria eliminar este servicio ya que el filtro se está haciendo por la pk
-       jamas habria una pk duplicada
-    """
-
-    def eliminar_contactos_duplicados(self, base_datos):
-
-        contactos = Contacto.objects.filter(bd_contacto=base_datos)
-        cantidad_contactos = base_datos.cantidad_contactos
-        for contacto in contactos:
-            if contactos.filter(pk=contacto.pk).count() > 1:
-                contacto.delete()
-                cantidad_contactos -= 1
-
-        base_datos.cantidad_contactos = cantidad_contactos
-        base_datos.save()
@@ -26,14 +26,16 @@ from __future__ import unicode_literals
 
 import codecs
 import csv
+import io
 import logging
 import os
 
+from django.conf import settings
+from django.db import connection, transaction
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext as _
 
-from ominicontacto_app.errors import OmlArchivoImportacionInvalidoError, \
-    OmlError, OmlParserMaxRowError, OmlParserCsvImportacionError
+from ominicontacto_app.errors import OmlArchivoImportacionInvalidoError, OmlError
 from ominicontacto_app.models import ContactoBlacklist
 from ominicontacto_app.parser import ParserCsv
 
@@ -76,36 +78,77 @@ class CreacionBlacklistService(object):
     def importa_contactos(self, blacklist):
         """
         Segundo paso de la creación de una Blacklist.
-        Este método se encarga de generar los objectos Contacto por cada linea
-        del archivo de importación especificado para la base de datos de
-        contactos.
+        Este método se encarga de generar los objectos ContactoBlacklist por cada linea
+        del archivo de importación, insertándolos en lotes.
         """
 
         parser = ParserCsv()
+        insercion = InsercionTelefonosBlacklistEnLotes(blacklist)
 
-        try:
-            estructura_archivo = parser.get_estructura_archivo(blacklist)
+        # Si falla la importación se descartan todos los teléfonos insertados
+        with transaction.atomic():
+            filas = parser.iterar_estructura_archivo(blacklist)
+            next(filas)
             cantidad_contactos = 0
             if blacklist.cantidad_contactos:
                 cantidad_contactos = blacklist.cantidad_contactos
-            for lista_dato in estructura_archivo[1:]:
+            for lista_dato in filas:
                 cantidad_contactos += 1
-                ContactoBlacklist.objects.create(
-                    telefono=lista_dato[0],
-                    black_list=blacklist,
-                )
-        except OmlParserMaxRowError:
-            blacklist.elimina_contactos()
-            raise
-
-        except OmlParserCsvImportacionError:
-            blacklist.elimina_contactos()
-            raise
+                insercion.agregar(lista_dato[0])
+            insercion.volcar()
 
         blacklist.cantidad_contactos = cantidad_contactos
         blacklist.save()
 
 
+class InsercionTelefonosBlacklistEnLotes(object):
+    """
+    Inserta los teléfonos de una Blacklist en lotes de tamaño fijo, igual que
+    InsercionContactosEnLotes: con COPY ... FROM STDIN en PostgreSQL y con bulk_create en
+    otros motores.
+    """
+
+    def __init__(self, blacklist, tamano_lote=None):
+        self.blacklist = blacklist
+        if tamano_lote is None:
+            tamano_lote = settings.OL_TAMANO_LOTE_IMPORTACION_CONTACTOS
+        self.tamano_lote = tamano_lote
+        self.usar_copy = connection.vendor == 'postgresql'
+        self.lote = []
+
+    def agregar(self, telefono):
+        self.lote.append(telefono)
+        if len(self.lote) >= self.tamano_lote:
+            self.volcar()
+
+    def volcar(self):
+        """ Inserta en la base de datos los teléfonos pendientes del lote actual """
+        if not self.lote:
+            return
+        if self.usar_copy:
+            self._volcar_con_copy()
+        else:
+            ContactoBlacklist.objects.bulk_create([
+                ContactoBlacklist(telefono=telefono, black_list=self.blacklist)
+                for telefono in self.lote])
+        self.lote = []
+
+    def _volcar_con_copy(self):
+        opts = ContactoBlacklist._meta
+        columnas = [opts.get_field(nombre).column for nombre in ('telefono', 'black_list')]
+        buffer = io.StringIO()
+        for telefono in self.lote:
+            telefono = telefono.replace('\\', '\\\\').replace('\t', '\\t').replace(
+                '\n', '\\n').replace('\r', '\\r')
+            buffer.write('{0}\t{1}\n'.format(telefono, self.blacklist.pk))
+        buffer.seek(0)
+        sql = 'COPY {0} ({1}) FROM STDIN'.format(
+            connection.ops.quote_name(opts.db_table),
+            ', '.join(connection.ops.quote_name(columna) for columna in columnas))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+
 class NoSePuedeInferirMetadataErrorFormatoFilas(OmlError):
     """Indica que las filas no tienen el formato adecuado"""
     pass
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Búsqueda de contactos de una base de datos con resultados ordenados por relevancia.
+"""
+
+from __future__ import unicode_literals
+
+import logging as _logging
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction, OperationalError
+from django.db.models import FloatField, Func, Value
+from django.db.models.functions import Greatest, Upper
+
+from ominicontacto_app.models import Contacto, normalizar_texto_busqueda
+
+logger = _logging.getLogger(__name__)
+
+
+class SimilitudDePalabra(Func):
+    """ word_similarity() de pg_trgm: similitud del texto con la parte más parecida del campo """
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+class BuscadorDeContactos(object):
+    """
+    Devuelve primero los contactos con el mismo teléfono (comparando sólo dígitos) y después
+    los que contienen el texto en el teléfono o en los datos, ordenados por similitud de
+    trigramas. La segunda consulta se cancela si supera el presupuesto de tiempo, en cuyo
+    caso sólo se devuelven las coincidencias de teléfono.
+    """
+
+    LIMITE = 20
+    PRESUPUESTO_MS = 300
+
+    def __init__(self, bd_contacto, limite=None, presupuesto_ms=None):
+        self.bd_contacto = bd_contacto
+        self.limite = self.LIMITE if limite is None else limite
+        self.presupuesto_ms = self.PRESUPUESTO_MS if presupuesto_ms is None else presupuesto_ms
+
+    def buscar(self, texto):
+        """ Devuelve los contactos encontrados y si la búsqueda se completó dentro del
+            presupuesto de tiempo """
+        texto = texto.strip()
+        contactos = list(Contacto.objects.contactos_by_telefono_normalizado(
+            self.bd_contacto, texto).select_related('bd_contacto').order_by('pk')[:self.limite])
+        if not texto or len(contactos) >= self.limite:
+            return contactos, True
+        try:
+            contactos.extend(self._buscar_similares(texto, [contacto.pk for contacto in contactos],
+                                                    self.limite - len(contactos)))
+        except OperationalError as e:
+            logger.warning("Búsqueda de contactos cancelada por tiempo: {0}".format(e))
+            return contactos, False
+        return contactos, True
+
+    def _buscar_similares(self, texto, excluidos, cantidad):
+        texto_datos = normalizar_texto_busqueda(texto).upper()
+        similares = Contacto.objects.contactos_by_filtro_bd_contacto(
+            self.bd_contacto, texto).exclude(pk__in=excluidos).annotate(
+                similitud=Greatest(TrigramSimilarity('telefono', texto),
+                                   SimilitudDePalabra(Value(texto_datos), Upper('datos')))
+        ).select_related('bd_contacto').order_by('-similitud', 'pk')[:cantidad]
+        # Si se cancela por tiempo, al volver al savepoint también se descarta el SET LOCAL
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [self.presupuesto_ms])
+            similares = list(similares)
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout TO DEFAULT')
+        return similares
@@ -31,6 +31,8 @@ from django.utils.translation import ugettext as _
 from django.conf import settings
 from ominicontacto_app.utiles import elimina_comillas, remplace_espacio_por_guion
 from ominicontacto_app.services.wombat_service import WombatService
+from ominicontacto_app.services.wombat_snapshot import (
+    snapshot_runs, snapshot_calls, snapshot_stats)
 from ominicontacto_app.services.wombat_config import (
     CampanaCreator, TrunkCreator, RescheduleRuleCreator, EndPointCreator,
     CampanaEndPointCreator, CampanaListCreator, CampanaDeleteListCreator,
@@ -311,7 +313,11 @@ class CampanaService():
         nombre_lista_ascii = self.obtener_nombre_lista_ascii(campana)
         url_edit = "api/lists/?op=addToList&list={0}".format(nombre_lista_ascii)
         # crea lista de contactos en wombat
-        service_wombat.update_lista_wombat("newcampaign_list_contacto.txt", url_edit)
+        salida = service_wombat.update_lista_wombat("newcampaign_list_contacto.txt", url_edit)
+        if salida is None:
+            raise WombatDialerError(
+                _("No se pudo subir completa la lista de contactos {0} a Wombat").format(
+                    nombre_lista_ascii))
 
     def crear_lista_asociacion_campana_wombat(self, campana):
         """
@@ -343,6 +349,8 @@ class CampanaService():
                 raise WombatDialerError(r.text)
         else:
             raise WombatDialerError(r.raise_for_status())
+        # Cambió el estado de la campaña: las consultas siguientes no deben ver el anterior
+        snapshot_runs().invalidar()
 
     def start_campana_wombat(self, campana):
         """
@@ -419,6 +427,7 @@ class CampanaService():
             return False
 
         if r.status_code == 200:
+            snapshot_runs().invalidar()
             return True
         return False
 
@@ -428,13 +437,12 @@ class CampanaService():
         :param campana: campana a la cual deseo obtener sus datos
         :return: los datos de la campana
         """
-        service_wombat = WombatService()
-        url_edit = "api/live/runs/"
-        salida = service_wombat.list_config_wombat(url_edit)
-        if salida:
-            return self.obtener_datos_campana_json_de_wombat(salida, campana)
-        else:
+        id_wombat = str(campana.campaign_id_wombat)
+        runs = snapshot_runs().obtener([id_wombat])
+        if runs is None:
             return None
+        salida = {'result': {'campaigns': runs.get(id_wombat, [])}}
+        return self.obtener_datos_campana_json_de_wombat(salida, campana)
 
     def obtener_datos_campanas_run(self, campanas_por_id_wombat):
         """
@@ -442,13 +450,12 @@ class CampanaService():
         :param campana: diccionario con campanas (por wombat_id) a la cual deseo obtener sus datos
         :return: dict con los datos de la campanas indexado por id de campaña
         """
-        service_wombat = WombatService()
-        url_edit = "api/live/runs/"
-        salida = service_wombat.list_config_wombat(url_edit)
-        if salida:
-            return self.obtener_datos_campanas_json_de_wombat(salida, campanas_por_id_wombat)
-        else:
+        runs = snapshot_runs().obtener([str(id_wombat) for id_wombat in campanas_por_id_wombat])
+        if runs is None:
             return None
+        salida = {'result': {'campaigns': [
+            campaign for campaigns in runs.values() for campaign in campaigns]}}
+        return self.obtener_datos_campanas_json_de_wombat(salida, campanas_por_id_wombat)
 
     def cambiar_base(self, campana, telefonos, evitar_duplicados, evitar_sin_telefono,
                      prefijo_discador):
@@ -483,17 +490,12 @@ class CampanaService():
 
     def obtener_calls_live(self):
         """ retorna las llamada e en vivo en este momento"""
-        service_wombat = WombatService()
-        url_edit = "api/live/calls/"
-        salida = service_wombat.list_config_wombat(url_edit)
-        return self.obtener_datos_calls(salida)
+        calls = snapshot_calls().obtener(['hopperState'])
+        return self.obtener_datos_calls({'result': calls})
 
     def obtener_status_campana_running(self, hopper_camp_id):
         """ retorona el status de la campana en wombat"""
-        service_wombat = WombatService()
-        url_edit = "api/reports/stats/?id={0}".format(hopper_camp_id)
-        salida = service_wombat.list_config_wombat(url_edit)
-        result = salida['result']
+        result = snapshot_stats(hopper_camp_id).obtener(['statsOut'])
         status = self.translate_state_wombat(result['statsOut'])
         return status
 
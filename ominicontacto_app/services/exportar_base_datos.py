@@ -30,12 +30,12 @@ import os
 import json
 
 from django.conf import settings
+from django.db.models import Min
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext as _
 
 from ominicontacto_app.utiles import crear_archivo_en_media_root
 from ominicontacto_app.models import Contacto
-from ominicontacto_app.services.base_de_datos_contactos import BaseDatosService
 from ominicontacto_app.services.wombat_config import CampanaListContactoConfigFile
 
 logger = logging.getLogger(__name__)
@@ -127,6 +127,8 @@ class ArchivoDeReporteCsv(object):
 
 class SincronizarBaseDatosContactosService(object):
 
+    CONTACTOS_POR_LOTE = 5000
+
     def __init__(self):
         self._campana_list_contacto_config_file = CampanaListContactoConfigFile()
 
@@ -134,27 +136,31 @@ class SincronizarBaseDatosContactosService(object):
 
         base_datos = campana.bd_contacto
 
-        # no tiene sentido ya que esto hace un filtro por pk
-        if evitar_duplicados:
-            service_base_datos = BaseDatosService()
-            service_base_datos.eliminar_contactos_duplicados(base_datos)
-
         contactos = Contacto.objects.contactos_by_bd_contacto(base_datos)
 
         if evitar_sin_telefono:
             contactos = contactos.exclude(telefono__isnull=True).exclude(
                 telefono__exact='')
 
+        if evitar_duplicados:
+            # Sólo el primer contacto de cada teléfono
+            primeros = contactos.order_by().values('telefono').annotate(
+                primero=Min('pk')).values('primero')
+            contactos = contactos.filter(pk__in=primeros)
+
         metadata = base_datos.get_metadata()
 
-        lista_contacto = self.escribir_lista(contactos, metadata, campana, prefijo_discador)
+        lista_contacto = self.generar_lista(contactos, metadata, campana, prefijo_discador)
         logger.info(_("Creando archivo para asociacion lista {0} campana".format(campana.nombre)))
 
         self._campana_list_contacto_config_file.write(lista_contacto)
-        # return lista_contacto
-
-    def escribir_lista(self, contactos, metadata, campana, prefijo_discador):
 
+    def generar_lista(self, contactos, metadata, campana, prefijo_discador):
+        """
+        Genera la lista de contactos para wombat de a un lote por vez, sin tenerla entera en
+        memoria. Cada lote es una línea 'numbers=<contacto>|<contacto>|...' que se sube en un
+        request aparte (ver WombatService.update_lista_wombat).
+        """
         list_multinum = []
         n_multinum = 0
         # Itero por los otros campos con telefonos (menos el primero que esta en contacto.telefono)
@@ -169,18 +175,26 @@ class SincronizarBaseDatosContactosService(object):
                     posicion_en_datos -= 1
             list_multinum.append(('MULTINUM' + str((n_multinum)), posicion_en_datos))
 
-        lista_contactos = "numbers="
-        for contacto in contactos:
-            dato_contacto = []
+        campos = ('pk', 'telefono', 'datos') if list_multinum else ('pk', 'telefono')
+        id_campana = "id_campana:" + str(campana.id)
+        lote = []
+        lotes_generados = 0
+        for contacto in contactos.order_by('pk').values_list(*campos).iterator(
+                chunk_size=self.CONTACTOS_POR_LOTE):
             # --- Buscamos datos
-            dato_contacto.append(prefijo_discador + contacto.telefono)
-            dato_contacto.append("id_cliente:" + str(contacto.pk))
-            dato_contacto.append("id_campana:" + str(campana.id))
+            dato_contacto = [prefijo_discador + contacto[1], "id_cliente:" + str(contacto[0]),
+                             id_campana]
             if list_multinum:
-                datos = json.loads(contacto.datos)
+                datos = json.loads(contacto[2])
                 for nombre, posicion_en_datos in list_multinum:
                     dato_contacto.append(nombre + ":" + datos[posicion_en_datos])
 
-            lista_contactos += ",".join(dato_contacto) + "|"
+            lote.append(",".join(dato_contacto) + "|")
+            if len(lote) == self.CONTACTOS_POR_LOTE:
+                yield "numbers=" + "".join(lote) + "\n"
+                lotes_generados += 1
+                lote = []
 
-        return lista_contactos
+        # Aunque no haya contactos se sube la lista, para que wombat la cree
+        if lote or not lotes_generados:
+            yield "numbers=" + "".join(lote) + "\n"
@@ -30,6 +30,8 @@ from math import ceil
 import io
 import csv
 
+from ominicontacto_app.services.redis.progreso import PublicadorDeProgreso
+
 
 class GeneracionZipGrabaciones:
     def __init__(self, listado_archivos, zip_path, key_task, username):
@@ -53,16 +55,13 @@ class GeneracionZipGrabaciones:
         csv_writer = csv.writer(in_memory_csv)
         csv_writer.writerows([['Fecha', 'Tipo de llamada', 'Teléfono cliente',
                                'Agente', 'Campaña', 'Calificación', 'Nombre grabación']])
-        progreso = 0
-        cantidad_archivos = len(self.listado_archivos)
-        self.redis_connection.publish(self.key_task, progreso)
-        i = 1
+        progreso = PublicadorDeProgreso(self.key_task, len(self.listado_archivos),
+                                        self.redis_connection, redondeo=ceil)
+        progreso.iniciar()
         for archivo in self.listado_archivos:
             archivo_path = os.path.join(settings.SENDFILE_ROOT, archivo['archivo'])
             zf.write(archivo_path, archivo['archivo'], compress_type=compression)
-            progreso = ceil(i / cantidad_archivos * 100)
-            self.redis_connection.publish(self.key_task, progreso)
-            i += 1
+            progreso.avanzar()
             csv_line = [[
                 archivo['fecha'],
                 archivo['tipo_llamada'],
@@ -82,3 +81,10 @@ class GeneracionZipGrabaciones:
     # En un futuro ver si es neesario generar un nombre acorde a un patrón
     def _generar_zip_name(self, username):
         return f'{username}-grabaciones.zip'
+
+
+def generar_zip_grabaciones(key_task, listado_archivos, username):
+    """ Genera el zip con las grabaciones seleccionadas (trabajo en segundo plano) """
+    zip_path = os.path.join(settings.SENDFILE_ROOT, 'zip')
+    zip_grabaciones = GeneracionZipGrabaciones(listado_archivos, zip_path, key_task, username)
+    zip_grabaciones.genera_zip()
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Despachador de contactos de campañas preview respaldado en Redis.
+
+Por cada campaña se mantienen en Redis los AgenteEnContacto disponibles (estado INICIAL y
+activos) en sorted sets cuyo score es el 'orden': uno general (agente_id = -1) y uno por cada
+agente que tenga contactos reservados. Los contactos entregados y todavía no asignados se
+guardan en un hash por agente. La entrega se hace atómicamente con un script Lua, sin locks
+en la base de datos.
+
+Los cambios de estado resultantes se encolan en una lista que el comando
+``persistir_entregas_preview`` aplica en PostgreSQL de forma asíncrona.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.utils.translation import ugettext as _
+
+logger = logging.getLogger(__name__)
+
+
+# Devuelve el contacto entregado al agente (KEYS[4] hash de entregados) a los disponibles
+# generales (KEYS[2]) y encola su liberación (KEYS[5]). Deja en 'orden_liberado' su orden.
+LUA_LIBERAR_ENTREGA = """
+local orden_liberado = false
+local entregado = redis.call('HGET', KEYS[4], ARGV[1])
+if entregado then
+    local id, contacto_id, orden = string.match(entregado, '^(%d+):(%d+):(-?[%d.]+)$')
+    redis.call('ZADD', KEYS[2], orden, id .. ':' .. contacto_id)
+    redis.call('HDEL', KEYS[4], ARGV[1])
+    redis.call('RPUSH', KEYS[5], cjson.encode({
+        accion='liberar', id=tonumber(id), agente_id=tonumber(ARGV[1]),
+        modificado=tonumber(ARGV[2])}))
+    orden_liberado = tonumber(orden)
+end
+"""
+
+# KEYS: info, disponibles generales, disponibles del agente, entregados, persistencia
+# ARGV: agente_id, timestamp
+# Devuelve {-1} si la campaña no está cargada, {0} si no hay contactos disponibles o
+# {1, '<agente_en_contacto_id>:<contacto_id>'} con el contacto entregado.
+LUA_ENTREGAR = """
+if redis.call('HEXISTS', KEYS[1], 'total') == 0 then
+    return {-1}
+end
+""" + LUA_LIBERAR_ENTREGA + """
+-- Se entrega a partir del orden siguiente al del contacto liberado (o desde el principio)
+local total = tonumber(redis.call('HGET', KEYS[1], 'total'))
+local desde = 0
+if orden_liberado then
+    desde = (orden_liberado + 1) % (total + 1)
+end
+
+local function primero(minimo)
+    local elegido, key_elegida, orden_elegido = false, false, false
+    for i = 2, 3 do
+        local r = redis.call('ZRANGEBYSCORE', KEYS[i], minimo, '+inf', 'WITHSCORES', 'LIMIT', 0, 1)
+        if r[1] and (not orden_elegido or tonumber(r[2]) < orden_elegido) then
+            elegido, key_elegida, orden_elegido = r[1], KEYS[i], tonumber(r[2])
+        end
+    end
+    return elegido, key_elegida, orden_elegido
+end
+
+local elegido, key_elegida, orden = primero(desde)
+if not elegido then
+    elegido, key_elegida, orden = primero('-inf')
+end
+if not elegido then
+    return {0}
+end
+redis.call('ZREM', key_elegida, elegido)
+redis.call('HSET', KEYS[4], ARGV[1], elegido .. ':' .. orden)
+return {1, elegido}
+"""
+
+# KEYS: info, disponibles generales, disponibles del agente, entregados, persistencia
+# ARGV: agente_id, timestamp
+# Devuelve el orden del contacto liberado o false si el agente no tenía ninguno entregado.
+LUA_LIBERAR = LUA_LIBERAR_ENTREGA + """
+return orden_liberado and tostring(orden_liberado)
+"""
+
+# Quita el contacto entregado a un agente si sigue siendo el indicado.
+# KEYS: entregados. ARGV: agente_id, agente_en_contacto_id
+LUA_QUITAR_ENTREGA = """
+local entregado = redis.call('HGET', KEYS[1], ARGV[1])
+if entregado and string.match(entregado, '^(%d+):') == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Vuelve un contacto a los disponibles generales (si la campaña está cargada) y lo quita
+# de los entregados al agente.
+# KEYS: info, disponibles generales, entregados
+# ARGV: agente_en_contacto_id, contacto_id, orden, agente_id
+LUA_DEVOLVER = """
+if redis.call('HEXISTS', KEYS[1], 'total') == 0 then
+    return 0
+end
+local entregado = redis.call('HGET', KEYS[3], ARGV[4])
+if entregado and string.match(entregado, '^(%d+):') == ARGV[1] then
+    redis.call('HDEL', KEYS[3], ARGV[4])
+end
+return redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1] .. ':' .. ARGV[2])
+"""
+
+# Mueve el primer cambio de estado pendiente de persistir (KEYS[1]) a la lista de
+# fallidos (KEYS[2]).
+LUA_MOVER_A_FALLIDOS = """
+local pendiente = redis.call('LPOP', KEYS[1])
+if pendiente then
+    redis.call('RPUSH', KEYS[2], pendiente)
+end
+return pendiente
+"""
+
+
+class DespachadorContactosPreview(object):
+    """
+    Entrega atómicamente los contactos de las campañas preview a partir de su estado en Redis.
+    """
+
+    NO_CARGADA = -1
+    SIN_CONTACTOS = 0
+    ENTREGADO = 1
+
+    ACCION_ENTREGAR = 'entregar'
+    ACCION_LIBERAR = 'liberar'
+
+    KEY_INFO = 'OML:PREVIEW:{0}'
+    KEY_DISPONIBLES = 'OML:PREVIEW:{0}:DISPONIBLES:{1}'
+    KEY_AGENTES = 'OML:PREVIEW:{0}:AGENTES'
+    KEY_ENTREGADOS = 'OML:PREVIEW:{0}:ENTREGADOS'
+    KEY_CARGA = 'OML:PREVIEW:{0}:CARGA'
+    KEY_PERSISTENCIA = 'OML:PREVIEW:PERSISTENCIA'
+    KEY_PERSISTENCIA_FALLIDOS = 'OML:PREVIEW:PERSISTENCIA:FALLIDOS'
+
+    # Tiempo máximo que puede tardar la carga de una campaña desde la base de datos
+    TIMEOUT_CARGA = 60
+    TAMANO_LOTE_CARGA = 10000
+
+    def __init__(self, redis_connection=None):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+        self._entregar = self.redis_connection.register_script(LUA_ENTREGAR)
+        self._liberar = self.redis_connection.register_script(LUA_LIBERAR)
+        self._quitar_entrega = self.redis_connection.register_script(LUA_QUITAR_ENTREGA)
+        self._devolver = self.redis_connection.register_script(LUA_DEVOLVER)
+        self._mover_a_fallidos = self.redis_connection.register_script(LUA_MOVER_A_FALLIDOS)
+
+    @classmethod
+    def habilitado(cls):
+        return settings.OL_DESPACHADOR_PREVIEW_REDIS
+
+    def _keys_agente(self, campana_id, agente_id):
+        return [self.KEY_INFO.format(campana_id),
+                self.KEY_DISPONIBLES.format(campana_id, -1),
+                self.KEY_DISPONIBLES.format(campana_id, agente_id),
+                self.KEY_ENTREGADOS.format(campana_id),
+                self.KEY_PERSISTENCIA]
+
+    def entregar(self, campana_id, agente_id):
+        """
+        Libera el contacto entregado previamente al agente (si lo hubiera) y le entrega el
+        siguiente disponible. Devuelve el resultado y el par (agente_en_contacto_id,
+        contacto_id) entregado.
+        """
+        resultado = self._entregar(keys=self._keys_agente(campana_id, agente_id),
+                                   args=[agente_id, time.time()])
+        if int(resultado[0]) != self.ENTREGADO:
+            return int(resultado[0]), None
+        agente_en_contacto_id, contacto_id = resultado[1].split(':')
+        return self.ENTREGADO, (int(agente_en_contacto_id), int(contacto_id))
+
+    def confirmar_entrega(self, agente_en_contacto_id, agente_id):
+        """ Encola la persistencia de la entrega de un contacto a un agente """
+        self.redis_connection.rpush(self.KEY_PERSISTENCIA, json.dumps({
+            'accion': self.ACCION_ENTREGAR, 'id': agente_en_contacto_id,
+            'agente_id': agente_id, 'modificado': time.time()}))
+
+    def liberar(self, campana_id, agente_id):
+        """
+        Devuelve a los disponibles el contacto entregado al agente.
+        Devuelve su orden, o None si el agente no tenía ningún contacto entregado.
+        """
+        orden = self._liberar(keys=self._keys_agente(campana_id, agente_id),
+                              args=[agente_id, time.time()])
+        if orden is None:
+            return None
+        return int(float(orden))
+
+    def obtener_entrega(self, campana_id, agente_id):
+        """
+        Devuelve (agente_en_contacto_id, contacto_id, orden) del contacto entregado al agente
+        o None si no tiene ninguno.
+        """
+        entregado = self.redis_connection.hget(self.KEY_ENTREGADOS.format(campana_id), agente_id)
+        if entregado is None:
+            return None
+        agente_en_contacto_id, contacto_id, orden = entregado.split(':')
+        return int(agente_en_contacto_id), int(contacto_id), int(float(orden))
+
+    def quitar_entrega(self, campana_id, agente_id, agente_en_contacto_id):
+        """ Deja de considerar entregado el contacto al agente (p.ej. porque fue asignado) """
+        return self._quitar_entrega(keys=[self.KEY_ENTREGADOS.format(campana_id)],
+                                    args=[agente_id, agente_en_contacto_id])
+
+    def devolver(self, campana_id, agente_en_contacto_id, contacto_id, orden, agente_id=-1):
+        """
+        Vuelve a poner disponible un contacto liberado en la base de datos (p.ej. por
+        vencimiento de su tiempo de reserva).
+        """
+        return self._devolver(
+            keys=[self.KEY_INFO.format(campana_id), self.KEY_DISPONIBLES.format(campana_id, -1),
+                  self.KEY_ENTREGADOS.format(campana_id)],
+            args=[agente_en_contacto_id, contacto_id, orden, agente_id])
+
+    def agregar(self, campana_id, agente_en_contacto_id, contacto_id, orden, agente_id=-1):
+        """ Agrega un contacto nuevo a los disponibles si la campaña está cargada """
+        key_info = self.KEY_INFO.format(campana_id)
+        if not self.redis_connection.hexists(key_info, 'total'):
+            return
+        pipeline = self.redis_connection.pipeline()
+        pipeline.zadd(self.KEY_DISPONIBLES.format(campana_id, agente_id),
+                      {'{0}:{1}'.format(agente_en_contacto_id, contacto_id): orden})
+        pipeline.sadd(self.KEY_AGENTES.format(campana_id), agente_id)
+        pipeline.hincrby(key_info, 'total', 1)
+        pipeline.execute()
+
+    def invalidar(self, campana_id):
+        """
+        Descarta los contactos disponibles cargados de la campaña, que se volverán a cargar
+        desde la base de datos en la próxima entrega.
+        Los contactos entregados se conservan.
+        """
+        self.redis_connection.delete(self.KEY_INFO.format(campana_id))
+
+    def cargar(self, campana_id, obtener_contactos):
+        """
+        Carga en Redis los contactos de la campaña. obtener_contactos() debe devolver la
+        cantidad total de contactos de la campaña y los iterables de disponibles y de
+        entregados como tuplas (agente_en_contacto_id, contacto_id, agente_id, orden).
+        Devuelve False si la campaña está siendo cargada por otro proceso.
+        """
+        key_carga = self.KEY_CARGA.format(campana_id)
+        if not self.redis_connection.set(key_carga, 1, nx=True, ex=self.TIMEOUT_CARGA):
+            return False
+        try:
+            key_entregados = self.KEY_ENTREGADOS.format(campana_id)
+            # Las entregas aún no persistidas sólo están en Redis, por lo que se conservan
+            entregas_actuales = self.redis_connection.hgetall(key_entregados)
+            ids_entregados = set(valor.split(':')[0] for valor in entregas_actuales.values())
+            total, disponibles, entregados = obtener_contactos()
+
+            key_agentes = self.KEY_AGENTES.format(campana_id)
+            agentes_anteriores = self.redis_connection.smembers(key_agentes)
+            pipeline = self.redis_connection.pipeline()
+            pipeline.delete(key_agentes, key_entregados,
+                            self.KEY_DISPONIBLES.format(campana_id, -1),
+                            *[self.KEY_DISPONIBLES.format(campana_id, agente_id)
+                              for agente_id in agentes_anteriores])
+            lotes = {}
+            for agente_en_contacto_id, contacto_id, agente_id, orden in disponibles:
+                if str(agente_en_contacto_id) in ids_entregados:
+                    continue
+                lote = lotes.setdefault(agente_id, {})
+                lote['{0}:{1}'.format(agente_en_contacto_id, contacto_id)] = orden
+                if len(lote) >= self.TAMANO_LOTE_CARGA:
+                    pipeline.zadd(self.KEY_DISPONIBLES.format(campana_id, agente_id), lote)
+                    lotes[agente_id] = {}
+            for agente_id, lote in lotes.items():
+                if lote:
+                    pipeline.zadd(self.KEY_DISPONIBLES.format(campana_id, agente_id), lote)
+            if lotes:
+                pipeline.sadd(key_agentes, *lotes.keys())
+
+            entregas = {}
+            for agente_en_contacto_id, contacto_id, agente_id, orden in entregados:
+                entregas[str(agente_id)] = '{0}:{1}:{2}'.format(
+                    agente_en_contacto_id, contacto_id, orden)
+            entregas.update(entregas_actuales)
+            if entregas:
+                pipeline.hset(key_entregados, mapping=entregas)
+            pipeline.hset(self.KEY_INFO.format(campana_id), 'total', total)
+            pipeline.execute()
+        finally:
+            self.redis_connection.delete(key_carga)
+        return True
+
+    def obtener_pendientes(self, cantidad, timeout=1):
+        """
+        Devuelve hasta 'cantidad' cambios de estado pendientes de persistir, esperando hasta
+        'timeout' segundos si no hay ninguno. No los quita de la cola: una vez aplicados
+        deben descartarse con descartar_pendientes().
+        Se detiene en el primero que no pueda decodificarse; si es el primero de la cola lo
+        mueve a los fallidos.
+        """
+        if not self.redis_connection.llen(self.KEY_PERSISTENCIA):
+            time.sleep(timeout)
+        pendientes = self.redis_connection.lrange(self.KEY_PERSISTENCIA, 0, cantidad - 1)
+        resultado = []
+        for pendiente in pendientes:
+            try:
+                resultado.append(json.loads(pendiente))
+            except ValueError:
+                if not resultado:
+                    logger.error(_('Cambio de estado preview inválido: {0}'.format(pendiente)))
+                    self.mover_pendiente_a_fallidos()
+                break
+        return resultado
+
+    def descartar_pendientes(self, cantidad):
+        self.redis_connection.ltrim(self.KEY_PERSISTENCIA, cantidad, -1)
+
+    def mover_pendiente_a_fallidos(self):
+        """
+        Quita de la cola el primer cambio de estado pendiente y lo guarda en la lista de
+        fallidos para su revisión manual. Devuelve el cambio movido, o None si no había.
+        """
+        return self._mover_a_fallidos(
+            keys=[self.KEY_PERSISTENCIA, self.KEY_PERSISTENCIA_FALLIDOS])
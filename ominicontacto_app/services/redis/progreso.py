@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import time
+
+import redis
+from django.conf import settings
+
+
+class PublicadorDeProgreso(object):
+    """
+    Publica el porcentaje de avance de una tarea en su canal de Redis (key_task).
+    Sólo publica cuando cambia el porcentaje entero o cuando pasó el intervalo mínimo
+    desde la última publicación, para no hacer un round-trip a Redis por cada elemento.
+    El último valor publicado queda además en el campo 'progreso' del hash de status.
+    """
+
+    INTERVALO_PUBLICACION = 5
+
+    def __init__(self, key_task, total, redis_connection=None, intervalo=None,
+                 redondeo=int):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+        self.key_task = key_task
+        self.total = total
+        self.intervalo = self.INTERVALO_PUBLICACION if intervalo is None else intervalo
+        self.redondeo = redondeo
+        self.procesados = 0
+        self.ultimo_porcentaje = None
+        self.ultima_publicacion = 0
+        self.publicaciones = 0
+
+    def iniciar(self):
+        """ Publica el porcentaje inicial (100 si no hay nada para procesar) """
+        self.publicar(100 if self.total == 0 else 0)
+
+    def avanzar(self, cantidad=1):
+        self.procesados += cantidad
+        porcentaje = self.redondeo(self.procesados / self.total * 100) if self.total else 100
+        if porcentaje != self.ultimo_porcentaje or \
+                time.monotonic() - self.ultima_publicacion >= self.intervalo:
+            self.publicar(porcentaje)
+
+    def publicar(self, valor):
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.publish(self.key_task, valor)
+        pipeline.hset(self.key_task, 'progreso', valor)
+        pipeline.execute()
+        self.ultimo_porcentaje = valor
+        self.ultima_publicacion = time.monotonic()
+        self.publicaciones += 1
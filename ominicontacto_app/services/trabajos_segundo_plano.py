@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Cola persistente de trabajos en segundo plano (exportaciones, zips de grabaciones, etc.)
+respaldada en Redis y ejecutada por un pool de procesos independiente de uwsgi
+(comando ``ejecutar_trabajos_segundo_plano``).
+
+El estado de cada trabajo se guarda en el hash cuyo nombre es la key de status de la tarea
+(``OML:STATUS_*``), que además es el canal donde se publica el progreso.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+import redis
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext as _
+
+logger = logging.getLogger(__name__)
+
+
+class TipoDeTrabajo(object):
+    """ Describe un tipo de trabajo que puede ser encolado """
+
+    def __init__(self, nombre, funcion, concurrencia_maxima=1, reintentos=0):
+        self.nombre = nombre
+        # Path de la funcion a ejecutar. Recibe key_task y los parametros del trabajo
+        self.funcion = funcion
+        self.concurrencia_maxima = concurrencia_maxima
+        self.reintentos = reintentos
+
+
+TIPOS_DE_TRABAJO = {
+    tipo.nombre: tipo for tipo in (
+        TipoDeTrabajo('exportar_csv_campana',
+                      'reportes_app.reportes.reporte_llamados_contactados_csv.'
+                      'exportar_reporte_csv_campana',
+                      concurrencia_maxima=2, reintentos=1),
+        TipoDeTrabajo('zip_grabaciones',
+                      'ominicontacto_app.services.grabaciones.generacion_zip_grabaciones.'
+                      'generar_zip_grabaciones',
+                      concurrencia_maxima=1, reintentos=1),
+    )
+}
+
+
+# Mueve un trabajo de la cola a la lista de trabajos en proceso solo si no se
+# alcanzó el limite de concurrencia de su tipo.
+LUA_TOMAR_TRABAJO = """
+if redis.call('LLEN', KEYS[2]) >= tonumber(ARGV[1]) then
+    return false
+end
+return redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+"""
+
+
+class ColaDeTrabajos(object):
+
+    PENDIENTE = 'PENDIENTE'
+    EN_PROCESO = 'EN_PROCESO'
+    FINALIZADO = 'FINALIZADO'
+    ERROR = 'ERROR'
+
+    KEY_TRABAJO = 'OML:JOB:{0}'
+    KEY_CANALES = 'OML:JOB:{0}:CHANNELS'
+    KEY_COLA = 'OML:JOBS:QUEUE:{0}'
+    KEY_EN_PROCESO = 'OML:JOBS:PROCESSING:{0}'
+    KEY_DEDUPLICACION = 'OML:JOBS:DEDUP:{0}'
+
+    # Tiempo sin latidos luego del cual se considera que el trabajador de un trabajo murió
+    TIMEOUT_LATIDO = 60
+    # Tiempo que se conserva la información de un trabajo terminado
+    EXPIRACION_TRABAJO = 60 * 60 * 24
+
+    def __init__(self, redis_connection=None):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+        self._tomar_trabajo = self.redis_connection.register_script(LUA_TOMAR_TRABAJO)
+
+    def _clave_deduplicacion(self, tipo, parametros):
+        contenido = json.dumps([tipo, parametros], sort_keys=True)
+        return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+    def encolar(self, tipo, key_task, **parametros):
+        """
+        Encola un trabajo del tipo indicado. Si ya existe un trabajo idéntico pendiente o en
+        proceso no se encola uno nuevo, sino que key_task se suscribe a su progreso.
+        Devuelve el id del trabajo.
+        """
+        assert tipo in TIPOS_DE_TRABAJO
+        deduplicacion = self.KEY_DEDUPLICACION.format(
+            self._clave_deduplicacion(tipo, parametros))
+        trabajo_id = uuid.uuid4().hex
+        if not self.redis_connection.set(deduplicacion, trabajo_id, nx=True,
+                                         ex=self.EXPIRACION_TRABAJO):
+            trabajo_existente = self.redis_connection.get(deduplicacion)
+            if trabajo_existente is not None:
+                self.redis_connection.sadd(self.KEY_CANALES.format(trabajo_existente), key_task)
+                self.redis_connection.hset(key_task, mapping={
+                    'estado': self.PENDIENTE, 'trabajo': trabajo_existente})
+                logger.info(_('Trabajo {0} deduplicado en {1}'.format(tipo, trabajo_existente)))
+                return trabajo_existente
+            self.redis_connection.set(deduplicacion, trabajo_id, ex=self.EXPIRACION_TRABAJO)
+
+        pipeline = self.redis_connection.pipeline()
+        pipeline.hset(self.KEY_TRABAJO.format(trabajo_id), mapping={
+            'tipo': tipo,
+            'key_task': key_task,
+            'parametros': json.dumps(parametros),
+            'deduplicacion': deduplicacion,
+            'intentos': 0,
+            'estado': self.PENDIENTE,
+            'latido': time.time(),
+        })
+        pipeline.sadd(self.KEY_CANALES.format(trabajo_id), key_task)
+        pipeline.hset(key_task, mapping={'estado': self.PENDIENTE, 'trabajo': trabajo_id})
+        pipeline.lpush(self.KEY_COLA.format(tipo), trabajo_id)
+        pipeline.execute()
+        return trabajo_id
+
+    def obtener_trabajo(self, trabajo_id):
+        trabajo = self.redis_connection.hgetall(self.KEY_TRABAJO.format(trabajo_id))
+        if trabajo:
+            trabajo['id'] = trabajo_id
+            trabajo['parametros'] = json.loads(trabajo['parametros'])
+        return trabajo
+
+    def obtener_canales(self, trabajo_id):
+        return self.redis_connection.smembers(self.KEY_CANALES.format(trabajo_id))
+
+    def tomar_trabajo(self, tipos=None):
+        """
+        Devuelve el próximo trabajo a ejecutar respetando la concurrencia máxima por tipo,
+        o None si no hay trabajos disponibles.
+        """
+        if tipos is None:
+            tipos = TIPOS_DE_TRABAJO.keys()
+        for nombre_tipo in tipos:
+            tipo = TIPOS_DE_TRABAJO[nombre_tipo]
+            trabajo_id = self._tomar_trabajo(
+                keys=[self.KEY_COLA.format(tipo.nombre), self.KEY_EN_PROCESO.format(tipo.nombre)],
+                args=[tipo.concurrencia_maxima])
+            if trabajo_id:
+                # El latido se renueva al tomarlo: el del encolado puede tener más antigüedad
+                # que TIMEOUT_LATIDO y se recuperaría un trabajo que se está ejecutando
+                self.actualizar_estado(trabajo_id, self.EN_PROCESO, latido=time.time())
+                return self.obtener_trabajo(trabajo_id)
+        return None
+
+    def actualizar_estado(self, trabajo_id, estado, **datos):
+        datos['estado'] = estado
+        pipeline = self.redis_connection.pipeline()
+        pipeline.hset(self.KEY_TRABAJO.format(trabajo_id), mapping=datos)
+        for key_task in self.obtener_canales(trabajo_id):
+            pipeline.hset(key_task, mapping=datos)
+        pipeline.execute()
+
+    def registrar_latido(self, trabajo_id):
+        self.redis_connection.hset(self.KEY_TRABAJO.format(trabajo_id), 'latido', time.time())
+
+    def registrar_progreso(self, trabajo_id, progreso):
+        """ Replica el progreso publicado en el canal principal al resto de los suscriptores """
+        trabajo = self.obtener_trabajo(trabajo_id)
+        pipeline = self.redis_connection.pipeline()
+        for key_task in self.obtener_canales(trabajo_id):
+            pipeline.hset(key_task, 'progreso', progreso)
+            if key_task != trabajo['key_task']:
+                pipeline.publish(key_task, progreso)
+        pipeline.execute()
+
+    def _liberar(self, trabajo):
+        pipeline = self.redis_connection.pipeline()
+        pipeline.lrem(self.KEY_EN_PROCESO.format(trabajo['tipo']), 0, trabajo['id'])
+        pipeline.delete(trabajo['deduplicacion'])
+        pipeline.expire(self.KEY_TRABAJO.format(trabajo['id']), self.EXPIRACION_TRABAJO)
+        pipeline.expire(self.KEY_CANALES.format(trabajo['id']), self.EXPIRACION_TRABAJO)
+        for key_task in self.obtener_canales(trabajo['id']):
+            pipeline.expire(key_task, self.EXPIRACION_TRABAJO)
+        pipeline.execute()
+
+    def finalizar(self, trabajo):
+        self.actualizar_estado(trabajo['id'], self.FINALIZADO)
+        self._liberar(trabajo)
+
+    def fallar(self, trabajo, error):
+        """ Reencola el trabajo si le quedan reintentos, o lo marca con error """
+        tipo = TIPOS_DE_TRABAJO[trabajo['tipo']]
+        intentos = int(trabajo['intentos']) + 1
+        if intentos <= tipo.reintentos:
+            self.actualizar_estado(trabajo['id'], self.PENDIENTE, intentos=intentos,
+                                   error=str(error))
+            pipeline = self.redis_connection.pipeline()
+            pipeline.lrem(self.KEY_EN_PROCESO.format(tipo.nombre), 0, trabajo['id'])
+            pipeline.lpush(self.KEY_COLA.format(tipo.nombre), trabajo['id'])
+            pipeline.execute()
+        else:
+            self.actualizar_estado(trabajo['id'], self.ERROR, intentos=intentos,
+                                   error=str(error))
+            self._liberar(trabajo)
+
+    def recuperar_trabajos_abandonados(self):
+        """
+        Devuelve a la cola los trabajos en proceso cuyo trabajador dejó de registrar latidos
+        (por ejemplo, porque el proceso murió). Cuenta como un intento fallido, para que un
+        trabajo que siempre mata a su trabajador no se reintente indefinidamente.
+        """
+        limite = time.time() - self.TIMEOUT_LATIDO
+        recuperados = 0
+        for tipo in TIPOS_DE_TRABAJO.values():
+            key_en_proceso = self.KEY_EN_PROCESO.format(tipo.nombre)
+            for trabajo_id in self.redis_connection.lrange(key_en_proceso, 0, -1):
+                latido = self.redis_connection.hget(self.KEY_TRABAJO.format(trabajo_id), 'latido')
+                if latido is None or float(latido) < limite:
+                    if self.redis_connection.lrem(key_en_proceso, 0, trabajo_id):
+                        trabajo = self.obtener_trabajo(trabajo_id)
+                        if trabajo:
+                            self.fallar(trabajo, _('El trabajador dejó de registrar latidos'))
+                            recuperados += 1
+        return recuperados
+
+
+class MonitorDeTrabajo(threading.Thread):
+    """
+    Mientras se ejecuta un trabajo registra sus latidos y replica su progreso
+    a las tareas que fueron deduplicadas sobre él.
+    """
+
+    INTERVALO_LATIDO = 10
+
+    def __init__(self, cola, trabajo):
+        super(MonitorDeTrabajo, self).__init__(daemon=True)
+        self.cola = cola
+        self.trabajo = trabajo
+        self.finalizado = threading.Event()
+
+    def run(self):
+        pubsub = self.cola.redis_connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.trabajo['key_task'])
+        ultimo_latido = 0
+        try:
+            while not self.finalizado.is_set():
+                if time.time() - ultimo_latido >= self.INTERVALO_LATIDO:
+                    self.cola.registrar_latido(self.trabajo['id'])
+                    ultimo_latido = time.time()
+                mensaje = pubsub.get_message(timeout=1)
+                if mensaje and mensaje['type'] == 'message':
+                    self.cola.registrar_progreso(self.trabajo['id'], mensaje['data'])
+        finally:
+            pubsub.close()
+
+    def detener(self):
+        self.finalizado.set()
+        self.join()
+
+
+class TrabajadorSegundoPlano(object):
+    """ Ejecuta en un loop los trabajos encolados """
+
+    ESPERA_SIN_TRABAJOS = 1
+
+    def __init__(self, cola=None, tipos=None):
+        if cola is None:
+            cola = ColaDeTrabajos()
+        self.cola = cola
+        self.tipos = tipos
+        self.detenido = False
+
+    def ejecutar_trabajo(self, trabajo):
+        tipo = TIPOS_DE_TRABAJO[trabajo['tipo']]
+        funcion = import_string(tipo.funcion)
+        monitor = MonitorDeTrabajo(self.cola, trabajo)
+        monitor.start()
+        try:
+            funcion(trabajo['key_task'], **trabajo['parametros'])
+        except Exception as e:
+            logger.exception(_('Error al ejecutar el trabajo {0} ({1}): {2}'.format(
+                trabajo['id'], trabajo['tipo'], e)))
+            self.cola.fallar(trabajo, e)
+        else:
+            self.cola.finalizar(trabajo)
+        finally:
+            monitor.detener()
+            close_old_connections()
+
+    def ejecutar(self):
+        while not self.detenido:
+            trabajo = self.cola.tomar_trabajo(self.tipos)
+            if trabajo is None:
+                time.sleep(self.ESPERA_SIN_TRABAJOS)
+                continue
+            self.ejecutar_trabajo(trabajo)
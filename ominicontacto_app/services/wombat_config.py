@@ -283,12 +283,16 @@ class ConfigFile(object):
         self._filename = filename
 
     def write(self, contenido):
+        """ Escribe el contenido, que puede ser un string o un iterable de strings que se
+            escriben a medida que se generan """
         tmp_fd, tmp_filename = tempfile.mkstemp()
         try:
             tmp_file_obj = os.fdopen(tmp_fd, 'w', encoding='utf-8')
             # assert isinstance(contenido, json), \
             #     "Objeto NO es unicode: {0}".format(type(contenido))
-            tmp_file_obj.write(contenido)
+            if isinstance(contenido, str):
+                contenido = [contenido]
+            tmp_file_obj.writelines(contenido)
 
             tmp_file_obj.close()
 
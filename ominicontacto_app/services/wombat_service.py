@@ -17,14 +17,21 @@
 # along with this program.  If not, see http://www.gnu.org/licenses/.
 #
 
-"""Servicio para generar los curl hacia wombat"""
+"""Servicio para realizar los requests hacia la API de wombat"""
 
 from __future__ import unicode_literals
 
+import asyncio
+import functools
 import logging
-import subprocess
 import os
 import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 from django.conf import settings
 from django.utils.translation import ugettext as _
@@ -32,118 +39,171 @@ from django.utils.translation import ugettext as _
 logger = logging.getLogger(__name__)
 
 
+_sesion_wombat = None
+_pid_sesion_wombat = None
+_lock_sesion_wombat = threading.Lock()
+
+
+def obtener_sesion_wombat():
+    """ Devuelve la sesión HTTP del proceso hacia Wombat. Mantiene las conexiones abiertas
+        (keep-alive) y las cookies de autenticación entre requests. Se crea una por proceso
+        para no compartir sockets con los procesos forkeados por uwsgi. """
+    global _sesion_wombat, _pid_sesion_wombat
+    pid = os.getpid()
+    with _lock_sesion_wombat:
+        if _sesion_wombat is None or _pid_sesion_wombat != pid:
+            # Sólo se reintentan los errores de conexión: los requests son POST no idempotentes
+            reintentos = Retry(total=settings.OML_WOMBAT_REINTENTOS,
+                               connect=settings.OML_WOMBAT_REINTENTOS, read=0,
+                               backoff_factor=0.2)
+            adaptador = HTTPAdapter(pool_maxsize=settings.OML_WOMBAT_CONEXIONES,
+                                    max_retries=reintentos)
+            sesion = requests.Session()
+            sesion.mount('http://', adaptador)
+            sesion.mount('https://', adaptador)
+            _sesion_wombat = sesion
+            _pid_sesion_wombat = pid
+        return _sesion_wombat
+
+
 class WombatService():
 
+    ESPERA_REINTENTO_LOTE = 1
+
+    def _post(self, url_edit, verificar_estado=False, **kwargs):
+        """ Realiza un POST a la API de wombat con la sesión del proceso.
+            Lanza requests.exceptions.RequestException si no se pudo realizar, o si se indica
+            verificar_estado y wombat respondió con un status de error """
+        timeout_lectura = settings.OML_WOMBAT_TIMEOUT
+        if timeout_lectura is not None:
+            timeout_lectura = float(timeout_lectura)
+        respuesta = obtener_sesion_wombat().post(
+            '/'.join([settings.OML_WOMBAT_URL, url_edit]),
+            auth=(settings.OML_WOMBAT_USER, settings.OML_WOMBAT_PASSWORD),
+            timeout=(settings.OML_WOMBAT_TIMEOUT_CONEXION, timeout_lectura), **kwargs)
+        if verificar_estado:
+            respuesta.raise_for_status()
+        return respuesta.content
+
+    def _loggear_error(self, url_edit, error):
+        logger.warning(_("Error en el request a WOMBAT: {0}".format(error)))
+        logger.warning(_(" - URL: {0}".format(url_edit)))
+
     def update_config_wombat(self, json_file, url_edit):
         """Realiza un update en la config de wombat
 
-        :returns: json -- exit status de proceso ejecutado.
-                  0 (cero) si fue exitoso, otro valor si se produjo
-                  un error
+        :returns: json -- respuesta de wombat.
+                  None si no se pudo realizar el request
         """
         filename = os.path.join(settings.OML_WOMBAT_FILENAME,
                                 json_file)
         try:
-            # subprocess.check_call(settings.FTS_RELOAD_CMD,
-            #                      stdout=stdout_file, stderr=stderr_file)
-            out = subprocess.check_output(['curl', '--user',
-                                           ':'.join([settings.OML_WOMBAT_USER,
-                                                     settings.OML_WOMBAT_PASSWORD]),
-                                           '-X', 'POST', '--data-urlencode',
-                                           '@'.join(['data', filename]),
-                                           '/'.join([settings.OML_WOMBAT_URL,
-                                                     url_edit])])
+            with open(filename, 'rb') as archivo:
+                out = self._post(url_edit, data={'data': archivo.read()})
             logger.info(_("actualizacion en WOMBAT OK"))
             return json.loads(out)
-        except subprocess.CalledProcessError as e:
-            logger.warn(_("Exit status erroneo: {0}".format(e.returncode)))
-            logger.warn(" - Comando ejecutado: {0}".format(e.cmd))
-            print(e)
+        except requests.exceptions.RequestException as e:
+            self._loggear_error(url_edit, e)
 
     def update_lista_wombat(self, nombre_archivo, url_edit):
-        """Realiza un update en la config de wombat
-
-        :returns: out -- salida del comando ejectuado hacia wombat.
-                  0 (cero) si fue exitoso, otro valor si se produjo
-                  un error
+        """Agrega contactos a una lista de wombat. Cada línea del archivo ('numbers=...') se
+        envía en un request aparte, para no cargar el archivo entero en memoria. Un lote que
+        no se pudo enviar por un error de conexión se reintenta hasta OML_WOMBAT_REINTENTOS
+        veces. Ante cualquier otro error no se reintenta: wombat pudo haber agregado el lote
+        y reenviarlo duplicaría sus contactos.
+
+        :returns: out -- respuesta de wombat al último request.
+                  None si algún lote no se pudo subir (los anteriores ya quedaron en la lista)
         """
-        try:
-            # subprocess.check_call(settings.FTS_RELOAD_CMD,
-            #                      stdout=stdout_file, stderr=stderr_file)
-            filename_archivo = settings.OML_WOMBAT_FILENAME + nombre_archivo
-            out = subprocess.check_output(['curl', '--user',
-                                           ':'.join([settings.OML_WOMBAT_USER,
-                                                     settings.OML_WOMBAT_PASSWORD]),
-                                           '-m', settings.OML_WOMBAT_TIMEOUT, '-X', 'POST', '-w',
-                                           'string', '-d', "@{0}".format(filename_archivo),
-                                           '/'.join([settings.OML_WOMBAT_URL,
-                                                     url_edit])])
-            return out
-        except subprocess.CalledProcessError as e:
-            logger.warn(_("Exit status erroneo: {0}".format(e.returncode)))
-            logger.warn(_(" - Comando ejecutado: {0}".format(e.cmd)))
-            print(e)
+        filename_archivo = settings.OML_WOMBAT_FILENAME + nombre_archivo
+        out = None
+        with open(filename_archivo, 'rb') as archivo:
+            for numero_lote, linea in enumerate(archivo, 1):
+                linea = linea.rstrip(b'\r\n')
+                if linea:
+                    out = self._subir_lote(url_edit, linea, numero_lote)
+                    if out is None:
+                        return None
+        return out
+
+    def _subir_lote(self, url_edit, linea, numero_lote):
+        for intento in range(settings.OML_WOMBAT_REINTENTOS + 1):
+            if intento:
+                time.sleep(self.ESPERA_REINTENTO_LOTE * intento)
+            try:
+                return self._post(url_edit, verificar_estado=True, data=linea, headers={
+                    'Content-Type': 'application/x-www-form-urlencoded'})
+            except requests.exceptions.ConnectionError as e:
+                self._loggear_error(url_edit, e)
+            except requests.exceptions.RequestException as e:
+                self._loggear_error(url_edit, e)
+                break
+        logger.error(_("No se pudo subir el lote {0} de la lista a WOMBAT".format(numero_lote)))
+        return None
 
     def list_config_wombat(self, url_edit):
         """Realiza un list en la config de wombat
 
-        :returns: json -- exit status de proceso ejecutado.
-                  0 (cero) si fue exitoso, otro valor si se produjo
-                  un error
+        :returns: json -- respuesta de wombat.
+                  None si no se pudo realizar el request
         """
         try:
-            # subprocess.check_call(settings.FTS_RELOAD_CMD,
-            #                      stdout=stdout_file, stderr=stderr_file)
-            out = subprocess.check_output(['curl', '--user',
-                                           ':'.join([settings.OML_WOMBAT_USER,
-                                                     settings.OML_WOMBAT_PASSWORD]),
-                                           '-X', 'POST',
-                                           '/'.join([settings.OML_WOMBAT_URL,
-                                                     url_edit])])
+            out = self._post(url_edit)
             logger.info(_("list en WOMBAT OK"))
             return json.loads(out)
-        except subprocess.CalledProcessError as e:
-            logger.warn(_("Exit status erroneo: {0}".format(e.returncode)))
-            logger.warn(_(" - Comando ejecutado: {0}".format(e.cmd)))
-            print(e)
+        except requests.exceptions.RequestException as e:
+            self._loggear_error(url_edit, e)
 
     def set_call_ext_status(self, url_set_status):
         try:
-            # subprocess.check_call(settings.FTS_RELOAD_CMD,
-            #                      stdout=stdout_file, stderr=stderr_file)
-            out = subprocess.check_output(['curl', '--user',
-                                           ':'.join([settings.OML_WOMBAT_USER,
-                                                     settings.OML_WOMBAT_PASSWORD]),
-                                           '-X', 'POST',
-                                           '/'.join([settings.OML_WOMBAT_URL,
-                                                     url_set_status])])
-            if 'Event CALLSTATUS queued' in str(out):
+            out = self._post(url_set_status)
+            if b'Event CALLSTATUS queued' in out:
                 logger.info(_("Set extStatus en WOMBAT OK"))
             return True
-        except subprocess.CalledProcessError as e:
-            logger.warn(_("Exit status erroneo: {0}".format(e.returncode)))
-            logger.warn(_(" - Comando ejecutado: {0}".format(e.cmd)))
-            print(e)
+        except requests.exceptions.RequestException as e:
+            self._loggear_error(url_set_status, e)
 
     def post_json(self, url, object):
-        """Realiza un POST a wombat enviando el json de un objeto usando data-urlencode
+        """Realiza un POST a wombat enviando el json de un objeto en el campo 'data'
 
-        :returns: json -- exit status de proceso ejecutado.
-                  otro valor si se produjo un error
+        :returns: json -- respuesta de wombat.
+                  None si no se pudo realizar el request
         """
         try:
-            # subprocess.check_call(settings.FTS_RELOAD_CMD,
-            #                      stdout=stdout_file, stderr=stderr_file)
-            out = subprocess.check_output(['curl', '--user',
-                                           ':'.join([settings.OML_WOMBAT_USER,
-                                                     settings.OML_WOMBAT_PASSWORD]),
-                                           '-X', 'POST', '--data-urlencode',
-                                           "data={0}".format(json.dumps(object)),
-                                           '/'.join([settings.OML_WOMBAT_URL,
-                                                     url])])
+            out = self._post(url, data={'data': json.dumps(object)})
             logger.info(_("POST en WOMBAT OK"))
             return json.loads(out)
-        except subprocess.CalledProcessError as e:
-            logger.warn(_("Exit status erroneo: {0}".format(e.returncode)))
-            logger.warn(_(" - Comando ejecutado: {0}".format(e.cmd)))
-            print(e)
+        except requests.exceptions.RequestException as e:
+            self._loggear_error(url, e)
+
+
+class WombatServiceAsincronico(object):
+    """
+    Variante de WombatService para asyncio. Cada operación corre en un pool de threads que
+    comparte la sesión del proceso, de modo que se pueden lanzar muchas en paralelo con
+    asyncio.gather (por ejemplo notificar los extStatus de varias llamadas).
+    """
+
+    def __init__(self, loop=None, executor=None):
+        self.loop = loop
+        self.executor = executor
+        self.servicio = WombatService()
+
+    async def _ejecutar(self, metodo, *args):
+        loop = self.loop or asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(metodo, *args))
+
+    async def update_config_wombat(self, json_file, url_edit):
+        return await self._ejecutar(self.servicio.update_config_wombat, json_file, url_edit)
+
+    async def update_lista_wombat(self, nombre_archivo, url_edit):
+        return await self._ejecutar(self.servicio.update_lista_wombat, nombre_archivo, url_edit)
+
+    async def list_config_wombat(self, url_edit):
+        return await self._ejecutar(self.servicio.list_config_wombat, url_edit)
+
+    async def set_call_ext_status(self, url_set_status):
+        return await self._ejecutar(self.servicio.set_call_ext_status, url_set_status)
+
+    async def post_json(self, url, object):
+        return await self._ejecutar(self.servicio.post_json, url, object)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""Snapshots compartidos de los endpoints 'live' de la API de wombat"""
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import time
+from collections import defaultdict
+
+import redis
+from redis.exceptions import RedisError
+
+from django.conf import settings
+from django.utils.translation import ugettext as _
+
+from ominicontacto_app.services.wombat_service import WombatService
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotWombat(object):
+    """
+    Guarda en Redis la respuesta de un endpoint de wombat, indexada por los campos que
+    devuelve la función 'indexar', y la descarga a lo sumo una vez por intervalo
+    (OML_WOMBAT_INTERVALO_SNAPSHOT) sin importar cuántos procesos la consulten.
+    Si el snapshot venció, el primero que lo pide lo actualiza y los demás esperan a que
+    termine esa descarga en lugar de iniciar la suya.
+    Si Redis no está disponible se consulta a wombat directamente.
+    """
+
+    CLAVE = 'OML:WOMBAT_SNAPSHOT:{0}'
+    CLAVE_VIGENCIA = 'OML:WOMBAT_SNAPSHOT_VIGENTE:{0}'
+    CLAVE_LOCK = 'OML:WOMBAT_SNAPSHOT_LOCK:{0}'
+    DURACION_LOCK = 30
+    ESPERA = 0.05
+
+    def __init__(self, nombre, url, indexar, redis_connection=None, intervalo=None):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+        self.url = url
+        self.indexar = indexar
+        self.intervalo = settings.OML_WOMBAT_INTERVALO_SNAPSHOT if intervalo is None \
+            else intervalo
+        self.clave = self.CLAVE.format(nombre)
+        self.clave_vigencia = self.CLAVE_VIGENCIA.format(nombre)
+        self.clave_lock = self.CLAVE_LOCK.format(nombre)
+
+    def obtener(self, campos):
+        """ Devuelve un dict con el valor de cada uno de los campos que esté en el snapshot,
+            o None si no se pudo obtener la respuesta de wombat """
+        try:
+            if not self.redis_connection.exists(self.clave_vigencia) and \
+                    not self._actualizar_o_esperar():
+                return None
+            valores = self.redis_connection.hmget(self.clave, campos) if campos else []
+        except RedisError as e:
+            logger.warning(_('No se pudo usar el snapshot de wombat: {0}'.format(e)))
+            salida = WombatService().list_config_wombat(self.url)
+            if salida is None:
+                return None
+            indexados = self.indexar(salida)
+            return {campo: indexados[campo] for campo in campos if campo in indexados}
+        return {campo: json.loads(valor) for campo, valor in zip(campos, valores)
+                if valor is not None}
+
+    def invalidar(self):
+        """ Hace que la próxima consulta vuelva a descargar el snapshot """
+        try:
+            self.redis_connection.delete(self.clave_vigencia)
+        except RedisError as e:
+            logger.warning(_('No se pudo invalidar el snapshot de wombat: {0}'.format(e)))
+
+    def _actualizar_o_esperar(self):
+        """ Devuelve True si al terminar hay un snapshot vigente """
+        if self.redis_connection.set(self.clave_lock, 1, nx=True, ex=self.DURACION_LOCK):
+            try:
+                return self._actualizar()
+            finally:
+                self.redis_connection.delete(self.clave_lock)
+        limite = time.monotonic() + self.DURACION_LOCK
+        while time.monotonic() < limite:
+            time.sleep(self.ESPERA)
+            if self.redis_connection.exists(self.clave_vigencia):
+                return True
+            if not self.redis_connection.exists(self.clave_lock):
+                # Terminó la descarga en curso sin actualizar el snapshot (wombat no respondió)
+                return bool(self.redis_connection.exists(self.clave_vigencia))
+        return False
+
+    def _actualizar(self):
+        salida = WombatService().list_config_wombat(self.url)
+        if salida is None:
+            return False
+        indexados = self.indexar(salida)
+        pipeline = self.redis_connection.pipeline()
+        pipeline.delete(self.clave)
+        if indexados:
+            pipeline.hset(self.clave, mapping={
+                campo: json.dumps(valor) for campo, valor in indexados.items()})
+            # Sólo para no dejar claves huérfanas (ej: estadísticas de corridas ya terminadas)
+            pipeline.expire(self.clave, self.intervalo * 2)
+        pipeline.set(self.clave_vigencia, 1, ex=self.intervalo)
+        pipeline.execute()
+        return True
+
+
+def _indexar_runs(salida):
+    """ Agrupa las corridas de campañas por id de campaña de wombat """
+    runs = defaultdict(list)
+    for campaign in salida['result']['campaigns']:
+        runs[str(campaign['campaignId'])].append(campaign)
+    return runs
+
+
+def _indexar_calls(salida):
+    return {'hopperState': salida['result']['hopperState']}
+
+
+def _indexar_stats(salida):
+    return {'statsOut': salida['result']['statsOut']}
+
+
+def snapshot_runs(redis_connection=None):
+    """ Corridas de las campañas de wombat, indexadas por id de campaña de wombat """
+    return SnapshotWombat('RUNS', 'api/live/runs/', _indexar_runs, redis_connection)
+
+
+def snapshot_calls(redis_connection=None):
+    """ Llamadas en curso en wombat (campo 'hopperState') """
+    return SnapshotWombat('CALLS', 'api/live/calls/', _indexar_calls, redis_connection)
+
+
+def snapshot_stats(hopper_camp_id, redis_connection=None):
+    """ Estadísticas de una corrida de campaña de wombat (campo 'statsOut') """
+    return SnapshotWombat('STATS:{0}'.format(hopper_camp_id),
+                          'api/reports/stats/?id={0}'.format(hopper_camp_id), _indexar_stats,
+                          redis_connection)
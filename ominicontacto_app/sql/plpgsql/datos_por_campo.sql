@@ -0,0 +1,61 @@
+-- Mantienen las columnas JSONB Contacto.datos_por_campo y
+-- AgenteEnContacto.datos_contacto_por_campo a partir de las columnas de texto con JSON.
+-- Si el texto no es JSON válido la columna JSONB queda en NULL y se sigue usando el texto.
+
+-- Contacto.datos es una lista con los valores de las columnas de datos de la base, es decir
+-- todas excepto la del primer teléfono y la del id externo
+-- (ver MetadataBaseDatosContacto.nombres_de_columnas_de_datos)
+CREATE OR REPLACE FUNCTION contacto_datos_por_campo() RETURNS trigger AS $$
+DECLARE
+    metadata_bd jsonb;
+BEGIN
+    SELECT bd.metadata::jsonb INTO metadata_bd
+    FROM ominicontacto_app_basedatoscontacto bd
+    WHERE bd.id = NEW.bd_contacto_id;
+    IF metadata_bd IS NULL THEN
+        NEW.datos_por_campo := NULL;
+        RETURN NEW;
+    END IF;
+
+    SELECT COALESCE(jsonb_object_agg(columnas.nombre, datos.valor), '{}')
+        INTO NEW.datos_por_campo
+    FROM (
+        SELECT nombre, row_number() OVER (ORDER BY indice) AS posicion
+        FROM jsonb_array_elements_text(metadata_bd->'nombres_de_columnas')
+            WITH ORDINALITY AS nombres(nombre, indice)
+        WHERE nombre IS DISTINCT FROM
+                metadata_bd->'nombres_de_columnas'->>((metadata_bd->'cols_telefono'->>0)::int)
+            AND nombre IS DISTINCT FROM
+                metadata_bd->'nombres_de_columnas'->>((metadata_bd->>'col_id_externo')::int)
+    ) columnas
+    JOIN jsonb_array_elements(NEW.datos::jsonb) WITH ORDINALITY AS datos(valor, posicion)
+        USING (posicion);
+    RETURN NEW;
+EXCEPTION
+    WHEN invalid_text_representation OR invalid_parameter_value THEN
+        NEW.datos_por_campo := NULL;
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacto_datos_por_campo ON ominicontacto_app_contacto;
+CREATE TRIGGER contacto_datos_por_campo
+    BEFORE INSERT OR UPDATE OF datos, bd_contacto_id ON ominicontacto_app_contacto
+    FOR EACH ROW EXECUTE PROCEDURE contacto_datos_por_campo();
+
+-- AgenteEnContacto.datos_contacto ya es un objeto con los nombres de las columnas
+CREATE OR REPLACE FUNCTION agenteencontacto_datos_por_campo() RETURNS trigger AS $$
+BEGIN
+    NEW.datos_contacto_por_campo := NEW.datos_contacto::jsonb;
+    RETURN NEW;
+EXCEPTION
+    WHEN invalid_text_representation THEN
+        NEW.datos_contacto_por_campo := NULL;
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS agenteencontacto_datos_por_campo ON ominicontacto_app_agenteencontacto;
+CREATE TRIGGER agenteencontacto_datos_por_campo
+    BEFORE INSERT OR UPDATE OF datos_contacto ON ominicontacto_app_agenteencontacto
+    FOR EACH ROW EXECUTE PROCEDURE agenteencontacto_datos_por_campo();
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests para el pool de conexiones de 'ominicontacto_app.services.asterisk.asterisk_ami'
+"""
+
+from mock import patch, MagicMock
+
+from asterisk.manager import ManagerException, ManagerSocketException
+
+from ominicontacto_app.tests.utiles import OMLBaseTest
+
+from ominicontacto_app.services.asterisk.asterisk_ami import (
+    ManagerAMI, PoolConexionesAMI, AMIManagerConnector)
+
+
+class ManagerAMITest(OMLBaseTest):
+
+    def _respuesta(self, action_id):
+        respuesta = MagicMock()
+        respuesta.get_header.return_value = action_id
+        return respuesta
+
+    def test_send_actions_escribe_una_vez_y_correlaciona_por_action_id(self):
+        manager = ManagerAMI()
+        manager._connected.set()
+        # Evita que close() intente hacer logoff sobre el socket falso
+        self.addCleanup(manager._connected.clear)
+        manager._sock = MagicMock()
+        manager.hostname = 'asterisk'
+        respuesta_1 = self._respuesta('asterisk-00000000')
+        respuesta_2 = self._respuesta('asterisk-00000001')
+        # Las respuestas llegan en distinto orden que las acciones
+        manager._response_queue.put(respuesta_2)
+        manager._response_queue.put(respuesta_1)
+
+        respuestas = manager.send_actions([
+            {'Action': 'QueueAdd', 'Queue': 'cola'},
+            {'Action': 'QueueLog', 'Queue': 'ALL'}])
+
+        self.assertEqual(respuestas, [respuesta_1, respuesta_2])
+        manager._sock.write.assert_called_once()
+        enviado = manager._sock.write.call_args[0][0].decode('utf8')
+        self.assertIn('ActionID: asterisk-00000000', enviado)
+        self.assertIn('ActionID: asterisk-00000001', enviado)
+
+    def test_send_actions_sin_respuesta_no_espera_indefinidamente(self):
+        manager = ManagerAMI(timeout_respuesta=0.01)
+        manager._connected.set()
+        self.addCleanup(manager._connected.clear)
+        manager._sock = MagicMock()
+        manager.hostname = 'asterisk'
+
+        with self.assertRaises(ManagerException):
+            manager.send_actions([{'Action': 'QueueLog', 'Queue': 'ALL'}])
+
+
+class PoolConexionesAMITest(OMLBaseTest):
+
+    def _manager(self):
+        manager = MagicMock()
+        manager.connected.return_value = True
+        return manager
+
+    @patch.object(PoolConexionesAMI, '_conectar')
+    def test_obtener_reutiliza_conexion_devuelta(self, _conectar):
+        manager = self._manager()
+        _conectar.return_value = manager
+        pool = PoolConexionesAMI(2)
+        pool.devolver(pool.obtener())
+
+        self.assertEqual(pool.obtener(), manager)
+        self.assertEqual(_conectar.call_count, 1)
+
+    @patch.object(PoolConexionesAMI, '_conectar')
+    def test_obtener_descarta_conexiones_cortadas(self, _conectar):
+        cortada = self._manager()
+        nueva = self._manager()
+        _conectar.side_effect = [cortada, nueva]
+        pool = PoolConexionesAMI(2)
+        pool.devolver(pool.obtener())
+        cortada.connected.return_value = False
+
+        self.assertEqual(pool.obtener(), nueva)
+        cortada.close.assert_called_once()
+
+    def test_devolver_cierra_conexiones_que_exceden_el_tamano(self):
+        pool = PoolConexionesAMI(1)
+        manager_1 = self._manager()
+        manager_2 = self._manager()
+        pool.devolver(manager_1)
+        pool.devolver(manager_2)
+
+        manager_1.close.assert_not_called()
+        manager_2.close.assert_called_once()
+
+
+class AMIManagerConnectorTest(OMLBaseTest):
+
+    @patch.object(PoolConexionesAMI, 'del_proceso')
+    def test_queue_add_envia_todas_las_acciones_juntas(self, del_proceso):
+        manager = MagicMock()
+        manager.connected.return_value = True
+        del_proceso.return_value.obtener.return_value = manager
+        connector = AMIManagerConnector()
+        connector.connect()
+        content = {0: 'SIP/1001', 1: 'agente', 2: ['cola_1', 'cola_2'], 3: [0, 1],
+                   4: 'SIP/1001'}
+
+        connector._ami_manager('QueueAdd', content)
+        connector.disconnect()
+
+        manager.send_actions.assert_called_once()
+        acciones = manager.send_actions.call_args[0][0]
+        self.assertEqual([accion['Action'] for accion in acciones],
+                         ['QueueAdd', 'QueueAdd', 'QueueLog'])
+        del_proceso.return_value.devolver.assert_called_once_with(manager, descartar=False)
+
+    @patch.object(PoolConexionesAMI, 'del_proceso')
+    def test_conexion_con_error_de_socket_no_vuelve_al_pool(self, del_proceso):
+        manager = MagicMock()
+        manager.connected.return_value = True
+        manager.send_actions.side_effect = ManagerSocketException(0, 'Connection Terminated')
+        del_proceso.return_value.obtener.return_value = manager
+        connector = AMIManagerConnector()
+        connector.connect()
+
+        data_returned, error = connector._ami_manager(
+            'QueuePause', {0: 'SIP/1001', 4: 'SIP/1001', 5: 'pausa', 6: 'true'})
+        connector.disconnect()
+
+        self.assertTrue(error)
+        del_proceso.return_value.devolver.assert_called_once_with(manager, descartar=True)
+
+    @patch.object(PoolConexionesAMI, 'del_proceso')
+    def test_conexion_desincronizada_no_vuelve_al_pool(self, del_proceso):
+        manager = MagicMock()
+        manager.connected.return_value = True
+        manager.send_actions.side_effect = ManagerException('Acciones sin respuesta: 1')
+        del_proceso.return_value.obtener.return_value = manager
+        connector = AMIManagerConnector()
+        connector.connect()
+
+        data_returned, error = connector._ami_manager(
+            'QueuePause', {0: 'SIP/1001', 4: 'SIP/1001', 5: 'pausa', 6: 'true'})
+        connector.disconnect()
+
+        self.assertTrue(error)
+        del_proceso.return_value.devolver.assert_called_once_with(manager, descartar=True)
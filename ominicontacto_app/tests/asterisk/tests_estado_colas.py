@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests para 'ominicontacto_app.services.asterisk.estado_colas', reproduciendo eventos AMI
+grabados en lugar de conectarse a Asterisk
+"""
+
+from fnmatch import fnmatch
+
+from ominicontacto_app.tests.utiles import OMLBaseTest
+
+from ominicontacto_app.services.asterisk.estado_colas import (
+    EstadoColasAsterisk, parsear_eventos_ami)
+
+
+class RedisEnMemoria(object):
+    """ Implementa sólo los comandos de Redis que usa EstadoColasAsterisk """
+
+    def __init__(self):
+        self.datos = {}
+
+    def sadd(self, clave, *valores):
+        self.datos.setdefault(clave, set()).update(str(valor) for valor in valores)
+
+    def srem(self, clave, *valores):
+        self.datos.get(clave, set()).difference_update(str(valor) for valor in valores)
+
+    def scard(self, clave):
+        return len(self.datos.get(clave, ()))
+
+    def smembers(self, clave):
+        return set(self.datos.get(clave, ()))
+
+    def set(self, clave, valor, ex=None):
+        self.datos[clave] = str(valor)
+
+    def exists(self, clave):
+        return int(bool(self.datos.get(clave)))
+
+    def delete(self, clave):
+        self.datos.pop(clave, None)
+
+    def scan_iter(self, match, count=None):
+        return [clave for clave in self.datos if fnmatch(clave, match)]
+
+    def pipeline(self, transaction=True):
+        return PipelineEnMemoria(self)
+
+
+class PipelineEnMemoria(object):
+
+    def __init__(self, redis_connection):
+        self.redis_connection = redis_connection
+        self.resultados = []
+
+    def __getattr__(self, comando):
+        def ejecutar(*args, **kwargs):
+            self.resultados.append(getattr(self.redis_connection, comando)(*args, **kwargs))
+        return ejecutar
+
+    def execute(self):
+        return self.resultados
+
+
+class EstadoColasAsteriskTest(OMLBaseTest):
+
+    def setUp(self):
+        super(EstadoColasAsteriskTest, self).setUp()
+        self.estado = EstadoColasAsterisk(redis_connection=RedisEnMemoria())
+
+    def _reproducir(self, archivo):
+        with open(self.get_test_resource(archivo)) as eventos:
+            for headers in parsear_eventos_ami(eventos.read()):
+                self.estado.procesar_evento(headers)
+
+    def test_reproduccion_de_eventos_actualiza_llamadas_en_espera(self):
+        self._reproducir('eventos_ami_colas.txt')
+
+        self.assertEqual(self.estado.obtener_llamadas_en_espera([12, 15, 20]), {12: 1, 15: 1})
+
+    def test_reproduccion_de_eventos_actualiza_agentes_no_disponibles(self):
+        self._reproducir('eventos_ami_colas.txt')
+
+        self.assertEqual(self.estado.obtener_agentes_no_disponibles(), set([3]))
+
+    def test_reemplazar_descarta_estado_anterior(self):
+        self._reproducir('eventos_ami_colas.txt')
+        queue_status = ('Response: Success\r\n\r\n'
+                        'Event: QueueMember\r\nQueue: 15_camp-entrante-2\r\nName: 7_agente-dos\r\n'
+                        'Status: 5\r\nPaused: 0\r\n\r\n'
+                        'Event: QueueEntry\r\nQueue: 20_camp-entrante-3\r\n'
+                        'Uniqueid: 1600000009.9\r\nPosition: 1\r\n\r\n'
+                        'Event: QueueStatusComplete\r\nEventList: Complete\r\n')
+
+        self.estado.reemplazar(parsear_eventos_ami(queue_status))
+
+        self.assertTrue(self.estado.esta_vigente())
+        self.assertEqual(self.estado.obtener_llamadas_en_espera([12, 15, 20]), {20: 1})
+        self.assertEqual(self.estado.obtener_agentes_no_disponibles(), set([7]))
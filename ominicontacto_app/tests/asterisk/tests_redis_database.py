@@ -21,11 +21,14 @@
 Tests para Families en 'ominicontacto_app.services.asterisk.redis_database'
 """
 
+from mock import MagicMock
+
 from ominicontacto_app.tests.utiles import OMLBaseTest
 
 from ominicontacto_app.services.asterisk.redis_database import (
     IVRFamily, ValidacionFechaHoraFamily, GrupoHorarioFamily, IdentificadorClienteFamily,
-    PausaFamily, RutaEntranteFamily, TrunkFamily, DestinoPersonalizadoFamily, CampanaFamily
+    PausaFamily, RutaEntranteFamily, TrunkFamily, DestinoPersonalizadoFamily, CampanaFamily,
+    AgenteFamily
 )
 
 from configuracion_telefonia_app.models import DestinoEntrante, OpcionDestino, IVR, Campana
@@ -157,6 +160,32 @@ class PausaFamilyTest(RedisDatabaseTest):
         family = PausaFamily()
         self.assertEqual(dict, family._create_dict(self.pausa))
 
+    def test_regenerar_families_solo_escribe_cambios_y_elimina_sobrantes(self):
+        pausa_modificada = PausaFactory()
+        family = PausaFamily()
+        esperadas = family._obtener_families_esperadas()
+        clave_pausa = family._get_nombre_family(self.pausa)
+        clave_modificada = family._get_nombre_family(pausa_modificada)
+        clave_sobrante = 'OML:PAUSE:999999'
+        actuales = {nombre: {'NAME': variables['NAME']} for nombre, variables in esperadas.items()}
+        actuales[clave_modificada] = {'NAME': 'otro nombre'}
+        actuales[clave_sobrante] = {'NAME': 'pausa eliminada'}
+
+        redis_connection = MagicMock()
+        lectura = MagicMock()
+        escritura = MagicMock()
+        redis_connection.pipeline.side_effect = [lectura, escritura]
+        redis_connection.scan_iter.return_value = list(actuales.keys())
+        lectura.execute.return_value = list(actuales.values())
+        family.redis_connection = redis_connection
+
+        self.assertEqual(family.regenerar_families(), (1, 1))
+        escritura.hset.assert_called_once_with(
+            clave_modificada, mapping={'NAME': pausa_modificada.nombre})
+        escritura.delete.assert_any_call(clave_sobrante)
+        self.assertNotIn(clave_pausa, [llamada[0][0] for llamada in escritura.hset.call_args_list])
+        escritura.execute.assert_called_once()
+
 
 class RutaEntranteFamilyTest(RedisDatabaseTest):
     def test_devuelve_diccionario_con_datos_correctos(self):
@@ -300,3 +329,26 @@ class CampanaFamilyTest(RedisDatabaseTest):
         family = CampanaFamily()
 
         self.assertEqual(dict, family._create_dict(self.campana_preview))
+
+
+class AgenteFamilyTest(OMLBaseTest):
+
+    def setUp(self):
+        super(AgenteFamilyTest, self).setUp()
+        self.redis_connection = MagicMock()
+        self.family = AgenteFamily()
+        self.family.redis_connection = self.redis_connection
+
+    def test_obtener_ids_agentes_usa_el_indice(self):
+        self.redis_connection.smembers.return_value = {'1', '2'}
+        self.assertEqual(self.family.obtener_ids_agentes(), {'1', '2'})
+        self.redis_connection.scan_iter.assert_not_called()
+
+    def test_obtener_ids_agentes_reconstruye_indice_inexistente(self):
+        self.redis_connection.smembers.return_value = set()
+        self.redis_connection.exists.return_value = 0
+        self.redis_connection.scan_iter.return_value = ['OML:AGENT:1', 'OML:AGENT:2']
+        self.assertEqual(self.family.obtener_ids_agentes(), {'1', '2'})
+        args = self.redis_connection.sadd.call_args[0]
+        self.assertEqual(args[0], AgenteFamily.CLAVE_INDICE)
+        self.assertEqual(set(args[1:]), {'1', '2'})
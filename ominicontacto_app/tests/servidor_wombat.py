@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+"""
+Servidor HTTP local que imita la API de Wombat Dialer, para probar WombatService y
+CampanaService sin un Wombat real. También se puede levantar para medir el cliente:
+
+    python ominicontacto_app/tests/servidor_wombat.py 8099
+
+y configurar OML_WOMBAT_URL = 'http://127.0.0.1:8099/wombat'.
+"""
+
+from __future__ import unicode_literals
+
+import base64
+import json
+import socketserver
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+RESPUESTAS_POR_DEFECTO = {
+    '/wombat/api/live/runs/': {'result': {'campaigns': []}},
+    '/wombat/api/live/calls/': {'result': {'hopperState': []}},
+    '/wombat/api/calls/': 'Event CALLSTATUS queued',
+    '/wombat/api/edit/': {'status': 'OK', 'results': []},
+    '/wombat/api/lists/': 'OK',
+}
+
+
+class _ManejadorWombat(BaseHTTPRequestHandler):
+    # HTTP/1.1 para mantener la conexión abierta entre requests (keep-alive)
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(_ManejadorWombat, self).setup()
+        with self.server.lock:
+            self.server.conexiones += 1
+
+    def do_POST(self):
+        self._responder()
+
+    def do_GET(self):
+        self._responder()
+
+    def _responder(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        cuerpo = self.rfile.read(largo) if largo else b''
+        url = urlparse(self.path)
+        request = {
+            'metodo': self.command,
+            'path': url.path,
+            'parametros': parse_qs(url.query),
+            'cuerpo': cuerpo,
+            'datos': parse_qs(cuerpo.decode('utf-8')),
+            'autorizacion': self._obtener_autorizacion(),
+        }
+        with self.server.lock:
+            self.server.requests.append(request)
+
+        if self.server.demora:
+            time.sleep(self.server.demora)
+        if self.server.credenciales and request['autorizacion'] != self.server.credenciales:
+            self._escribir(401, 'Unauthorized')
+            return
+        with self.server.lock:
+            fallar = self.server.fallas > 0
+            if fallar:
+                self.server.fallas -= 1
+        if fallar:
+            self._escribir(500, 'Internal Server Error')
+            return
+        self._escribir(200, self.server.obtener_respuesta(url.path))
+
+    def _obtener_autorizacion(self):
+        autorizacion = self.headers.get('Authorization', '')
+        if not autorizacion.startswith('Basic '):
+            return None
+        usuario, _, password = base64.b64decode(autorizacion[6:]).decode('utf-8').partition(':')
+        return (usuario, password)
+
+    def _escribir(self, status, respuesta):
+        if not isinstance(respuesta, str):
+            respuesta = json.dumps(respuesta)
+        contenido = respuesta.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServidorWombatDePrueba(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    Responde a cada path con la respuesta configurada para el prefijo más largo que lo
+    contenga (ver RESPUESTAS_POR_DEFECTO) y registra los requests recibidos y la cantidad de
+    conexiones aceptadas. Si se indican credenciales responde 401 a los requests sin ellas.
+    Con 'demora' se simula un Wombat lento y con 'fallas' la cantidad de próximos requests
+    que responden con error 500.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, puerto=0, credenciales=None, respuestas=None):
+        HTTPServer.__init__(self, ('127.0.0.1', puerto), _ManejadorWombat)
+        self.lock = threading.Lock()
+        self.credenciales = credenciales
+        self.respuestas = dict(RESPUESTAS_POR_DEFECTO)
+        self.respuestas.update(respuestas or {})
+        self.requests = []
+        self.conexiones = 0
+        self.demora = 0
+        self.fallas = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/wombat'.format(self.server_address[1])
+
+    def obtener_respuesta(self, path):
+        prefijos = [prefijo for prefijo in self.respuestas if path.startswith(prefijo)]
+        if not prefijos:
+            return {'status': 'ERROR'}
+        return self.respuestas[max(prefijos, key=len)]
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    servidor = ServidorWombatDePrueba(puerto)
+    print('Wombat de prueba en {0}'.format(servidor.url))
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
@@ -22,8 +22,14 @@ Tests relacionados al Blacklist
 """
 from __future__ import unicode_literals
 
+from django.core.files import File
+from django.test.utils import override_settings
 from django.urls import reverse
+from mock import patch
 
+from ominicontacto_app.models import Blacklist, ContactoBlacklist
+from ominicontacto_app.services.asterisk.redis_database import BlacklistFamily
+from ominicontacto_app.services.black_list import CreacionBlacklistService
 from ominicontacto_app.tests.utiles import OMLBaseTest
 from ominicontacto_app.tests.factories import BlackListFactory
 
@@ -54,3 +60,63 @@ class TestsBlacklist (OMLBaseTest):
         data = response.context_data['object_list']
         n_blacklist = data.count()
         self.assertEqual(n_blacklist, 1)
+
+
+class ImportacionBlacklistTest(OMLBaseTest):
+
+    def _crear_blacklist(self, telefonos):
+        blacklist = BlackListFactory(cantidad_contactos=0)
+        for telefono in telefonos:
+            ContactoBlacklist.objects.create(telefono=telefono, black_list=blacklist)
+        return blacklist
+
+    def test_importa_contactos_en_lotes(self):
+        blacklist = Blacklist(nombre='blacklist')
+        blacklist.archivo_importacion = File(open(self.get_test_resource(
+            'blacklist-ejemplo.csv'), 'r'))
+        blacklist.nombre_archivo_importacion = 'blacklist-ejemplo.csv'
+        blacklist.save()
+        with override_settings(OL_TAMANO_LOTE_IMPORTACION_CONTACTOS=3):
+            CreacionBlacklistService().importa_contactos(blacklist)
+        telefonos = blacklist.contactosblacklist.values_list('telefono', flat=True)
+        self.assertEqual(sorted(telefonos), ['3511111111', '3511111111', '3512222222',
+                                             '3513333333'])
+        self.assertEqual(blacklist.cantidad_contactos, 4)
+
+    @patch('ominicontacto_app.services.asterisk.redis_database.redis.Redis')
+    def test_regenerar_arma_el_set_en_una_clave_temporal(self, Redis):
+        redis_connection = Redis.return_value
+        blacklist = self._crear_blacklist(['1', '2', '3'])
+        blacklist_family = BlacklistFamily()
+        blacklist_family.TAMANO_LOTE = 2
+        blacklist_family.regenerar_families(blacklist)
+        llamadas = redis_connection.sadd.call_args_list
+        clave_temporal = llamadas[0][0][0]
+        self.assertTrue(clave_temporal.startswith('OML:BLACKLIST:TMP:'))
+        self.assertEqual([len(llamada[0]) - 1 for llamada in llamadas], [2, 1])
+        self.assertEqual(sorted(telefono for llamada in llamadas for telefono in llamada[0][1:]),
+                         ['1', '2', '3'])
+        redis_connection.rename.assert_called_once_with(clave_temporal, 'OML:BLACKLIST')
+        redis_connection.delete.assert_not_called()
+
+    @patch('ominicontacto_app.services.asterisk.redis_database.redis.Redis')
+    def test_actualizar_aplica_solo_las_diferencias(self, Redis):
+        redis_connection = Redis.return_value
+        redis_connection.scard.return_value = 2
+        anterior = self._crear_blacklist(['1', '2'])
+        nueva = self._crear_blacklist(['2', '3'])
+        BlacklistFamily().actualizar_families(nueva, anterior)
+        pipeline = redis_connection.pipeline.return_value
+        pipeline.sadd.assert_called_once_with('OML:BLACKLIST', '3')
+        pipeline.srem.assert_called_once_with('OML:BLACKLIST', '1')
+        redis_connection.rename.assert_not_called()
+
+    @patch('ominicontacto_app.services.asterisk.redis_database.redis.Redis')
+    def test_actualizar_regenera_si_redis_no_refleja_la_blacklist_anterior(self, Redis):
+        redis_connection = Redis.return_value
+        redis_connection.scard.return_value = 0
+        anterior = self._crear_blacklist(['1', '2'])
+        nueva = self._crear_blacklist(['2', '3'])
+        BlacklistFamily().actualizar_families(nueva, anterior)
+        redis_connection.pipeline.return_value.sadd.assert_not_called()
+        self.assertEqual(redis_connection.rename.call_count, 1)
@@ -21,14 +21,21 @@
 
 from __future__ import unicode_literals
 
+import os
+import shutil
+import subprocess
 import tempfile
 
 from django.test.utils import override_settings
-from ominicontacto_app.services.audio_conversor import ConversorDeAudioService
+from configuracion_telefonia_app.models import MusicaDeEspera
+from configuracion_telefonia_app.tests.factories import PlaylistFactory
+from ominicontacto_app.errors import OmlAudioConversionError
+from ominicontacto_app.services.audio_conversor import (
+    ConversorDeAudioService, CacheConversionesDeAudio)
 from ominicontacto_app.models import ArchivoDeAudio
 from ominicontacto_app.tests.utiles import OMLBaseTest
 import logging as _logging
-from mock import Mock
+from mock import Mock, MagicMock, patch
 
 
 logger = _logging.getLogger(__name__)
@@ -126,3 +133,98 @@ class ConvertirAudioDeArchivoDeAudioGlobalesTests(OMLBaseTest):
         self.assertEqual(fc_p2, sc_p2, "En diversas llamadas se generaron "
                          "nombres de archivos destinos (convertidos) "
                          "distintos!")
+
+
+@override_settings(MEDIA_ROOT=_tmpdir(),
+                   TMPL_OML_AUDIO_CONVERSOR=["cp", "<INPUT_FILE>", "<OUTPUT_FILE>"],
+                   TMPL_OML_AUDIO_CONVERSOR_EXTENSION=".wav")
+class ConversionDeAudioConCacheTests(OMLBaseTest):
+    """Testea la conversion de audios en el pool con la cache de conversiones"""
+
+    def setUp(self):
+        super(ConversionDeAudioConCacheTests, self).setUp()
+        self.directorio = _tmpdir()
+        cache = CacheConversionesDeAudio(os.path.join(self.directorio, "cache"))
+        self.servicio = ConversorDeAudioService(cache=cache)
+        self.original = os.path.join(self.directorio, "original.wav")
+        shutil.copy(self.get_test_resource("wavs/8k16bitpcm.wav"), self.original)
+
+    def _salida(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def _leer(self, archivo):
+        with open(archivo, "rb") as f:
+            return f.read()
+
+    def _convertir_contando_conversiones(self, *conversiones):
+        with patch("ominicontacto_app.services.audio_conversor.subprocess.check_call",
+                   wraps=subprocess.check_call) as check_call:
+            for entrada, salida in conversiones:
+                self.servicio._convertir_audio(entrada, salida)
+        return check_call.call_count
+
+    def test_audio_ya_convertido_se_copia_de_la_cache(self):
+        conversiones = self._convertir_contando_conversiones(
+            (self.original, self._salida("salida1.wav")),
+            (self.original, self._salida("salida2.wav")))
+
+        self.assertEqual(conversiones, 1)
+        self.assertEqual(self._leer(self._salida("salida2.wav")), self._leer(self.original))
+
+    def test_audio_distinto_o_cambio_de_conversor_se_vuelve_a_convertir(self):
+        otro = self.copy_test_resource_to_mediaroot("wavs/empty.wav")
+        conversiones = self._convertir_contando_conversiones(
+            (self.original, self._salida("salida1.wav")),
+            (otro, self._salida("salida2.wav")))
+        self.assertEqual(conversiones, 2)
+
+        with override_settings(TMPL_OML_AUDIO_CONVERSOR=[
+                "cp", "-p", "<INPUT_FILE>", "<OUTPUT_FILE>"]):
+            conversiones = self._convertir_contando_conversiones(
+                (self.original, self._salida("salida3.wav")))
+        self.assertEqual(conversiones, 1)
+
+    @override_settings(TMPL_OML_AUDIO_CONVERSOR=["false", "<INPUT_FILE>", "<OUTPUT_FILE>"])
+    def test_error_de_conversion_conserva_el_audio_anterior(self):
+        salida = self._salida("salida.wav")
+        with open(salida, "wb") as f:
+            f.write(b"anterior")
+
+        with self.assertRaises(OmlAudioConversionError):
+            self.servicio._convertir_audio(self.original, salida)
+
+        self.assertEqual(self._leer(salida), b"anterior")
+        self.assertEqual(sorted(os.listdir(self.directorio)), ["original.wav", "salida.wav"])
+
+    def test_convertir_audios_en_paralelo_informa_errores_y_progreso(self):
+        progreso = MagicMock()
+        inexistente = self._salida("inexistente.wav")
+        conversiones = [(self.original, self._salida("salida1.wav")),
+                        (self.original, self._salida("salida2.wav")),
+                        (inexistente, self._salida("salida3.wav"))]
+
+        errores = self.servicio.convertir_audios(conversiones, progreso)
+
+        self.assertEqual(list(errores), [self._salida("salida3.wav")])
+        self.assertTrue(os.path.exists(self._salida("salida1.wav")))
+        self.assertTrue(os.path.exists(self._salida("salida2.wav")))
+        self.assertEqual(progreso.iniciar.call_count, 1)
+        self.assertEqual(progreso.avanzar.call_count, 3)
+
+    def test_convertir_audios_de_playlist(self):
+        original = self.copy_test_resource_to_mediaroot("wavs/8k16bitpcm.wav")
+        playlist = PlaylistFactory()
+        musica = MusicaDeEspera.objects.create(
+            nombre="musica1", playlist=playlist, audio_original=os.path.basename(original))
+        sin_audio = MusicaDeEspera.objects.create(
+            nombre="musica2", playlist=playlist, audio_original="inexistente.wav")
+
+        fallidas = self.servicio.convertir_audios_de_playlist(playlist)
+
+        self.assertEqual(fallidas, [])
+        musica.refresh_from_db()
+        sin_audio.refresh_from_db()
+        self.assertEqual(musica.audio_asterisk.name, os.path.join(
+            "musicas_asterisk", playlist.nombre, "{0}-musica1.wav".format(musica.id)))
+        self.assertEqual(self._leer(musica.audio_asterisk.path), self._leer(original))
+        self.assertFalse(sin_audio.audio_asterisk)
@@ -23,7 +23,12 @@ from __future__ import unicode_literals
 
 import json
 
-from ominicontacto_app.models import BaseDatosContacto, MetadataBaseDatosContactoDTO
+from io import StringIO
+
+from django.core.management import call_command
+
+from ominicontacto_app.models import BaseDatosContacto, MetadataBaseDatosContactoDTO, Contacto
+from ominicontacto_app.tests.factories import ContactoFactory
 from ominicontacto_app.tests.utiles import OMLBaseTest
 
 
@@ -254,3 +259,75 @@ class TestMetadataBaseDatosContactoParseoDeDatos(OMLBaseTest):
         with self.assertRaises(AssertionError):
             self.metadata.obtener_telefono_de_dato_de_contacto(
                 self.datos_json_con_faltantes)
+
+
+class DatosPorCampoTest(OMLBaseTest):
+    """Tests de Contacto.datos_por_campo, completado por trigger"""
+
+    def test_trigger_completa_datos_por_campo(self):
+        contacto = ContactoFactory(datos='["Juan", "Perez", "123", "351", "352"]')
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.datos_por_campo, {
+            'nombre': 'Juan', 'apellido': 'Perez', 'dni': '123', 'telefono2': '351',
+            'telefono3': '352'})
+
+    def test_obtener_datos_igual_con_y_sin_datos_por_campo(self):
+        contacto = ContactoFactory()
+        contacto.refresh_from_db()
+        sin_datos_por_campo = Contacto.objects.get(pk=contacto.pk)
+        sin_datos_por_campo.datos_por_campo = None
+        self.assertEqual(contacto.obtener_datos(), sin_datos_por_campo.obtener_datos())
+
+    def test_contactos_by_campo(self):
+        contacto = ContactoFactory(datos='["Juan", "Perez", "123", "351", "352"]')
+        ContactoFactory(bd_contacto=contacto.bd_contacto,
+                        datos='["Ana", "Perez", "456", "351", "352"]')
+        self.assertEqual(list(Contacto.objects.contactos_by_campo(
+            contacto.bd_contacto, 'dni', '123')), [contacto])
+
+    def test_completar_datos_por_campo_completa_contactos_anteriores(self):
+        contacto = ContactoFactory()
+        Contacto.objects.filter(pk=contacto.pk).update(datos_por_campo=None)
+        call_command('completar_datos_por_campo', pausa=0, stdout=StringIO())
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.datos_por_campo['nombre'], json.loads(contacto.datos)[0])
+
+    def test_completar_datos_por_campo_de_una_base_recorre_solo_sus_ids(self):
+        contacto = ContactoFactory()
+        for _i in range(3):
+            ContactoFactory()
+        Contacto.objects.filter(pk=contacto.pk).update(datos_por_campo=None)
+        salida = StringIO()
+        call_command('completar_datos_por_campo', base=contacto.bd_contacto_id, lote=1, pausa=0,
+                     stdout=salida)
+        contacto.refresh_from_db()
+        self.assertEqual(contacto.datos_por_campo['nombre'], json.loads(contacto.datos)[0])
+        self.assertEqual(salida.getvalue().count('\n'), 1)
+
+
+class MetadataCompartidaTest(OMLBaseTest):
+    """Tests de BaseDatosContacto.get_metadata_compartida"""
+
+    def test_contactos_de_la_misma_base_comparten_la_metadata(self):
+        contacto = ContactoFactory()
+        ContactoFactory(bd_contacto=contacto.bd_contacto)
+        contactos = Contacto.objects.filter(
+            bd_contacto=contacto.bd_contacto).select_related('bd_contacto')
+        metadata_1, metadata_2 = [c.bd_contacto.get_metadata_compartida() for c in contactos]
+        self.assertIs(metadata_1, metadata_2)
+
+    def test_metadata_compartida_no_se_puede_modificar(self):
+        contacto = ContactoFactory()
+        metadata = contacto.bd_contacto.get_metadata_compartida()
+        with self.assertRaises(TypeError):
+            metadata.columna_con_telefono = 0
+
+    def test_guardar_la_base_invalida_la_metadata_compartida(self):
+        bd_contacto = ContactoFactory().bd_contacto
+        anterior = BaseDatosContacto.objects.get(pk=bd_contacto.pk).get_metadata_compartida()
+        metadata = bd_contacto.get_metadata()
+        metadata.nombres_de_columnas = ['telefono'] + metadata.nombres_de_columnas[1:]
+        metadata.save()
+        actual = BaseDatosContacto.objects.get(pk=bd_contacto.pk).get_metadata_compartida()
+        self.assertIsNot(anterior, actual)
+        self.assertEqual(actual.nombres_de_columnas[0], 'telefono')
@@ -23,15 +23,22 @@ Tests relacionados con la lista de contactos de los Agentes
 from __future__ import unicode_literals
 
 import json
-from mock import patch
+import time
+from mock import MagicMock, patch
+from redis.exceptions import ConnectionError
 from django.utils.translation import ugettext_lazy as _
 
+from django.test import override_settings
 from django.urls import reverse
+from django.utils.timezone import now, timedelta
 
 from ominicontacto_app.tests.factories import (CampanaFactory, ContactoFactory, QueueFactory,
                                                AgenteEnContactoFactory)
 from ominicontacto_app.tests.utiles import OMLBaseTest, PASSWORD
+from ominicontacto_app.management.commands.persistir_entregas_preview import (
+    Command as PersistirEntregasPreviewCommand)
 from ominicontacto_app.models import AgenteEnContacto, Campana, User
+from ominicontacto_app.services.redis.despachador_preview import DespachadorContactosPreview
 
 
 class AsignacionDeContactosPreviewTests(OMLBaseTest):
@@ -380,6 +387,24 @@ class AsignacionDeContactosPreviewTests(OMLBaseTest):
         id_contacto = resultado['contacto_id']
         self.assertEqual(id_contacto, agente_en_contacto2.contacto_id)
 
+    def test_actualizar_campo_desactivacion_recalcula_contactos_desactivados(self):
+        pk_campana = self.campana_preview.pk
+        agente_en_contacto = AgenteEnContacto.objects.filter(campana_id=pk_campana).first()
+        datos_contacto_dict = json.loads(agente_en_contacto.datos_contacto)
+        datos_contacto_dict['dni'] = 'FALSE'
+        agente_en_contacto.datos_contacto = json.dumps(datos_contacto_dict)
+        agente_en_contacto.save()
+        agente_en_contacto.refresh_from_db()
+        self.assertFalse(agente_en_contacto.desactivado)
+        self.campana_preview.actualizar_campo_desactivacion('dni')
+        agente_en_contacto.refresh_from_db()
+        self.assertTrue(agente_en_contacto.desactivado)
+        self.assertEqual(AgenteEnContacto.objects.activos(pk_campana).filter(
+            pk=agente_en_contacto.pk).count(), 0)
+        self.campana_preview.actualizar_campo_desactivacion('')
+        agente_en_contacto.refresh_from_db()
+        self.assertFalse(agente_en_contacto.desactivado)
+
     def test_campos_bloqueados_no_se_modifican(self):
         self.campana_preview.campos_bd_no_editables = json.dumps(['telefono'])
         self.campana_preview.save()
@@ -401,3 +426,120 @@ class AsignacionDeContactosPreviewTests(OMLBaseTest):
         agente_en_contacto.refresh_from_db()
         self.assertEqual(contacto.telefono, telefono_viejo)
         self.assertEqual(agente_en_contacto.telefono_contacto, str(telefono_viejo))
+
+    def test_liberar_contactos_por_tiempo_libera_reservas_vencidas(self):
+        ahora = now()
+        contacto_3 = ContactoFactory.create(bd_contacto=self.campana_preview.bd_contacto)
+        contacto_4 = ContactoFactory.create(bd_contacto=self.campana_preview.bd_contacto)
+        for contacto in (contacto_3, contacto_4):
+            self.campana_preview.adicionar_agente_en_contacto(contacto, -1)
+        vencimientos = [
+            (self.contacto_1, AgenteEnContacto.ESTADO_ENTREGADO, 3),
+            (self.contacto_2, AgenteEnContacto.ESTADO_ENTREGADO, 1),
+            (contacto_3, AgenteEnContacto.ESTADO_ASIGNADO, 31),
+            (contacto_4, AgenteEnContacto.ESTADO_ASIGNADO, 10),
+        ]
+        for contacto, estado, minutos in vencimientos:
+            AgenteEnContacto.objects.filter(contacto_id=contacto.pk).update(
+                agente_id=self.agente_1.pk, estado=estado,
+                modificado=ahora - timedelta(minutes=minutos))
+
+        self.assertEqual(AgenteEnContacto.liberar_contactos_por_tiempo(), 2)
+        liberados = AgenteEnContacto.objects.filter(
+            agente_id=-1, estado=AgenteEnContacto.ESTADO_INICIAL).values_list(
+                'contacto_id', flat=True)
+        self.assertEqual(set(liberados), set([self.contacto_1.pk, contacto_3.pk]))
+
+
+@override_settings(OL_DESPACHADOR_PREVIEW_REDIS=True)
+@patch.object(DespachadorContactosPreview, 'confirmar_entrega')
+@patch.object(DespachadorContactosPreview, 'quitar_entrega')
+@patch.object(DespachadorContactosPreview, 'entregar')
+class DespachadorContactosPreviewTests(OMLBaseTest):
+
+    def setUp(self):
+        self.agente = self.crear_agente_profile()
+        self.campana_preview = CampanaFactory.create(
+            type=Campana.TYPE_PREVIEW, tiempo_desconexion=2, estado=Campana.ESTADO_ACTIVA)
+        self.contacto_1 = ContactoFactory.create(bd_contacto=self.campana_preview.bd_contacto)
+        self.contacto_2 = ContactoFactory.create(bd_contacto=self.campana_preview.bd_contacto)
+        self.campana_preview.establecer_valores_iniciales_agente_contacto(False, False)
+        self.agente_en_contacto_1 = AgenteEnContacto.objects.get(contacto_id=self.contacto_1.pk)
+        self.agente_en_contacto_2 = AgenteEnContacto.objects.get(contacto_id=self.contacto_2.pk)
+
+    def _entrega(self, agente_en_contacto):
+        return (DespachadorContactosPreview.ENTREGADO,
+                (agente_en_contacto.pk, agente_en_contacto.contacto_id))
+
+    def test_entrega_desde_despachador_encola_la_persistencia(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        entregar.return_value = self._entrega(self.agente_en_contacto_1)
+        data = AgenteEnContacto.entregar_contacto(self.agente, self.campana_preview.pk)
+        self.assertEqual(data['code'], 'contacto-entregado')
+        self.assertEqual(data['contacto_id'], self.contacto_1.pk)
+        self.assertEqual(data['agente_id'], self.agente.pk)
+        confirmar_entrega.assert_called_once_with(self.agente_en_contacto_1.pk, self.agente.pk)
+        # La base de datos se actualiza de forma asíncrona
+        self.agente_en_contacto_1.refresh_from_db()
+        self.assertEqual(self.agente_en_contacto_1.estado, AgenteEnContacto.ESTADO_INICIAL)
+
+    def test_despachador_descarta_contactos_finalizados(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        AgenteEnContacto.objects.filter(pk=self.agente_en_contacto_1.pk).update(
+            estado=AgenteEnContacto.ESTADO_FINALIZADO)
+        entregar.side_effect = [self._entrega(self.agente_en_contacto_1),
+                                self._entrega(self.agente_en_contacto_2)]
+        data = AgenteEnContacto.entregar_contacto(self.agente, self.campana_preview.pk)
+        self.assertEqual(data['contacto_id'], self.contacto_2.pk)
+        quitar_entrega.assert_called_once_with(
+            self.campana_preview.pk, self.agente.pk, self.agente_en_contacto_1.pk)
+
+    def test_despachador_sin_contactos_disponibles(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        entregar.return_value = (DespachadorContactosPreview.SIN_CONTACTOS, None)
+        data = AgenteEnContacto.entregar_contacto(self.agente, self.campana_preview.pk)
+        self.assertEqual(data['code'], 'error-no-contactos')
+
+    def test_error_de_redis_entrega_desde_la_base_de_datos(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        entregar.side_effect = ConnectionError()
+        data = AgenteEnContacto.entregar_contacto(self.agente, self.campana_preview.pk)
+        self.assertEqual(data['code'], 'contacto-entregado')
+        self.assertTrue(AgenteEnContacto.objects.filter(
+            agente_id=self.agente.pk, estado=AgenteEnContacto.ESTADO_ENTREGADO).exists())
+
+    def test_persistir_entregas_no_pisa_contactos_asignados(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        AgenteEnContacto.objects.filter(pk=self.agente_en_contacto_2.pk).update(
+            agente_id=self.agente.pk, estado=AgenteEnContacto.ESTADO_ASIGNADO)
+        ahora = time.time()
+        AgenteEnContacto.persistir_entregas([
+            {'accion': 'entregar', 'id': self.agente_en_contacto_1.pk,
+             'agente_id': self.agente.pk, 'modificado': ahora},
+            {'accion': 'entregar', 'id': self.agente_en_contacto_2.pk,
+             'agente_id': self.agente.pk, 'modificado': ahora},
+            {'accion': 'liberar', 'id': self.agente_en_contacto_2.pk,
+             'agente_id': self.agente.pk, 'modificado': ahora},
+        ])
+        self.agente_en_contacto_1.refresh_from_db()
+        self.agente_en_contacto_2.refresh_from_db()
+        self.assertEqual(self.agente_en_contacto_1.estado, AgenteEnContacto.ESTADO_ENTREGADO)
+        self.assertEqual(self.agente_en_contacto_1.agente_id, self.agente.pk)
+        self.assertEqual(self.agente_en_contacto_2.estado, AgenteEnContacto.ESTADO_ASIGNADO)
+
+    def test_persistir_entregas_mueve_a_fallidos_los_cambios_invalidos(
+            self, entregar, quitar_entrega, confirmar_entrega):
+        despachador = MagicMock()
+        despachador.obtener_pendientes.return_value = [
+            {'accion': 'entregar', 'id': self.agente_en_contacto_1.pk,
+             'agente_id': self.agente.pk, 'modificado': time.time()},
+            {'accion': 'entregar', 'id': self.agente_en_contacto_2.pk,
+             'agente_id': self.agente.pk},
+        ]
+        PersistirEntregasPreviewCommand()._persistir_lote(despachador)
+        despachador.descartar_pendientes.assert_called_once_with(1)
+        despachador.mover_pendiente_a_fallidos.assert_called_once_with()
+        self.agente_en_contacto_1.refresh_from_db()
+        self.agente_en_contacto_2.refresh_from_db()
+        self.assertEqual(self.agente_en_contacto_1.estado, AgenteEnContacto.ESTADO_ENTREGADO)
+        self.assertEqual(self.agente_en_contacto_2.estado, AgenteEnContacto.ESTADO_INICIAL)
@@ -22,12 +22,13 @@
 from __future__ import unicode_literals
 
 from django.core.files import File
+from django.test.utils import override_settings
 
 from ominicontacto_app.errors import OmlArchivoImportacionInvalidoError
 from ominicontacto_app.models import BaseDatosContacto, Contacto
 from ominicontacto_app.services.base_de_datos_contactos import \
     CreacionBaseDatosService, PredictorMetadataService, \
-    NoSePuedeInferirMetadataError
+    NoSePuedeInferirMetadataError, CreacionBaseDatosServiceIdExternoError
 from ominicontacto_app.tests.utiles import OMLBaseTest
 from ominicontacto_app.utiles import ValidadorDeNombreDeCampoExtra
 
@@ -75,6 +76,49 @@ class TestGeneraBaseDatosContacto(OMLBaseTest):
         for contacto in bd.contactos.all():
             self.assertIsNotNone(contacto.id_externo)
 
+    def _crear_bd_planilla_ejemplo_1(self, columna_id_externo):
+        bd = BaseDatosContacto(id=1)
+        bd.archivo_importacion = File(open(self.get_test_resource(
+            "planilla-ejemplo-1.csv"), 'r'))
+        bd.nombre_archivo_importacion = "planilla-ejemplo-1.csv"
+        bd.save()
+
+        metadata = bd.get_metadata()
+        metadata.cantidad_de_columnas = 3
+        metadata.columna_con_telefono = 0
+        metadata.columnas_con_telefono = [0, 2]
+        metadata.columna_id_externo = columna_id_externo
+        metadata.nombres_de_columnas = ["telefono",
+                                        "nombre",
+                                        "velular"]
+        metadata.save()
+        return bd
+
+    @override_settings(OL_TAMANO_LOTE_IMPORTACION_CONTACTOS=3)
+    def test_importa_contactos_en_varios_lotes(self):
+        bd = self._crear_bd_planilla_ejemplo_1(None)
+
+        creacion_base_de_datos_service = CreacionBaseDatosService()
+        creacion_base_de_datos_service.importa_contactos(bd, ["telefono", "celular"], None)
+
+        self.assertEqual(bd.contactos.count(), 4)
+        self.assertEqual(bd.cantidad_contactos, 4)
+        contacto = bd.contactos.get(telefono='2830173491')
+        self.assertEqual(contacto.lista_de_datos(), ['alsdkjfieasdf', '3516983419'])
+        self.assertIsNone(contacto.id_externo)
+
+    @override_settings(OL_TAMANO_LOTE_IMPORTACION_CONTACTOS=2)
+    def test_importa_contactos_id_externo_repetido_descarta_lotes_insertados(self):
+        bd = self._crear_bd_planilla_ejemplo_1(1)
+        Contacto.objects.create(bd_contacto=bd, telefono='1234567', datos='[]',
+                                id_externo='alsdkjfieasdf')
+
+        creacion_base_de_datos_service = CreacionBaseDatosService()
+        with self.assertRaises(CreacionBaseDatosServiceIdExternoError):
+            creacion_base_de_datos_service.importa_contactos(bd, ["telefono", "celular"], 1)
+
+        self.assertEqual(bd.contactos.count(), 1)
+
     def test_define_base_dato_contacto(self):
         bd = BaseDatosContacto(id=1)
         bd.save()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests del publicador de progreso de tareas
+"""
+from __future__ import unicode_literals
+
+from mock import MagicMock
+
+from ominicontacto_app.services.redis.progreso import PublicadorDeProgreso
+from ominicontacto_app.tests.utiles import OMLBaseTest
+
+
+class PublicadorDeProgresoTest(OMLBaseTest):
+
+    def _procesar(self, total, intervalo=3600):
+        redis_connection = MagicMock()
+        progreso = PublicadorDeProgreso('OML:STATUS_CSV_REPORT:CONTACTED:1:T1', total,
+                                        redis_connection, intervalo=intervalo)
+        progreso.iniciar()
+        for i in range(total):
+            progreso.avanzar()
+        return progreso, redis_connection.pipeline.return_value
+
+    def test_sin_elementos_publica_100(self):
+        progreso, pipeline = self._procesar(0)
+        pipeline.publish.assert_called_once_with('OML:STATUS_CSV_REPORT:CONTACTED:1:T1', 100)
+
+    def test_benchmark_cantidad_de_publicaciones(self):
+        # Publicando por cada elemento se harían 1 + total llamadas a Redis.
+        total = 200000
+        progreso, pipeline = self._procesar(total)
+        llamadas_sin_limitar = total + 1
+        self.assertEqual(progreso.publicaciones, 101)
+        self.assertEqual(pipeline.execute.call_count, 101)
+        self.assertEqual(llamadas_sin_limitar // progreso.publicaciones, 1980)
+        pipeline.publish.assert_called_with('OML:STATUS_CSV_REPORT:CONTACTED:1:T1', 100)
+
+    def test_republica_al_pasar_el_intervalo_aunque_no_cambie_el_porcentaje(self):
+        progreso, pipeline = self._procesar(1000, intervalo=0)
+        self.assertEqual(progreso.publicaciones, 1001)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests de la cola de trabajos en segundo plano
+"""
+from __future__ import unicode_literals
+
+from mock import patch, MagicMock
+
+from django.urls import reverse
+
+from ominicontacto_app.models import User
+from ominicontacto_app.services.trabajos_segundo_plano import (
+    ColaDeTrabajos, TrabajadorSegundoPlano, MonitorDeTrabajo)
+from ominicontacto_app.tests.factories import CampanaFactory
+from ominicontacto_app.tests.utiles import OMLBaseTest, PASSWORD
+
+
+class ColaDeTrabajosTest(OMLBaseTest):
+
+    def setUp(self):
+        super(ColaDeTrabajosTest, self).setUp()
+        self.redis_connection = MagicMock()
+        self.cola = ColaDeTrabajos(self.redis_connection)
+        self.trabajo = {
+            'id': 'abc', 'tipo': 'zip_grabaciones', 'key_task': 'OML:STATUS_DOWNLOAD:1:zip',
+            'parametros': {'listado_archivos': [], 'username': 'sup'}, 'intentos': '0',
+            'deduplicacion': 'OML:JOBS:DEDUP:123',
+        }
+
+    def test_trabajo_duplicado_no_se_encola(self):
+        self.redis_connection.set.return_value = False
+        self.redis_connection.get.return_value = 'abc'
+        trabajo_id = self.cola.encolar('zip_grabaciones', 'OML:STATUS_DOWNLOAD:2:zip',
+                                       listado_archivos=[], username='sup')
+        self.assertEqual(trabajo_id, 'abc')
+        self.redis_connection.sadd.assert_called_with('OML:JOB:abc:CHANNELS',
+                                                      'OML:STATUS_DOWNLOAD:2:zip')
+        self.redis_connection.pipeline.assert_not_called()
+
+    def test_trabajo_fallido_se_reencola_si_quedan_reintentos(self):
+        pipeline = self.redis_connection.pipeline.return_value
+        self.redis_connection.smembers.return_value = set()
+        self.cola.fallar(self.trabajo, Exception('error'))
+        pipeline.lpush.assert_called_with('OML:JOBS:QUEUE:zip_grabaciones', 'abc')
+        pipeline.delete.assert_not_called()
+
+    def test_trabajo_fallido_sin_reintentos_se_libera(self):
+        pipeline = self.redis_connection.pipeline.return_value
+        self.redis_connection.smembers.return_value = set()
+        self.trabajo['intentos'] = '1'
+        self.cola.fallar(self.trabajo, Exception('error'))
+        pipeline.lpush.assert_not_called()
+        pipeline.delete.assert_called_with('OML:JOBS:DEDUP:123')
+
+    def test_tomar_trabajo_renueva_el_latido(self):
+        self.cola._tomar_trabajo = MagicMock(return_value='abc')
+        self.redis_connection.smembers.return_value = set()
+        self.redis_connection.hgetall.return_value = {
+            'tipo': 'zip_grabaciones', 'parametros': '{}', 'intentos': '0'}
+        self.cola.tomar_trabajo(['zip_grabaciones'])
+        pipeline = self.redis_connection.pipeline.return_value
+        mapping = pipeline.hset.call_args[1]['mapping']
+        self.assertEqual(mapping['estado'], ColaDeTrabajos.EN_PROCESO)
+        self.assertIn('latido', mapping)
+
+    def test_trabajo_abandonado_cuenta_como_intento_fallido(self):
+        self.redis_connection.lrange.side_effect = \
+            lambda key, inicio, fin: ['abc'] if key.endswith('zip_grabaciones') else []
+        self.redis_connection.hget.return_value = '0'
+        self.redis_connection.lrem.return_value = 1
+        self.redis_connection.smembers.return_value = set()
+        self.redis_connection.hgetall.return_value = dict(
+            self.trabajo, parametros='{}', intentos='1')
+        pipeline = self.redis_connection.pipeline.return_value
+
+        self.assertEqual(self.cola.recuperar_trabajos_abandonados(), 1)
+
+        pipeline.lpush.assert_not_called()
+        pipeline.delete.assert_called_with('OML:JOBS:DEDUP:123')
+        self.assertEqual(pipeline.hset.call_args_list[0][1]['mapping']['estado'],
+                         ColaDeTrabajos.ERROR)
+
+    @patch.object(MonitorDeTrabajo, 'detener')
+    @patch.object(MonitorDeTrabajo, 'start')
+    @patch('ominicontacto_app.services.grabaciones.generacion_zip_grabaciones.'
+           'generar_zip_grabaciones')
+    def test_trabajador_ejecuta_funcion_del_tipo_de_trabajo(self, generar_zip, start, detener):
+        cola = MagicMock()
+        trabajador = TrabajadorSegundoPlano(cola)
+        trabajador.ejecutar_trabajo(self.trabajo)
+        generar_zip.assert_called_with('OML:STATUS_DOWNLOAD:1:zip', listado_archivos=[],
+                                       username='sup')
+        cola.finalizar.assert_called_with(self.trabajo)
+
+
+class ExportacionCSVEncoladaTest(OMLBaseTest):
+
+    def setUp(self):
+        super(ExportacionCSVEncoladaTest, self).setUp()
+        self.supervisor_admin = self.crear_supervisor_profile(rol=User.ADMINISTRADOR)
+        self.campana = CampanaFactory()
+        self.client.login(username=self.supervisor_admin.user.username, password=PASSWORD)
+
+    @patch.object(ColaDeTrabajos, 'encolar')
+    @patch('redis.Redis.register_script')
+    def test_exportar_csv_contactados_encola_trabajo(self, register_script, encolar):
+        post_data = {'campana_id': self.campana.pk, 'task_id': 'T1',
+                     'desde': '01/02/2020', 'hasta': '10/02/2020'}
+        response = self.client.post(reverse('api_exportar_csv_contactados'), post_data)
+        self.assertEqual(response.json()['id'], 'T1')
+        encolar.assert_called_with(
+            'exportar_csv_campana',
+            'OML:STATUS_CSV_REPORT:CONTACTED:{0}:T1'.format(self.campana.pk),
+            tipo_reporte='contactados', campana_id=self.campana.pk,
+            desde='01/02/2020', hasta='10/02/2020')
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests de WombatService contra el servidor Wombat de prueba
+"""
+from __future__ import unicode_literals
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import requests
+from django.test.utils import override_settings
+from mock import MagicMock, patch
+from redis.exceptions import RedisError
+
+from ominicontacto_app.models import Campana
+from ominicontacto_app.services.campana_service import CampanaService, WombatDialerError
+from ominicontacto_app.services.exportar_base_datos import SincronizarBaseDatosContactosService
+from ominicontacto_app.services.wombat_service import WombatService, WombatServiceAsincronico
+from ominicontacto_app.services.wombat_snapshot import snapshot_runs
+from ominicontacto_app.tests.factories import CampanaFactory, ContactoFactory
+from ominicontacto_app.tests.servidor_wombat import ServidorWombatDePrueba
+from ominicontacto_app.tests.utiles import OMLBaseTest
+
+
+class WombatBaseTest(OMLBaseTest):
+    """Levanta un servidor Wombat de prueba y apunta la configuración a él"""
+
+    def setUp(self):
+        super(WombatBaseTest, self).setUp()
+        self.servidor = ServidorWombatDePrueba(credenciales=('wombat', 'secreto')).iniciar()
+        self.addCleanup(self.servidor.detener)
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        configuracion = override_settings(
+            OML_WOMBAT_URL=self.servidor.url, OML_WOMBAT_USER='wombat',
+            OML_WOMBAT_PASSWORD='secreto', OML_WOMBAT_FILENAME=self.directorio + '/')
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        snapshot_runs().invalidar()
+
+
+class WombatServiceTest(WombatBaseTest):
+
+    def test_reutiliza_la_conexion_entre_requests(self):
+        servicio = WombatService()
+        for i in range(5):
+            salida = servicio.list_config_wombat('api/edit/list/?mode=L')
+            self.assertEqual(salida['status'], 'OK')
+        self.assertEqual(self.servidor.conexiones, 1)
+        self.assertEqual(len(self.servidor.requests), 5)
+
+    def test_update_config_wombat_envia_el_archivo_en_el_campo_data(self):
+        with open(os.path.join(self.directorio, 'newcampaign.json'), 'w') as archivo:
+            archivo.write('{"name": "campaña"}')
+        salida = WombatService().update_config_wombat(
+            'newcampaign.json', 'api/edit/campaign/?mode=E')
+        self.assertEqual(salida['status'], 'OK')
+        request = self.servidor.requests[-1]
+        self.assertEqual(request['path'], '/wombat/api/edit/campaign/')
+        self.assertEqual(request['datos']['data'], ['{"name": "campaña"}'])
+        self.assertEqual(request['autorizacion'], ('wombat', 'secreto'))
+
+    def test_update_lista_wombat_envia_cada_linea_en_un_request(self):
+        with open(os.path.join(self.directorio, 'lista.txt'), 'w') as archivo:
+            archivo.write('numbers=351111,Juan|\nnumbers=351222,Ana|\n')
+        WombatService().update_lista_wombat('lista.txt', 'api/lists/?op=addToList&list=L1')
+        self.assertEqual([request['cuerpo'] for request in self.servidor.requests],
+                         [b'numbers=351111,Juan|', b'numbers=351222,Ana|'])
+        self.assertEqual(self.servidor.conexiones, 1)
+
+    @patch.object(WombatService, '_post')
+    @patch('ominicontacto_app.services.wombat_service.time.sleep')
+    def test_update_lista_wombat_reintenta_el_lote_con_error_de_conexion(self, sleep, _post):
+        with open(os.path.join(self.directorio, 'lista.txt'), 'w') as archivo:
+            archivo.write('numbers=351111,Juan|\nnumbers=351222,Ana|\n')
+        _post.side_effect = [requests.exceptions.ConnectionError(), b'OK', b'OK']
+
+        salida = WombatService().update_lista_wombat(
+            'lista.txt', 'api/lists/?op=addToList&list=L1')
+
+        self.assertEqual(salida, b'OK')
+        self.assertEqual([llamada[1]['data'] for llamada in _post.call_args_list],
+                         [b'numbers=351111,Juan|', b'numbers=351111,Juan|',
+                          b'numbers=351222,Ana|'])
+
+    @patch('ominicontacto_app.services.wombat_service.time.sleep')
+    def test_update_lista_wombat_no_reintenta_el_lote_con_error_del_servidor(self, sleep):
+        with open(os.path.join(self.directorio, 'lista.txt'), 'w') as archivo:
+            archivo.write('numbers=351111,Juan|\nnumbers=351222,Ana|\n')
+        self.servidor.fallas = 1
+
+        salida = WombatService().update_lista_wombat(
+            'lista.txt', 'api/lists/?op=addToList&list=L1')
+
+        self.assertIsNone(salida)
+        # Sin reenviar el lote ni subir los siguientes
+        self.assertEqual([request['cuerpo'] for request in self.servidor.requests],
+                         [b'numbers=351111,Juan|'])
+
+    @patch.object(WombatService, '_post')
+    @patch('ominicontacto_app.services.wombat_service.time.sleep')
+    def test_update_lista_wombat_no_reintenta_el_lote_con_timeout_de_lectura(self, sleep, _post):
+        with open(os.path.join(self.directorio, 'lista.txt'), 'w') as archivo:
+            archivo.write('numbers=351111,Juan|\n')
+        _post.side_effect = requests.exceptions.ReadTimeout()
+
+        salida = WombatService().update_lista_wombat(
+            'lista.txt', 'api/lists/?op=addToList&list=L1')
+
+        self.assertIsNone(salida)
+        self.assertEqual(_post.call_count, 1)
+
+    def test_post_json(self):
+        WombatService().post_json('api/edit/campaign/reschedule/?mode=D&parent=1', {'id': 3})
+        self.assertEqual(json.loads(self.servidor.requests[-1]['datos']['data'][0]), {'id': 3})
+
+    def test_devuelve_none_si_wombat_no_esta_disponible(self):
+        self.servidor.detener()
+        self.assertIsNone(WombatService().list_config_wombat('api/live/runs/'))
+
+    def test_variante_asincronica_reutiliza_la_sesion(self):
+        servicio = WombatServiceAsincronico(loop=asyncio.new_event_loop())
+        self.addCleanup(servicio.loop.close)
+        urls = ['api/calls/?op=extstatus&wombatid={0}&status=1'.format(i) for i in range(10)]
+        resultados = servicio.loop.run_until_complete(asyncio.gather(
+            *[servicio.set_call_ext_status(url) for url in urls], loop=servicio.loop))
+        self.assertEqual(resultados, [True] * 10)
+        self.assertEqual(len(self.servidor.requests), 10)
+        self.assertLessEqual(self.servidor.conexiones, 10)
+
+    def test_campana_service_obtiene_datos_de_la_campana_en_ejecucion(self):
+        campana = CampanaFactory(type=Campana.TYPE_DIALER, campaign_id_wombat=7)
+        datos = {'campaignId': 7, 'state': 'RUNNING', 'n_est_remaining_calls': 3}
+        self.servidor.respuestas['/wombat/api/live/runs/'] = {
+            'result': {'campaigns': [{'campaignId': 8, 'state': 'RUNNING'}, datos]}}
+        self.assertEqual(CampanaService().obtener_dato_campana_run(campana), datos)
+
+
+class SnapshotWombatTest(WombatBaseTest):
+
+    def setUp(self):
+        super(SnapshotWombatTest, self).setUp()
+        self.campana = CampanaFactory(type=Campana.TYPE_DIALER, campaign_id_wombat=7)
+        self.datos = {'campaignId': 7, 'state': 'RUNNING'}
+        self.servidor.respuestas['/wombat/api/live/runs/'] = {
+            'result': {'campaigns': [{'campaignId': 8, 'state': 'RUNNING'}, self.datos]}}
+
+    def _requests_runs(self):
+        return [request for request in self.servidor.requests
+                if request['path'] == '/wombat/api/live/runs/']
+
+    def test_consultas_dentro_del_intervalo_usan_el_snapshot(self):
+        servicio = CampanaService()
+        for i in range(3):
+            self.assertEqual(servicio.obtener_dato_campana_run(self.campana), self.datos)
+        datos_campanas = servicio.obtener_datos_campanas_run({7: self.campana})
+        self.assertEqual(datos_campanas, {self.campana.id: self.datos})
+        self.assertEqual(len(self._requests_runs()), 1)
+
+    def test_consultas_concurrentes_esperan_la_descarga_en_curso(self):
+        self.servidor.demora = 0.3
+        resultados = []
+
+        def consultar():
+            resultados.append(CampanaService().obtener_dato_campana_run(self.campana))
+
+        threads = [threading.Thread(target=consultar) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(resultados, [self.datos] * 5)
+        self.assertEqual(len(self._requests_runs()), 1)
+
+    def test_sin_redis_consulta_a_wombat(self):
+        redis_connection = MagicMock()
+        redis_connection.exists.side_effect = RedisError
+        runs = snapshot_runs(redis_connection).obtener(['7', '9'])
+        self.assertEqual(runs, {'7': [self.datos]})
+        self.assertEqual(len(self._requests_runs()), 1)
+
+
+class ListaContactosWombatTest(WombatBaseTest):
+
+    def setUp(self):
+        super(ListaContactosWombatTest, self).setUp()
+        self.contacto_1 = ContactoFactory(telefono='351111')
+        self.bd_contacto = self.contacto_1.bd_contacto
+        self.contacto_2 = ContactoFactory(bd_contacto=self.bd_contacto, telefono='351222')
+        self.contacto_3 = ContactoFactory(bd_contacto=self.bd_contacto, telefono='351111')
+        self.campana = CampanaFactory(type=Campana.TYPE_DIALER, bd_contacto=self.bd_contacto)
+
+    def _crear_lista(self, evitar_duplicados):
+        servicio = SincronizarBaseDatosContactosService()
+        servicio.CONTACTOS_POR_LOTE = 2
+        servicio.crear_lista(self.campana, evitar_duplicados, False, '0')
+        with open(os.path.join(self.directorio, 'newcampaign_list_contacto.txt')) as archivo:
+            return archivo.read().splitlines()
+
+    def _contacto_en_lista(self, contacto):
+        datos = json.loads(contacto.datos)
+        return '0{0},id_cliente:{1},id_campana:{2},MULTINUM1:{3},MULTINUM2:{4}|'.format(
+            contacto.telefono, contacto.pk, self.campana.pk, datos[3], datos[4])
+
+    def test_escribe_la_lista_en_lotes(self):
+        lineas = self._crear_lista(evitar_duplicados=False)
+        self.assertEqual(lineas, [
+            'numbers=' + self._contacto_en_lista(self.contacto_1) +
+            self._contacto_en_lista(self.contacto_2),
+            'numbers=' + self._contacto_en_lista(self.contacto_3)])
+
+    def test_evitar_duplicados_deja_el_primer_contacto_de_cada_telefono(self):
+        lineas = self._crear_lista(evitar_duplicados=True)
+        self.assertEqual(lineas, [
+            'numbers=' + self._contacto_en_lista(self.contacto_1) +
+            self._contacto_en_lista(self.contacto_2)])
+
+    def test_sube_la_lista_por_lotes(self):
+        self._crear_lista(evitar_duplicados=False)
+        CampanaService().crear_lista_contactos_wombat(self.campana)
+        self.assertEqual(len(self.servidor.requests), 2)
+
+    @patch('ominicontacto_app.services.wombat_service.time.sleep')
+    def test_lista_incompleta_levanta_error(self, sleep):
+        self._crear_lista(evitar_duplicados=False)
+        self.servidor.fallas = 100
+        with self.assertRaises(WombatDialerError):
+            CampanaService().crear_lista_contactos_wombat(self.campana)
@@ -43,6 +43,7 @@ from ominicontacto_app.models import (
     ActuacionVigente, ReglasIncidencia, CalificacionCliente,
     ArchivoDeAudio
 )
+from ominicontacto_app.permisos import cache_permisos_oml
 from ominicontacto_app.tests.factories import (NombreCalificacionFactory, GrupoFactory,
                                                QueueMemberFactory)
 from ominicontacto_app.services.audio_conversor import ConversorDeAudioService
@@ -145,6 +146,7 @@ class OMLTestUtilsMixin(object):
             reported_by=user
         )
         profile.user.groups.set([Group.objects.get(name=User.AGENTE)])
+        cache_permisos_oml.invalidar_usuario(user.id)
         return profile
 
     def crear_supervisor_profile(self, rol=User.GERENTE, user=None):
@@ -167,6 +169,7 @@ class OMLTestUtilsMixin(object):
             user.groups.set([Group.objects.get(name=User.REFERENTE)])
         elif rol == User.SUPERVISOR:
             user.groups.set([Group.objects.get(name=User.SUPERVISOR)])
+        cache_permisos_oml.invalidar_usuario(user.id)
 
         return SupervisorProfile.objects.create(
             user=user,
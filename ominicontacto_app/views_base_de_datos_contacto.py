@@ -829,6 +829,7 @@ class ActualizaBaseDatosContactoView(UpdateView):
             orden += 1
         # insertamos las instancias en la BD
         AgenteEnContacto.objects.bulk_create(agente_en_contacto_list)
+        AgenteEnContacto.invalidar_despachador(self.campana.pk)
 
     def post(self, request, *args, **kwargs):
 
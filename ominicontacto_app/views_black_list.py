@@ -120,7 +120,7 @@ class BlacklistCreateView(CreateView):
     form_class = BlacklistForm
 
     def _eliminar_blacklist_anterior(self):
-        blacklist_antiguos = Blacklist.objects.all()
+        blacklist_antiguos = Blacklist.objects.exclude(pk=self.object.pk)
         blacklist_antiguos.delete()
 
     def form_valid(self, form):
@@ -181,12 +181,14 @@ class BlacklistCreateView(CreateView):
             )
             return self.form_invalid(form)
 
-        self._eliminar_blacklist_anterior()  # antes de guardar la blacklist, elimina los anteriores
+        # La blacklist anterior sigue vigente hasta que la nueva esté importada
+        blacklist_anterior = Blacklist.objects.last()
         self.object.save()
         creacion_black_list = CreacionBlacklistService()
         creacion_black_list.importa_contactos(self.object)
         blacklist_family = BlacklistFamily()
-        blacklist_family.regenerar_families(self.object)
+        blacklist_family.actualizar_families(self.object, blacklist_anterior)
+        self._eliminar_blacklist_anterior()
         return redirect(self.get_success_url())
 
     def get_success_url(self):
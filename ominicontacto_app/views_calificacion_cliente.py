@@ -67,7 +67,8 @@ class CalificacionClienteFormView(FormView):
         """Devuelve información sobre los contactos que tienen un número de teléfono
         en la BD
         """
-        contactos_info = list(self.campana.bd_contacto.contactos.filter(telefono=telefono))
+        contactos_info = list(Contacto.objects.contactos_by_telefono_normalizado(
+            self.campana.bd_contacto, telefono))
         return contactos_info
 
     def get_contacto(self, id_contacto):
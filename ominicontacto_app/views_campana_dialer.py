@@ -305,8 +305,18 @@ class UpdateBaseDatosDialerView(FormView):
         self.object.bd_contacto = bd_contacto
         self.object.save()
         # realiza el cambio de la base de datos en wombat
-        campana_service.cambiar_base(self.get_object(), columnas, evitar_duplicados,
-                                     evitar_sin_telefono, prefijo_discador)
+        try:
+            campana_service.cambiar_base(self.get_object(), columnas, evitar_duplicados,
+                                         evitar_sin_telefono, prefijo_discador)
+        except (WombatDialerError, RequestException) as e:
+            message = _("<strong>¡Cuidado!</strong> "
+                        "con el siguiente error: ") + "{0} .".format(e)
+            messages.add_message(
+                self.request,
+                messages.WARNING,
+                message,
+            )
+            return redirect(self.get_success_url())
         message = _('Operación Exitosa!\
                      Se llevó a cabo con éxito el cambio de base de datos.')
 
@@ -424,6 +424,7 @@ class LiberarReservarContactoAsignado(View):
                             ) + contactos_finalizados
                 messages.warning(self.request, message)
 
+        AgenteEnContacto.invalidar_despachador(campana_id)
         return HttpResponseRedirect(reverse('contactos_preview_asignados', args=[campana_id]))
 
 
@@ -541,8 +542,7 @@ class OrdenarAsignacionContactosView(FormView):
 
         # salvamos la eleccion del campo de desactivacion
         campana = Campana.objects.get(pk=pk_campana)
-        campana.campo_desactivacion = campo_desactivacion
-        campana.save()
+        campana.actualizar_campo_desactivacion(campo_desactivacion)
 
         bd_contacto = campana.bd_contacto
         nombres_columnas_datos = bd_contacto.get_metadata().nombres_de_columnas_de_datos
@@ -551,6 +551,8 @@ class OrdenarAsignacionContactosView(FormView):
         imported_data = tablib.Dataset().load(agents_in_contacts_dat.decode('utf8'), format='csv')
         result = AgenteEnContactoResourceImport().import_data(
             imported_data, nombres_columnas_datos=nombres_columnas_datos, dry_run=False)
+        # el orden y el campo de desactivacion cambian los contactos disponibles
+        AgenteEnContacto.invalidar_despachador(campana.pk)
         if not result.has_errors():
             message = _('Se ha realizado la importación con éxito.')
             messages.success(self.request, message)
@@ -575,8 +577,7 @@ class DescargarOrdenAgentesEnContactosView(View):
 
         # salvamos la eleccion del campo de desactivacion
         campana = Campana.objects.get(pk=pk_campana)
-        campana.campo_desactivacion = campo_desactivacion
-        campana.save()
+        campana.actualizar_campo_desactivacion(campo_desactivacion)
 
         bd_contacto = campana.bd_contacto
         nombres_columnas_datos = bd_contacto.get_metadata().nombres_de_columnas_de_datos
@@ -164,7 +164,8 @@ class ContactosTelefonosRepetidosView(TemplateView):
             context['call_data'] = json.loads(call_data_json)
 
         context['campana'] = campana
-        context['contactos'] = campana.bd_contacto.contactos.filter(telefono=telefono)
+        context['contactos'] = Contacto.objects.contactos_by_telefono_normalizado(
+            campana.bd_contacto, telefono)
         return context
 
 
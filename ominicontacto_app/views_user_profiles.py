@@ -46,7 +46,7 @@ from ominicontacto_app.forms import (
 from ominicontacto_app.models import (
     SupervisorProfile, AgenteProfile, ClienteWebPhoneProfile, User, QueueMember, Grupo,
 )
-from ominicontacto_app.permisos import PermisoOML
+from ominicontacto_app.permisos import PermisoOML, cache_permisos_oml
 
 from ominicontacto_app.views_queue_member import activar_cola, remover_agente_cola_asterisk
 
@@ -438,6 +438,7 @@ class SupervisorProfileUpdateView(FormView):
         self.profile.is_administrador = rol.name == User.ADMINISTRADOR
         self.profile.is_customer = rol.name == User.REFERENTE
         self.profile.user.groups.set([rol])
+        cache_permisos_oml.invalidar_usuario(self.profile.user.id)
         self.profile.save()
         return super(SupervisorProfileUpdateView, self).form_valid(form)
 
@@ -26,11 +26,47 @@ contactados(hoy en dia por las calificaciones(calificacioncliente))
 
 from django.utils.translation import ugettext as _
 from django.db import connection
-from django.db.models import Count
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
 from ominicontacto_app.models import Campana, CalificacionCliente
 from reportes_app.models import LlamadaLog
 
 
+def _sql_ultimo_log_no_contactados(campana, campana_tipo):
+    """
+    Devuelve la consulta (y sus parámetros) con el último log (contacto_id, event) de cada
+    contacto de la base actual de la campaña que nunca fue contactado (no tiene CONNECT).
+    La restricción a la base actual y la exclusión de los contactados se resuelven con
+    un join y un anti-join en lugar de enumerar los ids de los contactos.
+    """
+    # Asumo que Los logs con mayor id son los mas nuevos
+    sql = """
+        SELECT r1.contacto_id, r1.event
+            FROM "reportes_app_llamadalog" r1
+            INNER JOIN (
+                SELECT l.contacto_id, MAX(l.id) AS id__max
+                FROM "reportes_app_llamadalog" l
+                INNER JOIN "ominicontacto_app_contacto" c ON c.id = l.contacto_id
+                WHERE l.campana_id = %s AND
+                      l.tipo_llamada = %s AND
+                      l.tipo_campana = %s AND
+                      c.bd_contacto_id = %s AND
+                      NOT EXISTS (
+                          SELECT 1 FROM "reportes_app_llamadalog" lc
+                          WHERE lc.contacto_id = l.contacto_id AND
+                                lc.campana_id = %s AND
+                                lc.tipo_llamada = %s AND
+                                lc.tipo_campana = %s AND
+                                lc.event = 'CONNECT')
+                GROUP BY l.contacto_id
+            ) r2
+            ON r1.id = r2.id__max
+    """
+    params = [campana.id, campana_tipo, campana_tipo, campana.bd_contacto_id,
+              campana.id, campana_tipo, campana_tipo]
+    return sql, params
+
+
 class EstadisticasContactacion():
 
     MAP_ESTADO_ID = {
@@ -76,46 +112,23 @@ class EstadisticasContactacion():
             cantidad_contactacion = CantidadContactacion(id_estado, estado, no_calificados)
             count_estados.update({id_estado: cantidad_contactacion})
 
-    def _contabilizar_llamados_no_contactados(self, count_estados, campana, contactados,
-                                              ids_contactos_base_actual):
+    def _contabilizar_llamados_no_contactados(self, count_estados, campana):
         # Cantidades de llamados no contactados por EVENTO FINAL
-        # Asumo que Los logs con mayor id son los mas nuevos
-        # Solo filtrar logs de contactos de la base actual no contactados
-        contactos_ids = set(ids_contactos_base_actual).difference(set(contactados))
-        filtro_contactos = "AND contacto_id in ('"
-        filtro_contactos += "','".join([str(x) for x in contactos_ids])
-        filtro_contactos += "')"
-        filtro_contactos_r1 = "AND r1.contacto_id in ('"
-        filtro_contactos_r1 += "','".join([str(x) for x in contactos_ids])
-        filtro_contactos_r1 += "')"
+        # Solo contabilizar logs de contactos de la base actual no contactados
         if campana.type == Campana.TYPE_DIALER:
             campana_tipo = Campana.TYPE_DIALER
         if campana.type == Campana.TYPE_PREVIEW:
             campana_tipo = Campana.TYPE_PREVIEW
 
-        params = {'campana_id': campana.id, 'tipo_dialer': campana_tipo,
-                  'filtro_contactos': filtro_contactos,
-                  'filtro_contactos_r1': filtro_contactos_r1, }
+        sql_ultimos_logs, params = _sql_ultimo_log_no_contactados(campana, campana_tipo)
         sql = """
-        SELECT r1.event, COUNT(r1.event)
-            FROM "reportes_app_llamadalog" r1
-            INNER JOIN (
-                SELECT contacto_id, MAX(id) AS id__max
-                FROM "reportes_app_llamadalog"
-                WHERE campana_id = {campana_id} AND
-                      tipo_llamada = {tipo_dialer} AND
-                      tipo_campana = {tipo_dialer} {filtro_contactos}
-                GROUP BY contacto_id
-            ) r2
-            ON r1.id = r2.id__max
-            WHERE r1.campana_id = {campana_id} AND
-                  r1.tipo_llamada = {tipo_dialer} AND
-                  r1.tipo_campana = {tipo_dialer} {filtro_contactos_r1}
-            GROUP BY r1.event
-        """.format(**params)
+        SELECT ultimos.event, COUNT(ultimos.event)
+            FROM ({0}) ultimos
+            GROUP BY ultimos.event
+        """.format(sql_ultimos_logs)
 
         cursor = connection.cursor()
-        cursor.execute(sql)
+        cursor.execute(sql, params)
         values = cursor.fetchall()
         for evento, cantidad in values:
             # Me interesan solo los contactos cuya ultima conexion ha fallado.
@@ -150,8 +163,7 @@ class EstadisticasContactacion():
                                                                              flat=True)
 
         self._contabilizar_llamados_no_calificados(count_estados, campana, contactados)
-        self._contabilizar_llamados_no_contactados(
-            count_estados, campana, contactados, ids_contactos_base_actual)
+        self._contabilizar_llamados_no_contactados(count_estados, campana)
 
         return count_estados
 
@@ -226,21 +238,19 @@ class RecicladorContactosCampanaDIALER():
         correspondiente, y en caso de que sea mas de uno se sumarizan las
         mismas.
         """
-        contactos_reciclados = set()
+        contactos_reciclados = campana.bd_contacto.contactos.none()
         if reciclado_calificacion:
-            contactos_reciclados.update(self._obtener_contactos_calificados(
-                campana, reciclado_calificacion))
+            contactos_reciclados |= self._obtener_contactos_calificados(
+                campana, reciclado_calificacion)
         if reciclado_no_contactacion:
-            contactos_reciclados.update(self._obtener_contactos_no_contactados(
-                campana, reciclado_no_contactacion))
+            contactos_reciclados |= self._obtener_contactos_no_contactados(
+                campana, reciclado_no_contactacion)
         return contactos_reciclados
 
     def _obtener_contactos_no_llamados(self, campana):
         llamadas = LlamadaLog.objects.filter(campana_id=campana.id, contacto_id__isnull=False)
         contacto_ids = llamadas.values_list('contacto_id', flat=True).distinct()
-        queryset_no_llamados = campana.bd_contacto.contactos.exclude(id__in=contacto_ids)
-        contactos_no_llamados = [no_llamado for no_llamado in queryset_no_llamados]
-        return contactos_no_llamados
+        return campana.bd_contacto.contactos.exclude(id__in=contacto_ids)
 
     def _obtener_contactos_calificados(self, campana, reciclado_calificacion):
         """
@@ -250,10 +260,10 @@ class RecicladorContactosCampanaDIALER():
         """
         calificaciones_query = campana.obtener_calificaciones().filter(
             opcion_calificacion__in=reciclado_calificacion,
-            contacto__bd_contacto=campana.bd_contacto).distinct()
+            contacto__bd_contacto=campana.bd_contacto)
 
-        contactos = [calificacion.contacto for calificacion in calificaciones_query]
-        return contactos
+        return campana.bd_contacto.contactos.filter(
+            id__in=calificaciones_query.values('contacto_id'))
 
     def _obtener_contactos_no_contactados(self, campana, reciclado_no_contactacion):
         """
@@ -262,77 +272,48 @@ class RecicladorContactosCampanaDIALER():
 
         """
         ids_contactos_base_actual = campana.bd_contacto.contactos.values_list('id', flat=True)
-        id_contactos = []
+        filtro_contactos = Q()
         filtrar_no_calificados = False
-        filtro_eventos = ''
+        eventos = []
         for evento_id in reciclado_no_contactacion:
             evento_id = int(evento_id)
             if evento_id == EstadisticasContactacion.AGENTE_NO_CALIFICO:
                 filtrar_no_calificados = True
             else:
-                evento = EstadisticasContactacion.MAP_ID_ESTADO[evento_id]
-                if filtro_eventos:
-                    filtro_eventos += ","
-                filtro_eventos += "'%s'" % evento
+                eventos.append(EstadisticasContactacion.MAP_ID_ESTADO[evento_id])
 
         if campana.type == Campana.TYPE_DIALER:
             campana_tipo = Campana.TYPE_DIALER
         if campana.type == Campana.TYPE_PREVIEW:
             campana_tipo = Campana.TYPE_PREVIEW
 
-        contactados = LlamadaLog.objects.filter(campana_id=campana.id,
-                                                tipo_campana=campana_tipo,
-                                                tipo_llamada=campana_tipo,
-                                                contacto_id__in=ids_contactos_base_actual,
-                                                event='CONNECT').values_list('contacto_id',
-                                                                             flat=True)
-
         # Filtrar los contactos Llamados no Calificados
         if filtrar_no_calificados:
+            contactados = LlamadaLog.objects.filter(campana_id=campana.id,
+                                                    tipo_campana=campana_tipo,
+                                                    tipo_llamada=campana_tipo,
+                                                    contacto_id__in=ids_contactos_base_actual,
+                                                    event='CONNECT').values_list('contacto_id',
+                                                                                 flat=True)
             id_calificados = CalificacionCliente.objects.filter(
                 opcion_calificacion__campana_id=campana.id,
                 contacto__bd_contacto=campana.bd_contacto).values_list('contacto_id', flat=True)
             no_calificados = contactados.exclude(contacto_id__in=id_calificados)
-            id_contactos += no_calificados
+            filtro_contactos |= Q(id__in=no_calificados)
 
         # Filtrar los llamados no contactados (solo contactos de la base actual)
-        if filtro_eventos:
-            contactos_no_contactados = set(ids_contactos_base_actual).difference(set(contactados))
-            filtro_contactos = "AND contacto_id in ('"
-            filtro_contactos += "','".join([str(x) for x in contactos_no_contactados])
-            filtro_contactos += "')"
-            filtro_contactos_r1 = "AND r1.contacto_id in ('"
-            filtro_contactos_r1 += "','".join([str(x) for x in contactos_no_contactados])
-            filtro_contactos_r1 += "')"
-
-            params = {'campana_id': campana.id, 'tipo_dialer': campana_tipo,
-                      'filtro_contactos': filtro_contactos,
-                      'filtro_contactos_r1': filtro_contactos_r1,
-                      'filtro_eventos': filtro_eventos}
+        if eventos:
+            sql_ultimos_logs, params = _sql_ultimo_log_no_contactados(campana, campana_tipo)
             sql = """
-            SELECT r1.contacto_id
-                FROM "reportes_app_llamadalog" r1
-                INNER JOIN (
-                    SELECT contacto_id, MAX(id) AS id__max
-                    FROM "reportes_app_llamadalog"
-                    WHERE campana_id = {campana_id} AND
-                          tipo_llamada = {tipo_dialer} AND
-                          tipo_campana = {tipo_dialer} {filtro_contactos}
-                    GROUP BY contacto_id
-                ) r2
-                ON r1.id = r2.id__max
-                WHERE r1.campana_id = {campana_id} AND
-                      r1.tipo_llamada = {tipo_dialer} AND
-                      r1.tipo_campana = {tipo_dialer} {filtro_contactos_r1}
-                      AND event IN ({filtro_eventos})
-            """.format(**params)
-
-            cursor = connection.cursor()
-            cursor.execute(sql)
-            values = cursor.fetchall()
-            id_contactos += [x[0] for x in values]
-
-        return campana.bd_contacto.contactos.filter(id__in=id_contactos)
+            SELECT ultimos.contacto_id
+                FROM ({0}) ultimos
+                WHERE ultimos.event = ANY(%s)
+            """.format(sql_ultimos_logs)
+            filtro_contactos |= Q(id__in=RawSQL(sql, params + [eventos]))
+
+        if not filtro_contactos:
+            return campana.bd_contacto.contactos.none()
+        return campana.bd_contacto.contactos.filter(filtro_contactos)
 
     def reciclar(self, campana, reciclado_calificacion, reciclado_no_contactacion):
 
@@ -342,8 +323,7 @@ class RecicladorContactosCampanaDIALER():
 
         # Si quiero reciclar una campana activa puede existir contactos que no fueron llamados
         if campana.estado == Campana.ESTADO_ACTIVA:
-            contactos_no_llamados = self._obtener_contactos_no_llamados(campana)
-            contactos_reciclados.update(contactos_no_llamados)
+            contactos_reciclados |= self._obtener_contactos_no_llamados(campana)
 
         # Creamos la instancia de BaseDatosContacto para el reciclado.
         bd_contacto_reciclada = campana.bd_contacto.copia_para_reciclar()
@@ -29,7 +29,7 @@ from mock import patch
 
 from django.db.models import Count
 from ominicontacto_app.tests.utiles import OMLBaseTest
-from ominicontacto_app.models import CalificacionCliente
+from ominicontacto_app.models import Campana, CalificacionCliente
 from ominicontacto_app.services.audio_conversor import ConversorDeAudioService
 from reciclado_app.resultado_contactacion import (
     EstadisticasContactacion, RecicladorContactosCampanaDIALER
@@ -193,3 +193,25 @@ class RecicladoTest(OMLBaseTest):
             generador.generar_log(self.campana_2, False, estado, contacto.telefono, None, contacto)
         contactos_no_llamados = reciclador._obtener_contactos_no_llamados(self.campana_2)
         self.assertEqual(len(contactos_no_llamados), 80)
+
+    def test_reciclar_copia_contactos_reciclados_a_nueva_base(self):
+        self._generar_llamadas_y_calificaciones(self.estados)
+        reciclador = RecicladorContactosCampanaDIALER()
+        ids_estados = [EstadisticasContactacion.MAP_ESTADO_ID[estado] for estado in self.estados]
+        ids_estados.append(EstadisticasContactacion.AGENTE_NO_CALIFICO)
+        opciones_calificacion = list(self.campana.opciones_calificacion.all())
+
+        esperados = reciclador.obtener_contactos_reciclados(
+            self.campana, opciones_calificacion, ids_estados)
+        if self.campana.estado == Campana.ESTADO_ACTIVA:
+            esperados = esperados | reciclador._obtener_contactos_no_llamados(self.campana)
+        datos_esperados = sorted(esperados.values_list('telefono', 'datos', 'id_externo'))
+
+        bd_contacto_reciclada = reciclador.reciclar(
+            self.campana, opciones_calificacion, ids_estados)
+
+        contactos_reciclados = bd_contacto_reciclada.contactos.all()
+        self.assertEqual(bd_contacto_reciclada.cantidad_contactos, len(datos_esperados))
+        self.assertEqual(sorted(contactos_reciclados.values_list(
+            'telefono', 'datos', 'id_externo')), datos_esperados)
+        self.assertFalse(contactos_reciclados.filter(es_originario=False).exists())
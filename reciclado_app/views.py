@@ -31,7 +31,8 @@ from ominicontacto_app.models import Campana
 from reciclado_app.forms import RecicladoForm
 from reciclado_app.resultado_contactacion import (
     EstadisticasContactacion, RecicladorContactosCampanaDIALER)
-from ominicontacto_app.services.campana_service import CampanaService
+from ominicontacto_app.services.campana_service import CampanaService, WombatDialerError
+from requests.exceptions import RequestException
 
 import logging as logging_
 
@@ -152,8 +153,14 @@ class ReciclarCampanaDialerFormView(ReciclarCampanaMixin, FormView):
 
     def _reciclar_misma_campana(self, campana):
         campana_service = CampanaService()
-        campana_service.cambiar_base(campana, [], False, False, "")
         update_campana = "campana_dialer_update"
+        try:
+            campana_service.cambiar_base(campana, [], False, False, "")
+        except (WombatDialerError, RequestException) as e:
+            message = _("<strong>¡Cuidado!</strong> "
+                        "con el siguiente error: ") + "{0} .".format(e)
+            messages.add_message(self.request, messages.WARNING, message)
+            return update_campana
         campana.estado = Campana.ESTADO_INACTIVA
         campana.save()
         return update_campana
@@ -19,7 +19,8 @@
 
 import logging
 from django.core.management.base import BaseCommand
-from reportes_app.reportes.reporte_llamadas_supervision import ReporteLlamadasDialersFamily
+from reportes_app.reportes.actualizacion_incremental_supervision import (
+    ActualizadorIncrementalDeSupervisionDialers)
 
 
 logger = logging.getLogger(__name__)
@@ -27,14 +28,19 @@ logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     """
-    Calcula y carga en Redis los datos del reporte de llamadas entrantes.
+    Actualiza en Redis los datos del reporte de supervisión de llamadas dialers con los
+    eventos nuevos del día. Regenera el reporte completo al cambiar el día o con --regenerar.
     """
 
-    help = 'Calcula y carga en Redis los datos del reporte de llamadas entrantes.'
+    help = 'Actualiza en Redis los datos del reporte de llamadas dialers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regenerar', action='store_true',
+                            help='Regenerar el reporte completo del día')
 
     def handle(self, *args, **options):
-        family = ReporteLlamadasDialersFamily()
         try:
-            family.regenerar_families()
+            actualizador = ActualizadorIncrementalDeSupervisionDialers()
+            actualizador.actualizar(regenerar=options['regenerar'])
         except Exception as e:
             logger.error('Fallo del comando: {0}'.format(e))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils.timezone import now, timedelta
+
+from ominicontacto_app.utiles import convert_fecha_datetime, fecha_local
+from reportes_app.models import DiaConsolidadoLlamadas, LlamadaLog, ResumenDiarioLlamadas
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Genera el resumen diario de logs de llamadas para los días cerrados que aún no fueron
+    consolidados. También regenera los de los últimos DIAS_REVISION días consolidados si
+    llegaron logs después de consolidarlos. Los logs que lleguen más tarde no se reflejan en
+    el reporte hasta reconsolidar con --desde.
+    """
+
+    DIAS_REVISION = 3
+
+    help = 'Genera el resumen diario de logs de llamadas de los días aún no consolidados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=str, default=None,
+                            help='Reconsolidar a partir de esta fecha (dd/mm/aaaa)')
+
+    def _obtener_primer_dia_pendiente(self, desde):
+        if desde is not None:
+            return convert_fecha_datetime(desde).date()
+        ultimo_consolidado = DiaConsolidadoLlamadas.objects.aggregate(
+            ultimo=Max('fecha'))['ultimo']
+        if ultimo_consolidado is not None:
+            return ultimo_consolidado + timedelta(days=1)
+        primer_log = LlamadaLog.objects.aggregate(primero=Min('time'))['primero']
+        if primer_log is not None:
+            return fecha_local(primer_log)
+        return None
+
+    def _consolidar(self, dia):
+        cantidad = ResumenDiarioLlamadas.objects.consolidar_dia(dia)
+        logger.info('Resumen diario de llamadas del {0}: {1} registros'.format(dia, cantidad))
+
+    def handle(self, *args, **options):
+        try:
+            dia = self._obtener_primer_dia_pendiente(options['desde'])
+            ultimo_dia_cerrado = fecha_local(now()) - timedelta(days=1)
+            for desactualizado in ResumenDiarioLlamadas.objects.obtener_dias_desactualizados(
+                    ultimo_dia_cerrado - timedelta(days=self.DIAS_REVISION - 1),
+                    ultimo_dia_cerrado):
+                self._consolidar(desactualizado)
+            while dia is not None and dia <= ultimo_dia_cerrado:
+                self._consolidar(dia)
+                dia += timedelta(days=1)
+        except Exception as e:
+            logger.error('Fallo del comando: {0}'.format(e))
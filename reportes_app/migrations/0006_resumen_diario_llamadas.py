@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reportes_app', '0005_queue_log_longitud_campos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaConsolidadoLlamadas',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenDiarioLlamadas',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('campana_id', models.IntegerField()),
+                ('tipo_campana', models.IntegerField(blank=True, null=True)),
+                ('tipo_llamada', models.IntegerField(blank=True, null=True)),
+                ('event', models.CharField(blank=True, max_length=32, null=True)),
+                ('cantidad', models.IntegerField()),
+                ('bridge_wait_time', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='resumendiariollamadas',
+            index_together={('fecha', 'campana_id')},
+        ),
+    ]
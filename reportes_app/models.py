@@ -23,8 +23,9 @@ from django.utils.timezone import now
 from ominicontacto_app.utiles import crear_segmento_grabaciones_url, datetime_hora_maxima_dia, \
     datetime_hora_minima_dia, fecha_local
 import urllib.parse
-from django.db import models, connection
+from django.db import models, connection, transaction
 from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.db.models.functions import TruncDate
 from django.core.exceptions import SuspiciousOperation
 from django.utils.translation import ugettext as _
@@ -436,6 +437,93 @@ class LlamadaLog(models.Model):
         return AgenteProfile.objects.get(id=self.agente_id)
 
 
+class ResumenDiarioLlamadasManager(models.Manager):
+    """
+    Manager del resumen diario de LlamadaLog
+    """
+
+    def consolidar_dia(self, fecha):
+        """
+        (Re)genera el resumen de los logs de llamadas del día local indicado y lo marca
+        como consolidado. Es idempotente, por lo que puede volver a ejecutarse sobre un día
+        ya consolidado.
+        """
+        logs_del_dia = LlamadaLog.objects.filter(
+            time__range=(datetime_hora_minima_dia(fecha), datetime_hora_maxima_dia(fecha)),
+            campana_id__isnull=False)
+        conteos = logs_del_dia.values(
+            'campana_id', 'tipo_campana', 'tipo_llamada', 'event').annotate(
+                cantidad=Count('id'), suma_bridge_wait_time=Coalesce(Sum('bridge_wait_time'), 0)
+        ).order_by()
+        resumenes = [ResumenDiarioLlamadas(fecha=fecha,
+                                           campana_id=conteo['campana_id'],
+                                           tipo_campana=conteo['tipo_campana'],
+                                           tipo_llamada=conteo['tipo_llamada'],
+                                           event=conteo['event'],
+                                           cantidad=conteo['cantidad'],
+                                           bridge_wait_time=conteo['suma_bridge_wait_time'])
+                     for conteo in conteos]
+        with transaction.atomic():
+            self.filter(fecha=fecha).delete()
+            self.bulk_create(resumenes)
+            DiaConsolidadoLlamadas.objects.get_or_create(fecha=fecha)
+        return len(resumenes)
+
+    def obtener_dias_consolidados(self, fecha_desde, fecha_hasta):
+        return set(DiaConsolidadoLlamadas.objects.filter(
+            fecha__range=(fecha_desde, fecha_hasta)).values_list('fecha', flat=True))
+
+    def obtener_dias_desactualizados(self, fecha_desde, fecha_hasta):
+        """
+        Días consolidados del rango cuyo resumen no suma la misma cantidad de logs que hay
+        en LlamadaLog, por ejemplo por logs que llegaron después de consolidar el día.
+        """
+        desactualizados = []
+        for fecha in sorted(self.obtener_dias_consolidados(fecha_desde, fecha_hasta)):
+            resumidos = self.filter(fecha=fecha).aggregate(
+                total=Coalesce(Sum('cantidad'), 0))['total']
+            logs = LlamadaLog.objects.filter(
+                time__range=(datetime_hora_minima_dia(fecha), datetime_hora_maxima_dia(fecha)),
+                campana_id__isnull=False).count()
+            if logs != resumidos:
+                desactualizados.append(fecha)
+        return desactualizados
+
+
+class ResumenDiarioLlamadas(models.Model):
+    """
+    Cantidad de logs de llamadas (y suma de sus tiempos de espera) por día local, campaña,
+    tipo de llamada y evento. Se mantiene con el comando consolidar_resumen_diario_llamadas
+    """
+
+    objects = ResumenDiarioLlamadasManager()
+
+    fecha = models.DateField()
+    campana_id = models.IntegerField()
+    tipo_campana = models.IntegerField(blank=True, null=True)
+    tipo_llamada = models.IntegerField(blank=True, null=True)
+    event = models.CharField(max_length=32, blank=True, null=True)
+    cantidad = models.IntegerField()
+    bridge_wait_time = models.BigIntegerField()
+
+    class Meta:
+        index_together = [('fecha', 'campana_id')]
+
+    def __str__(self):
+        return "Resumen de llamadas del {0} para la campaña de id {1} con el evento {2}: " \
+               "{3}".format(self.fecha, self.campana_id, self.event, self.cantidad)
+
+
+class DiaConsolidadoLlamadas(models.Model):
+    """
+    Días cuyo ResumenDiarioLlamadas ya fue generado
+    """
+    fecha = models.DateField(unique=True)
+
+    def __str__(self):
+        return "Día de llamadas consolidado {0}".format(self.fecha)
+
+
 class ActividadAgenteLogManager(models.Manager):
     """
     Manager de actividadAgenteLog
@@ -471,6 +559,124 @@ class ActividadAgenteLogManager(models.Manager):
         except ActividadAgenteLog.DoesNotExist:
             raise (SuspiciousOperation(_("No se encontraron pausas ")))
 
+    def obtener_totales_sesion_agentes(self, fecha_desde, fecha_hasta, agentes, ahora):
+        """
+        Empareja en la base de datos los ADDMEMBER / REMOVEMEMBER de cada agente (LEAD sobre
+        los eventos de sesión ordenados por tiempo) y devuelve, por cada agente con eventos de
+        sesión o pausa en el período: (agente_id, tiempo_sesion, inicio_sesiones, fin_sesiones).
+        Una sesión cerrada por otro ADDMEMBER no suma tiempo y la última sesión abierta
+        se cuenta hasta 'ahora'.
+        """
+        fecha_desde = datetime_hora_minima_dia(fecha_desde)
+        fecha_hasta = datetime_hora_maxima_dia(fecha_hasta)
+
+        cursor = connection.cursor()
+        sql = """with eventos as (
+                     select id, agente_id, time, event from reportes_app_actividadagentelog
+                     where time between %(fecha_desde)s and %(fecha_hasta)s
+                     and agente_id = ANY(%(agentes)s) and event = ANY(%(eventos)s)
+                 ), sesiones as (
+                     select agente_id, time, event,
+                     lead(event) over w as evento_siguiente, lead(time) over w as time_siguiente,
+                     row_number() over (partition by agente_id, event
+                                        order by time desc, id desc) as orden_inverso
+                     from eventos where event in ('ADDMEMBER', 'REMOVEMEMBER')
+                     window w as (partition by agente_id order by time, id)
+                 )
+                 select agentes.agente_id,
+                 coalesce(sum(case when s.event = 'ADDMEMBER' and
+                                        s.evento_siguiente = 'REMOVEMEMBER'
+                                   then s.time_siguiente - s.time
+                                   when s.event = 'ADDMEMBER' and s.evento_siguiente is null
+                                   then %(ahora)s - s.time end), interval '0'),
+                 min(s.time),
+                 coalesce(max(case when s.event = 'ADDMEMBER' and s.orden_inverso = 1
+                                   then coalesce(s.time_siguiente, %(ahora)s) end), min(s.time))
+                 from (select distinct agente_id from eventos) agentes
+                 left join sesiones s on s.agente_id = agentes.agente_id
+                 group by agentes.agente_id order by agentes.agente_id desc
+        """
+        params = {
+            'fecha_desde': fecha_desde,
+            'fecha_hasta': fecha_hasta,
+            'agentes': agentes,
+            'eventos': ['ADDMEMBER', 'REMOVEMEMBER', 'PAUSEALL', 'UNPAUSEALL'],
+            'ahora': ahora,
+        }
+
+        cursor.execute(sql, params)
+        values = cursor.fetchall()
+        return values
+
+    def obtener_totales_pausa_agentes(self, fecha_desde, fecha_hasta, agentes):
+        """
+        Devuelve por agente y pausa (agente_id, pausa_id, tiempo_pausa), en el orden en que
+        se inició cada pausa. Cada PAUSEALL dura hasta el siguiente evento de sesión o pausa
+        del agente (LEAD), y si no lo hay no suma tiempo.
+        """
+        fecha_desde = datetime_hora_minima_dia(fecha_desde)
+        fecha_hasta = datetime_hora_maxima_dia(fecha_hasta)
+
+        cursor = connection.cursor()
+        sql = """with pausas as (
+                     select agente_id, time, event, pausa_id,
+                     lead(time) over (partition by agente_id order by time, id) as time_siguiente
+                     from reportes_app_actividadagentelog
+                     where time between %(fecha_desde)s and %(fecha_hasta)s
+                     and agente_id = ANY(%(agentes)s) and event = ANY(%(eventos)s)
+                 )
+                 select agente_id, pausa_id, coalesce(sum(time_siguiente - time), interval '0')
+                 from pausas where event = 'PAUSEALL'
+                 group by agente_id, pausa_id order by agente_id desc, min(time)
+        """
+        params = {
+            'fecha_desde': fecha_desde,
+            'fecha_hasta': fecha_hasta,
+            'agentes': agentes,
+            'eventos': ['ADDMEMBER', 'REMOVEMEMBER', 'PAUSEALL', 'UNPAUSEALL'],
+        }
+
+        cursor.execute(sql, params)
+        values = cursor.fetchall()
+        return values
+
+    def obtener_intervalos_sesion_agente(self, fecha_desde, fecha_hasta, agente_id, ahora):
+        """
+        Devuelve (inicio, fin, erroneo) por cada sesión del agente, más una fila
+        (time, None, True) por cada REMOVEMEMBER sin un ADDMEMBER previo.
+        Las sesiones no cerradas por un REMOVEMEMBER (terminan en el siguiente ADDMEMBER o
+        siguen abiertas hasta 'ahora') se marcan como erroneas.
+        """
+        fecha_desde = datetime_hora_minima_dia(fecha_desde)
+        fecha_hasta = datetime_hora_maxima_dia(fecha_hasta)
+
+        cursor = connection.cursor()
+        sql = """with sesiones as (
+                     select id, time, event,
+                     lead(event) over w as evento_siguiente, lead(time) over w as time_siguiente,
+                     count(*) filter (where event = 'ADDMEMBER') over w as inicios_previos
+                     from reportes_app_actividadagentelog
+                     where time between %(fecha_desde)s and %(fecha_hasta)s
+                     and agente_id = %(agente_id)s and event in ('ADDMEMBER', 'REMOVEMEMBER')
+                     window w as (order by time, id)
+                 )
+                 select time,
+                 case when event = 'ADDMEMBER' then coalesce(time_siguiente, %(ahora)s) end,
+                 event = 'REMOVEMEMBER' or evento_siguiente is distinct from 'REMOVEMEMBER'
+                 from sesiones where event = 'ADDMEMBER' or inicios_previos = 0
+                 order by time, id
+        """
+        params = {
+            'fecha_desde': fecha_desde,
+            'fecha_hasta': fecha_hasta,
+            'agente_id': agente_id,
+            'ahora': ahora,
+        }
+
+        cursor.execute(sql, params)
+        values = cursor.fetchall()
+        return values
+
 
 class ActividadAgenteLog(models.Model):
     """
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+from __future__ import unicode_literals
+
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.encoding import force_text
+from django.utils.timezone import now, localtime
+
+from ominicontacto_app.models import Campana
+from ominicontacto_app.utiles import datetime_hora_minima_dia
+from reportes_app.models import LlamadaLog
+from reportes_app.reportes.reporte_llamadas_entrantes import (
+    ReporteDeLLamadasEntrantesDeSupervision, ReporteLlamadasEntranteFamily)
+from reportes_app.reportes.reporte_llamadas_salientes import (
+    ReporteDeLLamadasSalientesDeSupervision, ReporteLlamadasSalienteFamily)
+from reportes_app.reportes.reporte_llamadas_supervision import (
+    ReporteDeLLamadasDialerDeSupervision, ReporteLlamadasDialersFamily)
+
+import logging as _logging
+
+logger = _logging.getLogger(__name__)
+
+
+# Suma los incrementos y pisa los valores instantáneos en una family con un campo por contador.
+# Si la family no existe y no hay nada distinto de cero para guardar no la crea, igual que
+# la regeneración completa, que sólo crea families de campañas con datos.
+# KEYS[1]: family de la campaña
+# ARGV[1]: nombre de la campaña, ARGV[2]: incrementos (JSON), ARGV[3]: valores (JSON)
+LUA_ACTUALIZAR_FAMILY_CONTADORES = """
+local incrementos = cjson.decode(ARGV[2])
+local valores = cjson.decode(ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local vacia = next(incrementos) == nil
+    for _, valor in pairs(valores) do
+        if valor ~= 0 then vacia = false end
+    end
+    if vacia then return 0 end
+    redis.call('HSET', KEYS[1], 'nombre', ARGV[1])
+end
+for campo, cantidad in pairs(incrementos) do
+    redis.call('HINCRBY', KEYS[1], campo, cantidad)
+end
+for campo, valor in pairs(valores) do
+    if redis.call('HGET', KEYS[1], campo) ~= tostring(valor) then
+        redis.call('HSET', KEYS[1], campo, valor)
+    end
+end
+return 1
+"""
+
+# Igual que el anterior para las families que guardan las estadísticas como JSON en el campo
+# ESTADISTICAS (son las que consumen la API y la supervisión de salientes y dialers).
+# ARGV[4]: estadísticas iniciales (JSON) a usar si la family no existe
+LUA_ACTUALIZAR_FAMILY_JSON = """
+local incrementos = cjson.decode(ARGV[2])
+local valores = cjson.decode(ARGV[3])
+local actual = redis.call('HGET', KEYS[1], 'ESTADISTICAS')
+local estadisticas
+if actual then
+    estadisticas = cjson.decode(actual)
+else
+    local vacia = next(incrementos) == nil
+    for _, valor in pairs(valores) do
+        if valor ~= 0 then vacia = false end
+    end
+    if vacia then return 0 end
+    estadisticas = cjson.decode(ARGV[4])
+end
+for campo, cantidad in pairs(incrementos) do
+    estadisticas[campo] = (estadisticas[campo] or 0) + cantidad
+end
+for campo, valor in pairs(valores) do
+    estadisticas[campo] = valor
+end
+local nuevas = cjson.encode(estadisticas)
+if nuevas ~= actual then
+    redis.call('HSET', KEYS[1], 'NOMBRE', ARGV[1], 'ESTADISTICAS', nuevas)
+end
+return 1
+"""
+
+
+class ActualizadorIncrementalDeSupervision(object):
+    """
+    Mantiene actualizadas las families de supervisión de llamadas del día aplicando sólo los
+    eventos de LlamadaLog posteriores al último procesado (checkpoint guardado en Redis).
+    Los valores instantáneos (gestiones, llamadas en espera, etc.) se recalculan en cada
+    actualización. La regeneración completa de las families se hace sólo al cambiar el día,
+    si no hay checkpoint o si se pide explícitamente.
+    """
+
+    CLAVE_CHECKPOINT = 'OML:SUPERVISION_CHECKPOINT:{0}'
+    CLAVE_LOCK = 'OML:SUPERVISION_LOCK:{0}'
+    DURACION_LOCK = 300
+    DEMORA_CHECKPOINT = 10
+
+    NOMBRE = None
+    FAMILY = None
+    REPORTE = None
+    TIPOS_CAMPANA = ()
+    TIPO_LLAMADA = None
+    CAMPOS_INSTANTANEOS = ()
+    LUA_ACTUALIZAR_FAMILY = None
+
+    def __init__(self, redis_connection=None):
+        if redis_connection is None:
+            redis_connection = redis.Redis(
+                host=settings.REDIS_HOSTNAME,
+                port=settings.CONSTANCE_REDIS_CONNECTION['port'],
+                decode_responses=True)
+        self.redis_connection = redis_connection
+        self.family = self.FAMILY()
+        self.family.redis_connection = redis_connection
+        self._actualizar_family = redis_connection.register_script(self.LUA_ACTUALIZAR_FAMILY)
+
+    @property
+    def clave_checkpoint(self):
+        return self.CLAVE_CHECKPOINT.format(self.NOMBRE)
+
+    def _get_nombre_family(self, campana_id):
+        return "{0}:{1}".format(self.family.get_nombre_families(), campana_id)
+
+    def actualizar(self, regenerar=False):
+        """ Aplica los eventos nuevos, o regenera las families si corresponde.
+            Devuelve False si no se actualizó por haber otra actualización en curso. """
+        clave_lock = self.CLAVE_LOCK.format(self.NOMBRE)
+        if not self.redis_connection.set(clave_lock, 1, nx=True, ex=self.DURACION_LOCK):
+            logger.warning('Actualización de supervisión {0} en curso'.format(self.NOMBRE))
+            return False
+        try:
+            hoy = localtime(now()).date().isoformat()
+            checkpoint = self.redis_connection.hgetall(self.clave_checkpoint)
+            if regenerar or checkpoint.get('fecha') != hoy:
+                self.regenerar(hoy)
+            else:
+                self._aplicar_eventos_nuevos(int(checkpoint['ultimo_id']), hoy)
+            return True
+        finally:
+            self.redis_connection.delete(clave_lock)
+
+    def regenerar(self, hoy):
+        """ Regenera completamente las families y guarda el checkpoint del último LlamadaLog
+            tenido en cuenta """
+        aislar = not connection.in_atomic_block
+        with transaction.atomic():
+            if aislar:
+                # Mismo snapshot para el último id y para los logs que cuenta el reporte
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            ultimo_id = self._obtener_ultimo_id()
+            self.family.regenerar_families()
+        self.redis_connection.hset(self.clave_checkpoint,
+                                   mapping={'fecha': hoy, 'ultimo_id': ultimo_id})
+
+    def _obtener_ultimo_id(self):
+        return LlamadaLog.objects.aggregate(Max('id'))['id__max'] or 0
+
+    def _obtener_ultimo_id_confirmado(self):
+        # El trigger de queue_log inserta los LlamadaLog en transacciones concurrentes, por lo
+        # que uno con id menor puede confirmarse después que otro mayor. El checkpoint no avanza
+        # sobre los logs de los últimos segundos para no saltear los todavía no confirmados.
+        limite = now() - timedelta(seconds=self.DEMORA_CHECKPOINT)
+        return LlamadaLog.objects.filter(time__lte=limite).aggregate(
+            Max('id'))['id__max'] or 0
+
+    def _aplicar_eventos_nuevos(self, ultimo_id, hoy):
+        hasta_id = max(ultimo_id, self._obtener_ultimo_id_confirmado())
+        campanas = dict(Campana.objects.obtener_actuales().filter(
+            type__in=self.TIPOS_CAMPANA).values_list('id', 'nombre'))
+        incrementos = self.obtener_incrementos(ultimo_id, hasta_id, campanas.keys())
+        valores = self._obtener_valores_instantaneos()
+
+        pipeline = self.redis_connection.pipeline()
+        for campana_id, nombre in campanas.items():
+            nombre = force_text(nombre)
+            iniciales = dict(self.REPORTE.INICIALES, nombre=nombre)
+            valores_campana = {campo: valores.get(campana_id, {}).get(campo, 0)
+                               for campo in self.CAMPOS_INSTANTANEOS}
+            self._actualizar_family(
+                keys=[self._get_nombre_family(campana_id)],
+                args=[nombre, json.dumps(incrementos.get(campana_id, {})),
+                      json.dumps(valores_campana), json.dumps(iniciales)],
+                client=pipeline)
+        pipeline.hset(self.clave_checkpoint, mapping={'fecha': hoy, 'ultimo_id': hasta_id})
+        pipeline.execute()
+
+    def obtener_incrementos(self, desde_id, hasta_id, campanas_ids):
+        """ Devuelve por campaña los incrementos de cada contador según los LlamadaLog con
+            id en (desde_id, hasta_id] """
+        logs = LlamadaLog.objects.filter(
+            id__gt=desde_id, id__lte=hasta_id, time__gte=datetime_hora_minima_dia(localtime(now())),
+            campana_id__in=campanas_ids, event__in=self.REPORTE.EVENTOS_LLAMADA)
+        if self.TIPO_LLAMADA is not None:
+            logs = logs.filter(tipo_llamada=self.TIPO_LLAMADA)
+
+        incrementos = defaultdict(lambda: defaultdict(int))
+        for log in logs.values_list('campana_id', 'event', 'bridge_wait_time',
+                                    named=True).iterator():
+            self.REPORTE._contabilizar_tipos_de_llamada_por_campana(
+                incrementos[log.campana_id], log)
+        return {campana_id: dict(cantidades) for campana_id, cantidades in incrementos.items()}
+
+    def _obtener_valores_instantaneos(self):
+        return self.REPORTE(contabilizar_llamadas=False).estadisticas
+
+
+class ActualizadorIncrementalDeSupervisionEntrantes(ActualizadorIncrementalDeSupervision):
+    NOMBRE = 'ENTRANTES'
+    FAMILY = ReporteLlamadasEntranteFamily
+    REPORTE = ReporteDeLLamadasEntrantesDeSupervision
+    TIPOS_CAMPANA = (Campana.TYPE_ENTRANTE, )
+    TIPO_LLAMADA = LlamadaLog.LLAMADA_ENTRANTE
+    CAMPOS_INSTANTANEOS = ('gestiones', 'llamadas_en_espera')
+    LUA_ACTUALIZAR_FAMILY = LUA_ACTUALIZAR_FAMILY_CONTADORES
+
+
+class ActualizadorIncrementalDeSupervisionSalientes(ActualizadorIncrementalDeSupervision):
+    NOMBRE = 'SALIENTES'
+    FAMILY = ReporteLlamadasSalienteFamily
+    REPORTE = ReporteDeLLamadasSalientesDeSupervision
+    TIPOS_CAMPANA = (Campana.TYPE_PREVIEW, Campana.TYPE_MANUAL)
+    CAMPOS_INSTANTANEOS = ('gestiones', )
+    LUA_ACTUALIZAR_FAMILY = LUA_ACTUALIZAR_FAMILY_JSON
+
+
+class ActualizadorIncrementalDeSupervisionDialers(ActualizadorIncrementalDeSupervision):
+    NOMBRE = 'DIALERS'
+    FAMILY = ReporteLlamadasDialersFamily
+    REPORTE = ReporteDeLLamadasDialerDeSupervision
+    TIPOS_CAMPANA = (Campana.TYPE_DIALER, )
+    TIPO_LLAMADA = Campana.TYPE_DIALER
+    CAMPOS_INSTANTANEOS = ('gestiones', 'pendientes', 'canales_discando')
+    LUA_ACTUALIZAR_FAMILY = LUA_ACTUALIZAR_FAMILY_JSON
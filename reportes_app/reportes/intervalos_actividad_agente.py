@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Emparejamiento de los eventos de sesión (ADDMEMBER / REMOVEMEMBER) y de pausa (PAUSEALL /
+UNPAUSEALL) de ActividadAgenteLog en intervalos de tiempo.
+
+CalculadorDeIntervalosSQL realiza el emparejamiento en PostgreSQL con funciones de ventana,
+CalculadorDeIntervalosPython es la implementación de referencia que recorre los eventos en
+Python. Ambos ordenan los eventos simultáneos por id y devuelven los mismos resultados.
+"""
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict, namedtuple
+from itertools import groupby
+
+from django.db import connection
+from django.utils.timezone import timedelta
+
+from reportes_app.models import ActividadAgenteLog
+
+EVENTOS_SESION_Y_PAUSA = ['ADDMEMBER', 'REMOVEMEMBER', 'PAUSEALL', 'UNPAUSEALL']
+
+# pausas: OrderedDict pausa_id -> tiempo total, en el orden en que se inició cada pausa.
+# inicio_sesiones y fin_sesiones son None si el agente no tiene eventos de sesión.
+TotalesActividadAgente = namedtuple(
+    'TotalesActividadAgente',
+    ['agente_id', 'tiempo_sesion', 'inicio_sesiones', 'fin_sesiones', 'pausas'])
+
+
+class CalculadorDeIntervalosSQL(object):
+
+    def calcular_totales_agentes(self, agente_ids, fecha_inicio, fecha_fin, ahora):
+        """
+        Devuelve un TotalesActividadAgente por cada agente con eventos en el período,
+        ordenados por agente_id descendente
+        """
+        pausas_por_agente = {}
+        for agente_id, pausa_id, tiempo in ActividadAgenteLog.objects.\
+                obtener_totales_pausa_agentes(fecha_inicio, fecha_fin, agente_ids):
+            pausas_por_agente.setdefault(agente_id, OrderedDict())[pausa_id] = tiempo
+
+        totales = []
+        for agente_id, tiempo_sesion, inicio, fin in ActividadAgenteLog.objects.\
+                obtener_totales_sesion_agentes(fecha_inicio, fecha_fin, agente_ids, ahora):
+            totales.append(TotalesActividadAgente(
+                agente_id, tiempo_sesion, inicio, fin,
+                pausas_por_agente.get(agente_id, OrderedDict())))
+        return totales
+
+    def calcular_sesiones_agente(self, agente_id, fecha_inicio, fecha_fin, ahora):
+        """
+        Devuelve la lista de sesiones (inicio, fin) del agente y si hubo logs erroneos
+        (REMOVEMEMBER sin sesión iniciada o sesiones sin REMOVEMEMBER)
+        """
+        sesiones = []
+        logs_erroneos = False
+        for inicio, fin, erroneo in ActividadAgenteLog.objects.obtener_intervalos_sesion_agente(
+                fecha_inicio, fecha_fin, agente_id, ahora):
+            if fin is not None:
+                sesiones.append((inicio, fin))
+            logs_erroneos = logs_erroneos or erroneo
+        return sesiones, logs_erroneos
+
+
+class CalculadorDeIntervalosPython(object):
+
+    def _obtener_logs(self, agente_ids, fecha_inicio, fecha_fin, eventos):
+        return ActividadAgenteLog.objects.obtener_tiempos_event_agentes(
+            eventos, fecha_inicio, fecha_fin, agente_ids).order_by('-agente_id', 'time', 'id')
+
+    def calcular_totales_agentes(self, agente_ids, fecha_inicio, fecha_fin, ahora):
+        logs = self._obtener_logs(agente_ids, fecha_inicio, fecha_fin, EVENTOS_SESION_Y_PAUSA)
+        return [self._calcular_totales_agente(agente_id, logs_agente, ahora)
+                for agente_id, logs_agente in groupby(logs, key=lambda log: log[0])]
+
+    def _calcular_totales_agente(self, agente_id, logs_agente, ahora):
+        tiempo_sesion = timedelta()
+        inicio_sesiones = None
+        # [inicio, fin] de la última sesión
+        sesion = None
+        pausas = OrderedDict()
+        # [pausa_id, inicio] de la última pausa si todavía no finalizó
+        pausa = None
+        for __, time, event, pausa_id in logs_agente:
+            if pausa is not None:
+                pausas[pausa[0]] += time - pausa[1]
+                pausa = None
+            if event == 'PAUSEALL':
+                pausas.setdefault(pausa_id, timedelta())
+                pausa = [pausa_id, time]
+            elif event == 'ADDMEMBER':
+                if sesion is not None and sesion[1] is None:
+                    # Una sesión que no se cerró con un REMOVEMEMBER no se contabiliza
+                    sesion[1] = time
+                sesion = [time, None]
+            elif event == 'REMOVEMEMBER':
+                if sesion is None:
+                    sesion = [time, time]
+                elif sesion[1] is None:
+                    sesion[1] = time
+                    tiempo_sesion += time - sesion[0]
+            if inicio_sesiones is None and sesion is not None:
+                inicio_sesiones = sesion[0]
+        fin_sesiones = None
+        if sesion is not None:
+            if sesion[1] is None:
+                sesion[1] = ahora
+                tiempo_sesion += ahora - sesion[0]
+            fin_sesiones = sesion[1]
+        return TotalesActividadAgente(
+            agente_id, tiempo_sesion, inicio_sesiones, fin_sesiones, pausas)
+
+    def calcular_sesiones_agente(self, agente_id, fecha_inicio, fecha_fin, ahora):
+        logs = self._obtener_logs(
+            [agente_id], fecha_inicio, fecha_fin, ['ADDMEMBER', 'REMOVEMEMBER'])
+        sesiones = []
+        logs_erroneos = False
+        inicio = None
+        finalizada = False
+        for __, time, event, __ in logs:
+            if event == 'REMOVEMEMBER':
+                if inicio is None:
+                    # REMOVEMEMBER sin sesión iniciada, se descarta
+                    logs_erroneos = True
+                elif not finalizada:
+                    sesiones.append((inicio, time))
+                    finalizada = True
+            elif event == 'ADDMEMBER':
+                if inicio is not None and not finalizada:
+                    # Sesión sin REMOVEMEMBER, se contabiliza hasta el nuevo inicio
+                    logs_erroneos = True
+                    sesiones.append((inicio, time))
+                inicio = time
+                finalizada = False
+        if inicio is not None and not finalizada:
+            logs_erroneos = True
+            sesiones.append((inicio, ahora))
+        return sesiones, logs_erroneos
+
+
+def obtener_calculador_de_intervalos():
+    if connection.vendor == 'postgresql':
+        return CalculadorDeIntervalosSQL()
+    return CalculadorDeIntervalosPython()
@@ -23,6 +23,7 @@ from django.utils.translation import ugettext as _
 from django.utils.timezone import now, timedelta
 from reportes_app.actividad_agente_log import AgenteTiemposReporte
 from reportes_app.models import ActividadAgenteLog, LlamadaLog
+from reportes_app.reportes.intervalos_actividad_agente import obtener_calculador_de_intervalos
 from ominicontacto_app.utiles import datetime_hora_maxima_dia, datetime_hora_minima_dia, fecha_local
 from ominicontacto_app.models import Pausa
 
@@ -40,58 +41,12 @@ class TiemposAgente(object):
         """ Calcula el tiempo de session teniendo en cuenta los eventos
         ADDMEMBER, REMOVEMEMBER por fecha dia a dia"""
 
-        eventos_sesion = ['ADDMEMBER', 'REMOVEMEMBER']
-        logs_erroneos = False
-        logs_agente = ActividadAgenteLog.objects.obtener_tiempos_event_agentes(
-            eventos_sesion, fecha_inferior, fecha_superior, [agente.id])
-        datos_ultima_sesion = {
-            'inicio': None,
-            'fin': None,
-        }
-
-        TIME = 1
-        EVENT = 2
-        for log in reversed(logs_agente):
-            if log[EVENT] == 'REMOVEMEMBER':
-                if datos_ultima_sesion['inicio'] is None:
-                    logs_erroneos = True
-                    # Si la ultima sesion no esta iniciada descarto el REMOVEMEMBER.
-                    pass
-                elif datos_ultima_sesion['fin'] is None:
-                    # Si no esta finalizada, contabilizo la sesion.
-                    datos_ultima_sesion['fin'] = log[TIME]
-                    self._computar_tiempo_session_fecha(tiempos_fechas,
-                                                        datos_ultima_sesion['inicio'],
-                                                        datos_ultima_sesion['fin'])
-                # Si la ultima sesion ya esta finalizada, descarto el REMOVEMEMBER
-
-            if log[EVENT] == 'ADDMEMBER':
-                # Si la ultima sesion esta iniciada
-                if datos_ultima_sesion['inicio'] is not None:
-                    #  Si no esta finalizada Contabilizo una sesion. y Arranco otra.
-                    if datos_ultima_sesion['fin'] is None:
-                        logs_erroneos = True
-                        # ATENCION: Se podria estimar mejor poniendo un maximo.
-                        self._computar_tiempo_session_fecha(tiempos_fechas,
-                                                            datos_ultima_sesion['inicio'],
-                                                            log[TIME])
-                        datos_ultima_sesion['inicio'] = log[TIME]
-                        datos_ultima_sesion['fin'] = None
-                    # Si esta finalizada, solamente arranco otra
-                    else:
-                        datos_ultima_sesion['inicio'] = log[TIME]
-                        datos_ultima_sesion['fin'] = None
-                else:
-                    datos_ultima_sesion['inicio'] = log[TIME]
-
-        # Si la ultima sesion esta incompleta, aviso de logs erroneos / sesiones incompletas.
-        if datos_ultima_sesion['inicio'] is not None and datos_ultima_sesion['fin'] is None:
-            logs_erroneos = True
-            hora_reporte = now()
-            # Contabilizo duracion de sesión hasta la hora actual
-            self._computar_tiempo_session_fecha(tiempos_fechas,
-                                                datos_ultima_sesion['inicio'],
-                                                hora_reporte)
+        calculador = obtener_calculador_de_intervalos()
+        # Las sesiones sin REMOVEMEMBER se cuentan hasta el siguiente ADDMEMBER o la hora actual
+        sesiones, logs_erroneos = calculador.calcular_sesiones_agente(
+            agente.id, fecha_inferior, fecha_superior, now())
+        for inicio, fin in sesiones:
+            self._computar_tiempo_session_fecha(tiempos_fechas, inicio, fin)
         return tiempos_fechas, logs_erroneos
 
     def calcular_tiempo_pausa_fecha_agente(self, agente, fecha_inferior,
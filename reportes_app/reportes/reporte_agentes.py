@@ -24,8 +24,9 @@ from django.utils.translation import ugettext as _
 from django.utils.timezone import now, timedelta
 from ominicontacto_app.models import Campana, Pausa
 from ominicontacto_app.utiles import datetime_hora_maxima_dia, datetime_hora_minima_dia
-from reportes_app.models import ActividadAgenteLog, LlamadaLog
+from reportes_app.models import LlamadaLog
 from reportes_app.actividad_agente_log import AgenteTiemposReporte
+from reportes_app.reportes.intervalos_actividad_agente import obtener_calculador_de_intervalos
 from reportes_app.reportes.reporte_llamadas import LLAMADA_TRANSF_INTERNA
 from collections import OrderedDict
 from utiles_globales import adicionar_render_unicode
@@ -161,22 +162,16 @@ class ReporteAgentes(object):
 
     def _procesa_tiempos_pausa(self, agentes, fecha_inicio, fecha_fin):
         agentes_dict = {agente.id: agente for agente in agentes}
-        logs_agentes = self._cargar_logs_agentes(list(agentes_dict.keys()), fecha_inicio, fecha_fin)
+        calculador = obtener_calculador_de_intervalos()
+        totales_agentes = calculador.calcular_totales_agentes(
+            list(agentes_dict.keys()), fecha_inicio, fecha_fin, now())
         lista_pausas = list(Pausa.objects.all())
-        for agente_id, fecha, event, pausa_id in logs_agentes[::-1]:
+        for totales in totales_agentes:
             datos_agente_actual = self.datos_agentes.setdefault(
-                agente_id, ActividadAgente(agentes_dict[agente_id], lista_pausas=lista_pausas))
+                totales.agente_id,
+                ActividadAgente(agentes_dict[totales.agente_id], lista_pausas=lista_pausas))
 
-            datos_agente_actual.procesa_log(event, fecha, pausa_id)
-
-    def _cargar_logs_agentes(self, agente_ids, fecha_inicio, fecha_fin):
-        eventos_sesion = ['ADDMEMBER', 'REMOVEMEMBER', 'PAUSEALL', 'UNPAUSEALL']
-
-        return ActividadAgenteLog.objects.obtener_tiempos_event_agentes(
-            eventos_sesion,
-            fecha_inicio,
-            fecha_fin,
-            agente_ids)
+            datos_agente_actual.cargar_totales(totales)
 
     def _obtener_total_agentes_tipo_llamada(self, fecha_inicio, fecha_fin):
         dict_agentes_llamadas = {}
@@ -267,22 +262,25 @@ class ActividadAgente(object):
             res[pausa.id] = pausa
         return res
 
-    def procesa_log(self, event, time, pausa_id):
-        if event == 'REMOVEMEMBER':
-            if self.sesiones == []:
-                self.sesiones.append(SesionAgente(
-                    fecha_inicio=time, fecha_fin=time))
-            else:
-                self.sesiones[-1].establecer_finalizacion(time)
-                self.tiempo_sesion += self.sesiones[-1].calcular_duracion()
-
-        elif event == 'ADDMEMBER':
-            if self.sesiones != []:
-                sesion_anterior = self.sesiones[-1]
-                sesion_anterior.establecer_finalizacion(time)
-            self.sesiones.append(SesionAgente(fecha_inicio=time))
+    def cargar_totales(self, totales):
+        """
+        Carga los tiempos de sesión y de pausa ya emparejados (TotalesActividadAgente).
+        Las sesiones quedan resumidas en una sola que abarca desde el inicio de la primera
+        hasta el fin de la última, y las pausas en una por cada pausa_id.
+        """
+        self.sesiones = []
+        if totales.inicio_sesiones is not None:
+            sesion = SesionAgente(totales.inicio_sesiones, totales.fin_sesiones)
+            sesion.duracion = totales.tiempo_sesion
+            self.sesiones.append(sesion)
+        self.tiempo_sesion = totales.tiempo_sesion
 
-        self._procesa_pausa_log(event, time, pausa_id)
+        self.pausas = []
+        for pausa_id, duracion in totales.pausas.items():
+            pausa = PausaAgente(pausa_id, self.pausas_por_id[int(pausa_id)])
+            pausa.duracion = duracion
+            self.pausas.append(pausa)
+            self.tiempo_pausa += duracion
 
     def calcula_totales(self):
         self._totaliza_pausas()
@@ -338,23 +336,6 @@ class ActividadAgente(object):
             r.append(p)
         return r
 
-    def _procesa_pausa_log(self, event, time, pausa_id):
-        if (event == 'UNPAUSEALL' or event == 'REMOVEMEMBER' or event == 'ADDMEMBER')\
-                and self.pausas != []:
-            if not self.pausas[-1].establecer_finalizacion(time, pausa_id):
-                self.pausas.append(PausaAgente(
-                    pausa_id, self.pausas_por_id[int(pausa_id)],
-                    fecha_inicio=self.pausas[-1].fecha_inicio))
-                self.pausas[-1].establecer_finalizacion(time, pausa_id)
-            self.tiempo_pausa += self.pausas[-1].calcular_duracion()
-        elif event == 'PAUSEALL':
-            if self.pausas != []:
-                self.pausas[-1].establecer_finalizacion(time, pausa_id)
-                self.tiempo_pausa += self.pausas[-1].calcular_duracion()
-
-            self.pausas.append(PausaAgente(
-                pausa_id, self.pausas_por_id[int(pausa_id)], fecha_inicio=time))
-
     def _procesa_tiempo_hold(self, fecha_inicio, fecha_fin):
         fecha_superior = datetime_hora_maxima_dia(fecha_fin)
         fecha_inferior = datetime_hora_minima_dia(fecha_inicio)
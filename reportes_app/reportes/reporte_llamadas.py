@@ -18,14 +18,22 @@
 #
 from __future__ import unicode_literals, division
 
+from collections import namedtuple
+from heapq import merge
+from operator import attrgetter
+
 import pygal
 
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.timezone import timedelta
 from django.utils.translation import ugettext as _
 from django.utils.encoding import force_text
 
 from ominicontacto_app.models import Campana
-from ominicontacto_app.utiles import fecha_hora_local
-from reportes_app.models import LlamadaLog
+from ominicontacto_app.utiles import (
+    datetime_hora_maxima_dia, datetime_hora_minima_dia, fecha_local)
+from reportes_app.models import LlamadaLog, ResumenDiarioLlamadas
 from reportes_app.utiles import (
     ESTILO_AMARILLO_VERDE_ROJO, ESTILO_AZUL_VIOLETA_NARANJA_CELESTE, ESTILO_VERDE_AZUL,
     ESTILO_ROJO_VERDE_GRIS_NEGRO, ESTILO_VERDE_GRIS_NEGRO_ROJO, ESTILO_VERDE_ROJO
@@ -128,6 +136,11 @@ INICIALES_POR_CAMPANA = {
     }
 }
 
+CAMPOS_CONTEO = ('fecha', 'campana_id', 'tipo_campana', 'tipo_llamada', 'event')
+
+# Cantidad de logs con los mismos valores en CAMPOS_CONTEO y suma de sus bridge_wait_time
+ConteoDeLlamadas = namedtuple('ConteoDeLlamadas', CAMPOS_CONTEO + ('cantidad', 'bridge_wait_time'))
+
 CAMPANA_TYPES = {
     Campana.TYPE_ENTRANTE: Campana.TYPE_ENTRANTE_DISPLAY,
     Campana.TYPE_DIALER: Campana.TYPE_DIALER_DISPLAY,
@@ -143,12 +156,13 @@ class ReporteDeLlamadas(object):
     def __init__(self, desde, hasta, incluir_finalizadas, user):
         self.campanas = self._campanas_implicadas(user, incluir_finalizadas)
         campanas_ids = self.campanas.values_list('id', flat=True)
+        self.campanas_ids = list(campanas_ids)
         self.logs = LlamadaLog.objects.filter(time__gte=desde,
                                               time__lte=hasta,
                                               campana_id__in=campanas_ids)
         self._inicializar_conteo_de_estadisticas(desde, hasta)
 
-        self._contabilizar_estadisticas()
+        self._contabilizar_estadisticas(desde, hasta)
 
     def _campanas_implicadas(self, user, incluir_finalizadas):
         if user.get_is_administrador():
@@ -235,9 +249,74 @@ class ReporteDeLlamadas(object):
         self.estadisticas['tipos_de_llamada_por_campana'][tipo][campana.id] = tipos_por_campana
         self.estadisticas_por_fecha['tipos_de_llamada_por_campana'][tipo][campana.id] = {}
 
-    def _contabilizar_estadisticas(self):
-        for log in self.logs:
-            fecha = fecha_hora_local(log.time).strftime('%d-%m-%Y')
+    def _obtener_dias_completos(self, desde, hasta):
+        """ Primer y último día local que el rango [desde, hasta] cubre completos """
+        primer_dia = fecha_local(desde)
+        if datetime_hora_minima_dia(primer_dia) < desde:
+            primer_dia += timedelta(days=1)
+        ultimo_dia = fecha_local(hasta)
+        if datetime_hora_maxima_dia(ultimo_dia) > hasta:
+            ultimo_dia -= timedelta(days=1)
+        return primer_dia, ultimo_dia
+
+    def _obtener_rangos_no_consolidados(self, desde, hasta, dias_consolidados):
+        """ Rangos de [desde, hasta] que cubren los días no consolidados, uniendo los días
+            consecutivos """
+        rangos = []
+        dia = fecha_local(desde)
+        ultimo_dia = fecha_local(hasta)
+        anterior_pendiente = False
+        while dia <= ultimo_dia:
+            pendiente = dia not in dias_consolidados
+            if pendiente:
+                fin = min(hasta, datetime_hora_maxima_dia(dia))
+                if anterior_pendiente:
+                    rangos[-1] = (rangos[-1][0], fin)
+                else:
+                    rangos.append((max(desde, datetime_hora_minima_dia(dia)), fin))
+            anterior_pendiente = pendiente
+            dia += timedelta(days=1)
+        return rangos
+
+    def _obtener_conteos(self, desde, hasta):
+        """
+        Devuelve los ConteoDeLlamadas del período ordenados por fecha. Los días completos
+        ya consolidados se leen de ResumenDiarioLlamadas y el resto (el día actual y los
+        extremos parciales del rango) se agrupan directamente desde LlamadaLog, filtrando por
+        rangos de 'time' para no leer los logs de los días consolidados.
+        """
+        primer_dia, ultimo_dia = self._obtener_dias_completos(desde, hasta)
+        dias_consolidados = set()
+        if primer_dia <= ultimo_dia:
+            dias_consolidados = ResumenDiarioLlamadas.objects.obtener_dias_consolidados(
+                primer_dia, ultimo_dia)
+
+        conteos_logs = []
+        rangos = self._obtener_rangos_no_consolidados(desde, hasta, dias_consolidados)
+        if rangos:
+            filtro_rangos = Q()
+            for inicio, fin in rangos:
+                filtro_rangos |= Q(time__gte=inicio, time__lte=fin)
+            logs = self.logs.filter(filtro_rangos).annotate(fecha=TruncDate('time'))
+            conteos_logs = logs.values(*CAMPOS_CONTEO).annotate(
+                cantidad=Count('id'), bridge_wait_time=Coalesce(Sum('bridge_wait_time'), 0)
+            ).order_by('fecha')
+
+        resumenes = []
+        if dias_consolidados:
+            resumenes = ResumenDiarioLlamadas.objects.filter(
+                fecha__in=dias_consolidados, campana_id__in=self.campanas_ids).values_list(
+                    *ConteoDeLlamadas._fields).order_by('fecha')
+
+        # Las estadísticas por fecha se cargan en el orden en que llegan los conteos
+        return merge((ConteoDeLlamadas(**conteo) for conteo in conteos_logs),
+                     (ConteoDeLlamadas(*resumen) for resumen in resumenes),
+                     key=attrgetter('fecha'))
+
+    def _contabilizar_estadisticas(self, desde, hasta):
+        # Cada 'log' es un ConteoDeLlamadas que agrupa 'cantidad' logs iguales
+        for log in self._obtener_conteos(desde, hasta):
+            fecha = log.fecha.strftime('%d-%m-%Y')
             tipo_campana = str(log.tipo_campana)
             tipo_llamada = str(log.tipo_llamada)
             if int(tipo_llamada) in LLAMADAS_TRANSFERENCIA:
@@ -266,67 +345,67 @@ class ReporteDeLlamadas(object):
     def _contabilizar_total_llamadas_procesadas(self, log):
         if log.event == 'DIAL' or (log.event in ['ENTERQUEUE', 'ABANDONWEL'] and
                                    log.tipo_campana == Campana.TYPE_ENTRANTE):
-            self.estadisticas['total_llamadas_procesadas'] += 1
+            self.estadisticas['total_llamadas_procesadas'] += log.cantidad
         #  Contabilizar solo llamadas transferidas a OTRA CAMPAÑA: ENTERQUEUE-TRANSFER
         if log.event == 'ENTERQUEUE-TRANSFER':
-            self.estadisticas['total_llamadas_procesadas'] += 1
+            self.estadisticas['total_llamadas_procesadas'] += log.cantidad
 
     def _contabilizar_llamada_por_tipo(self, estadisticas_tipo, log):
         # Contabilizar solo llamadas transferidas a OTRA CAMPAÑA: ENTERQUEUE-TRANSFER
         if log.tipo_llamada == LLAMADA_TRANSF_INTERNA:
             if log.event == 'ENTERQUEUE-TRANSFER':
-                estadisticas_tipo['total'] += 1
+                estadisticas_tipo['total'] += log.cantidad
             elif log.event == 'CONNECT':
-                estadisticas_tipo['conectadas'] += 1
+                estadisticas_tipo['conectadas'] += log.cantidad
             elif log.event == 'CAMPT-FAIL':
-                estadisticas_tipo['no_conectadas'] += 1
+                estadisticas_tipo['no_conectadas'] += log.cantidad
         elif log.event == 'DIAL':
             if not log.tipo_llamada == Campana.TYPE_ENTRANTE:
-                estadisticas_tipo['total'] += 1
+                estadisticas_tipo['total'] += log.cantidad
         elif log.event == 'ENTERQUEUE':
             if log.tipo_llamada == Campana.TYPE_ENTRANTE:
-                estadisticas_tipo['total'] += 1
+                estadisticas_tipo['total'] += log.cantidad
         elif log.event == 'ANSWER':
             if log.tipo_llamada in LLAMADAS_DE_AGENTE:
-                estadisticas_tipo['conectadas'] += 1
+                estadisticas_tipo['conectadas'] += log.cantidad
             elif log.tipo_llamada == Campana.TYPE_DIALER:
-                estadisticas_tipo['atendidas'] += 1
+                estadisticas_tipo['atendidas'] += log.cantidad
         elif log.event == 'CONNECT':
             if log.tipo_llamada == Campana.TYPE_ENTRANTE:
-                estadisticas_tipo['atendidas'] += 1
+                estadisticas_tipo['atendidas'] += log.cantidad
         elif log.event == 'EXITWITHTIMEOUT':
             if log.tipo_llamada == Campana.TYPE_DIALER:
-                estadisticas_tipo['perdidas'] += 1
+                estadisticas_tipo['perdidas'] += log.cantidad
             elif log.tipo_llamada == Campana.TYPE_ENTRANTE:
-                estadisticas_tipo['expiradas'] += 1
+                estadisticas_tipo['expiradas'] += log.cantidad
         elif log.event == 'ABANDON':
             if log.tipo_llamada == Campana.TYPE_DIALER:
-                estadisticas_tipo['perdidas'] += 1
+                estadisticas_tipo['perdidas'] += log.cantidad
             if log.tipo_llamada == Campana.TYPE_ENTRANTE:
-                estadisticas_tipo['abandonadas'] += 1
+                estadisticas_tipo['abandonadas'] += log.cantidad
         elif log.event == 'ABANDONWEL':
             # solo las campañas entrantes tienen este evento
             assert log.tipo_llamada == Campana.TYPE_ENTRANTE
-            estadisticas_tipo['total'] += 1
-            estadisticas_tipo['abandonadas_anuncio'] += 1
+            estadisticas_tipo['total'] += log.cantidad
+            estadisticas_tipo['abandonadas_anuncio'] += log.cantidad
         elif log.event in LlamadaLog.EVENTOS_NO_CONTACTACION:
             if log.tipo_llamada in LLAMADAS_DE_AGENTE:
-                estadisticas_tipo['no_conectadas'] += 1
+                estadisticas_tipo['no_conectadas'] += log.cantidad
             elif log.tipo_llamada == Campana.TYPE_DIALER:
-                estadisticas_tipo['no_atendidas'] += 1
+                estadisticas_tipo['no_atendidas'] += log.cantidad
 
     def _contabilizar_llamadas_por_campana(self, log):
         estadisticas_campana = self.estadisticas['llamadas_por_campana'][log.campana_id]
         if log.event == 'DIAL':
-            estadisticas_campana['total'] += 1
+            estadisticas_campana['total'] += log.cantidad
             if log.tipo_llamada in LLAMADAS_MANUALES:
-                estadisticas_campana['manuales'] += 1
+                estadisticas_campana['manuales'] += log.cantidad
         elif log.event in ['ENTERQUEUE', 'ABANDONWEL']:
             if log.tipo_campana == Campana.TYPE_ENTRANTE:
-                estadisticas_campana['total'] += 1
+                estadisticas_campana['total'] += log.cantidad
         elif log.event == 'ENTERQUEUE-TRANSFER':
             # assert(log.tipo_campana == Campana.TYPE_ENTRANTE, 'Transfiere a campaña no entrante?')
-            estadisticas_campana['total'] += 1
+            estadisticas_campana['total'] += log.cantidad
 
     def _contabilizar_tipos_de_llamada_por_campana(self, estadisticas_campana, log):
         if log.tipo_campana == Campana.TYPE_MANUAL:
@@ -342,60 +421,60 @@ class ReporteDeLlamadas(object):
         if not log.tipo_campana == Campana.TYPE_MANUAL and log.tipo_llamada in LLAMADAS_MANUALES:
             self._contabilizar_tipos_de_llamada_manual(datos_campana, log)
         if log.event == 'DIAL':
-            datos_campana['efectuadas'] += 1
+            datos_campana['efectuadas'] += log.cantidad
         elif log.event == 'ANSWER':
-            datos_campana['conectadas'] += 1
+            datos_campana['conectadas'] += log.cantidad
             datos_campana['t_espera_conexion'] += log.bridge_wait_time
         elif log.event in LlamadaLog.EVENTOS_NO_CONTACTACION:
-            datos_campana['no_conectadas'] += 1
+            datos_campana['no_conectadas'] += log.cantidad
             datos_campana['t_espera_conexion'] += log.bridge_wait_time
 
     def _contabilizar_tipos_de_llamada_por_campana_dialer(self, datos_campana, log):
         if log.tipo_llamada in LLAMADAS_MANUALES:
             self._contabilizar_tipos_de_llamada_manual(datos_campana, log)
         elif log.event == 'DIAL':
-            datos_campana['efectuadas'] += 1
+            datos_campana['efectuadas'] += log.cantidad
         elif log.event == 'ANSWER':
-            datos_campana['atendidas'] += 1
+            datos_campana['atendidas'] += log.cantidad
             datos_campana['t_espera_atencion'] += log.bridge_wait_time
         elif log.event == 'CONNECT':
-            datos_campana['conectadas'] += 1
+            datos_campana['conectadas'] += log.cantidad
             datos_campana['t_espera_conexion'] += log.bridge_wait_time
         elif log.event == 'EXITWITHTIMEOUT':
-            datos_campana['expiradas'] += 1
+            datos_campana['expiradas'] += log.cantidad
         elif log.event == 'ABANDON':
-            datos_campana['abandonadas'] += 1
+            datos_campana['abandonadas'] += log.cantidad
             datos_campana['t_abandono'] += log.bridge_wait_time
 
     def _contabilizar_tipos_de_llamada_por_campana_entrante(self, datos_campana, log):
         if log.tipo_llamada in LLAMADAS_MANUALES:
             self._contabilizar_tipos_de_llamada_manual(datos_campana, log)
         elif log.event == 'ENTERQUEUE':
-            datos_campana['recibidas'] += 1
+            datos_campana['recibidas'] += log.cantidad
         elif log.event == 'ENTERQUEUE-TRANSFER':
-            datos_campana['recibidas'] += 1
-            datos_campana['recibidas_transferencias'] += 1
+            datos_campana['recibidas'] += log.cantidad
+            datos_campana['recibidas_transferencias'] += log.cantidad
         elif log.event == 'CONNECT':
-            datos_campana['atendidas'] += 1
+            datos_campana['atendidas'] += log.cantidad
             datos_campana['t_espera_conexion'] += log.bridge_wait_time
         elif log.event == 'EXITWITHTIMEOUT':
-            datos_campana['expiradas'] += 1
+            datos_campana['expiradas'] += log.cantidad
         elif log.event == 'ABANDON':
-            datos_campana['abandonadas'] += 1
+            datos_campana['abandonadas'] += log.cantidad
             datos_campana['t_abandono'] += log.bridge_wait_time
         elif log.event == 'ABANDONWEL':
-            datos_campana['recibidas'] += 1
-            datos_campana['abandonadas_anuncio'] += 1
+            datos_campana['recibidas'] += log.cantidad
+            datos_campana['abandonadas_anuncio'] += log.cantidad
             datos_campana['t_abandono'] += log.bridge_wait_time
 
     def _contabilizar_tipos_de_llamada_manual(self, datos_campana, log):
         if log.event == 'DIAL':
-            datos_campana['efectuadas_manuales'] += 1
+            datos_campana['efectuadas_manuales'] += log.cantidad
         elif log.event == 'ANSWER':
-            datos_campana['conectadas_manuales'] += 1
+            datos_campana['conectadas_manuales'] += log.cantidad
             datos_campana['t_espera_conexion_manuales'] += log.bridge_wait_time
         elif log.event in LlamadaLog.EVENTOS_NO_CONTACTACION:
-            datos_campana['no_conectadas_manuales'] += 1
+            datos_campana['no_conectadas_manuales'] += log.cantidad
             datos_campana['t_espera_conexion_manuales'] += log.bridge_wait_time
 
     def _aplicar_promedios_a_tiempos(self):
@@ -797,6 +876,7 @@ class GeneradorReportesLlamadasCSV(object):
 class ReporteTipoDeLlamadasDeCampana(ReporteDeLlamadas):
 
     def __init__(self, desde, hasta, id_campana):
+        self.campanas_ids = [id_campana]
         self.logs = LlamadaLog.objects.filter(time__gte=desde,
                                               time__lte=hasta,
                                               campana_id=id_campana)
@@ -805,10 +885,10 @@ class ReporteTipoDeLlamadasDeCampana(ReporteDeLlamadas):
         tipo = str(self.campana.type)
         self.estadisticas = INICIALES_POR_CAMPANA[tipo].copy()
 
-        self._contabilizar_estadisticas()
+        self._contabilizar_estadisticas(desde, hasta)
 
-    def _contabilizar_estadisticas(self):
+    def _contabilizar_estadisticas(self, desde, hasta):
         tipo = str(self.campana.type)
-        for log in self.logs:
+        for log in self._obtener_conteos(desde, hasta):
             self._contabilizar_tipos_de_llamada_por_campana(self.estadisticas, log)
         self._aplicar_promedios_a_tiempos_de_campana(tipo, self.estadisticas)
@@ -26,6 +26,7 @@ from asterisk.manager import Manager, ManagerSocketException, ManagerAuthExcepti
 from reportes_app.models import LlamadaLog
 from ominicontacto_app.utiles import datetime_hora_maxima_dia, datetime_hora_minima_dia
 from ominicontacto_app.models import CalificacionCliente, Campana, OpcionCalificacion
+from ominicontacto_app.services.asterisk.estado_colas import EstadoColasAsterisk
 from ominicontacto_app.services.asterisk.redis_database import AbstractRedisFamily
 
 import logging as _logging
@@ -46,7 +47,7 @@ class ReporteDeLLamadasEntrantesDeSupervision(object):
     EVENTOS_LLAMADA = ['ENTERQUEUE', 'ENTERQUEUE-TRANSFER', 'CONNECT', 'EXITWITHTIMEOUT', 'ABANDON',
                        'ABANDONWEL']
 
-    def __init__(self):
+    def __init__(self, contabilizar_llamadas=True):
         query_campanas = Campana.objects.obtener_actuales().filter(type=Campana.TYPE_ENTRANTE)
         self.campanas = {}
         for campana in query_campanas:
@@ -56,7 +57,8 @@ class ReporteDeLLamadasEntrantesDeSupervision(object):
         self.desde = datetime_hora_minima_dia(hoy)
         self.hasta = datetime_hora_maxima_dia(hoy)
         self.estadisticas = {}
-        self._contabilizar_estadisticas_de_llamadas()
+        if contabilizar_llamadas:
+            self._contabilizar_estadisticas_de_llamadas()
         self._contabilizar_gestiones()
         self._contabilizar_llamadas_en_espera_por_campana()
 
@@ -80,7 +82,8 @@ class ReporteDeLLamadasEntrantesDeSupervision(object):
         datos_campana['nombre'] = force_text(campana.nombre)
         self.estadisticas[campana.id] = datos_campana
 
-    def _contabilizar_tipos_de_llamada_por_campana(self, datos_campana, log):
+    @classmethod
+    def _contabilizar_tipos_de_llamada_por_campana(cls, datos_campana, log):
         if log.event == 'CONNECT':
             datos_campana['llamadas_atendidas'] += 1
             datos_campana['tiempo_acumulado_espera'] += log.bridge_wait_time
@@ -157,6 +160,11 @@ class ReporteDeLLamadasEntrantesDeSupervision(object):
             return queue_status_raw
 
     def _obtener_llamadas_en_espera(self):
+        estado_colas = EstadoColasAsterisk()
+        if estado_colas.esta_vigente():
+            # Estado mantenido por el comando escuchar_eventos_colas
+            self.llamadas_en_cola = estado_colas.obtener_llamadas_en_espera(self.campanas.keys())
+            return
         queue_status_raw = self._obtener_llamadas_en_espera_raw()
         try:
             self.llamadas_en_cola = self._parsear_queue_status_pasada_2(
@@ -188,11 +196,6 @@ class ReporteLlamadasEntranteFamily(AbstractRedisFamily):
     def get_nombre_families(self):
         return "OML:SUPERVISION_CAMPAIGN"
 
-    def regenerar_families(self):
-        """regenera la family"""
-        self._delete_tree_family()
-        self._create_families()
-
     def regenerar_family(self, family_member):
         """regenera una family"""
         self.delete_family(family_member)
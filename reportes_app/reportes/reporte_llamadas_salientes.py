@@ -38,7 +38,7 @@ class ReporteDeLLamadasSalientesDeSupervision(object):
     }
     EVENTOS_LLAMADA = ('DIAL', 'ANSWER') + LlamadaLog.EVENTOS_NO_CONEXION
 
-    def __init__(self):
+    def __init__(self, contabilizar_llamadas=True):
         query_campanas = Campana.objects.obtener_actuales().filter(type__in=[Campana.TYPE_PREVIEW,
                                                                              Campana.TYPE_MANUAL])
         self.campanas = {}
@@ -48,7 +48,8 @@ class ReporteDeLLamadasSalientesDeSupervision(object):
         self.desde = datetime_hora_minima_dia(hoy)
         self.hasta = datetime_hora_maxima_dia(hoy)
         self.estadisticas = {}
-        self._contabilizar_estadisticas_de_llamadas()
+        if contabilizar_llamadas:
+            self._contabilizar_estadisticas_de_llamadas()
         self._contabilizar_gestiones()
 
     def _obtener_logs_de_llamadas(self):
@@ -89,7 +90,8 @@ class ReporteDeLLamadasSalientesDeSupervision(object):
             self._contabilizar_tipos_de_llamada_por_campana(
                 estadisticas_campana, log)
 
-    def _contabilizar_tipos_de_llamada_por_campana(self, datos_campana, log):
+    @classmethod
+    def _contabilizar_tipos_de_llamada_por_campana(cls, datos_campana, log):
 
         if log.event == 'DIAL':
             datos_campana['efectuadas'] += 1
@@ -161,10 +163,9 @@ class ReporteLlamadasSalienteFamily(AbstractRedisFamily):
         except (RedisError) as e:
             raise e
 
-    def regenerar_families(self):
-        """regenera la family"""
-        self._delete_tree_family()
-        self._create_families()
+    def _obtener_families_esperadas(self):
+        return {self._get_nombre_family(campana_id): self._create_dict(datos)
+                for campana_id, datos in self._obtener_todos()}
 
     # def regenerar_family(self, campana):
     # Necesitaria correr el reporte para regenerarla
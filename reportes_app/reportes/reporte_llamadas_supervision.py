@@ -41,7 +41,7 @@ logger = _logging.getLogger(__name__)
 
 
 class ReporteDeLlamadasDeSupervision(object):
-    def __init__(self, user_supervisor=None):
+    def __init__(self, user_supervisor=None, contabilizar_llamadas=True):
         if user_supervisor:
             query_campanas = self._obtener_campanas(user_supervisor)
         else:
@@ -55,7 +55,8 @@ class ReporteDeLlamadasDeSupervision(object):
         self.hasta = datetime_hora_maxima_dia(hoy)
 
         self.estadisticas = {}
-        self._contabilizar_estadisticas_de_llamadas()
+        if contabilizar_llamadas:
+            self._contabilizar_estadisticas_de_llamadas()
         self._contabilizar_gestiones()
 
     def _inicializar_conteo_de_campana(self, campana_id):
@@ -242,8 +243,9 @@ class ReporteDeLLamadasDialerDeSupervision(ReporteDeLlamadasDeSupervision):
     }
     EVENTOS_LLAMADA = ('DIAL', 'CONNECT', 'ANSWER') + LlamadaLog.EVENTOS_NO_CONEXION
 
-    def __init__(self):
-        super(ReporteDeLLamadasDialerDeSupervision, self).__init__()
+    def __init__(self, contabilizar_llamadas=True):
+        super(ReporteDeLLamadasDialerDeSupervision, self).__init__(
+            contabilizar_llamadas=contabilizar_llamadas)
         self._contabilizar_llamadas_pendientes()
         self._contabilizar_llamadas_en_curso()
 
@@ -257,7 +259,8 @@ class ReporteDeLLamadasDialerDeSupervision(ReporteDeLlamadasDeSupervision):
                                          tipo_llamada=Campana.TYPE_DIALER,
                                          event__in=self.EVENTOS_LLAMADA)
 
-    def _contabilizar_tipos_de_llamada_por_campana(self, datos_campana, log):
+    @classmethod
+    def _contabilizar_tipos_de_llamada_por_campana(cls, datos_campana, log):
         if log.event == 'DIAL':
             datos_campana['efectuadas'] += 1
         elif log.event in LlamadaLog.EVENTOS_NO_CONEXION:
@@ -309,6 +312,8 @@ class ReporteDeLLamadasDialerDeSupervision(ReporteDeLlamadasDeSupervision):
         cursor.execute(sql, params)
         values = cursor.fetchall()
         for campana_id, cantidad in values:
+            if campana_id not in self.estadisticas:
+                self._inicializar_conteo_de_campana(campana_id)
             self.estadisticas[campana_id]['canales_discando'] = cantidad
 
 
@@ -371,10 +376,9 @@ class ReporteLlamadasDialersFamily(AbstractRedisFamily):
         except (RedisError) as e:
             raise e
 
-    def regenerar_families(self):
-        """regenera la family"""
-        self._delete_tree_family()
-        self._create_families()
+    def _obtener_families_esperadas(self):
+        return {self._get_nombre_family(campana_id): self._create_dict(datos)
+                for campana_id, datos in self._obtener_todos()}
 
     # def regenerar_family(self, campana):
     # Necesitaria correr el reporte para regenerarla
@@ -24,9 +24,11 @@ Servicio para generar reporte csv de las reportes de los agentes
 from __future__ import unicode_literals
 
 import csv
+import datetime
 import logging
 import os
 import json
+import tempfile
 
 import redis
 
@@ -37,10 +39,11 @@ from django.utils.encoding import force_text
 from django.utils.translation import ugettext as _
 from django.utils.timezone import localtime, timedelta
 
-from ominicontacto_app.utiles import crear_archivo_en_media_root
+from ominicontacto_app.utiles import crear_archivo_en_media_root, convert_fecha_datetime
 
 from ominicontacto_app.models import Campana, OpcionCalificacion, HistoricalCalificacionCliente
 from ominicontacto_app.services.estadisticas_campana import EstadisticasBaseCampana
+from ominicontacto_app.services.redis.progreso import PublicadorDeProgreso
 
 from reportes_app.models import LlamadaLog
 
@@ -77,6 +80,63 @@ class ReporteCSV:
             return contacto.lista_de_datos_completa()
         return [""] * len(campos_contacto)
 
+    def _generar(self, key_task, archivo_de_reporte):
+        """
+        Si se indica un archivo de reporte las filas se escriben a medida que se generan en
+        un temporal del mismo directorio, que reemplaza al archivo de reporte al terminar: el
+        reporte anterior se puede seguir descargando completo mientras se genera el nuevo.
+        Sino las filas se acumulan en self.datos.
+        """
+        self.datos = []
+        self.csv_writer = None
+        if archivo_de_reporte is None:
+            self._generar_reporte(key_task)
+            return
+        archivo_de_reporte.crear_archivo_en_directorio()
+        descriptor, temporal = tempfile.mkstemp(
+            dir=os.path.dirname(archivo_de_reporte.ruta), prefix='.tmp-', suffix='.csv')
+        try:
+            with open(descriptor, 'w', newline='', encoding='utf-8') as csvfile:
+                self.csv_writer = csv.writer(csvfile)
+                self._generar_reporte(key_task)
+            os.chmod(temporal, 0o644)
+            os.replace(temporal, archivo_de_reporte.ruta)
+        except Exception:
+            os.remove(temporal)
+            raise
+        finally:
+            self.csv_writer = None
+
+    def _agregar_fila(self, fila):
+        lista_datos_utf8 = [force_text(item) for item in fila]
+        if self.csv_writer is None:
+            self.datos.append(lista_datos_utf8)
+        else:
+            self.csv_writer.writerow(lista_datos_utf8)
+
+    def _iterar_logs_en_lotes(self, logs_llamadas):
+        """
+        Recorre los logs con un cursor del lado del servidor y antes de entregar cada lote
+        carga en self.contactos_dict sólo los contactos referenciados por ese lote.
+        """
+        tamano_lote = settings.OL_TAMANO_LOTE_REPORTES_CSV
+        lote = []
+        for log_llamada in logs_llamadas.iterator(chunk_size=tamano_lote):
+            lote.append(log_llamada)
+            if len(lote) == tamano_lote:
+                self._cargar_contactos_lote(lote)
+                yield from lote
+                lote = []
+        self._cargar_contactos_lote(lote)
+        yield from lote
+
+    def _cargar_contactos_lote(self, lote):
+        ids_contactos = {log_llamada.contacto_id for log_llamada in lote
+                         if log_llamada.contacto_id is not None}
+        contactos = self.campana.bd_contacto.contactos.filter(
+            pk__in=ids_contactos).select_related('bd_contacto')
+        self.contactos_dict = {contacto.pk: contacto for contacto in contactos}
+
 
 class ReporteContactadosCSV(EstadisticasBaseCampana, ReporteCSV):
 
@@ -89,33 +149,29 @@ class ReporteContactadosCSV(EstadisticasBaseCampana, ReporteCSV):
             return True
         return False
 
-    def __init__(self, campana, key_task, fecha_desde, fecha_hasta):
+    def __init__(self, campana, key_task, fecha_desde, fecha_hasta, archivo_de_reporte=None):
         self.campana = campana
         self.fecha_desde = fecha_desde
         self.fecha_hasta = fecha_hasta
         self._inicializar_valores_estadisticas()
-        self.contactos_dict = {contacto.pk: contacto
-                               for contacto in self.campana.bd_contacto.contactos.all()}
+        self.contactos_dict = {}
         self.campos_contacto_datos = self.bd_metadata.nombres_de_columnas
-        self.datos = []
         self.campos_formulario_opciones = {}
         self.posiciones_opciones = {}
+        self._generar(key_task, archivo_de_reporte)
+
+    def _generar_reporte(self, key_task):
         self._escribir_encabezado()
 
         logs_llamadas = self._obtener_logs_de_llamadas()
 
-        numero_logs_llamadas = logs_llamadas.count()
-        if numero_logs_llamadas == 0:
-            porcentaje_inicial = 100
-        else:
-            porcentaje_inicial = 0
-        self.redis_connection.publish(key_task, porcentaje_inicial)  # percentage of task completed
+        progreso = PublicadorDeProgreso(key_task, logs_llamadas.count(), self.redis_connection)
+        progreso.iniciar()  # percentage of task completed
 
         callids_analizados = set()
 
-        for i, log_llamada in enumerate(logs_llamadas, start=1):
-            percentage = int((i / numero_logs_llamadas) * 100)
-            self.redis_connection.publish(key_task, percentage)
+        for log_llamada in self._iterar_logs_en_lotes(logs_llamadas):
+            progreso.avanzar()
             callid = log_llamada.callid
             evento = log_llamada.event
             calificacion_historica = self.calificaciones_historicas_dict.get(callid, False)
@@ -176,8 +232,7 @@ class ReporteContactadosCSV(EstadisticasBaseCampana, ReporteCSV):
                         encabezado.append(nombre)
                         cant_campos_gestion += 1
 
-        lista_datos_utf8 = [force_text(item) for item in encabezado]
-        self.datos.append(lista_datos_utf8)
+        self._agregar_fila(encabezado)
 
     def _escribir_linea_log(self, llamada_log, datos_calificacion, calificacion_historica):
         datos_contacto = [''] * len(self.campos_contacto_datos)
@@ -238,42 +293,37 @@ class ReporteContactadosCSV(EstadisticasBaseCampana, ReporteCSV):
         registro.append(bd_contacto)
         registro.extend(datos_gestion)
 
-        lista_datos_utf8 = [force_text(item) for item in registro]
-        self.datos.append(lista_datos_utf8)
+        self._agregar_fila(registro)
 
 
 class ReporteCalificadosCSV(EstadisticasBaseCampana, ReporteCSV):
 
     def __init__(
-            self, campana, key_task, fecha_desde, fecha_hasta):
+            self, campana, key_task, fecha_desde, fecha_hasta, archivo_de_reporte=None):
         self.campana = campana
         self.fecha_desde = fecha_desde
         self.fecha_hasta = fecha_hasta
         self._inicializar_valores_estadisticas()
-        self.contactos_dict = {contacto.pk: contacto
-                               for contacto in self.campana.bd_contacto.contactos.all()}
         self.campos_contacto_datos = self.bd_metadata.nombres_de_columnas
-        self.datos = []
         self.campos_formularios_opciones = {}
         self.posiciones_opciones = {}
+        self._generar(key_task, archivo_de_reporte)
+
+    def _generar_reporte(self, key_task):
         self._escribir_encabezado()
 
         logs_llamadas = self._obtener_logs_de_llamadas()
 
-        numero_logs_llamadas = logs_llamadas.count()
-        if numero_logs_llamadas == 0:
-            porcentaje_inicial = 100
-        else:
-            porcentaje_inicial = 0
+        progreso = PublicadorDeProgreso(key_task, logs_llamadas.count(), self.redis_connection)
         calificaciones_analizadas = set()
-        self.redis_connection.publish(key_task, porcentaje_inicial)  # percentage of task completed
-        for i, log_llamada in enumerate(logs_llamadas, start=1):
-            percentage = int((i / numero_logs_llamadas) * 100)
-            self.redis_connection.publish(key_task, percentage)
+        progreso.iniciar()  # percentage of task completed
+        # Los datos del contacto salen de la calificación, no hace falta cargar contactos
+        for log_llamada in logs_llamadas.iterator(chunk_size=settings.OL_TAMANO_LOTE_REPORTES_CSV):
+            progreso.avanzar()
             callid = log_llamada.callid
             calificacion_historica = self.calificaciones_historicas_dict.get(callid, False)
             calificacion_final = self.calificaciones_finales_dict.get(callid, False)
-            if campana.es_entrante:
+            if self.campana.es_entrante:
                 calificacion = calificacion_historica
             else:
                 calificacion = calificacion_final
@@ -305,8 +355,7 @@ class ReporteCalificadosCSV(EstadisticasBaseCampana, ReporteCSV):
                     for campo in campos:
                         nombre = campo.nombre_campo
                         encabezado.append(nombre)
-        lista_datos_utf8 = [force_text(item) for item in encabezado]
-        self.datos.append(lista_datos_utf8)
+        self._agregar_fila(encabezado)
 
     def _escribir_linea_calificacion(self, calificacion_val, log_llamada):
         lista_opciones = []
@@ -363,34 +412,29 @@ class ReporteCalificadosCSV(EstadisticasBaseCampana, ReporteCSV):
                 lista_opciones.append(
                     datos.get(campo.nombre_campo, '').replace('\r\n', ' '))
 
-        lista_datos_utf8 = [force_text(item) for item in lista_opciones]
-        self.datos.append(lista_datos_utf8)
+        self._agregar_fila(lista_opciones)
 
 
 class ReporteNoAtendidosCSV(EstadisticasBaseCampana, ReporteCSV):
-    def __init__(self, campana, key_task, fecha_desde, fecha_hasta):
+    def __init__(self, campana, key_task, fecha_desde, fecha_hasta, archivo_de_reporte=None):
         self.campana = campana
         self.fecha_desde = fecha_desde
         self.fecha_hasta = fecha_hasta
         self.bd_metadata = self.campana.bd_contacto.get_metadata()
         self.campos_contacto = self.bd_metadata.nombres_de_columnas
-        self.datos = []
-        self.contactos_dict = {contacto.pk: contacto
-                               for contacto in self.campana.bd_contacto.contactos.all()}
+        self.contactos_dict = {}
         self.agentes_dict = {}
         self._inicializar_valores_agentes()
+        self._generar(key_task, archivo_de_reporte)
+
+    def _generar_reporte(self, key_task):
         self._escribir_encabezado()
         logs_llamadas = self._obtener_logs_de_llamadas()
 
-        numero_logs_llamadas = logs_llamadas.count()
-        if numero_logs_llamadas == 0:
-            porcentaje_inicial = 100
-        else:
-            porcentaje_inicial = 0
-        self.redis_connection.publish(key_task, porcentaje_inicial)  # percentage of task completed
-        for i, log_llamada in enumerate(logs_llamadas, start=1):
-            percentage = int((i / numero_logs_llamadas) * 100)
-            self.redis_connection.publish(key_task, percentage)
+        progreso = PublicadorDeProgreso(key_task, logs_llamadas.count(), self.redis_connection)
+        progreso.iniciar()  # percentage of task completed
+        for log_llamada in self._iterar_logs_en_lotes(logs_llamadas):
+            progreso.avanzar()
             self._escribir_linea_log(log_llamada, self.contactos_dict, self.agentes_dict)
 
     def _escribir_encabezado(self):
@@ -400,8 +444,7 @@ class ReporteNoAtendidosCSV(EstadisticasBaseCampana, ReporteCSV):
         encabezado.append(_("Fecha-Hora Contacto"))
         encabezado.append(_("Tel status"))
         encabezado.append(_("Agente"))
-        lista_datos_utf8 = [force_text(item) for item in encabezado]
-        self.datos.append(lista_datos_utf8)
+        self._agregar_fila(encabezado)
 
     def _escribir_linea_log(self, log_no_contactado, contactos_dict, agentes_dict):
         lista_opciones = []
@@ -425,8 +468,7 @@ class ReporteNoAtendidosCSV(EstadisticasBaseCampana, ReporteCSV):
                 agente_info = agentes_dict.get(log_no_contactado.agente_id, -1)
             lista_opciones.append(agente_info)
             # --- Finalmente, escribimos la linea
-            lista_datos_utf8 = [force_text(item) for item in lista_opciones]
-            self.datos.append(lista_datos_utf8)
+            self._agregar_fila(lista_opciones)
 
 
 class ArchivoDeReporteCsv(object):
@@ -510,3 +552,24 @@ class ExportacionCampanaCSV(object):
                 campana, "no_atendidos", datos_no_atendidos)
             archivo_de_reporte.crear_archivo_en_directorio()
             archivo_de_reporte.escribir_archivo_datos_csv()
+
+
+def exportar_reporte_csv_campana(key_task, tipo_reporte, campana_id, desde, hasta):
+    """
+    Genera el archivo CSV de uno de los reportes de la campaña ('contactados', 'calificados'
+    o 'no_atendidos'). Se ejecuta como trabajo en segundo plano, las fechas tienen formato
+    dd/mm/aaaa.
+    """
+    fecha_desde = datetime.datetime.combine(convert_fecha_datetime(desde), datetime.time.min)
+    fecha_hasta = datetime.datetime.combine(convert_fecha_datetime(hasta), datetime.time.max)
+    clases_reporte = {
+        'contactados': ReporteContactadosCSV,
+        'calificados': ReporteCalificadosCSV,
+        'no_atendidos': ReporteNoAtendidosCSV,
+    }
+    if tipo_reporte not in clases_reporte:
+        raise ValueError(_('Tipo de reporte desconocido: {0}'.format(tipo_reporte)))
+    campana = Campana.objects.get(pk=campana_id)
+    archivo_de_reporte = ArchivoDeReporteCsv(campana, tipo_reporte, None)
+    clases_reporte[tipo_reporte](
+        campana, key_task, fecha_desde, fecha_hasta, archivo_de_reporte=archivo_de_reporte)
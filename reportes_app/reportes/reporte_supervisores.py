@@ -47,7 +47,8 @@ class ReporteSupervisores(object):
                 'campana': []
             }
         # Nombres de campañas a la que esta asignado
-        asignaciones_agentes = QueueMember.objects.values('member_id', 'queue_name__campana_id')
+        asignaciones_agentes = QueueMember.objects.values(
+            'member_id', 'queue_name__campana_id').order_by('id')
         for asignacion in asignaciones_agentes:
             id_campana = asignacion['queue_name__campana_id']
             id_agente = asignacion['member_id']
@@ -110,10 +111,8 @@ class ReporteSupervisoresFamily(AbstractRedisFamily):
 
     def regenerar_families(self):
         """regenera la family"""
-        # Precalculo el resultado para que no quede vacio redis mientras calcula
         self.reporte_resultado = self._obtener_resultado()
-        self._delete_tree_family()
-        self._create_families()
+        return super(ReporteSupervisoresFamily, self).regenerar_families()
 
     def regenerar_family(self, family_member):
         """regenera una family"""
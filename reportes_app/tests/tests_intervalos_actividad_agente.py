@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2018 Freetech Solutions
+
+# This file is part of OMniLeads
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+#
+
+"""
+Tests de paridad entre los calculadores de intervalos de sesión y pausa en SQL y en Python
+"""
+
+from __future__ import unicode_literals
+
+from mock import patch
+
+from django.utils import timezone
+
+from ominicontacto_app.tests.factories import ActividadAgenteLogFactory, PausaFactory
+from ominicontacto_app.tests.utiles import OMLBaseTest
+from ominicontacto_app.utiles import datetime_hora_minima_dia
+from reportes_app.reportes.intervalos_actividad_agente import (
+    CalculadorDeIntervalosPython, CalculadorDeIntervalosSQL)
+from reportes_app.reportes.reporte_agente_tiempos import TiemposAgente
+from reportes_app.reportes.reporte_agentes import ReporteAgentes
+
+
+class CalculadoresDeIntervalosTests(OMLBaseTest):
+
+    def setUp(self):
+        super(CalculadoresDeIntervalosTests, self).setUp()
+        ayer = timezone.now() - timezone.timedelta(days=1)
+        self.fecha = ayer
+        self.base = datetime_hora_minima_dia(ayer) + timezone.timedelta(hours=8)
+        self.ahora = self.base + timezone.timedelta(hours=20)
+        self.pausa_1 = PausaFactory()
+        self.pausa_2 = PausaFactory()
+        p1 = str(self.pausa_1.id)
+        p2 = str(self.pausa_2.id)
+        escenarios = [
+            # Sesión normal con dos pausas
+            [(0, 'ADDMEMBER', ''), (10, 'PAUSEALL', p1), (25, 'UNPAUSEALL', p1),
+             (40, 'PAUSEALL', '0'), (41, 'UNPAUSEALL', '0'), (60, 'REMOVEMEMBER', '')],
+            # REMOVEMEMBER sin sesión iniciada y última pausa sin finalizar
+            [(0, 'REMOVEMEMBER', ''), (5, 'ADDMEMBER', ''), (30, 'PAUSEALL', p2),
+             (90, 'REMOVEMEMBER', ''), (100, 'PAUSEALL', p1)],
+            # Sesión sin REMOVEMEMBER seguida de otra sesión y REMOVEMEMBER repetido
+            [(0, 'ADDMEMBER', ''), (20, 'ADDMEMBER', ''), (50, 'REMOVEMEMBER', ''),
+             (55, 'REMOVEMEMBER', '')],
+            # Pausas encadenadas y sesión que queda abierta
+            [(0, 'ADDMEMBER', ''), (5, 'PAUSEALL', p1), (15, 'PAUSEALL', p2),
+             (30, 'PAUSEALL', p1), (45, 'ADDMEMBER', ''), (70, 'UNPAUSEALL', p1)],
+            # Sólo eventos sin sesión
+            [(3, 'UNPAUSEALL', p2)],
+            # Eventos simultáneos
+            [(0, 'ADDMEMBER', ''), (10, 'PAUSEALL', p1), (10, 'UNPAUSEALL', p1),
+             (10, 'PAUSEALL', p2), (20, 'REMOVEMEMBER', ''), (20, 'ADDMEMBER', '')],
+        ]
+        self.agentes = []
+        for escenario in escenarios:
+            agente = self.crear_agente_profile()
+            self.agentes.append(agente)
+            for minutos, evento, pausa_id in escenario:
+                ActividadAgenteLogFactory(
+                    agente_id=agente.id, event=evento, pausa_id=pausa_id,
+                    time=self.base + timezone.timedelta(minutes=minutos))
+        self.agente_ids = [agente.id for agente in self.agentes]
+
+    def test_totales_agentes_coinciden(self):
+        totales_sql = CalculadorDeIntervalosSQL().calcular_totales_agentes(
+            self.agente_ids, self.fecha, self.fecha, self.ahora)
+        totales_python = CalculadorDeIntervalosPython().calcular_totales_agentes(
+            self.agente_ids, self.fecha, self.fecha, self.ahora)
+        self.assertEqual(len(totales_python), len(self.agentes))
+        self.assertEqual(totales_sql, totales_python)
+
+    def test_totales_agentes_valores_esperados(self):
+        totales = {totales.agente_id: totales for totales in
+                   CalculadorDeIntervalosPython().calcular_totales_agentes(
+                       self.agente_ids, self.fecha, self.fecha, self.ahora)}
+        minutos = timezone.timedelta(minutes=1)
+        normal, remove_inicial, sin_remove, abierta, sin_sesion, simultaneos = self.agente_ids
+
+        self.assertEqual(totales[normal].tiempo_sesion, 60 * minutos)
+        self.assertEqual(list(totales[normal].pausas.values()), [15 * minutos, minutos])
+
+        self.assertEqual(totales[remove_inicial].tiempo_sesion, 85 * minutos)
+        self.assertEqual(totales[remove_inicial].inicio_sesiones, self.base)
+        self.assertEqual(list(totales[remove_inicial].pausas.values()),
+                         [60 * minutos, 0 * minutos])
+
+        # La sesión cerrada por otro ADDMEMBER no suma tiempo
+        self.assertEqual(totales[sin_remove].tiempo_sesion, 30 * minutos)
+        self.assertEqual(totales[sin_remove].fin_sesiones,
+                         self.base + timezone.timedelta(minutes=50))
+
+        self.assertEqual(totales[abierta].tiempo_sesion,
+                         self.ahora - self.base - 45 * minutos)
+        self.assertEqual(totales[abierta].fin_sesiones, self.ahora)
+        self.assertEqual(list(totales[abierta].pausas.items()),
+                         [(str(self.pausa_1.id), 25 * minutos),
+                          (str(self.pausa_2.id), 15 * minutos)])
+
+        self.assertIsNone(totales[sin_sesion].inicio_sesiones)
+        self.assertEqual(totales[sin_sesion].pausas, {})
+
+    def test_sesiones_agente_coinciden(self):
+        for agente_id in self.agente_ids:
+            sesiones_sql = CalculadorDeIntervalosSQL().calcular_sesiones_agente(
+                agente_id, self.fecha, self.fecha, self.ahora)
+            sesiones_python = CalculadorDeIntervalosPython().calcular_sesiones_agente(
+                agente_id, self.fecha, self.fecha, self.ahora)
+            self.assertEqual(sesiones_sql, sesiones_python)
+
+    def test_sesiones_agente_marca_logs_erroneos(self):
+        calculador = CalculadorDeIntervalosPython()
+        normal, remove_inicial, sin_remove, abierta, __, __ = self.agente_ids
+        self.assertFalse(calculador.calcular_sesiones_agente(
+            normal, self.fecha, self.fecha, self.ahora)[1])
+        for agente_id in (remove_inicial, sin_remove, abierta):
+            self.assertTrue(calculador.calcular_sesiones_agente(
+                agente_id, self.fecha, self.fecha, self.ahora)[1])
+        sesiones, __ = calculador.calcular_sesiones_agente(
+            sin_remove, self.fecha, self.fecha, self.ahora)
+        self.assertEqual(sesiones, [(self.base, self.base + timezone.timedelta(minutes=20)),
+                                    (self.base + timezone.timedelta(minutes=20),
+                                     self.base + timezone.timedelta(minutes=50))])
+
+    def _datos_reporte_agentes(self, calculador):
+        with patch('reportes_app.reportes.reporte_agentes.obtener_calculador_de_intervalos',
+                   return_value=calculador), \
+                patch('reportes_app.reportes.reporte_agentes.now', return_value=self.ahora):
+            reporte = ReporteAgentes()
+            reporte.genera_tiempos_pausa(self.agentes, self.fecha, self.fecha)
+            reporte._genera_tiempos_totales_agentes()
+        tiempos = [(tiempos.agente.id, tiempos.tiempo_sesion, tiempos.tiempo_pausa)
+                   for tiempos in reporte.tiempos]
+        return tiempos, reporte.devuelve_pausas_agentes()
+
+    def test_reporte_agentes_coincide_con_ambos_calculadores(self):
+        self.assertEqual(self._datos_reporte_agentes(CalculadorDeIntervalosSQL()),
+                         self._datos_reporte_agentes(CalculadorDeIntervalosPython()))
+
+    def _datos_tiempos_agente(self, calculador, agente):
+        with patch('reportes_app.reportes.reporte_agente_tiempos.'
+                   'obtener_calculador_de_intervalos', return_value=calculador), \
+                patch('reportes_app.reportes.reporte_agente_tiempos.now',
+                      return_value=self.ahora):
+            tiempos, erroneos = TiemposAgente().calcular_tiempo_session_fecha_agente(
+                agente, self.fecha, self.fecha, [])
+        return [(tiempo.agente, tiempo.tiempo_sesion) for tiempo in tiempos], erroneos
+
+    def test_tiempos_agente_por_fecha_coincide_con_ambos_calculadores(self):
+        for agente in self.agentes[:4]:
+            self.assertEqual(self._datos_tiempos_agente(CalculadorDeIntervalosSQL(), agente),
+                             self._datos_tiempos_agente(CalculadorDeIntervalosPython(), agente))
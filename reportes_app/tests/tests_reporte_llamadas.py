@@ -23,11 +23,12 @@ from django.test import TestCase
 from django.utils.timezone import now, timedelta
 from django.urls import reverse
 
-from ominicontacto_app.utiles import datetime_hora_minima_dia, fecha_hora_local
+from ominicontacto_app.utiles import datetime_hora_minima_dia, fecha_hora_local, fecha_local
 from ominicontacto_app.models import Campana
 from ominicontacto_app.tests.factories import SupervisorProfileFactory, AgenteProfileFactory,\
     CampanaFactory, ContactoFactory, UserFactory
 
+from reportes_app.models import LlamadaLog, ResumenDiarioLlamadas
 from reportes_app.reportes.reporte_llamadas import ReporteDeLlamadas
 from reportes_app.tests.utiles import GeneradorDeLlamadaLogs
 
@@ -715,3 +716,69 @@ class DatosPorFechaReporteLlamadasTests(BaseReporteDeLlamadasTests):
         self.assertEqual(datos_hoy['atendidas'], 3)
         self.assertEqual(datos_hoy['recibidas'], 3)
         self.assertEqual(datos_hoy['t_espera_conexion'], 6)
+
+
+class ResumenDiarioReporteDeLlamadasTests(BaseReporteDeLlamadasTests):
+
+    def _generar_logs(self, time):
+        generador = GeneradorDeLlamadaLogs()
+        generador.generar_log(self.manual, True, 'ANSWER', '123', self.agente1,
+                              bridge_wait_time=3, time=time)
+        generador.generar_log(self.dialer, False, 'COMPLETEAGENT', '123', self.agente1,
+                              contacto=self.contacto_d, bridge_wait_time=4, time=time)
+        generador.generar_log(self.dialer, False, 'ABANDON', '123', bridge_wait_time=5, time=time)
+        generador.generar_log(self.dialer, True, 'NOANSWER', '123', self.agente2,
+                              bridge_wait_time=2, time=time)
+        generador.generar_log(self.entrante, False, 'COMPLETEOUTNUM', '123', self.agente1,
+                              bridge_wait_time=6, time=time)
+        generador.generar_log(self.entrante, False, 'EXITWITHTIMEOUT', '123',
+                              bridge_wait_time=7, time=time)
+        generador.generar_log(self.preview, False, 'BUSY', '123', self.agente3,
+                              contacto=self.contacto_p, bridge_wait_time=1, time=time)
+
+    def test_reporte_con_dias_consolidados_es_identico_al_calculado_desde_los_logs(self):
+        self._generar_logs(self.durante)
+        self._generar_logs(self.hasta)
+        reporte_logs = ReporteDeLlamadas(self.desde, self.hasta, True, self.supervisor.user)
+
+        ayer = fecha_local(self.durante)
+        self.assertGreater(ResumenDiarioLlamadas.objects.consolidar_dia(ayer), 0)
+        # Los logs del día consolidado ya no se leen
+        LlamadaLog.objects.filter(time__lt=datetime_hora_minima_dia(self.hasta)).delete()
+        reporte_resumen = ReporteDeLlamadas(self.desde, self.hasta, True, self.supervisor.user)
+
+        self.assertEqual(reporte_resumen.estadisticas, reporte_logs.estadisticas)
+        self.assertEqual(reporte_resumen.estadisticas_por_fecha,
+                         reporte_logs.estadisticas_por_fecha)
+
+    def test_consolidar_dia_es_idempotente(self):
+        self._generar_logs(self.durante)
+        ayer = fecha_local(self.durante)
+        cantidad = ResumenDiarioLlamadas.objects.consolidar_dia(ayer)
+        self.assertEqual(ResumenDiarioLlamadas.objects.consolidar_dia(ayer), cantidad)
+        self.assertEqual(ResumenDiarioLlamadas.objects.filter(fecha=ayer).count(), cantidad)
+
+    def test_estadisticas_por_fecha_ordenadas_con_dias_consolidados(self):
+        self._generar_logs(self.durante)
+        self._generar_logs(self.hasta)
+        ResumenDiarioLlamadas.objects.consolidar_dia(fecha_local(self.durante))
+
+        reporte = ReporteDeLlamadas(self.desde, self.hasta, True, self.supervisor.user)
+
+        fechas = list(reporte.estadisticas_por_fecha['llamadas_por_tipo'][
+            str(Campana.TYPE_DIALER)])
+        self.assertEqual(fechas, [self.durante.strftime('%d-%m-%Y'),
+                                  self.hasta.strftime('%d-%m-%Y')])
+
+    def test_dia_consolidado_con_logs_posteriores_queda_desactualizado(self):
+        self._generar_logs(self.durante)
+        ayer = fecha_local(self.durante)
+        ResumenDiarioLlamadas.objects.consolidar_dia(ayer)
+        self.assertEqual(ResumenDiarioLlamadas.objects.obtener_dias_desactualizados(ayer, ayer),
+                         [])
+
+        GeneradorDeLlamadaLogs().generar_log(self.entrante, False, 'EXITWITHTIMEOUT', '123',
+                                             bridge_wait_time=7, time=self.durante)
+
+        self.assertEqual(ResumenDiarioLlamadas.objects.obtener_dias_desactualizados(ayer, ayer),
+                         [ayer])
@@ -24,6 +24,7 @@ from ominicontacto_app.tests.factories import (
     CampanaFactory, OpcionCalificacionFactory, QueueFactory, CalificacionClienteFactory,
     LlamadaLogFactory)
 
+from ominicontacto_app.services.asterisk.estado_colas import EstadoColasAsterisk
 from reportes_app.reportes.reporte_llamadas_entrantes import ReporteDeLLamadasEntrantesDeSupervision
 from reportes_app.tests.utiles import GeneradorDeLlamadaLogs
 from reportes_app.models import LlamadaLog
@@ -169,3 +170,14 @@ class ReporteDeLLamadasEntrantesDeSupervisionTest(OMLBaseTest):
         reporte = ReporteDeLLamadasEntrantesDeSupervision()
         estadisticas = reporte.estadisticas
         self.assertEqual(estadisticas[self.entrante1.pk]['llamadas_en_espera'], 1)
+
+    @patch.object(EstadoColasAsterisk, 'obtener_llamadas_en_espera')
+    @patch.object(EstadoColasAsterisk, 'esta_vigente')
+    @patch.object(ReporteDeLLamadasEntrantesDeSupervision, '_obtener_llamadas_en_espera_raw')
+    def test_contabilizar_llamadas_en_espera_desde_eventos_de_colas(
+            self, _obtener_llamadas_en_espera_raw, esta_vigente, obtener_llamadas_en_espera):
+        esta_vigente.return_value = True
+        obtener_llamadas_en_espera.return_value = {self.entrante1.pk: 2}
+        reporte = ReporteDeLLamadasEntrantesDeSupervision()
+        self.assertEqual(reporte.estadisticas[self.entrante1.pk]['llamadas_en_espera'], 2)
+        _obtener_llamadas_en_espera_raw.assert_not_called()
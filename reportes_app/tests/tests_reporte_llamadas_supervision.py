@@ -18,14 +18,20 @@
 #
 from ominicontacto_app.services.asterisk.supervisor_activity import SupervisorActivityAmiManager
 from ominicontacto_app.models import Campana, OpcionCalificacion
-from mock import patch
+from mock import patch, MagicMock
 
+from datetime import timedelta
+from django.db.models import Max
 from django.test import TestCase
+from django.utils.timezone import now, localtime
 import json
 
 from reportes_app.reportes.reporte_llamadas_supervision import (
     ReporteDeLLamadasEntrantesDeSupervision, ReporteDeLLamadasSalientesDeSupervision
 )
+from reportes_app.models import LlamadaLog
+from reportes_app.reportes.actualizacion_incremental_supervision import (
+    ActualizadorIncrementalDeSupervisionEntrantes, ActualizadorIncrementalDeSupervisionSalientes)
 from reportes_app.reportes.reporte_llamadas_salientes import ReporteLlamadasSalienteFamily
 from reportes_app.services.redis_service import RedisService
 from reportes_app.tests.utiles import GeneradorDeLlamadaLogs
@@ -301,3 +307,87 @@ class ReporteDeLLamadasSalientesDeSupervisionTest(TestCase):
             self.assertEqual(datos_redis['NOMBRE'], reporte.estadisticas[id_campana]['nombre'])
             self.assertEqual(
                 datos_redis['ESTADISTICAS'], json.dumps(reporte.estadisticas[id_campana]))
+
+
+class ActualizadorIncrementalDeSupervisionTest(TestCase):
+
+    def setUp(self):
+        super(ActualizadorIncrementalDeSupervisionTest, self).setUp()
+        self.generador = GeneradorDeLlamadaLogs()
+        self.agente = AgenteProfileFactory()
+        self.manual = CampanaFactory.create(type=Campana.TYPE_MANUAL, nombre='camp-manual-1',
+                                            estado=Campana.ESTADO_ACTIVA)
+        self.preview = CampanaFactory.create(type=Campana.TYPE_PREVIEW, nombre='camp-preview-1',
+                                             estado=Campana.ESTADO_ACTIVA)
+        self.redis_connection = MagicMock()
+        self.actualizador = ActualizadorIncrementalDeSupervisionSalientes(self.redis_connection)
+
+    def _generar_log(self, campana, evento):
+        self.generador.generar_log(campana, False, evento, '35100001111',
+                                   agente=self.agente, contacto=None, bridge_wait_time=-1,
+                                   duracion_llamada=10, archivo_grabacion='', time=None)
+
+    def test_obtener_incrementos_solo_cuenta_logs_posteriores_al_checkpoint(self):
+        self._generar_log(self.manual, 'COMPLETEAGENT')
+        checkpoint = LlamadaLog.objects.aggregate(Max('id'))['id__max']
+        self._generar_log(self.preview, 'COMPLETEAGENT')
+        self._generar_log(self.preview, 'BUSY')
+        ultimo_id = LlamadaLog.objects.aggregate(Max('id'))['id__max']
+
+        incrementos = self.actualizador.obtener_incrementos(
+            checkpoint, ultimo_id, [self.manual.id, self.preview.id])
+
+        self.assertNotIn(self.manual.id, incrementos)
+        self.assertEqual(incrementos[self.preview.id],
+                         {'efectuadas': 2, 'conectadas': 1, 'no_conectadas': 1})
+
+    @patch.object(ActualizadorIncrementalDeSupervisionSalientes, '_aplicar_eventos_nuevos')
+    @patch.object(ActualizadorIncrementalDeSupervisionSalientes, 'regenerar')
+    def test_actualizar_regenera_si_el_checkpoint_es_de_otro_dia(self, regenerar,
+                                                                 _aplicar_eventos_nuevos):
+        self.redis_connection.hgetall.return_value = {'fecha': '2000-01-01', 'ultimo_id': '10'}
+        self.assertTrue(self.actualizador.actualizar())
+        regenerar.assert_called_once()
+        _aplicar_eventos_nuevos.assert_not_called()
+
+    @patch.object(ActualizadorIncrementalDeSupervisionSalientes, '_aplicar_eventos_nuevos')
+    @patch.object(ActualizadorIncrementalDeSupervisionSalientes, 'regenerar')
+    def test_actualizar_aplica_eventos_nuevos_desde_el_checkpoint_del_dia(
+            self, regenerar, _aplicar_eventos_nuevos):
+        hoy = localtime(now()).date().isoformat()
+        self.redis_connection.hgetall.return_value = {'fecha': hoy, 'ultimo_id': '10'}
+        self.assertTrue(self.actualizador.actualizar())
+        regenerar.assert_not_called()
+        _aplicar_eventos_nuevos.assert_called_once_with(10, hoy)
+
+    def test_actualizar_no_hace_nada_si_hay_otra_actualizacion_en_curso(self):
+        self.redis_connection.set.return_value = False
+        self.assertFalse(self.actualizador.actualizar())
+        self.redis_connection.hgetall.assert_not_called()
+
+    @patch.object(ActualizadorIncrementalDeSupervisionSalientes, 'DEMORA_CHECKPOINT', 60)
+    def test_checkpoint_no_avanza_sobre_los_logs_recientes(self):
+        self._generar_log(self.manual, 'COMPLETEAGENT')
+        ultimo_id = LlamadaLog.objects.aggregate(Max('id'))['id__max']
+        LlamadaLog.objects.filter(id=ultimo_id).update(time=now() - timedelta(minutes=5))
+        self._generar_log(self.preview, 'COMPLETEAGENT')
+
+        self.assertEqual(self.actualizador._obtener_ultimo_id_confirmado(), ultimo_id)
+
+    @patch.object(ActualizadorIncrementalDeSupervisionEntrantes, 'DEMORA_CHECKPOINT', 0)
+    @patch.object(ActualizadorIncrementalDeSupervisionEntrantes, '_obtener_valores_instantaneos')
+    def test_aplicar_eventos_nuevos_entrantes(self, _obtener_valores_instantaneos):
+        _obtener_valores_instantaneos.return_value = {}
+        entrante = CampanaFactory.create(type=Campana.TYPE_ENTRANTE, nombre='camp-entrante-1',
+                                         estado=Campana.ESTADO_ACTIVA)
+        actualizador = ActualizadorIncrementalDeSupervisionEntrantes(self.redis_connection)
+        self.generador.generar_log(entrante, False, 'COMPLETEAGENT', '35100001111',
+                                   agente=self.agente, bridge_wait_time=4, duracion_llamada=10)
+        hoy = localtime(now()).date().isoformat()
+
+        actualizador._aplicar_eventos_nuevos(0, hoy)
+
+        actualizar_family = self.redis_connection.register_script.return_value
+        kwargs = actualizar_family.call_args[1]
+        self.assertEqual(kwargs['keys'], ['OML:SUPERVISION_CAMPAIGN:{0}'.format(entrante.id)])
+        self.assertEqual(json.loads(kwargs['args'][1])['llamadas_atendidas'], 1)
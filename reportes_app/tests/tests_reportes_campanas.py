@@ -21,6 +21,9 @@
 
 from __future__ import unicode_literals
 
+import csv
+import os
+
 from datetime import timedelta
 
 
@@ -28,6 +31,7 @@ from pygal import Bar
 from mock import patch
 
 from django.conf import settings
+from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 
@@ -37,7 +41,7 @@ from ominicontacto_app.services.estadisticas_campana import (
     EstadisticasService, CampanaService)
 from ominicontacto_app.services.reporte_campana_pdf import ReporteCampanaPDFService
 from reportes_app.reportes.reporte_llamados_contactados_csv import (
-    ReporteContactadosCSV, ExportacionCampanaCSV)
+    ArchivoDeReporteCsv, ReporteContactadosCSV, ReporteNoAtendidosCSV, ExportacionCampanaCSV)
 from ominicontacto_app.services.reporte_respuestas_formulario import (
     ReporteRespuestaFormularioGestionService)
 from ominicontacto_app.tests.utiles import OMLBaseTest, PASSWORD
@@ -539,6 +543,46 @@ class ReportesCampanasTests(BaseTestDeReportes):
         # muestra el histórico de contactados (aqui cuenta la linea de header)
         self.assertEqual(len(reporte_contactados_csv.datos), 5)
 
+    @override_settings(OL_TAMANO_LOTE_REPORTES_CSV=2)
+    def test_reportes_csv_escritos_en_lotes_coinciden_con_reporte_en_memoria(self):
+        hoy_ahora = fecha_hora_local(timezone.now())
+        fecha_desde = datetime_hora_minima_dia_utc(hoy_ahora)
+        fecha_hasta = datetime_hora_maxima_dia_utc(hoy_ahora)
+        for clase_reporte, nombre in ((ReporteContactadosCSV, 'contactados'),
+                                      (ReporteNoAtendidosCSV, 'no_atendidos')):
+            reporte = clase_reporte(self.campana_activa, 'key_task', fecha_desde, fecha_hasta)
+            archivo_de_reporte = ArchivoDeReporteCsv(self.campana_activa, nombre, None)
+            reporte_en_archivo = clase_reporte(
+                self.campana_activa, 'key_task', fecha_desde, fecha_hasta,
+                archivo_de_reporte=archivo_de_reporte)
+            self.addCleanup(os.remove, archivo_de_reporte.ruta)
+            with open(archivo_de_reporte.ruta, newline='', encoding='utf-8') as csvfile:
+                filas = list(csv.reader(csvfile))
+            self.assertEqual(reporte_en_archivo.datos, [])
+            self.assertEqual(filas, reporte.datos)
+            self.assertGreater(len(filas), 1)
+
+    def test_reporte_csv_fallido_conserva_el_reporte_anterior(self):
+        hoy_ahora = fecha_hora_local(timezone.now())
+        fecha_desde = datetime_hora_minima_dia_utc(hoy_ahora)
+        fecha_hasta = datetime_hora_maxima_dia_utc(hoy_ahora)
+        archivo_de_reporte = ArchivoDeReporteCsv(self.campana_activa, 'contactados', None)
+        directorio = os.path.dirname(archivo_de_reporte.ruta)
+        os.makedirs(directorio, exist_ok=True)
+        with open(archivo_de_reporte.ruta, 'w') as csvfile:
+            csvfile.write('anterior')
+        self.addCleanup(os.remove, archivo_de_reporte.ruta)
+
+        with patch.object(ReporteContactadosCSV, '_generar_reporte', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                ReporteContactadosCSV(self.campana_activa, 'key_task', fecha_desde, fecha_hasta,
+                                      archivo_de_reporte=archivo_de_reporte)
+
+        with open(archivo_de_reporte.ruta) as csvfile:
+            self.assertEqual(csvfile.read(), 'anterior')
+        self.assertFalse([nombre for nombre in os.listdir(directorio)
+                          if nombre.startswith('.tmp-')])
+
     @patch.object(ReporteCampanaPDFService, 'crea_reporte_pdf')
     @patch.object(Bar, 'render_to_png')
     def test_datos_reporte_grafico_campana_entrantes_totales_calificaciones_contabiliza_historico(